@@ -4,12 +4,71 @@
 """
 
 try:
-    from .bybit_api import BybitRealAccount, RealAccountManager, real_account_manager
+    from .bybit_api import BybitRealAccount, AsyncBybitRealAccount, RealAccountManager, real_account_manager
+except ImportError:
+    pass
+
+try:
+    from .http_transport import HttpTransport, AsyncHttpTransport, http_transport, async_http_transport
+except ImportError:
+    pass
+
+try:
+    from .instrument_registry import InstrumentRegistry, instrument_registry
+except ImportError:
+    pass
+
+try:
+    from .price_bus import PriceBus, price_bus
+except ImportError:
+    pass
+
+try:
+    from .ticker_snapshot import TickerSnapshot, ticker_snapshot
+except ImportError:
+    pass
+
+try:
+    from .private_stream import PrivateStreamManager, private_stream_manager
+except ImportError:
+    pass
+
+try:
+    from .rate_limiter import RateLimiter, rate_limiter
+except ImportError:
+    pass
+
+try:
+    from .request_coalescer import RequestCoalescer, request_coalescer
+except ImportError:
+    pass
+
+try:
+    from .latency_tracer import LatencyTracer, latency_tracer
 except ImportError:
     pass
 
 __all__ = [
     'BybitRealAccount',
+    'AsyncBybitRealAccount',
     'RealAccountManager',
-    'real_account_manager'
+    'real_account_manager',
+    'HttpTransport',
+    'http_transport',
+    'AsyncHttpTransport',
+    'async_http_transport',
+    'InstrumentRegistry',
+    'instrument_registry',
+    'PriceBus',
+    'price_bus',
+    'TickerSnapshot',
+    'ticker_snapshot',
+    'PrivateStreamManager',
+    'private_stream_manager',
+    'RateLimiter',
+    'rate_limiter',
+    'RequestCoalescer',
+    'request_coalescer',
+    'LatencyTracer',
+    'latency_tracer'
 ]
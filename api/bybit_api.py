@@ -5,24 +5,51 @@ Bybit API - إدارة الحساب الحقيقي على Bybit
 يدير جميع الاتصالات مع Bybit API
 """
 
+import asyncio
 import logging
 import hmac
 import hashlib
 import time
+import json
 import requests
 from typing import Dict, Optional, List, Any
 from urllib.parse import urlencode
 from datetime import datetime
 
+from api.exchange_base import AsyncExchangeBase
+from api.http_transport import http_transport, async_http_transport
+from api.instrument_registry import instrument_registry
+from api.latency_tracer import latency_tracer
+from api.private_stream import private_stream_manager
+from api.rate_limiter import rate_limiter
+from api.request_coalescer import request_coalescer
+
 logger = logging.getLogger(__name__)
 
+try:
+    from config import BYBIT_BASE_URL
+except ImportError:
+    BYBIT_BASE_URL = "https://api.bybit.com"
+
+
+def _safe_float(value, default=0.0):
+    """تحويل القيم إلى float بأمان"""
+    try:
+        if value is None or value == '':
+            return default
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
 class BybitRealAccount:
     """إدارة الحساب الحقيقي على Bybit"""
     
-    def __init__(self, api_key: str, api_secret: str):
+    def __init__(self, api_key: str, api_secret: str, base_url: str = None):
         self.api_key = api_key
         self.api_secret = api_secret
-        self.base_url = "https://api.bybit.com"
+        # base_url قابل للتغيير (مثلاً إلى المحاكي المحلي)
+        self.base_url = (base_url or BYBIT_BASE_URL).rstrip('/')
         
     def _generate_signature(self, timestamp: str, recv_window: str, params_str: str) -> str:
         """توليد التوقيع لـ Bybit V5"""
@@ -34,101 +61,116 @@ class BybitRealAccount:
         ).hexdigest()
         return signature
     
-    def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Optional[Dict]:
-        """إرسال طلب إلى Bybit API - محسّن مع توقيع صحيح"""
+    def _build_request(self, method: str, endpoint: str, params: Dict = None):
+        """
+        بناء الطلب الموقّع (URL، Headers، Body) دون إرساله
+        
+        يُستخدم من العميل المتزامن وغير المتزامن لضمان توقيع واحد متطابق
+        """
         if params is None:
             params = {}
         
         timestamp = str(int(time.time() * 1000))
         recv_window = "5000"
         
+        # بناء التوقيع بطريقة مختلفة حسب نوع الطلب
+        if method == 'GET':
+            # للطلبات GET: استخدام query string
+            params_str = urlencode(sorted(params.items())) if params else ""
+            url = f"{self.base_url}{endpoint}"
+            if params_str:
+                url += f"?{params_str}"
+            body = None
+            
+        elif method == 'POST':
+            # للطلبات POST: استخدام JSON body
+            # ترتيب المعاملات أبجدياً لضمان توافق التوقيع
+            if params:
+                params_sorted = {k: params[k] for k in sorted(params.keys())}
+                # استخدام json.dumps بدون مسافات
+                params_str = json.dumps(params_sorted, separators=(',', ':'), sort_keys=True)
+            else:
+                params_str = ""
+            url = f"{self.base_url}{endpoint}"
+            logger.debug(f"📤 POST إلى {endpoint}")
+            logger.debug(f"📋 المعاملات المرتبة: {params_str}")
+            # إرسال المعاملات كنص JSON لضمان التطابق التام مع التوقيع
+            body = params_str or None
+        else:
+            raise ValueError(f"نوع طلب غير مدعوم: {method}")
+        
+        signature = self._generate_signature(timestamp, recv_window, params_str)
+        
+        headers = {
+            'X-BAPI-API-KEY': self.api_key,
+            'X-BAPI-SIGN': signature,
+            'X-BAPI-TIMESTAMP': timestamp,
+            'X-BAPI-RECV-WINDOW': recv_window,
+            'X-BAPI-SIGN-TYPE': '2',
+            'Content-Type': 'application/json'
+        }
+        
+        return url, headers, body
+    
+    @staticmethod
+    def _parse_response(endpoint: str, status_code: int, result: Optional[Dict], text: str = '') -> Optional[Dict]:
+        """تحليل استجابة Bybit وتوحيد شكل النتيجة أو الخطأ"""
+        if status_code != 200:
+            logger.error(f"❌ Bybit API Error (HTTP {status_code}): {text}")
+            return {'error': f'HTTP {status_code}', 'details': text}
+        
+        if result.get('retCode') == 0:
+            logger.debug(f"✅ نجح الطلب: {endpoint}")
+            
+            # للأوامر، نحتاج الاستجابة الكاملة لأن orderId قد يكون في result أو في المستوى الأعلى
+            if endpoint == '/v5/order/create':
+                # إرجاع الاستجابة الكاملة للأوامر
+                logger.debug(f"📋 استجابة كاملة للأمر: {result}")
+                return result
+            else:
+                # للطلبات الأخرى، إرجاع result فقط
+                return result.get('result')
+        
+        ret_msg = result.get('retMsg', '')
+        ret_code = result.get('retCode', 0)
+        
+        # التعامل مع الأخطاء المقبولة (مثل leverage not modified)
+        if ret_code == 110043 or 'leverage not modified' in ret_msg.lower():
+            logger.info(f"ℹ️ Bybit: {ret_msg} (retCode: {ret_code}) - يُعتبر نجاحاً")
+            return {'error': ret_msg, 'retCode': ret_code, 'acceptable': True}
+        
+        logger.error(f"❌ خطأ من Bybit API: {ret_msg}")
+        logger.error(f"   retCode: {ret_code}")
+        # إرجاع الاستجابة الكاملة لمعالجة الأخطاء بشكل أفضل
+        return {'error': ret_msg, 'retCode': ret_code}
+    
+    def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """إرسال طلب إلى Bybit API - محسّن مع توقيع صحيح"""
+        group = rate_limiter.endpoint_group('bybit', endpoint)
         try:
-            # بناء التوقيع بطريقة مختلفة حسب نوع الطلب
-            if method == 'GET':
-                # للطلبات GET: استخدام query string
-                params_str = urlencode(sorted(params.items())) if params else ""
-                signature = self._generate_signature(timestamp, recv_window, params_str)
+            for attempt in range(rate_limiter.max_retries + 1):
+                # انتظار الدور في حد المفتاح قبل التوقيع (الطابع الزمني يُحسب بعد الانتظار)
+                rate_limiter.acquire('bybit', self.api_key, group)
                 
-                headers = {
-                    'X-BAPI-API-KEY': self.api_key,
-                    'X-BAPI-SIGN': signature,
-                    'X-BAPI-TIMESTAMP': timestamp,
-                    'X-BAPI-RECV-WINDOW': recv_window,
-                    'X-BAPI-SIGN-TYPE': '2',
-                    'Content-Type': 'application/json'
-                }
-                
-                url = f"{self.base_url}{endpoint}"
-                if params_str:
-                    url += f"?{params_str}"
+                try:
+                    url, headers, body = self._build_request(method, endpoint, params)
+                except ValueError as e:
+                    logger.error(f"❌ {e}")
+                    return None
                 
-                response = requests.get(url, headers=headers, timeout=10)
-                
-            elif method == 'POST':
-                # للطلبات POST: استخدام JSON body
-                import json
-                # ترتيب المعاملات أبجدياً لضمان توافق التوقيع
-                params_sorted = {}
-                if params:
-                    params_sorted = {k: params[k] for k in sorted(params.keys())}
-                    # استخدام json.dumps بدون مسافات
-                    params_str = json.dumps(params_sorted, separators=(',', ':'), sort_keys=True)
+                if method == 'GET':
+                    response = http_transport.get(url, headers=headers)
                 else:
-                    params_str = ""
-                signature = self._generate_signature(timestamp, recv_window, params_str)
+                    response = http_transport.post(url, headers=headers, data=body)
                 
-                headers = {
-                    'X-BAPI-API-KEY': self.api_key,
-                    'X-BAPI-SIGN': signature,
-                    'X-BAPI-TIMESTAMP': timestamp,
-                    'X-BAPI-RECV-WINDOW': recv_window,
-                    'X-BAPI-SIGN-TYPE': '2',
-                    'Content-Type': 'application/json'
-                }
-                
-                url = f"{self.base_url}{endpoint}"
-                logger.debug(f"📤 POST إلى {endpoint}")
-                logger.debug(f"📋 المعاملات المرتبة: {params_str}")
-                
-                # إرسال المعاملات كنص JSON لضمان التطابق التام مع التوقيع
-                if params_str:
-                    response = requests.post(url, headers=headers, data=params_str, timeout=10)
-                else:
-                    response = requests.post(url, headers=headers, timeout=10)
-            else:
-                logger.error(f"❌ نوع طلب غير مدعوم: {method}")
-                return None
-            
-            # معالجة الاستجابة
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('retCode') == 0:
-                    logger.debug(f"✅ نجح الطلب: {endpoint}")
-                    
-                    # للأوامر، نحتاج الاستجابة الكاملة لأن orderId قد يكون في result أو في المستوى الأعلى
-                    if endpoint == '/v5/order/create':
-                        # إرجاع الاستجابة الكاملة للأوامر
-                        logger.debug(f"📋 استجابة كاملة للأمر: {result}")
-                        return result
-                    else:
-                        # للطلبات الأخرى، إرجاع result فقط
-                        return result.get('result')
-                else:
-                    ret_msg = result.get('retMsg', '')
-                    ret_code = result.get('retCode', 0)
-                    
-                    # التعامل مع الأخطاء المقبولة (مثل leverage not modified)
-                    if ret_code == 110043 or 'leverage not modified' in ret_msg.lower():
-                        logger.info(f"ℹ️ Bybit: {ret_msg} (retCode: {ret_code}) - يُعتبر نجاحاً")
-                        return {'error': ret_msg, 'retCode': ret_code, 'acceptable': True}
-                    
-                    logger.error(f"❌ خطأ من Bybit API: {ret_msg}")
-                    logger.error(f"   retCode: {ret_code}")
-                    # إرجاع الاستجابة الكاملة لمعالجة الأخطاء بشكل أفضل
-                    return {'error': ret_msg, 'retCode': ret_code}
-            else:
-                logger.error(f"❌ Bybit API Error (HTTP {response.status_code}): {response.text}")
-                return {'error': f'HTTP {response.status_code}', 'details': response.text}
+                # معالجة الاستجابة
+                payload = response.json() if response.status_code == 200 else None
+                rate_limited = rate_limiter.update_from_response(
+                    'bybit', self.api_key, group, response.status_code, response.headers, payload
+                )
+                if rate_limited and attempt < rate_limiter.max_retries:
+                    continue
+                return self._parse_response(endpoint, response.status_code, payload, response.text)
             
         except requests.exceptions.Timeout:
             logger.error(f"❌ انتهت مهلة الاتصال بـ Bybit")
@@ -142,29 +184,28 @@ class BybitRealAccount:
             logger.error(traceback.format_exc())
             return {'error': str(e)}
     
-    def get_wallet_balance(self, market_type: str = 'unified') -> Optional[Dict]:
-        """
-        الحصول على رصيد المحفظة الحقيقي
-        market_type: 'unified' للحساب الموحد، 'spot' للسبوت، 'contract' للفيوتشر
+    def _public_key(self, endpoint: str, params: Dict) -> tuple:
+        """مفتاح دمج الطلبات العامة (لا يعتمد على مفتاح API)"""
+        return ('bybit', self.base_url, endpoint, tuple(sorted(params.items())))
+    
+    def _public_request(self, endpoint: str, params: Dict) -> Optional[Dict]:
         """
-        # دالة مساعدة لتحويل القيم بأمان
-        def safe_float(value, default=0.0):
-            try:
-                if value is None or value == '':
-                    return default
-                return float(value)
-            except (ValueError, TypeError):
-                return default
-        
-        # Bybit V5 API يدعم فقط UNIFIED account type
-        account_type = 'UNIFIED'
-        
-        logger.info(f"🔍 جلب رصيد المحفظة الموحدة من Bybit (نوع السوق: {market_type})")
-        
-        result = self._make_request('GET', '/v5/account/wallet-balance', {
-            'accountType': account_type
-        })
+        طلب بيانات سوق عامة بدون توقيع
         
+        الطلبات المتطابقة المتزامنة (من عدة متابعين لنفس الإشارة) تشترك في طلب HTTP واحد
+        """
+        def fetch():
+            rate_limiter.acquire('bybit', '', 'market')
+            response = http_transport.get(f"{self.base_url}{endpoint}", params=params)
+            payload = response.json() if response.status_code == 200 else None
+            rate_limiter.update_from_response('bybit', '', 'market', response.status_code, response.headers, payload)
+            return self._parse_response(endpoint, response.status_code, payload, response.text)
+        
+        return request_coalescer.call(self._public_key(endpoint, params), fetch)
+    
+    @staticmethod
+    def _parse_wallet_balance(result: Optional[Dict], market_type: str) -> Optional[Dict]:
+        """تحويل استجابة wallet-balance إلى صيغة الرصيد الموحدة"""
         # التحقق من وجود خطأ في الاستجابة
         if result and isinstance(result, dict) and 'error' in result:
             logger.error(f"❌ خطأ في الحصول على الرصيد: {result['error']}")
@@ -175,81 +216,97 @@ class BybitRealAccount:
             coins = account.get('coin', [])
             
             balance_data = {
-                'total_equity': safe_float(account.get('totalEquity', 0)),
-                'available_balance': safe_float(account.get('totalAvailableBalance', 0)),
-                'total_wallet_balance': safe_float(account.get('totalWalletBalance', 0)),
-                'unrealized_pnl': safe_float(account.get('totalPerpUPL', 0)),
-                'account_type': account_type,
+                'total_equity': _safe_float(account.get('totalEquity', 0)),
+                'available_balance': _safe_float(account.get('totalAvailableBalance', 0)),
+                'total_wallet_balance': _safe_float(account.get('totalWalletBalance', 0)),
+                'unrealized_pnl': _safe_float(account.get('totalPerpUPL', 0)),
+                'account_type': 'UNIFIED',
                 'market_type': market_type,
                 'coins': {}
             }
             
             for coin in coins:
                 coin_name = coin.get('coin')
-                equity = safe_float(coin.get('equity', 0))
+                equity = _safe_float(coin.get('equity', 0))
                 if equity > 0:
                     balance_data['coins'][coin_name] = {
                         'equity': equity,
-                        'available': safe_float(coin.get('availableToWithdraw', 0)),
-                        'wallet_balance': safe_float(coin.get('walletBalance', 0)),
-                        'unrealized_pnl': safe_float(coin.get('unrealisedPnl', 0))
+                        'available': _safe_float(coin.get('availableToWithdraw', 0)),
+                        'wallet_balance': _safe_float(coin.get('walletBalance', 0)),
+                        'unrealized_pnl': _safe_float(coin.get('unrealisedPnl', 0))
                     }
             
             return balance_data
         
         return None
     
-    def get_open_positions(self, category: str = 'linear') -> List[Dict]:
-        """الحصول على الصفقات المفتوحة الحقيقية"""
-        result = self._make_request('GET', '/v5/position/list', {
-            'category': category,
-            'settleCoin': 'USDT'
+    def get_wallet_balance(self, market_type: str = 'unified') -> Optional[Dict]:
+        """
+        الحصول على رصيد المحفظة الحقيقي
+        market_type: 'unified' للحساب الموحد، 'spot' للسبوت، 'contract' للفيوتشر
+        """
+        # النسخة المحلية من البث الخاص إذا كانت حية
+        mirror = private_stream_manager.get_live_mirror(self.api_key)
+        if mirror is not None and mirror.wallet is not None:
+            return self._parse_wallet_balance({'list': [mirror.wallet]}, market_type)
+        
+        # Bybit V5 API يدعم فقط UNIFIED account type
+        logger.info(f"🔍 جلب رصيد المحفظة الموحدة من Bybit (نوع السوق: {market_type})")
+        
+        result = self._make_request('GET', '/v5/account/wallet-balance', {
+            'accountType': 'UNIFIED'
         })
         
+        return self._parse_wallet_balance(result, market_type)
+    
+    @staticmethod
+    def _parse_positions(result: Optional[Dict]) -> List[Dict]:
+        """تحويل استجابة position/list إلى قائمة الصفقات المفتوحة"""
         # التحقق من وجود خطأ في الاستجابة
         if result and isinstance(result, dict) and 'error' in result:
             logger.error(f"❌ خطأ في الحصول على الصفقات: {result['error']}")
             return []
         
-        # دالة مساعدة لتحويل القيم بأمان
-        def safe_float(value, default=0.0):
-            try:
-                if value is None or value == '':
-                    return default
-                return float(value)
-            except (ValueError, TypeError):
-                return default
-        
         positions = []
         if result and 'list' in result:
             for pos in result['list']:
-                size = safe_float(pos.get('size', 0))
+                size = _safe_float(pos.get('size', 0))
                 if size > 0:
                     positions.append({
                         'symbol': pos.get('symbol'),
                         'side': pos.get('side'),
                         'size': size,
-                        'entry_price': safe_float(pos.get('avgPrice', 0)),
-                        'mark_price': safe_float(pos.get('markPrice', 0)),
-                        'unrealized_pnl': safe_float(pos.get('unrealisedPnl', 0)),
+                        'entry_price': _safe_float(pos.get('avgPrice', 0)),
+                        'mark_price': _safe_float(pos.get('markPrice', 0)),
+                        'unrealized_pnl': _safe_float(pos.get('unrealisedPnl', 0)),
                         'leverage': pos.get('leverage', '1'),
-                        'liquidation_price': safe_float(pos.get('liqPrice', 0)),
-                        'take_profit': safe_float(pos.get('takeProfit', 0)),
-                        'stop_loss': safe_float(pos.get('stopLoss', 0)),
+                        'liquidation_price': _safe_float(pos.get('liqPrice', 0)),
+                        'take_profit': _safe_float(pos.get('takeProfit', 0)),
+                        'stop_loss': _safe_float(pos.get('stopLoss', 0)),
                         'created_time': pos.get('createdTime')
                     })
         
         return positions
     
-    def place_order(self, category: str, symbol: str, side: str, order_type: str,
-                   qty: float, price: float = None, leverage: int = None,
-                   take_profit: float = None, stop_loss: float = None,
-                   reduce_only: bool = False) -> Optional[Dict]:
-        """وضع أمر تداول حقيقي"""
+    def get_open_positions(self, category: str = 'linear') -> List[Dict]:
+        """الحصول على الصفقات المفتوحة الحقيقية"""
+        # النسخة المحلية من البث الخاص إذا كانت حية
+        mirror = private_stream_manager.get_live_mirror(self.api_key, category)
+        if mirror is not None:
+            return self._parse_positions({'list': mirror.get_positions(category)})
         
-        # جلب معلومات الرمز للتحقق من الحد الأدنى
-        instrument_info = self.get_instrument_info(symbol, category)
+        result = self._make_request('GET', '/v5/position/list', {
+            'category': category,
+            'settleCoin': 'USDT'
+        })
         
+        return self._parse_positions(result)
+    
+    def _build_order_params(self, category: str, symbol: str, side: str, order_type: str,
+                            qty: float, price: float = None, take_profit: float = None,
+                            stop_loss: float = None, reduce_only: bool = False,
+                            instrument_info: Optional[Dict] = None, order_link_id: str = None) -> Dict:
+        """تجهيز معاملات /v5/order/create مع تقريب الكمية حسب معلومات الرمز"""
         if instrument_info:
             min_qty = instrument_info['min_order_qty']
             qty_step = instrument_info['qty_step']
@@ -289,17 +346,25 @@ class BybitRealAccount:
         if stop_loss:
             params['stopLoss'] = str(stop_loss)
         
-        # تعيين الرافعة المالية أولاً إذا كانت محددة
-        if leverage and category in ['linear', 'inverse']:
-            leverage_result = self.set_leverage(category, symbol, leverage)
-            if not leverage_result:
-                logger.warning(f"⚠️ فشل تعيين الرافعة المالية {leverage}x لـ {symbol} - سيتم المتابعة بالرافعة الحالية")
-        
-        result = self._make_request('POST', '/v5/order/create', params)
+        # معرف ثابت للأمر - المنصة ترفض تكراره فلا تُنفذ الإشارة المعادة مرتين
+        if order_link_id:
+            params['orderLinkId'] = order_link_id
         
+        return params
+    
+    @staticmethod
+    def _parse_order_result(result: Optional[Dict], symbol: str, side: str, order_type: str,
+                            qty: float, price: float = None) -> Dict:
+        """تحليل استجابة /v5/order/create واستخراج orderId أو رسالة خطأ مترجمة"""
         # التحقق من وجود خطأ في الاستجابة
         if result and isinstance(result, dict) and 'error' in result:
             error_msg = result['error']
+            
+            # orderLinkId مكرر: الأمر نُفذ سابقاً (إعادة إشارة من السجل)
+            if result.get('retCode') == 110072:
+                logger.warning(f"🔁 الأمر {symbol} منفذ مسبقاً (orderLinkId مكرر) - لن يُعاد تنفيذه")
+                return {'error': 'الأمر منفذ مسبقاً', 'retCode': 110072, 'duplicate': True}
+            
             logger.error(f"❌ خطأ في وضع الأمر: {error_msg}")
             
             # ترجمة رسائل الخطأ الشائعة
@@ -374,35 +439,67 @@ class BybitRealAccount:
         logger.error(f"❌ استجابة فارغة من Bybit")
         return {'error': 'Empty result from Bybit'}
     
+    def place_order(self, category: str, symbol: str, side: str, order_type: str,
+                   qty: float, price: float = None, leverage: int = None,
+                   take_profit: float = None, stop_loss: float = None,
+                   reduce_only: bool = False, order_link_id: str = None) -> Optional[Dict]:
+        """وضع أمر تداول حقيقي"""
+        
+        # جلب معلومات الرمز للتحقق من الحد الأدنى
+        instrument_info = self.get_instrument_info(symbol, category)
+        
+        params = self._build_order_params(
+            category, symbol, side, order_type, qty, price,
+            take_profit, stop_loss, reduce_only, instrument_info, order_link_id
+        )
+        
+        # تعيين الرافعة المالية أولاً إذا كانت محددة
+        if leverage and category in ['linear', 'inverse']:
+            leverage_result = self.set_leverage(category, symbol, leverage)
+            if not leverage_result:
+                logger.warning(f"⚠️ فشل تعيين الرافعة المالية {leverage}x لـ {symbol} - سيتم المتابعة بالرافعة الحالية")
+        
+        result = self._make_request('POST', '/v5/order/create', params)
+        
+        return self._parse_order_result(result, symbol, side, order_type, float(params['qty']), price)
+    
+    @staticmethod
+    def _leverage_params(category: str, symbol: str, leverage: int) -> Dict:
+        """معاملات /v5/position/set-leverage"""
+        return {
+            'category': category,
+            'symbol': symbol,
+            'buyLeverage': str(leverage),
+            'sellLeverage': str(leverage)
+        }
+    
+    @staticmethod
+    def _parse_leverage_result(result: Optional[Dict], symbol: str, leverage: int) -> bool:
+        """تحليل نتيجة تعيين الرافعة (leverage not modified تُعتبر نجاحاً)"""
+        # التحقق من وجود خطأ في النتيجة
+        if result and isinstance(result, dict) and 'error' in result:
+            error_msg = result['error']
+            logger.warning(f"⚠️ تحذير من Bybit عند تعيين الرافعة: {error_msg}")
+            
+            # بعض الأخطاء مقبولة (مثل الرافعة مُعيّنة بالفعل)
+            if 'leverage not modified' in error_msg.lower():
+                logger.info(f"✅ الرافعة المالية {leverage}x مُعيّنة بالفعل لـ {symbol}")
+                return True  # نعتبرها نجاح
+            
+            return False
+        
+        if result is not None:
+            logger.info(f"✅ تم تعيين الرافعة المالية {leverage}x لـ {symbol}")
+            return True
+        
+        return False
+    
     def set_leverage(self, category: str, symbol: str, leverage: int) -> bool:
         """تعيين الرافعة المالية على المنصة"""
         try:
-            params = {
-                'category': category,
-                'symbol': symbol,
-                'buyLeverage': str(leverage),
-                'sellLeverage': str(leverage)
-            }
-            
+            params = self._leverage_params(category, symbol, leverage)
             result = self._make_request('POST', '/v5/position/set-leverage', params)
-            
-            # التحقق من وجود خطأ في النتيجة
-            if result and isinstance(result, dict) and 'error' in result:
-                error_msg = result['error']
-                logger.warning(f"⚠️ تحذير من Bybit عند تعيين الرافعة: {error_msg}")
-                
-                # بعض الأخطاء مقبولة (مثل الرافعة مُعيّنة بالفعل)
-                if 'leverage not modified' in error_msg.lower():
-                    logger.info(f"✅ الرافعة المالية {leverage}x مُعيّنة بالفعل لـ {symbol}")
-                    return True  # نعتبرها نجاح
-                
-                return False
-            
-            if result is not None:
-                logger.info(f"✅ تم تعيين الرافعة المالية {leverage}x لـ {symbol}")
-                return True
-            
-            return False
+            return self._parse_leverage_result(result, symbol, leverage)
             
         except Exception as e:
             logger.error(f"❌ خطأ في تعيين الرافعة المالية: {e}")
@@ -521,53 +618,76 @@ class BybitRealAccount:
     def get_ticker_price(self, symbol: str, category: str = "spot") -> Optional[float]:
         """الحصول على سعر الرمز الحالي"""
         try:
-            endpoint = "/v5/market/tickers"
-            # تحويل futures إلى linear للتوافق مع Bybit API
-            api_category = "linear" if category == "futures" else category
-            params = {"category": api_category, "symbol": symbol}
-            
-            result = self._make_request('GET', endpoint, params)
-            
-            if result and 'list' in result and result['list']:
-                return float(result['list'][0].get('lastPrice', 0))
-            
-            return None
+            result = self._public_request("/v5/market/tickers", self._ticker_params(symbol, category))
+            return self._parse_ticker_price(result)
             
         except Exception as e:
             logger.error(f"خطأ في الحصول على السعر: {e}")
             return None
     
+    @staticmethod
+    def _ticker_params(symbol: str, category: str) -> Dict:
+        """معاملات /v5/market/tickers (تحويل futures إلى linear للتوافق مع Bybit API)"""
+        api_category = "linear" if category == "futures" else category
+        return {"category": api_category, "symbol": symbol}
+    
+    @staticmethod
+    def _parse_ticker_price(result: Optional[Dict]) -> Optional[float]:
+        """استخراج lastPrice من استجابة tickers"""
+        if result and 'list' in result and result['list']:
+            return float(result['list'][0].get('lastPrice', 0))
+        return None
+    
+    @staticmethod
+    def _parse_instrument_info(result: Optional[Dict], symbol: str) -> Dict:
+        """استخراج الحد الأدنى للكمية وخطوة الكمية من استجابة instruments-info"""
+        if result and 'list' in result and result['list']:
+            instrument = result['list'][0]
+            
+            # استخراج المعلومات المطلوبة
+            min_order_qty = float(instrument.get('lotSizeFilter', {}).get('minOrderQty', 0) or 0)
+            qty_step = float(instrument.get('lotSizeFilter', {}).get('qtyStep', 0) or 0)
+            
+            logger.info(f"📋 معلومات الرمز {symbol}:")
+            logger.info(f"   الحد الأدنى: {min_order_qty}")
+            logger.info(f"   خطوة الكمية: {qty_step}")
+            
+            return {
+                'min_order_qty': min_order_qty if min_order_qty > 0 else 0.001,
+                'qty_step': qty_step if qty_step > 0 else 0.001
+            }
+        
+        # في حالة عدم وجود معلومات، إرجاع قيم افتراضية آمنة
+        logger.warning(f"⚠️ لم يتم العثور على معلومات الرمز {symbol} - استخدام القيم الافتراضية")
+        return {
+            'min_order_qty': 0.001,
+            'qty_step': 0.001
+        }
+    
+    @staticmethod
+    def _store_instrument_info(result: Optional[Dict], symbol: str, category: str):
+        """حفظ نتيجة طلب الرمز المفرد في سجل الرموز لتجنب تكرار الطلب"""
+        if result and result.get('list'):
+            instrument_registry.update_instrument(
+                symbol, category, instrument_registry._parse_instrument(result['list'][0], category)
+            )
+    
     def get_instrument_info(self, symbol: str, category: str) -> Optional[Dict]:
         """الحصول على معلومات الأداة المالية (مثل الحد الأدنى للكمية وخطوة الكمية)"""
+        # القراءة من سجل الرموز أولاً بدون طلب شبكة
+        cached = instrument_registry.get_instrument_info(symbol, category)
+        if cached:
+            return cached
+        
         try:
             api_category = "linear" if category == "futures" else category
-            result = self._make_request('GET', '/v5/market/instruments-info', {
+            result = self._public_request('/v5/market/instruments-info', {
                 'category': api_category,
                 'symbol': symbol
             })
             
-            if result and 'list' in result and result['list']:
-                instrument = result['list'][0]
-                
-                # استخراج المعلومات المطلوبة
-                min_order_qty = float(instrument.get('lotSizeFilter', {}).get('minOrderQty', 0) or 0)
-                qty_step = float(instrument.get('lotSizeFilter', {}).get('qtyStep', 0) or 0)
-                
-                logger.info(f"📋 معلومات الرمز {symbol}:")
-                logger.info(f"   الحد الأدنى: {min_order_qty}")
-                logger.info(f"   خطوة الكمية: {qty_step}")
-                
-                return {
-                    'min_order_qty': min_order_qty if min_order_qty > 0 else 0.001,
-                    'qty_step': qty_step if qty_step > 0 else 0.001
-                }
-            
-            # في حالة عدم وجود معلومات، إرجاع قيم افتراضية آمنة
-            logger.warning(f"⚠️ لم يتم العثور على معلومات الرمز {symbol} - استخدام القيم الافتراضية")
-            return {
-                'min_order_qty': 0.001,
-                'qty_step': 0.001
-            }
+            self._store_instrument_info(result, symbol, api_category)
+            return self._parse_instrument_info(result, symbol)
             
         except Exception as e:
             logger.error(f"❌ خطأ في الحصول على معلومات الرمز {symbol}: {e}")
@@ -635,16 +755,176 @@ class BybitRealAccount:
 
 
 
+class AsyncBybitRealAccount(AsyncExchangeBase):
+    """
+    النسخة غير المتزامنة من الحساب الحقيقي على Bybit
+    
+    تستخدم نفس التوقيع وتحليل الاستجابات في BybitRealAccount لكن عبر aiohttp،
+    فلا تحجز الـ event loop أثناء انتظار المنصة
+    """
+    
+    def __init__(self, account: BybitRealAccount):
+        super().__init__('bybit', account.api_key, account.api_secret)
+        self.account = account
+    
+    async def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Optional[Dict]:
+        """إرسال طلب غير متزامن إلى Bybit API"""
+        group = rate_limiter.endpoint_group('bybit', endpoint)
+        try:
+            for attempt in range(rate_limiter.max_retries + 1):
+                await rate_limiter.acquire_async('bybit', self.api_key, group)
+                
+                try:
+                    url, headers, body = self.account._build_request(method, endpoint, params)
+                except ValueError as e:
+                    logger.error(f"❌ {e}")
+                    return None
+                
+                if method == 'GET':
+                    response = await async_http_transport.get(url, headers=headers)
+                else:
+                    response = await async_http_transport.post(url, headers=headers, data=body)
+                
+                payload = response.json() if response.status_code == 200 else None
+                rate_limited = rate_limiter.update_from_response(
+                    'bybit', self.api_key, group, response.status_code, response.headers, payload
+                )
+                if rate_limited and attempt < rate_limiter.max_retries:
+                    continue
+                return self.account._parse_response(endpoint, response.status_code, payload, response.text)
+            
+        except requests.exceptions.Timeout:
+            logger.error(f"❌ انتهت مهلة الاتصال بـ Bybit")
+            return {'error': 'Connection timeout'}
+        except requests.exceptions.ConnectionError:
+            logger.error(f"❌ فشل الاتصال بـ Bybit")
+            return {'error': 'Connection failed'}
+        except Exception as e:
+            logger.error(f"❌ خطأ في طلب Bybit: {e}")
+            return {'error': str(e)}
+    
+    async def _public_request(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """طلب بيانات سوق عامة بدون توقيع مع دمج الطلبات المتطابقة"""
+        async def fetch():
+            await rate_limiter.acquire_async('bybit', '', 'market')
+            response = await async_http_transport.get(f"{self.account.base_url}{endpoint}", params=params)
+            payload = response.json() if response.status_code == 200 else None
+            rate_limiter.update_from_response('bybit', '', 'market', response.status_code, response.headers, payload)
+            return self.account._parse_response(endpoint, response.status_code, payload, response.text)
+        
+        return await request_coalescer.call_async(self.account._public_key(endpoint, params), fetch)
+    
+    async def get_wallet_balance(self, market_type: str = 'unified') -> Optional[Dict]:
+        """الحصول على رصيد المحفظة الحقيقي"""
+        mirror = private_stream_manager.get_live_mirror(self.api_key)
+        if mirror is not None and mirror.wallet is not None:
+            return self.account._parse_wallet_balance({'list': [mirror.wallet]}, market_type)
+        
+        result = await self._make_request('GET', '/v5/account/wallet-balance', {
+            'accountType': 'UNIFIED'
+        })
+        return self.account._parse_wallet_balance(result, market_type)
+    
+    async def get_positions(self, category: str = 'linear', symbol: str = None) -> List[Dict]:
+        """الحصول على الصفقات المفتوحة الحقيقية"""
+        mirror = private_stream_manager.get_live_mirror(self.api_key, category)
+        if mirror is not None:
+            return self.account._parse_positions({'list': mirror.get_positions(category, symbol)})
+        
+        params = {'category': category, 'settleCoin': 'USDT'}
+        if symbol:
+            params['symbol'] = symbol
+        result = await self._make_request('GET', '/v5/position/list', params)
+        return self.account._parse_positions(result)
+    
+    @latency_tracer.traced('exchange.set_leverage')
+    async def set_leverage(self, category: str, symbol: str, leverage: int) -> bool:
+        """تعيين الرافعة المالية على المنصة"""
+        try:
+            params = self.account._leverage_params(category, symbol, leverage)
+            result = await self._make_request('POST', '/v5/position/set-leverage', params)
+            return self.account._parse_leverage_result(result, symbol, leverage)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تعيين الرافعة المالية: {e}")
+            return False
+    
+    async def get_ticker(self, category: str, symbol: str) -> Optional[Dict]:
+        """الحصول على معلومات السعر"""
+        try:
+            result = await self._public_request('/v5/market/tickers', self.account._ticker_params(symbol, category))
+            price = self.account._parse_ticker_price(result)
+            if price:
+                return {'lastPrice': str(price)}
+            return None
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على السعر: {e}")
+            return None
+    
+    @latency_tracer.traced('exchange.instrument_lookup')
+    async def get_instrument_info(self, symbol: str, category: str) -> Optional[Dict]:
+        """الحصول على معلومات الأداة المالية"""
+        cached = instrument_registry.get_instrument_info(symbol, category)
+        if cached:
+            return cached
+
+        try:
+            api_category = "linear" if category == "futures" else category
+            result = await self._public_request('/v5/market/instruments-info', {
+                'category': api_category,
+                'symbol': symbol
+            })
+            self.account._store_instrument_info(result, symbol, api_category)
+            return self.account._parse_instrument_info(result, symbol)
+        except Exception as e:
+            logger.error(f"❌ خطأ في الحصول على معلومات الرمز {symbol}: {e}")
+            return {
+                'min_order_qty': 0.001,
+                'qty_step': 0.001
+            }
+    
+    @latency_tracer.traced('exchange.place_order')
+    async def place_order(self, category: str, symbol: str, side: str, order_type: str,
+                          qty: float, price: float = None, leverage: int = None,
+                          take_profit: float = None, stop_loss: float = None,
+                          reduce_only: bool = False, order_link_id: str = None) -> Optional[Dict]:
+        """وضع أمر تداول حقيقي"""
+        # معلومات الرمز والرافعة لا يعتمد أحدهما على الآخر - تنفيذهما بالتوازي
+        set_leverage_needed = bool(leverage and category in ['linear', 'inverse'])
+        if set_leverage_needed:
+            instrument_info, leverage_result = await asyncio.gather(
+                self.get_instrument_info(symbol, category),
+                self.set_leverage(category, symbol, leverage)
+            )
+            if not leverage_result:
+                logger.warning(f"⚠️ فشل تعيين الرافعة المالية {leverage}x لـ {symbol} - سيتم المتابعة بالرافعة الحالية")
+        else:
+            instrument_info = await self.get_instrument_info(symbol, category)
+        
+        params = self.account._build_order_params(
+            category, symbol, side, order_type, qty, price,
+            take_profit, stop_loss, reduce_only, instrument_info, order_link_id
+        )
+        
+        # زمن تأكيد المنصة للأمر فقط (بدون الرافعة ومعلومات الرمز)
+        with latency_tracer.span('exchange.order_ack'):
+            result = await self._make_request('POST', '/v5/order/create', params)
+        
+        return self.account._parse_order_result(result, symbol, side, order_type, float(params['qty']), price)
+
+
 class RealAccountManager:
     """مدير الحسابات الحقيقية - الواجهة الموحدة"""
     
     def __init__(self):
         self.accounts = {}  # {user_id: account_object}
+        self.async_accounts = {}  # {user_id: async_account_object}
     
     def initialize_account(self, user_id: int, exchange: str, api_key: str, api_secret: str):
         """تهيئة حساب حقيقي للمستخدم"""
         if exchange.lower() == 'bybit':
             self.accounts[user_id] = BybitRealAccount(api_key, api_secret)
+            # البث الخاص للصفقات والأوامر والرصيد (اتصال واحد لكل مفتاح)
+            private_stream_manager.start(self.accounts[user_id])
         else:
             logger.error(f"Exchange غير مدعوم: {exchange}")
         
@@ -654,10 +934,30 @@ class RealAccountManager:
         """الحصول على حساب المستخدم"""
         return self.accounts.get(user_id)
     
+    def get_async_account(self, user_id: int):
+        """الحصول على النسخة غير المتزامنة من حساب المستخدم (تُنشأ عند أول طلب)"""
+        account = self.accounts.get(user_id)
+        if account is None:
+            return None
+        
+        async_account = self.async_accounts.get(user_id)
+        if async_account is None or async_account.account is not account:
+            if isinstance(account, BybitRealAccount):
+                async_account = AsyncBybitRealAccount(account)
+            else:
+                logger.error(f"❌ لا توجد نسخة غير متزامنة لنوع الحساب: {type(account).__name__}")
+                return None
+            self.async_accounts[user_id] = async_account
+        return async_account
+    
     def remove_account(self, user_id: int):
         """إزالة حساب المستخدم"""
+        self.async_accounts.pop(user_id, None)
         if user_id in self.accounts:
-            del self.accounts[user_id]
+            account = self.accounts.pop(user_id)
+            # إيقاف البث فقط إذا لم يعد أي مستخدم آخر يستخدم نفس المفتاح
+            if not any(a.api_key == account.api_key for a in self.accounts.values()):
+                private_stream_manager.stop(account.api_key)
             logger.info(f"تم إزالة الحساب الحقيقي للمستخدم {user_id}")
 
 
@@ -189,6 +189,105 @@ class ExchangeBase(ABC):
         pass
 
 
+class AsyncExchangeBase(ABC):
+    """
+    الواجهة غير المتزامنة للمنصات (asyncio)
+
+    نفس عمليات التداول الأساسية لكن بدوال async لا تحجز الـ event loop أثناء طلبات HTTP،
+    بحيث يمكن لحلقة واحدة إبقاء مئات الأوامر قيد التنفيذ في نفس الوقت بدون threads.
+    الفئة (category) تُمرر بصيغة Bybit: 'spot' أو 'linear'
+    """
+
+    def __init__(self, name: str, api_key: str = None, api_secret: str = None):
+        self.name = name
+        self.api_key = api_key
+        self.api_secret = api_secret
+
+    @abstractmethod
+    async def place_order(self, category: str, symbol: str, side: str, order_type: str,
+                          qty: float, price: float = None, **kwargs) -> Optional[Dict]:
+        """
+        وضع أمر تداول
+
+        Returns:
+            dict: يحتوي على order_id إذا نجح، أو error إذا فشل
+        """
+        pass
+
+    @abstractmethod
+    async def get_positions(self, category: str = 'linear', symbol: str = None) -> List[Dict]:
+        """جلب الصفقات المفتوحة"""
+        pass
+
+    @abstractmethod
+    async def get_wallet_balance(self, market_type: str = 'unified') -> Optional[Dict]:
+        """جلب رصيد المحفظة"""
+        pass
+
+    @abstractmethod
+    async def set_leverage(self, category: str, symbol: str, leverage: int) -> bool:
+        """تعيين الرافعة المالية"""
+        pass
+
+    @abstractmethod
+    async def get_ticker(self, category: str, symbol: str) -> Optional[Dict]:
+        """
+        جلب السعر الحالي
+
+        Returns:
+            dict: {'lastPrice': str} أو None
+        """
+        pass
+
+    @abstractmethod
+    async def get_instrument_info(self, symbol: str, category: str) -> Optional[Dict]:
+        """
+        جلب معلومات الرمز
+
+        Returns:
+            dict: {'min_order_qty': float, 'qty_step': float}
+        """
+        pass
+
+    async def get_ticker_price(self, symbol: str, category: str = 'spot') -> Optional[float]:
+        """جلب السعر الحالي كرقم"""
+        ticker = await self.get_ticker(category, symbol)
+        if ticker and 'lastPrice' in ticker:
+            return float(ticker['lastPrice'])
+        return None
+
+    async def get_open_positions(self, category: str = 'linear') -> List[Dict]:
+        """اسم بديل متوافق مع واجهة الحساب الحقيقي المتزامنة"""
+        return await self.get_positions(category)
+
+    async def close_position(self, category: str, symbol: str, side: str = None) -> Optional[Dict]:
+        """إغلاق صفقة مفتوحة بأمر عكسي بكامل الحجم"""
+        positions = await self.get_positions(category, symbol)
+        position = next((p for p in positions if p['symbol'] == symbol), None)
+
+        if not position:
+            return None
+
+        # عكس الجهة للإغلاق
+        if side:
+            close_side = side
+        else:
+            close_side = 'Sell' if position['side'].lower() == 'buy' else 'Buy'
+
+        return await self.place_order(
+            category=category,
+            symbol=symbol,
+            side=close_side,
+            order_type='Market',
+            qty=position['size'],
+            reduce_only=category != 'spot'
+        )
+
+    async def close(self):
+        """تحرير موارد الاتصال (اختياري)"""
+        pass
+
+
 class ExchangeRegistry:
     """
     سجل المنصات - لإدارة جميع المنصات المدعومة
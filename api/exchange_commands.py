@@ -711,9 +711,11 @@ async def test_and_save_bybit_keys(user_id: int, api_key: str, api_secret: str,
         import time
         import requests
         from urllib.parse import urlencode
+        from api.http_transport import http_transport
         
         # اختبار الاتصال الحقيقي مع Bybit
-        base_url = "https://api.bybit.com"
+        from config import BYBIT_BASE_URL
+        base_url = BYBIT_BASE_URL
         
         # استخدام endpoint بسيط لاختبار الاتصال
         endpoint = "/v5/account/wallet-balance"
@@ -762,10 +764,9 @@ async def test_and_save_bybit_keys(user_id: int, api_key: str, api_secret: str,
             logger.debug(f"API Key (first 8 chars): {str(api_key)[:8]}...")
             logger.debug(f"Signature: {signature[:16]}...")
             
-            response = requests.get(
+            response = http_transport.get(
                 url,
-                headers=headers,
-                timeout=10
+                headers=headers
             )
             
             # تسجيل الاستجابة
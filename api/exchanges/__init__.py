@@ -6,7 +6,7 @@ Exchanges Module - مجلد المنصات
 """
 
 from .bybit_exchange import BybitExchange
-from .bitget_exchange import BitgetExchange
+from .bitget_exchange import BitgetExchange, AsyncBitgetExchange
 
 # TODO: استيراد المنصات الأخرى عند إضافتها
 # from .binance_exchange import BinanceExchange
@@ -16,6 +16,7 @@ from .bitget_exchange import BitgetExchange
 __all__ = [
     'BybitExchange',
     'BitgetExchange',
+    'AsyncBitgetExchange',
     # 'BinanceExchange',
     # 'OKXExchange',
     # 'CoinbaseExchange',
@@ -10,7 +10,6 @@ import hmac
 import hashlib
 import time
 import base64
-import requests
 from typing import Dict, Optional, List
 import json
 import sys
@@ -18,11 +17,24 @@ import os
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
-from api.exchange_base import ExchangeBase
+from api.exchange_base import ExchangeBase, AsyncExchangeBase
+from api.http_transport import http_transport, async_http_transport
+from api.rate_limiter import rate_limiter
+from api.request_coalescer import request_coalescer
 
 logger = logging.getLogger(__name__)
 
 
+def _safe_float(value, default=0.0):
+    """تحويل القيم إلى float بأمان"""
+    try:
+        if value is None or value == '':
+            return default
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
 class BitgetExchange(ExchangeBase):
     """تطبيق منصة Bitget - كامل وجاهز للاستخدام"""
     
@@ -54,63 +66,82 @@ class BitgetExchange(ExchangeBase):
         
         return base64.b64encode(signature).decode('utf-8')
     
-    def _make_request(self, method: str, endpoint: str, params: Dict = None, body: Dict = None) -> Optional[Dict]:
-        """إرسال طلب إلى Bitget API"""
+    def _build_request(self, method: str, endpoint: str, params: Dict = None, body: Dict = None):
+        """بناء الطلب الموقّع (URL، Headers، Body) دون إرساله"""
         if params is None:
             params = {}
         
         timestamp = str(int(time.time() * 1000))
         
-        try:
-            # بناء request_path
-            request_path = endpoint
-            if params and method == 'GET':
-                query_string = '&'.join([f"{k}={v}" for k, v in sorted(params.items())])
-                request_path += f"?{query_string}"
-            
-            # بناء body للطلبات POST
-            body_str = ''
-            if body and method == 'POST':
-                body_str = json.dumps(body, separators=(',', ':'))
-            
-            # توليد التوقيع
-            signature = self._generate_signature(timestamp, method, request_path, body_str)
-            
-            # بناء Headers
-            headers = {
-                'ACCESS-KEY': str(self.api_key),
-                'ACCESS-SIGN': signature,
-                'ACCESS-TIMESTAMP': timestamp,
-                'Content-Type': 'application/json',
-                'locale': 'en-US'
-            }
-            
-            # إضافة passphrase إن وجد
-            if self.passphrase:
-                headers['ACCESS-PASSPHRASE'] = self.passphrase
-            
-            # إرسال الطلب
-            url = f"{self.base_url}{request_path}"
-            
-            if method == 'GET':
-                response = requests.get(url, headers=headers, timeout=10)
-            elif method == 'POST':
-                response = requests.post(url, headers=headers, data=body_str, timeout=10)
+        # بناء request_path
+        request_path = endpoint
+        if params and method == 'GET':
+            query_string = '&'.join([f"{k}={v}" for k, v in sorted(params.items())])
+            request_path += f"?{query_string}"
+        
+        # بناء body للطلبات POST
+        body_str = ''
+        if body and method == 'POST':
+            body_str = json.dumps(body, separators=(',', ':'))
+        
+        # توليد التوقيع
+        signature = self._generate_signature(timestamp, method, request_path, body_str)
+        
+        # بناء Headers
+        headers = {
+            'ACCESS-KEY': str(self.api_key),
+            'ACCESS-SIGN': signature,
+            'ACCESS-TIMESTAMP': timestamp,
+            'Content-Type': 'application/json',
+            'locale': 'en-US'
+        }
+        
+        # إضافة passphrase إن وجد
+        if self.passphrase:
+            headers['ACCESS-PASSPHRASE'] = self.passphrase
+        
+        return f"{self.base_url}{request_path}", headers, body_str
+    
+    @staticmethod
+    def _parse_response(status_code: int, result: Optional[Dict]) -> Optional[Dict]:
+        """تحليل استجابة Bitget"""
+        if status_code == 200:
+            if result.get('code') == '00000':  # Bitget success code
+                return result.get('data')
             else:
-                logger.error(f"❌ نوع طلب غير مدعوم: {method}")
+                logger.error(f"❌ خطأ من Bitget API: {result.get('msg')}")
                 return None
-            
-            # معالجة الاستجابة
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('code') == '00000':  # Bitget success code
-                    return result.get('data')
+        else:
+            logger.error(f"❌ Bitget API Error (HTTP {status_code})")
+            return None
+    
+    def _make_request(self, method: str, endpoint: str, params: Dict = None, body: Dict = None) -> Optional[Dict]:
+        """إرسال طلب إلى Bitget API"""
+        if method not in ('GET', 'POST'):
+            logger.error(f"❌ نوع طلب غير مدعوم: {method}")
+            return None
+        
+        group = rate_limiter.endpoint_group('bitget', endpoint)
+        try:
+            for attempt in range(rate_limiter.max_retries + 1):
+                # انتظار الدور في حد المفتاح قبل التوقيع
+                rate_limiter.acquire('bitget', self.api_key, group)
+                url, headers, body_str = self._build_request(method, endpoint, params, body)
+                
+                # إرسال الطلب
+                if method == 'GET':
+                    response = http_transport.get(url, headers=headers)
                 else:
-                    logger.error(f"❌ خطأ من Bitget API: {result.get('msg')}")
-                    return None
-            else:
-                logger.error(f"❌ Bitget API Error (HTTP {response.status_code})")
-                return None
+                    response = http_transport.post(url, headers=headers, data=body_str)
+                
+                # معالجة الاستجابة
+                payload = response.json() if response.status_code == 200 else None
+                rate_limited = rate_limiter.update_from_response(
+                    'bitget', self.api_key, group, response.status_code, response.headers, payload
+                )
+                if rate_limited and attempt < rate_limiter.max_retries:
+                    continue
+                return self._parse_response(response.status_code, payload)
                 
         except Exception as e:
             logger.error(f"❌ خطأ في طلب Bitget: {e}")
@@ -160,6 +191,71 @@ class BitgetExchange(ExchangeBase):
             # في حالة الخطأ، نعيد True لتجنب حظر الإشارات
             return True
     
+    @staticmethod
+    def _parse_spot_assets(result) -> Optional[Dict]:
+        """تحويل استجابة أصول Spot إلى صيغة الرصيد الموحدة"""
+        if not result:
+            return None
+        
+        total_equity = 0.0
+        available_balance = 0.0
+        coins_data = {}
+        
+        for asset in result:
+            coin_name = asset.get('coinName', 'UNKNOWN')
+            available = _safe_float(asset.get('available', 0))
+            frozen = _safe_float(asset.get('frozen', 0))
+            total = available + frozen
+            
+            if total > 0:
+                total_equity += total
+                available_balance += available
+                
+                coins_data[coin_name] = {
+                    'equity': total,
+                    'available': available,
+                    'frozen': frozen,
+                    'wallet_balance': total,
+                    'unrealized_pnl': 0.0
+                }
+        
+        return {
+            'total_equity': total_equity,
+            'available_balance': available_balance,
+            'total_wallet_balance': total_equity,
+            'unrealized_pnl': 0.0,
+            'coins': coins_data,
+            'account_type': 'SPOT'
+        }
+    
+    @staticmethod
+    def _parse_futures_account(result) -> Optional[Dict]:
+        """تحويل استجابة حساب Futures (USDT-M) إلى صيغة الرصيد الموحدة"""
+        if not result:
+            return None
+        
+        total_equity = _safe_float(result.get('equity', 0))
+        available = _safe_float(result.get('available', 0))
+        frozen = _safe_float(result.get('frozen', 0))
+        unrealized_pnl = _safe_float(result.get('unrealizedPL', 0))
+        
+        return {
+            'total_equity': total_equity,
+            'available_balance': available,
+            'total_wallet_balance': total_equity - unrealized_pnl,
+            'unrealized_pnl': unrealized_pnl,
+            'coins': {
+                'USDT': {
+                    'equity': total_equity,
+                    'available': available,
+                    'frozen': frozen,
+                    'wallet_balance': total_equity - unrealized_pnl,
+                    'unrealized_pnl': unrealized_pnl
+                }
+            },
+            'account_type': 'FUTURES'
+        }
+    
     def get_wallet_balance(self, market_type: str = 'spot') -> Optional[Dict]:
         """
         جلب رصيد المحفظة
@@ -167,79 +263,18 @@ class BitgetExchange(ExchangeBase):
         Args:
             market_type: 'spot' أو 'futures'
         """
-        def safe_float(value, default=0.0):
-            try:
-                if value is None or value == '':
-                    return default
-                return float(value)
-            except (ValueError, TypeError):
-                return default
-        
         try:
             if market_type == 'spot':
                 # جلب رصيد Spot
                 result = self._make_request('GET', '/api/spot/v1/account/assets')
-                
-                if result:
-                    total_equity = 0.0
-                    available_balance = 0.0
-                    coins_data = {}
-                    
-                    for asset in result:
-                        coin_name = asset.get('coinName', 'UNKNOWN')
-                        available = safe_float(asset.get('available', 0))
-                        frozen = safe_float(asset.get('frozen', 0))
-                        total = available + frozen
-                        
-                        if total > 0:
-                            total_equity += total
-                            available_balance += available
-                            
-                            coins_data[coin_name] = {
-                                'equity': total,
-                                'available': available,
-                                'frozen': frozen,
-                                'wallet_balance': total,
-                                'unrealized_pnl': 0.0
-                            }
-                    
-                    return {
-                        'total_equity': total_equity,
-                        'available_balance': available_balance,
-                        'total_wallet_balance': total_equity,
-                        'unrealized_pnl': 0.0,
-                        'coins': coins_data,
-                        'account_type': 'SPOT'
-                    }
+                return self._parse_spot_assets(result)
             
             elif market_type == 'futures':
                 # جلب رصيد Futures (USDT-M)
                 result = self._make_request('GET', '/api/mix/v1/account/accounts', {
                     'productType': 'umcbl'  # USDT-M Futures
                 })
-                
-                if result:
-                    total_equity = safe_float(result.get('equity', 0))
-                    available = safe_float(result.get('available', 0))
-                    frozen = safe_float(result.get('frozen', 0))
-                    unrealized_pnl = safe_float(result.get('unrealizedPL', 0))
-                    
-                    return {
-                        'total_equity': total_equity,
-                        'available_balance': available,
-                        'total_wallet_balance': total_equity - unrealized_pnl,
-                        'unrealized_pnl': unrealized_pnl,
-                        'coins': {
-                            'USDT': {
-                                'equity': total_equity,
-                                'available': available,
-                                'frozen': frozen,
-                                'wallet_balance': total_equity - unrealized_pnl,
-                                'unrealized_pnl': unrealized_pnl
-                            }
-                        },
-                        'account_type': 'FUTURES'
-                    }
+                return self._parse_futures_account(result)
             
             return None
             
@@ -247,6 +282,39 @@ class BitgetExchange(ExchangeBase):
             logger.error(f"❌ خطأ في جلب الرصيد: {e}")
             return None
     
+    @staticmethod
+    def _order_request(symbol: str, side: str, order_type: str, quantity: float,
+                       price: float = None, market_type: str = 'spot'):
+        """تجهيز endpoint وbody لأمر Spot أو Futures"""
+        if market_type == 'spot':
+            # Spot Order
+            order_data = {
+                'symbol': symbol,
+                'side': side.lower(),
+                'orderType': 'market' if order_type.lower() == 'market' else 'limit',
+                'force': 'gtc',
+                'size': str(quantity)
+            }
+            endpoint = '/api/spot/v1/trade/orders'
+        
+        elif market_type == 'futures':
+            # Futures Order
+            order_data = {
+                'symbol': symbol,
+                'marginCoin': 'USDT',
+                'side': 'open_long' if side.lower() == 'buy' else 'open_short',
+                'orderType': 'market' if order_type.lower() == 'market' else 'limit',
+                'size': str(quantity)
+            }
+            endpoint = '/api/mix/v1/order/placeOrder'
+        else:
+            return None, None
+        
+        if price and order_type.lower() == 'limit':
+            order_data['price'] = str(price)
+        
+        return endpoint, order_data
+    
     def place_order(self, symbol: str, side: str, order_type: str,
                    quantity: float, price: float = None, **kwargs) -> Optional[Dict]:
         """
@@ -263,37 +331,12 @@ class BitgetExchange(ExchangeBase):
         market_type = kwargs.get('market_type', 'spot')
         
         try:
-            if market_type == 'spot':
-                # Spot Order
-                order_data = {
-                    'symbol': symbol,
-                    'side': side.lower(),
-                    'orderType': 'market' if order_type.lower() == 'market' else 'limit',
-                    'force': 'gtc',
-                    'size': str(quantity)
-                }
-                
-                if price and order_type.lower() == 'limit':
-                    order_data['price'] = str(price)
-                
-                result = self._make_request('POST', '/api/spot/v1/trade/orders', body=order_data)
-                return result
+            endpoint, order_data = self._order_request(symbol, side, order_type, quantity, price, market_type)
+            if not endpoint:
+                return None
             
-            elif market_type == 'futures':
-                # Futures Order
-                order_data = {
-                    'symbol': symbol,
-                    'marginCoin': 'USDT',
-                    'side': 'open_long' if side.lower() == 'buy' else 'open_short',
-                    'orderType': 'market' if order_type.lower() == 'market' else 'limit',
-                    'size': str(quantity)
-                }
-                
-                if price and order_type.lower() == 'limit':
-                    order_data['price'] = str(price)
-                
-                result = self._make_request('POST', '/api/mix/v1/order/placeOrder', body=order_data)
-                return result
+            result = self._make_request('POST', endpoint, body=order_data)
+            return result
             
         except Exception as e:
             logger.error(f"❌ خطأ في وضع الأمر: {e}")
@@ -412,6 +455,224 @@ class BitgetExchange(ExchangeBase):
         return "https://www.bitget.com/referral/register?from=referral&clacCode=YOUR_CODE"
 
 
+class AsyncBitgetExchange(AsyncExchangeBase):
+    """
+    النسخة غير المتزامنة من منصة Bitget
+    
+    تعيد استخدام التوقيع وتحليل الاستجابات في BitgetExchange عبر aiohttp
+    """
+    
+    def __init__(self, exchange: BitgetExchange):
+        super().__init__('bitget', exchange.api_key, exchange.api_secret)
+        self.exchange = exchange
+    
+    @staticmethod
+    def _market_type(category: str) -> str:
+        """تحويل فئة Bybit ('spot'/'linear') إلى نوع سوق Bitget"""
+        return 'spot' if category == 'spot' else 'futures'
+    
+    @staticmethod
+    def _api_symbol(symbol: str, category: str) -> str:
+        """صيغة الرمز في Bitget v1 (BTCUSDT_SPBL للسبوت، BTCUSDT_UMCBL للفيوتشر)"""
+        suffix = '_SPBL' if category == 'spot' else '_UMCBL'
+        return symbol if symbol.endswith(suffix) else f"{symbol}{suffix}"
+    
+    async def _make_request(self, method: str, endpoint: str, params: Dict = None, body: Dict = None) -> Optional[Dict]:
+        """إرسال طلب غير متزامن إلى Bitget API"""
+        if method not in ('GET', 'POST'):
+            logger.error(f"❌ نوع طلب غير مدعوم: {method}")
+            return None
+        
+        group = rate_limiter.endpoint_group('bitget', endpoint)
+        try:
+            for attempt in range(rate_limiter.max_retries + 1):
+                await rate_limiter.acquire_async('bitget', self.exchange.api_key, group)
+                url, headers, body_str = self.exchange._build_request(method, endpoint, params, body)
+                
+                if method == 'GET':
+                    response = await async_http_transport.get(url, headers=headers)
+                else:
+                    response = await async_http_transport.post(url, headers=headers, data=body_str)
+                
+                payload = response.json() if response.status_code == 200 else None
+                rate_limited = rate_limiter.update_from_response(
+                    'bitget', self.exchange.api_key, group, response.status_code, response.headers, payload
+                )
+                if rate_limited and attempt < rate_limiter.max_retries:
+                    continue
+                return self.exchange._parse_response(response.status_code, payload)
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في طلب Bitget: {e}")
+            return None
+    
+    async def _public_request(self, endpoint: str, params: Dict) -> Optional[Dict]:
+        """طلب بيانات سوق عامة - الطلبات المتطابقة المتزامنة تشترك في طلب واحد"""
+        key = ('bitget', self.exchange.base_url, endpoint, tuple(sorted(params.items())))
+        return await request_coalescer.call_async(key, lambda: self._make_request('GET', endpoint, params))
+    
+    async def get_wallet_balance(self, market_type: str = 'spot') -> Optional[Dict]:
+        """جلب رصيد المحفظة"""
+        try:
+            if market_type == 'spot':
+                result = await self._make_request('GET', '/api/spot/v1/account/assets')
+                return self.exchange._parse_spot_assets(result)
+            
+            result = await self._make_request('GET', '/api/mix/v1/account/accounts', {
+                'productType': 'umcbl'
+            })
+            return self.exchange._parse_futures_account(result)
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في جلب الرصيد: {e}")
+            return None
+    
+    async def get_positions(self, category: str = 'linear', symbol: str = None) -> List[Dict]:
+        """جلب الصفقات المفتوحة (Futures فقط) بنفس صيغة صفقات Bybit"""
+        if category == 'spot':
+            return []
+        
+        try:
+            params = {
+                'productType': 'umcbl',
+                'marginCoin': 'USDT'
+            }
+            
+            result = await self._make_request('GET', '/api/mix/v1/position/allPosition', params)
+            
+            positions = []
+            for pos in result or []:
+                size = abs(_safe_float(pos.get('total', 0)))
+                if size <= 0:
+                    continue
+                pos_symbol = str(pos.get('symbol', '')).replace('_UMCBL', '')
+                if symbol and pos_symbol != symbol.replace('_UMCBL', ''):
+                    continue
+                positions.append({
+                    'symbol': pos_symbol,
+                    'side': 'Buy' if pos.get('holdSide') == 'long' else 'Sell',
+                    'size': size,
+                    'entry_price': _safe_float(pos.get('averageOpenPrice', 0)),
+                    'mark_price': _safe_float(pos.get('marketPrice', 0)),
+                    'unrealized_pnl': _safe_float(pos.get('unrealizedPL', 0)),
+                    'leverage': pos.get('leverage', '1'),
+                    'liquidation_price': _safe_float(pos.get('liquidationPrice', 0))
+                })
+            return positions
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في جلب الصفقات: {e}")
+            return []
+    
+    async def set_leverage(self, category: str, symbol: str, leverage: int) -> bool:
+        """تعيين الرافعة المالية (Futures)"""
+        try:
+            result = await self._make_request('POST', '/api/mix/v1/account/setLeverage', body={
+                'symbol': symbol,
+                'marginCoin': 'USDT',
+                'leverage': str(leverage)
+            })
+            return result is not None
+        except Exception as e:
+            logger.error(f"❌ خطأ في تعيين الرافعة: {e}")
+            return False
+    
+    async def get_ticker(self, category: str, symbol: str) -> Optional[Dict]:
+        """جلب السعر الحالي"""
+        try:
+            if category == 'spot':
+                endpoint = '/api/spot/v1/market/ticker'
+            else:
+                endpoint = '/api/mix/v1/market/ticker'
+            
+            result = await self._public_request(endpoint, {
+                'symbol': self._api_symbol(symbol, category)
+            })
+            
+            if result:
+                price = _safe_float(result.get('last') or result.get('close'))
+                if price > 0:
+                    return {'lastPrice': str(price)}
+            return None
+            
+        except Exception as e:
+            logger.error(f"خطأ في الحصول على السعر: {e}")
+            return None
+    
+    async def get_instrument_info(self, symbol: str, category: str) -> Optional[Dict]:
+        """جلب الحد الأدنى للكمية وخطوة الكمية"""
+        default_info = {'min_order_qty': 0.001, 'qty_step': 0.001}
+        
+        try:
+            api_symbol = self._api_symbol(symbol, category)
+            
+            if category == 'spot':
+                result = await self._public_request('/api/spot/v1/public/product', {
+                    'symbol': api_symbol
+                })
+                if result:
+                    scale = int(_safe_float(result.get('quantityScale'), 3))
+                    return {
+                        'min_order_qty': _safe_float(result.get('minTradeAmount'), 0.001) or 0.001,
+                        'qty_step': 10 ** -scale
+                    }
+            else:
+                result = await self._public_request('/api/mix/v1/market/contracts', {
+                    'productType': 'umcbl'
+                })
+                for contract in result or []:
+                    if contract.get('symbol') == api_symbol:
+                        return {
+                            'min_order_qty': _safe_float(contract.get('minTradeNum'), 0.001) or 0.001,
+                            'qty_step': _safe_float(contract.get('sizeMultiplier'), 0.001) or 0.001
+                        }
+            
+            logger.warning(f"⚠️ لم يتم العثور على معلومات الرمز {symbol} - استخدام القيم الافتراضية")
+            return default_info
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في الحصول على معلومات الرمز {symbol}: {e}")
+            return default_info
+    
+    async def place_order(self, category: str, symbol: str, side: str, order_type: str,
+                          qty: float, price: float = None, leverage: int = None,
+                          reduce_only: bool = False, **kwargs) -> Optional[Dict]:
+        """وضع أمر تداول"""
+        market_type = self._market_type(category)
+        
+        try:
+            if leverage and market_type == 'futures':
+                if not await self.set_leverage(category, symbol, leverage):
+                    logger.warning(f"⚠️ فشل تعيين الرافعة المالية {leverage}x لـ {symbol} - سيتم المتابعة بالرافعة الحالية")
+            
+            endpoint, order_data = self.exchange._order_request(symbol, side, order_type, qty, price, market_type)
+            if not endpoint:
+                return {'error': f'Unsupported market type: {market_type}'}
+            
+            # الإغلاق في Bitget يتم بجهة close_long / close_short
+            if reduce_only and market_type == 'futures':
+                order_data['side'] = 'close_long' if side.lower() == 'sell' else 'close_short'
+            
+            result = await self._make_request('POST', endpoint, body=order_data)
+            
+            if result and result.get('orderId'):
+                return {
+                    'order_id': result.get('orderId'),
+                    'order_link_id': result.get('clientOid'),
+                    'symbol': symbol,
+                    'side': side,
+                    'type': order_type,
+                    'qty': qty,
+                    'price': price
+                }
+            
+            return {'error': 'Failed to place order on Bitget', 'details': result}
+            
+        except Exception as e:
+            logger.error(f"❌ خطأ في وضع الأمر: {e}")
+            return {'error': str(e)}
+
+
 # ملاحظات هامة لاستخدام Bitget:
 """
 📝 **متطلبات Bitget API:**
@@ -8,7 +8,6 @@ import logging
 import hmac
 import hashlib
 import time
-import requests
 from typing import Dict, Optional, List
 from urllib.parse import urlencode
 import sys
@@ -18,6 +17,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from api.exchange_base import ExchangeBase
+from api.http_transport import http_transport
+
+try:
+    from config import BYBIT_BASE_URL
+except ImportError:
+    BYBIT_BASE_URL = "https://api.bybit.com"
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +30,11 @@ logger = logging.getLogger(__name__)
 class BybitExchange(ExchangeBase):
     """تطبيق منصة Bybit"""
     
-    def __init__(self, name: str = 'bybit', api_key: str = None, api_secret: str = None):
+    def __init__(self, name: str = 'bybit', api_key: str = None, api_secret: str = None,
+                 base_url: str = None):
         super().__init__(name, api_key, api_secret)
-        self.base_url = "https://api.bybit.com"
+        # base_url قابل للتغيير (مثلاً إلى المحاكي المحلي)
+        self.base_url = (base_url or BYBIT_BASE_URL).rstrip('/')
         self.testnet_url = "https://api-testnet.bybit.com"
         self.use_testnet = False
         
@@ -73,7 +80,7 @@ class BybitExchange(ExchangeBase):
                 if params_str:
                     url += f"?{params_str}"
                 
-                response = requests.get(url, headers=headers, timeout=10)
+                response = http_transport.get(url, headers=headers)
                 
             elif method == 'POST':
                 import json
@@ -98,9 +105,9 @@ class BybitExchange(ExchangeBase):
                 url = f"{self._get_base_url()}{endpoint}"
                 
                 if params_str:
-                    response = requests.post(url, headers=headers, data=params_str, timeout=10)
+                    response = http_transport.post(url, headers=headers, data=params_str)
                 else:
-                    response = requests.post(url, headers=headers, timeout=10)
+                    response = http_transport.post(url, headers=headers)
             else:
                 logger.error(f"❌ نوع طلب غير مدعوم: {method}")
                 return None
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP Transport - طبقة الاتصال المشتركة مع المنصات
+جلسة requests واحدة لكل مضيف مع اتصالات keep-alive مُجمّعة وعدادات زمن الاستجابة
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# aiohttp اختياري - بدونه يعمل العميل غير المتزامن عبر الجلسات المتزامنة في executor
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# الإعدادات الافتراضية في حال عدم توفر ملف الإعدادات
+try:
+    from config import HTTP_TRANSPORT_SETTINGS
+except ImportError:
+    HTTP_TRANSPORT_SETTINGS = {
+        'pool_connections': 10,
+        'pool_maxsize': 32,
+        'max_retries': 0,
+        'connect_timeout': 3.05,
+        'read_timeout': 10,
+    }
+
+
+class _LatencyCounter:
+    """عداد زمن الاستجابة لمضيف أو endpoint واحد"""
+
+    __slots__ = ('requests', 'errors', 'total_ms', 'max_ms', 'last_ms')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def record(self, elapsed_ms: float, failed: bool):
+        self.requests += 1
+        if failed:
+            self.errors += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def to_dict(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.total_ms / self.requests, 2) if self.requests else 0.0,
+            'max_ms': round(self.max_ms, 2),
+            'last_ms': round(self.last_ms, 2),
+        }
+
+
+class HttpTransport:
+    """
+    طبقة HTTP مشتركة لجميع عملاء المنصات
+
+    - جلسة requests.Session لكل مضيف (scheme + host) تعيد استخدام اتصالات TCP/TLS
+    - حجم المجمع والمهلات قابلة للضبط من HTTP_TRANSPORT_SETTINGS
+    - عدادات زمن الاستجابة لكل مضيف ولكل endpoint
+    """
+
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None,
+                 max_retries: int = None, connect_timeout: float = None,
+                 read_timeout: float = None):
+        self.pool_connections = pool_connections or HTTP_TRANSPORT_SETTINGS.get('pool_connections', 10)
+        self.pool_maxsize = pool_maxsize or HTTP_TRANSPORT_SETTINGS.get('pool_maxsize', 32)
+        self.max_retries = max_retries if max_retries is not None else HTTP_TRANSPORT_SETTINGS.get('max_retries', 0)
+        self.default_timeout = (
+            connect_timeout or HTTP_TRANSPORT_SETTINGS.get('connect_timeout', 3.05),
+            read_timeout or HTTP_TRANSPORT_SETTINGS.get('read_timeout', 10),
+        )
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+        self._host_stats: Dict[str, _LatencyCounter] = {}
+        self._endpoint_stats: Dict[Tuple[str, str, str], _LatencyCounter] = {}
+        self._stats_lock = threading.Lock()
+
+    def _get_session(self, host_key: str) -> requests.Session:
+        """الحصول على الجلسة الخاصة بالمضيف أو إنشاؤها"""
+        session = self._sessions.get(host_key)
+        if session is not None:
+            return session
+
+        with self._sessions_lock:
+            session = self._sessions.get(host_key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    max_retries=self.max_retries,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host_key] = session
+                logger.debug(f"🔌 جلسة HTTP جديدة للمضيف {host_key}")
+        return session
+
+    def _record(self, host_key: str, method: str, path: str, elapsed_ms: float, failed: bool):
+        """تسجيل زمن الطلب في العدادات"""
+        with self._stats_lock:
+            host_counter = self._host_stats.get(host_key)
+            if host_counter is None:
+                host_counter = self._host_stats[host_key] = _LatencyCounter()
+            host_counter.record(elapsed_ms, failed)
+
+            endpoint_key = (host_key, method, path)
+            endpoint_counter = self._endpoint_stats.get(endpoint_key)
+            if endpoint_counter is None:
+                endpoint_counter = self._endpoint_stats[endpoint_key] = _LatencyCounter()
+            endpoint_counter.record(elapsed_ms, failed)
+
+    def request(self, method: str, url: str,
+                timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                **kwargs) -> requests.Response:
+        """
+        إرسال طلب عبر الجلسة المجمّعة للمضيف
+
+        الاستثناءات (Timeout / ConnectionError) تُمرر كما هي ليتعامل معها المستدعي
+        """
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+        method = method.upper()
+        session = self._get_session(host_key)
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = session.request(method, url, timeout=timeout or self.default_timeout, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._record(host_key, method, parts.path, elapsed_ms, failed)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """طلب GET"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """طلب POST"""
+        return self.request('POST', url, **kwargs)
+
+    def get_stats(self) -> Dict:
+        """إحصائيات زمن الاستجابة لكل مضيف ولكل endpoint"""
+        with self._stats_lock:
+            hosts = {host: counter.to_dict() for host, counter in self._host_stats.items()}
+            endpoints = {
+                f"{method} {host}{path}": counter.to_dict()
+                for (host, method, path), counter in self._endpoint_stats.items()
+            }
+        return {
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'sessions': len(self._sessions),
+            'hosts': hosts,
+            'endpoints': endpoints,
+        }
+
+    def reset_stats(self):
+        """تصفير العدادات"""
+        with self._stats_lock:
+            self._host_stats.clear()
+            self._endpoint_stats.clear()
+
+    def close(self):
+        """إغلاق جميع الجلسات المفتوحة"""
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                try:
+                    session.close()
+                except Exception as e:
+                    logger.warning(f"⚠️ خطأ في إغلاق جلسة HTTP: {e}")
+            self._sessions.clear()
+
+
+class AsyncResponse:
+    """استجابة مبسطة للطلبات غير المتزامنة بنفس واجهة requests.Response المستخدمة"""
+
+    __slots__ = ('status_code', 'text', 'headers')
+
+    def __init__(self, status_code: int, text: str, headers: Dict):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncHttpTransport:
+    """
+    النسخة غير المتزامنة من طبقة HTTP
+
+    - جلسة aiohttp واحدة لكل event loop مع مجمع اتصالات keep-alive لكل مضيف
+    - نفس المهلات ونفس عدادات زمن الاستجابة الخاصة بـ HttpTransport
+    - أخطاء المهلة والاتصال تُرفع كاستثناءات requests ليتعامل معها المستدعي بنفس الطريقة
+    """
+
+    def __init__(self, transport: HttpTransport):
+        self.transport = transport
+        self._sessions: Dict[asyncio.AbstractEventLoop, 'aiohttp.ClientSession'] = {}
+
+    def _client_timeout(self, timeout):
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+        return aiohttp.ClientTimeout(total=timeout)
+
+    @staticmethod
+    def _discard_session(session):
+        """
+        إغلاق جلسة تخص loop مغلقاً (لا يمكن await session.close() عليه من الـ loop الحالي)
+
+        على loop مغلق لا توجد اتصالات تنتظر الإغلاق فيكتمل close() بخطوة واحدة دون الحاجة لـ loop؛
+        إذا احتاج انتظاراً (إصدار مختلف من aiohttp) يُفصل الـ connector على الأقل فلا تبقى الجلسة معلقة
+        """
+        closing = session.close()
+        try:
+            closing.send(None)
+        except StopIteration:
+            return
+        except Exception as e:
+            logger.debug(f"تعذر إغلاق جلسة aiohttp قديمة: {e}")
+        closing.close()
+        session.detach()
+
+    def _get_session(self):
+        """جلسة aiohttp الخاصة بالـ event loop الحالي"""
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            # تنظيف جلسات الحلقات المغلقة (الطلبات القديمة التي كانت تنشئ loop لكل webhook)
+            for stale_loop in [l for l in self._sessions if l.is_closed()]:
+                self._discard_session(self._sessions.pop(stale_loop))
+
+            connector = aiohttp.TCPConnector(
+                limit=self.transport.pool_maxsize * self.transport.pool_connections,
+                limit_per_host=self.transport.pool_maxsize,
+                keepalive_timeout=30,
+            )
+            session = aiohttp.ClientSession(connector=connector)
+            self._sessions[loop] = session
+            logger.debug("🔌 جلسة aiohttp جديدة للـ event loop الحالي")
+        return session
+
+    async def request(self, method: str, url: str, headers: Dict = None, data: str = None,
+                      params: Dict = None,
+                      timeout: Optional[Union[float, Tuple[float, float]]] = None) -> AsyncResponse:
+        """إرسال طلب دون حجز الـ event loop"""
+        timeout = timeout or self.transport.default_timeout
+
+        if not AIOHTTP_AVAILABLE:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                None,
+                lambda: self.transport.request(method, url, headers=headers, data=data,
+                                               params=params, timeout=timeout)
+            )
+            return AsyncResponse(response.status_code, response.text, dict(response.headers))
+
+        parts = urlsplit(url)
+        host_key = f"{parts.scheme}://{parts.netloc}"
+        method = method.upper()
+        session = self._get_session()
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            async with session.request(method, url, headers=headers, data=data, params=params,
+                                       timeout=self._client_timeout(timeout)) as response:
+                text = await response.text()
+                failed = response.status >= 400
+                return AsyncResponse(response.status, text, dict(response.headers))
+        except asyncio.TimeoutError as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except aiohttp.ClientError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.transport._record(host_key, method, parts.path, elapsed_ms, failed)
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        """طلب GET"""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> AsyncResponse:
+        """طلب POST"""
+        return await self.request('POST', url, **kwargs)
+
+    async def close(self):
+        """إغلاق جلسة الـ event loop الحالي"""
+        if not AIOHTTP_AVAILABLE:
+            return
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+# مثيلات عامة مشتركة
+http_transport = HttpTransport()
+async_http_transport = AsyncHttpTransport(http_transport)
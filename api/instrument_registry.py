@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Instrument Registry - سجل معلومات الرموز
+معلومات الحد الأدنى للكمية وخطوة الكمية وخطوة السعر لجميع رموز Spot و Linear
+تُحمّل دفعة واحدة من /v5/market/instruments-info وتُحفظ على القرص وتُحدّث في الخلفية
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from api.http_transport import http_transport
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import INSTRUMENT_REGISTRY_SETTINGS
+except ImportError:
+    INSTRUMENT_REGISTRY_SETTINGS = {
+        'cache_file': 'instruments_cache.json',
+        'ttl_seconds': 3600,
+        'refresh_check_interval': 60,
+        'categories': ['spot', 'linear'],
+    }
+
+try:
+    from config import BYBIT_BASE_URL
+except ImportError:
+    BYBIT_BASE_URL = "https://api.bybit.com"
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ملفات الأزواج الموجودة في المشروع تُستخدم كبذرة أولية عند عدم وجود ملف الكاش
+SEED_FILES = {
+    'spot': os.path.join(PROJECT_ROOT, 'spot_pairs.json'),
+    'linear': os.path.join(PROJECT_ROOT, 'futures_pairs.json'),
+}
+
+
+def _safe_float(value, default=0.0):
+    """تحويل القيم إلى float بأمان"""
+    try:
+        if value is None or value == '':
+            return default
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+
+class InstrumentRegistry:
+    """
+    سجل الرموز لكل فئة (spot / linear)
+
+    - القراءة O(1) من الذاكرة بدون أي طلب شبكة
+    - البذرة من spot_pairs.json / futures_pairs.json ثم من ملف الكاش المحفوظ
+    - التحديث الكامل لكل فئة بطلب واحد (مع الصفحات) عند انتهاء TTL
+    """
+
+    def __init__(self, base_url: str = None, cache_file: str = None,
+                 ttl_seconds: int = None):
+        self.base_url = base_url or BYBIT_BASE_URL
+        cache_file = cache_file or INSTRUMENT_REGISTRY_SETTINGS.get('cache_file', 'instruments_cache.json')
+        self.cache_file = cache_file if os.path.isabs(cache_file) else os.path.join(PROJECT_ROOT, cache_file)
+        self.ttl_seconds = ttl_seconds or INSTRUMENT_REGISTRY_SETTINGS.get('ttl_seconds', 3600)
+        self.categories = list(INSTRUMENT_REGISTRY_SETTINGS.get('categories', ['spot', 'linear']))
+
+        self._instruments: Dict[str, Dict[str, Dict]] = {category: {} for category in self.categories}
+        self._last_refresh: Dict[str, float] = {category: 0.0 for category in self.categories}
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+        self._started = False
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize_category(category: str) -> str:
+        """futures تُعامل كـ linear"""
+        return 'linear' if category in ('futures', 'linear') else category
+
+    # ==================== القراءة ====================
+
+    def get(self, symbol: str, category: str) -> Optional[Dict]:
+        """معلومات الرمز الكاملة أو None"""
+        category = self._normalize_category(category)
+        return self._instruments.get(category, {}).get(symbol)
+
+    def get_instrument_info(self, symbol: str, category: str) -> Optional[Dict]:
+        """
+        معلومات الرمز بنفس صيغة BybitRealAccount.get_instrument_info
+
+        Returns:
+            {'min_order_qty', 'qty_step', 'tick_size'} أو None إذا لم تكن معلومات الكمية معروفة
+        """
+        info = self.get(symbol, category)
+        if info and info.get('qty_step') and info.get('min_order_qty'):
+            self.hits += 1
+            return {
+                'min_order_qty': info['min_order_qty'],
+                'qty_step': info['qty_step'],
+                'tick_size': info.get('tick_size', 0.0)
+            }
+        self.misses += 1
+        return None
+
+    def has_symbol(self, symbol: str, category: str) -> bool:
+        """هل الرمز معروف في هذه الفئة"""
+        return self.get(symbol, category) is not None
+
+    def get_symbols(self, category: str) -> List[str]:
+        """قائمة الرموز المعروفة في الفئة"""
+        category = self._normalize_category(category)
+        return list(self._instruments.get(category, {}).keys())
+
+    def is_stale(self, category: str) -> bool:
+        """هل انتهت صلاحية بيانات الفئة"""
+        category = self._normalize_category(category)
+        return (time.time() - self._last_refresh.get(category, 0.0)) > self.ttl_seconds
+
+    # ==================== التحميل ====================
+
+    @staticmethod
+    def _parse_instrument(item: Dict, category: str) -> Dict:
+        """تحويل عنصر من instruments-info إلى سجل مختصر"""
+        lot = item.get('lotSizeFilter', {}) or {}
+        price_filter = item.get('priceFilter', {}) or {}
+
+        # في Spot تأتي خطوة الكمية باسم basePrecision
+        qty_step = _safe_float(lot.get('qtyStep')) or _safe_float(lot.get('basePrecision'))
+        if category == 'spot':
+            min_notional = _safe_float(lot.get('minOrderAmt'))
+        else:
+            min_notional = _safe_float(lot.get('minNotionalValue'))
+
+        return {
+            'symbol': item.get('symbol'),
+            'status': item.get('status', ''),
+            'base_coin': item.get('baseCoin', ''),
+            'quote_coin': item.get('quoteCoin', ''),
+            'min_order_qty': _safe_float(lot.get('minOrderQty')),
+            'max_order_qty': _safe_float(lot.get('maxOrderQty') or lot.get('maxMktOrderQty')),
+            'qty_step': qty_step,
+            'tick_size': _safe_float(price_filter.get('tickSize')),
+            'min_notional': min_notional,
+        }
+
+    def update_instrument(self, symbol: str, category: str, info: Dict):
+        """تحديث رمز واحد (مثلاً من استجابة طلب مفرد)"""
+        category = self._normalize_category(category)
+        with self._lock:
+            current = dict(self._instruments.setdefault(category, {}).get(symbol, {'symbol': symbol}))
+            current.update({k: v for k, v in info.items() if v not in (None, '')})
+            self._instruments[category][symbol] = current
+
+    def seed_from_pairs(self) -> int:
+        """بذرة أولية من ملفات الأزواج (الرمز والحالة فقط بدون معلومات الكمية)"""
+        seeded = 0
+        for category, path in SEED_FILES.items():
+            if category not in self._instruments or not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    pairs = json.load(f)
+                with self._lock:
+                    table = self._instruments[category]
+                    for pair in pairs:
+                        symbol = pair.get('symbol')
+                        if symbol and symbol not in table:
+                            table[symbol] = {
+                                'symbol': symbol,
+                                'status': pair.get('status', ''),
+                                'base_coin': pair.get('baseCoin', ''),
+                                'quote_coin': pair.get('quoteCoin', ''),
+                            }
+                            seeded += 1
+            except Exception as e:
+                logger.warning(f"⚠️ فشل قراءة ملف الأزواج {path}: {e}")
+        return seeded
+
+    def load_cache(self) -> bool:
+        """تحميل السجل المحفوظ على القرص"""
+        if not os.path.exists(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with self._lock:
+                for category, instruments in data.get('instruments', {}).items():
+                    if category in self._instruments:
+                        self._instruments[category].update(instruments)
+                for category, refreshed_at in data.get('last_refresh', {}).items():
+                    if category in self._last_refresh:
+                        self._last_refresh[category] = float(refreshed_at)
+            logger.info(f"✅ تم تحميل سجل الرموز من {self.cache_file}")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ فشل تحميل سجل الرموز من القرص: {e}")
+            return False
+
+    def save_cache(self) -> bool:
+        """حفظ السجل على القرص (كتابة ذرية)"""
+        try:
+            with self._lock:
+                data = {
+                    'last_refresh': dict(self._last_refresh),
+                    'instruments': {category: dict(table) for category, table in self._instruments.items()},
+                }
+            tmp_path = f"{self.cache_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_path, self.cache_file)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ فشل حفظ سجل الرموز: {e}")
+            return False
+
+    def refresh(self, category: str) -> int:
+        """
+        تحميل جميع رموز الفئة من /v5/market/instruments-info (مع الصفحات)
+
+        Returns:
+            عدد الرموز المحملة (0 عند الفشل)
+        """
+        category = self._normalize_category(category)
+        instruments = {}
+        cursor = ''
+
+        try:
+            while True:
+                params = {'category': category, 'limit': 1000}
+                if cursor:
+                    params['cursor'] = cursor
+
+                response = http_transport.get(f"{self.base_url}/v5/market/instruments-info", params=params)
+                if response.status_code != 200:
+                    logger.warning(f"⚠️ فشل تحميل رموز {category} (HTTP {response.status_code})")
+                    return 0
+
+                data = response.json()
+                if data.get('retCode') != 0:
+                    logger.warning(f"⚠️ فشل تحميل رموز {category}: {data.get('retMsg')}")
+                    return 0
+
+                result = data.get('result', {}) or {}
+                for item in result.get('list', []):
+                    symbol = item.get('symbol')
+                    if symbol:
+                        instruments[symbol] = self._parse_instrument(item, category)
+
+                cursor = result.get('nextPageCursor') or ''
+                if not cursor:
+                    break
+
+        except Exception as e:
+            logger.warning(f"⚠️ خطأ في تحميل رموز {category}: {e}")
+            return 0
+
+        if instruments:
+            with self._lock:
+                self._instruments[category] = instruments
+                self._last_refresh[category] = time.time()
+            logger.info(f"✅ تم تحديث سجل رموز {category}: {len(instruments)} رمز")
+        return len(instruments)
+
+    def refresh_stale(self) -> bool:
+        """تحديث الفئات المنتهية الصلاحية فقط وحفظ السجل إذا تغير"""
+        changed = False
+        for category in self.categories:
+            if self.is_stale(category) and self.refresh(category):
+                changed = True
+        if changed:
+            self.save_cache()
+        return changed
+
+    # ==================== التشغيل في الخلفية ====================
+
+    def start(self):
+        """تحميل البذرة والكاش ثم بدء التحديث الدوري في الخلفية (آمن للاستدعاء أكثر من مرة)"""
+        if self._started:
+            return
+        self._started = True
+
+        seeded = self.seed_from_pairs()
+        self.load_cache()
+        logger.info(f"📋 سجل الرموز جاهز ({seeded} رمز من ملفات الأزواج)")
+
+        def refresh_loop():
+            interval = INSTRUMENT_REGISTRY_SETTINGS.get('refresh_check_interval', 60)
+            while not self._stop_event.is_set():
+                try:
+                    self.refresh_stale()
+                except Exception as e:
+                    logger.error(f"❌ خطأ في التحديث الدوري لسجل الرموز: {e}")
+                self._stop_event.wait(interval)
+
+        self._refresh_thread = threading.Thread(target=refresh_loop, name='instrument-registry', daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        """إيقاف التحديث الدوري"""
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict:
+        """إحصائيات السجل"""
+        now = time.time()
+        return {
+            'categories': {
+                category: {
+                    'symbols': len(self._instruments.get(category, {})),
+                    'age_seconds': round(now - self._last_refresh[category], 1) if self._last_refresh[category] else None,
+                    'stale': self.is_stale(category),
+                }
+                for category in self.categories
+            },
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# مثيل عام
+instrument_registry = InstrumentRegistry()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Latency Tracer - تتبع زمن معالجة الإشارات
+تتبع مراحل الإشارة (spans) من استقبال الـ webhook حتى تأكيد المنصة والحفظ في قاعدة البيانات،
+مع مدرجات تكرارية لكل مرحلة ونسب p50/p95/p99
+"""
+
+import contextvars
+import functools
+import inspect
+import itertools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import TRACING_SETTINGS
+except ImportError:
+    TRACING_SETTINGS = {
+        'enabled': True,
+        'window_size': 1000,
+        'recent_traces': 50,
+        'slow_trace_ms': 3000,
+    }
+
+# حدود خانات المدرج التكراري بالميلي ثانية
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# التتبع الحالي - ينتقل تلقائياً إلى المهام (asyncio tasks)، ويُنقل إلى الخيوط عبر wrap()
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('latency_trace', default=None)
+
+
+class LatencyHistogram:
+    """مدرج تكراري بخانات ثابتة + نافذة لآخر القيم لحساب النسب المئوية"""
+
+    def __init__(self, window_size: int):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.window: Deque[float] = deque(maxlen=window_size)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration_ms: float):
+        with self._lock:
+            self.buckets[bisect_left(HISTOGRAM_BOUNDS_MS, duration_ms)] += 1
+            self.window.append(duration_ms)
+            self.count += 1
+            self.total_ms += duration_ms
+            self.max_ms = max(self.max_ms, duration_ms)
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], percentile: float) -> float:
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, int(round(percentile / 100.0 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            values = sorted(self.window)
+            buckets = list(self.buckets)
+        labels = [f"le_{bound}" for bound in HISTOGRAM_BOUNDS_MS] + ['le_inf']
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0.0,
+            'p50_ms': round(self._percentile(values, 50), 2),
+            'p95_ms': round(self._percentile(values, 95), 2),
+            'p99_ms': round(self._percentile(values, 99), 2),
+            'max_ms': round(self.max_ms, 2),
+            'histogram': {label: count for label, count in zip(labels, buckets) if count},
+        }
+
+
+class Trace:
+    """تتبع إشارة واحدة - قائمة المراحل مع بدايتها ومدتها نسبةً لبداية التتبع"""
+
+    __slots__ = ('trace_id', 'name', 'attributes', 'started_at', 'started_perf', 'spans', 'duration_ms')
+
+    def __init__(self, trace_id: str, name: str, attributes: Dict):
+        self.trace_id = trace_id
+        self.name = name
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.started_perf = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.duration_ms: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'attributes': self.attributes,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'spans': list(self.spans),
+        }
+
+
+class LatencyTracer:
+    """
+    متتبع زمن الإشارات
+
+    - start_trace() عند استقبال الـ webhook ثم finish_trace() بعد انتهاء المعالجة
+    - span(stage) / traced(stage) لقياس مرحلة؛ كل قياس يُضاف لمدرج المرحلة ولتتبع الإشارة الحالي إن وجد
+    - wrap(fn) ينقل التتبع الحالي إلى خيط جديد (contextvars لا تنتقل تلقائياً بين الخيوط)
+    """
+
+    def __init__(self, settings: Dict = None):
+        settings = settings or TRACING_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        self.window_size = settings.get('window_size', 1000)
+        self.slow_trace_ms = settings.get('slow_trace_ms', 3000)
+
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._recent: Deque[Dict] = deque(maxlen=settings.get('recent_traces', 50))
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _histogram(self, stage: str) -> LatencyHistogram:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, LatencyHistogram(self.window_size))
+        return histogram
+
+    def record(self, stage: str, duration_ms: float, started_perf: float = None):
+        """تسجيل مدة مرحلة في المدرج وفي التتبع الحالي"""
+        if not self.enabled:
+            return
+        self._histogram(stage).record(duration_ms)
+        trace = _current_trace.get()
+        if trace is not None:
+            offset = (started_perf - trace.started_perf) * 1000 if started_perf else None
+            trace.spans.append({
+                'stage': stage,
+                'start_ms': round(offset, 2) if offset is not None else None,
+                'duration_ms': round(duration_ms, 2),
+            })
+
+    # ==================== التتبع ====================
+
+    def start_trace(self, name: str, **attributes) -> Optional[Trace]:
+        """بدء تتبع جديد وجعله التتبع الحالي في هذا السياق"""
+        if not self.enabled:
+            return None
+        trace = Trace(f"{int(time.time())}-{next(self._ids)}", name, attributes)
+        _current_trace.set(trace)
+        return trace
+
+    def finish_trace(self, trace: Optional[Trace] = None):
+        """إنهاء التتبع وتسجيل الزمن الكلي (end_to_end)"""
+        trace = trace or _current_trace.get()
+        if trace is None or trace.duration_ms is not None:
+            return
+        trace.duration_ms = round((time.perf_counter() - trace.started_perf) * 1000, 2)
+        self._histogram(f"{trace.name}.end_to_end").record(trace.duration_ms)
+        self._recent.append(trace.to_dict())
+        if trace.duration_ms >= self.slow_trace_ms:
+            stages = ', '.join(f"{s['stage']}={s['duration_ms']}ms" for s in trace.spans)
+            logger.warning(f"⚠️ إشارة بطيئة {trace.trace_id} ({trace.duration_ms}ms): {stages}")
+        if _current_trace.get() is trace:
+            _current_trace.set(None)
+
+    def mark(self, stage: str):
+        """تسجيل الزمن المنقضي منذ بداية التتبع الحالي كمرحلة (مثلاً لحظة الرد على الـ webhook)"""
+        trace = _current_trace.get()
+        if trace is not None:
+            self.record(stage, (time.perf_counter() - trace.started_perf) * 1000, trace.started_perf)
+
+    @staticmethod
+    def current_trace() -> Optional[Trace]:
+        return _current_trace.get()
+
+    @staticmethod
+    def detach():
+        """فصل التتبع عن السياق الحالي بعد تسليمه لخيط آخر (ينهيه الخيط الآخر)"""
+        _current_trace.set(None)
+
+    @staticmethod
+    def wrap(fn: Callable) -> Callable:
+        """تغليف دالة لتعمل داخل نسخة من السياق الحالي (لتمرير التتبع إلى threading.Thread)"""
+        context = contextvars.copy_context()
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            return context.run(fn, *args, **kwargs)
+        return run
+
+    # ==================== المراحل ====================
+
+    @contextmanager
+    def span(self, stage: str):
+        """قياس مرحلة داخل كتلة with (يعمل في الكود المتزامن وغير المتزامن)"""
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000, started)
+
+    def traced(self, stage: str) -> Callable:
+        """Decorator لقياس دالة كاملة (متزامنة أو async)"""
+        def decorator(fn: Callable) -> Callable:
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(stage):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ==================== الإحصائيات ====================
+
+    def get_stats(self) -> Dict:
+        """مدرجات ونسب كل مرحلة"""
+        return {stage: histogram.to_dict() for stage, histogram in sorted(self._histograms.items())}
+
+    def get_recent_traces(self, limit: int = 10) -> List[Dict]:
+        return list(self._recent)[-limit:]
+
+    def format_report(self) -> str:
+        """ملخص نصي لعرضه في تلجرام"""
+        stats = self.get_stats()
+        if not stats:
+            return "📭 لا توجد قياسات زمن بعد"
+        lines = ["⏱️ زمن مراحل الإشارة (ms)", "المرحلة: count | p50 | p95 | p99 | max", ""]
+        for stage, data in stats.items():
+            lines.append(f"{stage}: {data['count']} | {data['p50_ms']} | {data['p95_ms']} | "
+                         f"{data['p99_ms']} | {data['max_ms']}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._recent.clear()
+
+
+# مثيل عام
+latency_tracer = LatencyTracer()
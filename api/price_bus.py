@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Price Bus - ناقل الأسعار المشترك
+اتصال WebSocket عام واحد لكل منصة ونوع سوق يغذي جدول آخر سعر في الذاكرة
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# websocket-client اختياري - بدونه يعمل الناقل كجدول أسعار يغذيه REST فقط
+try:
+    import websocket
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+try:
+    from config import PRICE_BUS_SETTINGS
+except ImportError:
+    PRICE_BUS_SETTINGS = {
+        'enabled': True,
+        'max_age_seconds': 15,
+        'heartbeat_interval': 20,
+        'reconnect_delay': 1,
+        'max_reconnect_delay': 30,
+        'ws_urls': {},
+    }
+
+
+def _normalize_market_type(market_type: str) -> str:
+    """linear تُعامل كـ futures"""
+    return 'futures' if market_type in ('futures', 'linear') else 'spot'
+
+
+class _BybitTickerProtocol:
+    """صيغة رسائل قناة tickers العامة في Bybit v5"""
+
+    urls = {
+        'spot': 'wss://stream.bybit.com/v5/public/spot',
+        'futures': 'wss://stream.bybit.com/v5/public/linear',
+    }
+    # Bybit Spot يقبل 10 رموز كحد أقصى في رسالة الاشتراك الواحدة
+    batch_size = 10
+    ping_message = json.dumps({'op': 'ping'})
+
+    @staticmethod
+    def subscribe_messages(symbols: List[str], market_type: str, op: str = 'subscribe') -> List[str]:
+        batch = _BybitTickerProtocol.batch_size
+        return [
+            json.dumps({'op': op, 'args': [f"tickers.{symbol}" for symbol in symbols[i:i + batch]]})
+            for i in range(0, len(symbols), batch)
+        ]
+
+    @staticmethod
+    def parse(message: Dict) -> List[Tuple[str, float]]:
+        topic = message.get('topic', '')
+        if not topic.startswith('tickers.'):
+            return []
+        data = message.get('data') or {}
+        # رسائل delta في linear قد لا تحتوي على lastPrice
+        price = data.get('lastPrice')
+        if not price:
+            return []
+        return [(data.get('symbol') or topic[len('tickers.'):], float(price))]
+
+
+class _BitgetTickerProtocol:
+    """صيغة رسائل قناة ticker العامة في Bitget v2"""
+
+    urls = {
+        'spot': 'wss://ws.bitget.com/v2/ws/public',
+        'futures': 'wss://ws.bitget.com/v2/ws/public',
+    }
+    batch_size = 50
+    ping_message = 'ping'
+
+    @staticmethod
+    def subscribe_messages(symbols: List[str], market_type: str, op: str = 'subscribe') -> List[str]:
+        inst_type = 'USDT-FUTURES' if market_type == 'futures' else 'SPOT'
+        batch = _BitgetTickerProtocol.batch_size
+        return [
+            json.dumps({'op': op, 'args': [
+                {'instType': inst_type, 'channel': 'ticker', 'instId': symbol}
+                for symbol in symbols[i:i + batch]
+            ]})
+            for i in range(0, len(symbols), batch)
+        ]
+
+    @staticmethod
+    def parse(message: Dict) -> List[Tuple[str, float]]:
+        if (message.get('arg') or {}).get('channel') != 'ticker':
+            return []
+        updates = []
+        for item in message.get('data') or []:
+            price = item.get('lastPr')
+            if item.get('instId') and price:
+                updates.append((item['instId'], float(price)))
+        return updates
+
+
+PROTOCOLS = {
+    'bybit': _BybitTickerProtocol,
+    'bitget': _BitgetTickerProtocol,
+}
+
+
+class _TickerStream:
+    """اتصال WebSocket واحد لمنصة ونوع سوق مع إعادة الاتصال وإعادة الاشتراك تلقائياً"""
+
+    def __init__(self, bus: 'PriceBus', exchange: str, market_type: str, url: str, protocol):
+        self.bus = bus
+        self.exchange = exchange
+        self.market_type = market_type
+        self.url = url
+        self.protocol = protocol
+
+        self.symbols = set()
+        self._lock = threading.Lock()
+        self._ws = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.connected = False
+
+        self.messages = 0
+        self.reconnects = 0
+        self.last_message_at = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"price-bus-{self.exchange}-{self.market_type}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _send(self, messages: List[str]):
+        ws = self._ws
+        if ws is None or not self.connected:
+            return
+        for message in messages:
+            try:
+                ws.send(message)
+            except Exception as e:
+                logger.warning(f"⚠️ فشل الإرسال إلى {self.exchange} {self.market_type} WS: {e}")
+                return
+
+    def add_symbols(self, symbols: Iterable[str]):
+        with self._lock:
+            new_symbols = [s for s in symbols if s not in self.symbols]
+            self.symbols.update(new_symbols)
+        if new_symbols:
+            self._send(self.protocol.subscribe_messages(new_symbols, self.market_type))
+
+    def remove_symbols(self, symbols: Iterable[str]):
+        with self._lock:
+            removed = [s for s in symbols if s in self.symbols]
+            self.symbols.difference_update(removed)
+        if removed:
+            self._send(self.protocol.subscribe_messages(removed, self.market_type, op='unsubscribe'))
+
+    def _on_open(self, ws):
+        self.connected = True
+        with self._lock:
+            symbols = sorted(self.symbols)
+        logger.info(f"📡 تم الاتصال بـ {self.exchange} {self.market_type} WS ({len(symbols)} رمز)")
+        # إعادة الاشتراك بعد كل اتصال جديد
+        self._send(self.protocol.subscribe_messages(symbols, self.market_type))
+
+    def _on_message(self, ws, raw):
+        self.messages += 1
+        self.last_message_at = time.time()
+        if raw == 'pong':
+            return
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        for symbol, price in self.protocol.parse(message):
+            self.bus.publish(self.exchange, self.market_type, symbol, price, self.last_message_at)
+
+    def _on_error(self, ws, error):
+        logger.warning(f"⚠️ خطأ في {self.exchange} {self.market_type} WS: {error}")
+
+    def _on_close(self, ws, status_code=None, reason=None):
+        self.connected = False
+
+    def _heartbeat(self, ws):
+        interval = PRICE_BUS_SETTINGS.get('heartbeat_interval', 20)
+        while not self._stop_event.wait(interval):
+            if self._ws is not ws or not self.connected:
+                if self._ws is not ws:
+                    return
+                continue
+            try:
+                ws.send(self.protocol.ping_message)
+            except Exception:
+                return
+
+    def _run(self):
+        delay = PRICE_BUS_SETTINGS.get('reconnect_delay', 1)
+        max_delay = PRICE_BUS_SETTINGS.get('max_reconnect_delay', 30)
+
+        while not self._stop_event.is_set():
+            started = time.time()
+            ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            self._ws = ws
+            threading.Thread(target=self._heartbeat, args=(ws,), daemon=True).start()
+            try:
+                ws.run_forever()
+            except Exception as e:
+                logger.error(f"❌ توقف {self.exchange} {self.market_type} WS: {e}")
+            finally:
+                self.connected = False
+                self._ws = None
+
+            if self._stop_event.is_set():
+                break
+
+            # تصفير التأخير إذا استمر الاتصال فترة معقولة
+            if time.time() - started > max_delay:
+                delay = PRICE_BUS_SETTINGS.get('reconnect_delay', 1)
+            self.reconnects += 1
+            logger.info(f"🔌 إعادة الاتصال بـ {self.exchange} {self.market_type} WS بعد {delay} ثانية")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, max_delay)
+
+    def get_stats(self) -> Dict:
+        return {
+            'url': self.url,
+            'connected': self.connected,
+            'symbols': len(self.symbols),
+            'messages': self.messages,
+            'reconnects': self.reconnects,
+            'last_message_age': round(time.time() - self.last_message_at, 2) if self.last_message_at else None,
+        }
+
+
+class PriceBus:
+    """
+    ناقل الأسعار المشترك
+
+    - subscribe/unsubscribe مع عداد مراجع لكل رمز
+    - اتصال WebSocket عام واحد لكل (منصة، نوع سوق) يُفتح عند أول اشتراك
+    - جدول آخر سعر مع وقت التحديث، ويمكن تغذيته أيضاً من طلبات REST عبر publish
+    - مستمعون (listeners) يُستدعون عند كل تحديث سعر
+    """
+
+    def __init__(self, ws_urls: Dict[str, Dict[str, str]] = None, enabled: bool = None):
+        self.enabled = PRICE_BUS_SETTINGS.get('enabled', True) if enabled is None else enabled
+        self.max_age_seconds = PRICE_BUS_SETTINGS.get('max_age_seconds', 15)
+        self.ws_urls = ws_urls if ws_urls is not None else PRICE_BUS_SETTINGS.get('ws_urls', {})
+
+        self._prices: Dict[Tuple[str, str, str], Tuple[float, float]] = {}
+        self._refcounts: Dict[Tuple[str, str], Dict[str, int]] = {}
+        self._streams: Dict[Tuple[str, str], _TickerStream] = {}
+        self._listeners: List[Callable] = []
+        self._lock = threading.Lock()
+
+    def _get_url(self, exchange: str, market_type: str) -> Optional[str]:
+        url = (self.ws_urls.get(exchange) or {}).get(market_type)
+        if url:
+            return url
+        protocol = PROTOCOLS.get(exchange)
+        return protocol.urls.get(market_type) if protocol else None
+
+    def _get_stream(self, exchange: str, market_type: str) -> Optional[_TickerStream]:
+        """الحصول على اتصال المنصة أو إنشاؤه (None إذا لم يكن البث متاحاً)"""
+        if not self.enabled or not WEBSOCKET_AVAILABLE or exchange not in PROTOCOLS:
+            return None
+        key = (exchange, market_type)
+        stream = self._streams.get(key)
+        if stream is None:
+            url = self._get_url(exchange, market_type)
+            if not url:
+                return None
+            stream = _TickerStream(self, exchange, market_type, url, PROTOCOLS[exchange])
+            self._streams[key] = stream
+            stream.start()
+        return stream
+
+    # ==================== الاشتراكات ====================
+
+    def subscribe(self, exchange: str, symbols: Iterable[str], market_type: str = 'spot') -> bool:
+        """
+        الاشتراك في أسعار رموز
+
+        Returns:
+            True إذا كانت الأسعار ستصل عبر WebSocket، False إذا كان الجدول يعتمد على REST فقط
+        """
+        exchange = exchange.lower()
+        market_type = _normalize_market_type(market_type)
+        new_symbols = []
+
+        with self._lock:
+            counts = self._refcounts.setdefault((exchange, market_type), {})
+            for symbol in symbols:
+                if counts.get(symbol, 0) == 0:
+                    new_symbols.append(symbol)
+                counts[symbol] = counts.get(symbol, 0) + 1
+            stream = self._get_stream(exchange, market_type)
+
+        if stream is not None and new_symbols:
+            stream.add_symbols(new_symbols)
+        return stream is not None
+
+    def unsubscribe(self, exchange: str, symbols: Iterable[str], market_type: str = 'spot'):
+        """إلغاء الاشتراك (يُلغى الرمز من الاتصال عند وصول عداده إلى صفر)"""
+        exchange = exchange.lower()
+        market_type = _normalize_market_type(market_type)
+        removed = []
+
+        with self._lock:
+            counts = self._refcounts.get((exchange, market_type), {})
+            for symbol in symbols:
+                if symbol not in counts:
+                    continue
+                counts[symbol] -= 1
+                if counts[symbol] <= 0:
+                    del counts[symbol]
+                    removed.append(symbol)
+            stream = self._streams.get((exchange, market_type))
+
+        if stream is not None and removed:
+            stream.remove_symbols(removed)
+
+    def get_subscriptions(self, exchange: str, market_type: str = 'spot') -> List[str]:
+        """الرموز المشترك بها حالياً"""
+        market_type = _normalize_market_type(market_type)
+        return list(self._refcounts.get((exchange.lower(), market_type), {}).keys())
+
+    def add_listener(self, callback: Callable[[str, str, str, float], None]):
+        """إضافة مستمع يُستدعى بـ (exchange, market_type, symbol, price) عند كل تحديث"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable):
+        """إزالة مستمع"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    # ==================== جدول الأسعار ====================
+
+    def publish(self, exchange: str, market_type: str, symbol: str, price: float, timestamp: float = None):
+        """تحديث سعر في الجدول (من WebSocket أو من طلب REST)"""
+        if not price:
+            return
+        exchange = exchange.lower()
+        market_type = _normalize_market_type(market_type)
+        self._prices[(exchange, market_type, symbol)] = (float(price), timestamp or time.time())
+
+        for callback in list(self._listeners):
+            try:
+                callback(exchange, market_type, symbol, float(price))
+            except Exception as e:
+                logger.error(f"❌ خطأ في مستمع الأسعار: {e}")
+
+    def publish_many(self, exchange: str, market_type: str, prices: Dict[str, float], timestamp: float = None):
+        """تحديث أسعار عدة رموز دفعة واحدة (لقطة كاملة من REST)"""
+        exchange = exchange.lower()
+        market_type = _normalize_market_type(market_type)
+        timestamp = timestamp or time.time()
+        self._prices.update({
+            (exchange, market_type, symbol): (float(price), timestamp)
+            for symbol, price in prices.items() if price
+        })
+
+        if self._listeners:
+            for symbol, price in prices.items():
+                if not price:
+                    continue
+                for callback in list(self._listeners):
+                    try:
+                        callback(exchange, market_type, symbol, float(price))
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في مستمع الأسعار: {e}")
+
+    def get_price_with_time(self, exchange: str, symbol: str, market_type: str = 'spot') -> Optional[Tuple[float, float]]:
+        """آخر سعر مع وقت تحديثه أو None"""
+        return self._prices.get((exchange.lower(), _normalize_market_type(market_type), symbol))
+
+    def get_price(self, exchange: str, symbol: str, market_type: str = 'spot',
+                  max_age: float = None) -> Optional[float]:
+        """آخر سعر إذا لم يتجاوز عمره max_age ثانية"""
+        entry = self.get_price_with_time(exchange, symbol, market_type)
+        if entry is None:
+            return None
+        price, updated_at = entry
+        max_age = self.max_age_seconds if max_age is None else max_age
+        if max_age and time.time() - updated_at > max_age:
+            return None
+        return price
+
+    def get_prices(self, exchange: str, symbols: Iterable[str], market_type: str = 'spot',
+                   max_age: float = None) -> Dict[str, float]:
+        """أسعار عدة رموز (الرموز بدون سعر حديث لا تظهر في النتيجة)"""
+        prices = {}
+        for symbol in symbols:
+            price = self.get_price(exchange, symbol, market_type, max_age)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def is_streaming(self, exchange: str, market_type: str = 'spot') -> bool:
+        """هل اتصال WebSocket للمنصة متصل حالياً"""
+        stream = self._streams.get((exchange.lower(), _normalize_market_type(market_type)))
+        return bool(stream and stream.connected)
+
+    def stop(self):
+        """إغلاق جميع الاتصالات"""
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams.clear()
+        for stream in streams:
+            stream.stop()
+
+    def get_stats(self) -> Dict:
+        """إحصائيات الاتصالات والجدول"""
+        return {
+            'enabled': self.enabled and WEBSOCKET_AVAILABLE,
+            'prices': len(self._prices),
+            'streams': {f"{exchange}:{market_type}": stream.get_stats()
+                        for (exchange, market_type), stream in self._streams.items()},
+        }
+
+
+# مثيل عام
+price_bus = PriceBus()
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Private Stream - البث الخاص للحسابات الحقيقية
+اتصال WebSocket خاص لكل مفتاح API (order / execution / position / wallet) مع نسخة محلية حية من الحساب
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# websocket-client اختياري - بدونه تبقى القراءة عبر REST كما كانت
+try:
+    import websocket
+    WEBSOCKET_AVAILABLE = True
+except ImportError:
+    WEBSOCKET_AVAILABLE = False
+
+try:
+    from config import PRIVATE_STREAM_SETTINGS
+except ImportError:
+    PRIVATE_STREAM_SETTINGS = {
+        'enabled': True,
+        'url': 'wss://stream.bybit.com/v5/private',
+        'heartbeat_interval': 20,
+        'resync_interval': 300,
+        'reconnect_delay': 1,
+        'max_reconnect_delay': 30,
+        'max_executions': 200,
+    }
+
+TOPICS = ['order', 'execution', 'position', 'wallet']
+
+# حالات الأوامر المنتهية التي تُزال من قائمة الأوامر المفتوحة
+FINAL_ORDER_STATUSES = {'Filled', 'Cancelled', 'Rejected', 'Deactivated', 'PartiallyFilledCanceled'}
+
+# الفئات التي تتم مزامنتها من REST (Spot لا يملك صفقات في Bybit v5)
+SYNC_CATEGORIES = ['linear']
+
+
+def _updated_time(item: Dict) -> int:
+    try:
+        return int(item.get('updatedTime') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class AccountMirror:
+    """
+    النسخة المحلية من حساب حقيقي
+
+    تحتفظ بالصفقات والأوامر المفتوحة والرصيد بصيغة Bybit الخام، وتُحدّث من البث الخاص
+    ومن لقطات REST. عند التعارض تُعتمد القيمة ذات updatedTime الأحدث
+    """
+
+    def __init__(self, max_executions: int = 200):
+        self.positions: Dict[tuple, Dict] = {}   # (category, symbol, positionIdx) -> position
+        self.orders: Dict[str, Dict] = {}        # orderId -> order
+        self.executions = deque(maxlen=max_executions)
+        self.wallet: Optional[Dict] = None
+        self.synced_categories = set()
+        self.last_update = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _position_key(item: Dict, category: str = None) -> tuple:
+        return (item.get('category') or category or 'linear', item.get('symbol'), int(item.get('positionIdx') or 0))
+
+    @staticmethod
+    def _normalize_position(item: Dict) -> Dict:
+        # رسائل البث تستخدم entryPrice بينما REST يستخدم avgPrice
+        if 'avgPrice' not in item and 'entryPrice' in item:
+            item = dict(item)
+            item['avgPrice'] = item['entryPrice']
+        return item
+
+    def apply_positions(self, items: List[Dict], category: str = None):
+        """تطبيق تحديثات الصفقات (من البث أو من REST)"""
+        with self._lock:
+            for item in items:
+                item = self._normalize_position(item)
+                key = self._position_key(item, category)
+                current = self.positions.get(key)
+                if current is not None and _updated_time(current) > _updated_time(item):
+                    continue
+                self.positions[key] = item
+            self.last_update = time.time()
+
+    def replace_positions(self, category: str, items: List[Dict], requested_at_ms: int = 0):
+        """
+        استبدال صفقات الفئة بلقطة REST كاملة (الصفقات غير الموجودة في اللقطة تُعتبر مغلقة)
+
+        الصفقات التي وصل تحديثها من البث بعد requested_at_ms تبقى كما هي
+        """
+        with self._lock:
+            snapshot = {}
+            for item in items:
+                item = self._normalize_position(item)
+                key = self._position_key(item, category)
+                current = self.positions.get(key)
+                # تحديث من البث وصل أثناء جلب اللقطة
+                if current is not None and _updated_time(current) > _updated_time(item):
+                    item = current
+                snapshot[key] = item
+            self.positions = {k: v for k, v in self.positions.items()
+                              if k[0] != category or _updated_time(v) > requested_at_ms}
+            self.positions.update(snapshot)
+            self.synced_categories.add(category)
+            self.last_update = time.time()
+
+    def apply_orders(self, items: List[Dict]):
+        """تطبيق تحديثات الأوامر"""
+        with self._lock:
+            for item in items:
+                order_id = item.get('orderId')
+                if not order_id:
+                    continue
+                if item.get('orderStatus') in FINAL_ORDER_STATUSES:
+                    self.orders.pop(order_id, None)
+                else:
+                    current = self.orders.get(order_id)
+                    if current is None or _updated_time(item) >= _updated_time(current):
+                        self.orders[order_id] = item
+            self.last_update = time.time()
+
+    def replace_orders(self, category: str, items: List[Dict]):
+        """استبدال الأوامر المفتوحة للفئة بلقطة REST"""
+        with self._lock:
+            self.orders = {k: v for k, v in self.orders.items() if (v.get('category') or 'linear') != category}
+            for item in items:
+                item.setdefault('category', category)
+                if item.get('orderId'):
+                    self.orders[item['orderId']] = item
+            self.last_update = time.time()
+
+    def apply_executions(self, items: List[Dict]):
+        """إضافة التنفيذات الجديدة"""
+        with self._lock:
+            self.executions.extend(items)
+            self.last_update = time.time()
+
+    def apply_wallet(self, items: List[Dict]):
+        """تحديث الرصيد (الحساب الموحد)"""
+        with self._lock:
+            for item in items:
+                if item.get('accountType', 'UNIFIED') == 'UNIFIED':
+                    self.wallet = item
+            self.last_update = time.time()
+
+    def get_positions(self, category: str = 'linear', symbol: str = None) -> List[Dict]:
+        """الصفقات الخام للفئة"""
+        with self._lock:
+            return [dict(p) for (cat, sym, _), p in self.positions.items()
+                    if cat == category and (symbol is None or sym == symbol)]
+
+    def get_orders(self, category: str = None, symbol: str = None) -> List[Dict]:
+        """الأوامر المفتوحة"""
+        with self._lock:
+            return [dict(o) for o in self.orders.values()
+                    if (category is None or (o.get('category') or 'linear') == category)
+                    and (symbol is None or o.get('symbol') == symbol)]
+
+    def get_executions(self, limit: int = 50) -> List[Dict]:
+        """آخر التنفيذات"""
+        with self._lock:
+            return list(self.executions)[-limit:]
+
+
+class PrivateStream:
+    """اتصال البث الخاص لمفتاح API واحد مع إعادة الاتصال وإعادة الاشتراك وإعادة المزامنة"""
+
+    def __init__(self, account, url: str = None):
+        self.account = account
+        self.url = url or PRIVATE_STREAM_SETTINGS.get('url', 'wss://stream.bybit.com/v5/private')
+        self.mirror = AccountMirror(PRIVATE_STREAM_SETTINGS.get('max_executions', 200))
+
+        self._ws = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._resync_lock = threading.Lock()
+        self.connected = False
+        self.authenticated = False
+        self.subscribed = False
+
+        self.messages = 0
+        self.reconnects = 0
+        self.resyncs = 0
+        self.last_message_at = 0.0
+        self.last_resync_at = 0.0
+
+    @property
+    def key_hint(self) -> str:
+        return f"{self.account.api_key[:6]}..."
+
+    def is_live(self, category: str = 'linear') -> bool:
+        """هل النسخة المحلية متزامنة والاتصال حي"""
+        max_silence = PRIVATE_STREAM_SETTINGS.get('heartbeat_interval', 20) * 2 + 10
+        return (self.subscribed
+                and category in self.mirror.synced_categories
+                and time.time() - self.last_message_at <= max_silence)
+
+    # ==================== دورة الاتصال ====================
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"private-stream-{self.key_hint}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def _auth_message(self) -> str:
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(
+            self.account.api_secret.encode('utf-8'),
+            f"GET/realtime{expires}".encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        return json.dumps({'op': 'auth', 'args': [self.account.api_key, expires, signature]})
+
+    def _on_open(self, ws):
+        self.connected = True
+        ws.send(self._auth_message())
+
+    def _on_message(self, ws, raw):
+        self.messages += 1
+        self.last_message_at = time.time()
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+
+        op = message.get('op')
+        if op == 'auth':
+            if message.get('success'):
+                self.authenticated = True
+                ws.send(json.dumps({'op': 'subscribe', 'args': TOPICS}))
+            else:
+                logger.error(f"❌ فشل مصادقة البث الخاص للمفتاح {self.key_hint}: {message.get('ret_msg')}")
+                self._stop_event.set()
+                ws.close()
+            return
+        if op == 'subscribe':
+            if message.get('success'):
+                self.subscribed = True
+                logger.info(f"📡 تم الاشتراك في البث الخاص للمفتاح {self.key_hint}")
+                # لقطة REST بعد كل اتصال لتغطية أي تحديثات فاتت أثناء الانقطاع
+                threading.Thread(target=self.resync, daemon=True).start()
+            return
+
+        topic = message.get('topic', '')
+        data = message.get('data') or []
+        if topic.startswith('position'):
+            self.mirror.apply_positions(data)
+        elif topic.startswith('order'):
+            self.mirror.apply_orders(data)
+        elif topic.startswith('execution'):
+            self.mirror.apply_executions(data)
+        elif topic.startswith('wallet'):
+            self.mirror.apply_wallet(data)
+
+    def _on_error(self, ws, error):
+        logger.warning(f"⚠️ خطأ في البث الخاص للمفتاح {self.key_hint}: {error}")
+
+    def _on_close(self, ws, status_code=None, reason=None):
+        self.connected = False
+        self.authenticated = False
+        self.subscribed = False
+        # بعد الانقطاع لا يُعتمد على النسخة المحلية حتى تكتمل المزامنة التالية
+        self.mirror.synced_categories.clear()
+
+    def _heartbeat(self, ws):
+        interval = PRIVATE_STREAM_SETTINGS.get('heartbeat_interval', 20)
+        resync_interval = PRIVATE_STREAM_SETTINGS.get('resync_interval', 300)
+        while not self._stop_event.wait(interval):
+            if self._ws is not ws:
+                return
+            if not self.connected:
+                continue
+            try:
+                ws.send(json.dumps({'op': 'ping'}))
+            except Exception:
+                return
+            # إعادة مزامنة دورية احتياطية
+            if self.subscribed and time.time() - self.last_resync_at > resync_interval:
+                self.resync()
+
+    def _run(self):
+        delay = PRIVATE_STREAM_SETTINGS.get('reconnect_delay', 1)
+        max_delay = PRIVATE_STREAM_SETTINGS.get('max_reconnect_delay', 30)
+
+        while not self._stop_event.is_set():
+            started = time.time()
+            ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            self._ws = ws
+            threading.Thread(target=self._heartbeat, args=(ws,), daemon=True).start()
+            try:
+                ws.run_forever()
+            except Exception as e:
+                logger.error(f"❌ توقف البث الخاص للمفتاح {self.key_hint}: {e}")
+            finally:
+                self._on_close(ws)
+                self._ws = None
+
+            if self._stop_event.is_set():
+                break
+
+            if time.time() - started > max_delay:
+                delay = PRIVATE_STREAM_SETTINGS.get('reconnect_delay', 1)
+            self.reconnects += 1
+            logger.info(f"🔌 إعادة الاتصال بالبث الخاص للمفتاح {self.key_hint} بعد {delay} ثانية")
+            self._stop_event.wait(delay)
+            delay = min(delay * 2, max_delay)
+
+    # ==================== المزامنة ====================
+
+    def resync(self) -> bool:
+        """لقطة REST كاملة للصفقات والأوامر والرصيد"""
+        if not self._resync_lock.acquire(blocking=False):
+            return False
+        try:
+            ok = True
+            for category in SYNC_CATEGORIES:
+                requested_at_ms = int(time.time() * 1000)
+                result = self.account._make_request('GET', '/v5/position/list', {
+                    'category': category, 'settleCoin': 'USDT'
+                })
+                if result and 'list' in result:
+                    self.mirror.replace_positions(category, result['list'], requested_at_ms)
+                else:
+                    ok = False
+
+                result = self.account._make_request('GET', '/v5/order/realtime', {
+                    'category': category, 'settleCoin': 'USDT'
+                })
+                if result and 'list' in result:
+                    self.mirror.replace_orders(category, result['list'])
+
+            result = self.account._make_request('GET', '/v5/account/wallet-balance', {'accountType': 'UNIFIED'})
+            if result and result.get('list'):
+                self.mirror.apply_wallet(result['list'])
+
+            self.resyncs += 1
+            self.last_resync_at = time.time()
+            if ok:
+                logger.info(f"✅ تمت مزامنة الحساب {self.key_hint} من REST")
+            return ok
+        except Exception as e:
+            logger.error(f"❌ خطأ في مزامنة الحساب {self.key_hint}: {e}")
+            return False
+        finally:
+            self._resync_lock.release()
+
+    def get_stats(self) -> Dict:
+        return {
+            'connected': self.connected,
+            'subscribed': self.subscribed,
+            'live': self.is_live(),
+            'positions': len(self.mirror.positions),
+            'open_orders': len(self.mirror.orders),
+            'messages': self.messages,
+            'reconnects': self.reconnects,
+            'resyncs': self.resyncs,
+            'last_message_age': round(time.time() - self.last_message_at, 1) if self.last_message_at else None,
+        }
+
+
+class PrivateStreamManager:
+    """مدير البث الخاص - اتصال واحد لكل مفتاح API مهما تعدد المستخدمون عليه"""
+
+    def __init__(self, url: str = None, enabled: bool = None):
+        self.url = url
+        self.enabled = PRIVATE_STREAM_SETTINGS.get('enabled', True) if enabled is None else enabled
+        self._streams: Dict[str, PrivateStream] = {}
+        self._lock = threading.Lock()
+
+    def start(self, account) -> Optional[PrivateStream]:
+        """بدء البث للحساب (أو إرجاع البث القائم لنفس المفتاح)"""
+        if not self.enabled or not WEBSOCKET_AVAILABLE or not account.api_key:
+            return None
+        with self._lock:
+            stream = self._streams.get(account.api_key)
+            if stream is None or stream.account.api_secret != account.api_secret:
+                if stream is not None:
+                    stream.stop()
+                stream = PrivateStream(account, self.url)
+                self._streams[account.api_key] = stream
+                stream.start()
+            return stream
+
+    def stop(self, api_key: str):
+        """إيقاف بث مفتاح"""
+        with self._lock:
+            stream = self._streams.pop(api_key, None)
+        if stream is not None:
+            stream.stop()
+
+    def get_stream(self, api_key: str) -> Optional[PrivateStream]:
+        return self._streams.get(api_key)
+
+    def get_live_mirror(self, api_key: str, category: str = 'linear') -> Optional[AccountMirror]:
+        """النسخة المحلية إذا كانت حية ومتزامنة، وإلا None (ليعود المستدعي إلى REST)"""
+        stream = self._streams.get(api_key)
+        if stream is not None and stream.is_live(category):
+            return stream.mirror
+        return None
+
+    def get_stats(self) -> Dict:
+        return {stream.key_hint: stream.get_stats() for stream in list(self._streams.values())}
+
+    def stop_all(self):
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams.clear()
+        for stream in streams:
+            stream.stop()
+
+
+# مثيل عام
+private_stream_manager = PrivateStreamManager()
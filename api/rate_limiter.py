@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate Limiter - محدد معدل الطلبات
+دلو رموز (token bucket) لكل (منصة، مفتاح API، مجموعة endpoints) يتكيف مع رؤوس حدود المنصة
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import RATE_LIMIT_SETTINGS
+except ImportError:
+    RATE_LIMIT_SETTINGS = {
+        'enabled': True,
+        'max_retries': 2,
+        'max_wait_seconds': 30,
+        'penalty_seconds': 1.0,
+        'limits': {
+            'bybit': {'order': 10, 'position': 10, 'account': 10, 'market': 50, 'default': 10},
+            'bitget': {'order': 10, 'position': 10, 'account': 10, 'market': 20, 'default': 10},
+        },
+    }
+
+# أكواد Bybit الخاصة بتجاوز الحد (الطلب مرفوض قبل المعالجة فيمكن إعادته)
+BYBIT_RATE_LIMIT_CODES = {10006, 10018}
+
+
+def _get_header(headers, name: str) -> Optional[str]:
+    """قراءة رأس بدون حساسية لحالة الأحرف (requests و aiohttp)"""
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is not None:
+        return value
+    lower = name.lower()
+    for key, value in headers.items():
+        if key.lower() == lower:
+            return value
+    return None
+
+
+class TokenBucket:
+    """
+    دلو رموز لمفتاح ومجموعة واحدة
+
+    reserve() يحجز رمزاً ويعيد مدة الانتظار؛ الرصيد قد يصبح سالباً فيتشكل طابور
+    بترتيب الحجز بدلاً من رفض الطلبات
+    """
+
+    def __init__(self, rate: float):
+        self.capacity = float(rate)
+        self.rate = float(rate)
+        self.tokens = float(rate)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def reserve(self) -> float:
+        """حجز رمز وإرجاع الثواني المطلوب انتظارها قبل الإرسال"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+            if self.blocked_until > now:
+                wait = max(wait, self.blocked_until - now)
+
+            self.requests += 1
+            if wait > 0:
+                self.waited += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+            return wait
+
+    def update_limits(self, limit: Optional[int], remaining: Optional[int], reset_at: Optional[float]):
+        """تكييف الدلو حسب رؤوس المنصة (limit / remaining / reset)"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit and limit > 0 and limit != self.capacity:
+                self.capacity = float(limit)
+                self.rate = float(limit)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+                if remaining <= 0 and reset_at:
+                    self.blocked_until = max(self.blocked_until, now + max(0.0, reset_at - time.time()))
+
+    def penalize(self, reset_at: Optional[float], penalty_seconds: float):
+        """تم رفض طلب بسبب تجاوز الحد - إيقاف الدلو حتى وقت إعادة التعيين"""
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, reset_at - time.time()) if reset_at else penalty_seconds
+            self.blocked_until = max(self.blocked_until, now + (delay or penalty_seconds))
+            self.tokens = min(self.tokens, 0.0)
+            self.throttled += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'rate': self.rate,
+            'tokens': round(self.tokens, 2),
+            'requests': self.requests,
+            'waited': self.waited,
+            'avg_wait_ms': round(self.total_wait / self.waited * 1000, 2) if self.waited else 0.0,
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+            'throttled': self.throttled,
+        }
+
+
+class RateLimiter:
+    """
+    محدد المعدل المشترك لجميع عملاء المنصات
+
+    - المفتاح: (exchange, api_key, group) حيث group مجموعة endpoints (order / position / account / market)
+    - الطلبات الزائدة تنتظر دورها بدلاً من الفشل
+    - رؤوس X-Bapi-Limit* من Bybit تضبط سعة الدلو والرصيد المتبقي ووقت إعادة التعيين
+    """
+
+    def __init__(self, settings: Dict = None):
+        settings = settings or RATE_LIMIT_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        self.max_retries = settings.get('max_retries', 2)
+        self.max_wait_seconds = settings.get('max_wait_seconds', 30)
+        self.penalty_seconds = settings.get('penalty_seconds', 1.0)
+        self.limits = settings.get('limits', {})
+
+        self._buckets: Dict[Tuple[str, str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoint_group(exchange: str, endpoint: str) -> str:
+        """تحديد مجموعة الـ endpoint (حدود المنصات تختلف حسب المجموعة)"""
+        path = endpoint.lower()
+        if 'market' in path or 'instruments' in path or 'ticker' in path:
+            return 'market'
+        if 'order' in path:
+            return 'order'
+        if 'position' in path or 'leverage' in path:
+            return 'position'
+        if 'account' in path or 'wallet' in path or 'asset' in path:
+            return 'account'
+        return 'default'
+
+    def _get_bucket(self, exchange: str, api_key: str, group: str) -> TokenBucket:
+        key = (exchange, api_key or '', group)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    exchange_limits = self.limits.get(exchange, {})
+                    rate = exchange_limits.get(group, exchange_limits.get('default', 10))
+                    bucket = self._buckets[key] = TokenBucket(rate)
+        return bucket
+
+    def _reserve(self, exchange: str, api_key: str, group: str) -> float:
+        wait = self._get_bucket(exchange, api_key, group).reserve()
+        if wait > self.max_wait_seconds:
+            logger.warning(f"⚠️ انتظار طويل لحد {exchange}/{group}: {wait:.1f} ثانية")
+        return min(wait, self.max_wait_seconds)
+
+    def acquire(self, exchange: str, api_key: str, group: str) -> float:
+        """انتظار الدور (متزامن) وإرجاع مدة الانتظار"""
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(exchange, api_key, group)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, exchange: str, api_key: str, group: str) -> float:
+        """انتظار الدور بدون حجز الـ event loop"""
+        if not self.enabled:
+            return 0.0
+        wait = self._reserve(exchange, api_key, group)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    @staticmethod
+    def _parse_headers(exchange: str, headers) -> Tuple[Optional[int], Optional[int], Optional[float]]:
+        """
+        استخراج (limit, remaining, reset_at بالثواني) من رؤوس الاستجابة
+
+        Bybit فقط ترسل رؤوس الحدود؛ Bitget لا ترسل رؤوساً موثقة فتبقى على الدلو الثابت
+        من الإعدادات مع التراجع عند رد 429
+        """
+        def to_int(value):
+            try:
+                return int(float(value))
+            except (TypeError, ValueError):
+                return None
+
+        if exchange == 'bybit':
+            limit = to_int(_get_header(headers, 'X-Bapi-Limit'))
+            remaining = to_int(_get_header(headers, 'X-Bapi-Limit-Status'))
+            reset_ms = to_int(_get_header(headers, 'X-Bapi-Limit-Reset-Timestamp'))
+            return limit, remaining, (reset_ms / 1000.0 if reset_ms else None)
+
+        return None, None, None
+
+    def update_from_response(self, exchange: str, api_key: str, group: str,
+                             status_code: int, headers, payload: Optional[Dict] = None) -> bool:
+        """
+        تحديث الدلو من الاستجابة
+
+        Returns:
+            True إذا كانت الاستجابة رفضاً بسبب تجاوز الحد ويجب إعادة الطلب
+        """
+        if not self.enabled:
+            return False
+
+        bucket = self._get_bucket(exchange, api_key, group)
+        limit, remaining, reset_at = self._parse_headers(exchange, headers)
+        if limit is not None or remaining is not None:
+            bucket.update_limits(limit, remaining, reset_at)
+
+        rate_limited = status_code == 429
+        if not rate_limited and exchange == 'bybit' and isinstance(payload, dict):
+            rate_limited = payload.get('retCode') in BYBIT_RATE_LIMIT_CODES
+
+        if rate_limited:
+            bucket.penalize(reset_at, self.penalty_seconds)
+            logger.warning(f"⚠️ تجاوز حد {exchange}/{group} للمفتاح {(api_key or '')[:6]}... - إعادة الطلب بعد الانتظار")
+        return rate_limited
+
+    def get_stats(self) -> Dict:
+        """مقاييس الانتظار لكل دلو"""
+        return {
+            f"{exchange}:{(api_key or '')[:6]}:{group}": bucket.to_dict()
+            for (exchange, api_key, group), bucket in list(self._buckets.items())
+        }
+
+
+# مثيل عام
+rate_limiter = RateLimiter()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request Coalescer - دمج الطلبات المتطابقة
+الطلبات العامة المتطابقة المتزامنة تشترك في طلب HTTP واحد ونتيجته (single-flight)
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import COALESCER_SETTINGS
+except ImportError:
+    COALESCER_SETTINGS = {
+        'enabled': True,
+        'freshness_seconds': 0.5,
+    }
+
+
+def _is_cacheable(result: Any) -> bool:
+    """الأخطاء والنتائج الفارغة لا تُحفظ بعد انتهاء الطلب"""
+    return result is not None and not (isinstance(result, dict) and 'error' in result)
+
+
+class _InFlight:
+    """طلب متزامن قيد التنفيذ ينتظره باقي المستدعين"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    دمج الطلبات المتطابقة
+
+    - نفس المفتاح أثناء تنفيذ طلب: ينتظر المستدعي نفس الطلب (coalesced)
+    - نفس المفتاح خلال نافذة الحداثة بعد نجاح الطلب: تُعاد النتيجة المحفوظة (hit)
+    - غير ذلك: يُنفذ طلب جديد (miss)
+    """
+
+    def __init__(self, freshness_seconds: float = None, enabled: bool = None):
+        self.freshness_seconds = (COALESCER_SETTINGS.get('freshness_seconds', 0.5)
+                                  if freshness_seconds is None else freshness_seconds)
+        self.enabled = COALESCER_SETTINGS.get('enabled', True) if enabled is None else enabled
+
+        self._cache: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._async_inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def _get_fresh(self, key: Hashable):
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] <= self.freshness_seconds:
+            return True, entry[1]
+        return False, None
+
+    def _store(self, key: Hashable, result: Any):
+        if _is_cacheable(result) and self.freshness_seconds > 0:
+            self._cache[key] = (time.monotonic(), result)
+            # تنظيف بسيط للمدخلات القديمة حتى لا يكبر الجدول بلا حد
+            if len(self._cache) > 5000:
+                cutoff = time.monotonic() - self.freshness_seconds
+                for stale_key in [k for k, (t, _) in self._cache.items() if t < cutoff]:
+                    self._cache.pop(stale_key, None)
+
+    def call(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """تنفيذ fn مرة واحدة لجميع المستدعين المتزامنين بنفس المفتاح"""
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            fresh, result = self._get_fresh(key)
+            if fresh:
+                self.hits += 1
+                return result
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                inflight = self._inflight[key] = _InFlight()
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            inflight.event.wait()
+            if inflight.error is not None:
+                raise inflight.error
+            return inflight.result
+
+        try:
+            inflight.result = fn()
+            with self._lock:
+                self._store(key, inflight.result)
+            return inflight.result
+        except Exception as e:
+            inflight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            inflight.event.set()
+
+    async def call_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """النسخة غير المتزامنة - المستدعون على نفس الـ event loop يشتركون في نفس الـ coroutine"""
+        if not self.enabled:
+            return await fn()
+
+        loop = asyncio.get_running_loop()
+        loop_key = (loop, key)
+
+        with self._lock:
+            fresh, result = self._get_fresh(key)
+            if fresh:
+                self.hits += 1
+                return result
+            future = self._async_inflight.get(loop_key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._async_inflight[loop_key] = loop.create_future()
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            result = await fn()
+            with self._lock:
+                self._store(key, result)
+            if not future.done():
+                future.set_result(result)
+            return result
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # تجنب تحذير "exception was never retrieved" عند عدم وجود منتظرين
+                future.exception()
+            raise
+        finally:
+            with self._lock:
+                self._async_inflight.pop(loop_key, None)
+
+    def get_stats(self) -> Dict:
+        """عدادات الإصابة والدمج"""
+        total = self.hits + self.coalesced + self.misses
+        return {
+            'freshness_seconds': self.freshness_seconds,
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses,
+            'saved_ratio': round((self.hits + self.coalesced) / total, 3) if total else 0.0,
+            'cached_keys': len(self._cache),
+        }
+
+    def reset_stats(self):
+        """تصفير العدادات"""
+        self.hits = self.coalesced = self.misses = 0
+
+
+# مثيل عام
+request_coalescer = RequestCoalescer()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ticker Snapshot - لقطة الأسعار الجماعية
+جلب أسعار جميع رموز الفئة بطلب واحد من /v5/market/tickers وتخزينها في جدول ناقل الأسعار
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from api.http_transport import http_transport
+from api.price_bus import price_bus
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import TICKER_SNAPSHOT_SETTINGS
+except ImportError:
+    TICKER_SNAPSHOT_SETTINGS = {
+        'base_url': 'https://api.bybit.com',
+        'max_age_seconds': 10,
+    }
+
+
+class TickerSnapshot:
+    """
+    لقطة أسعار Bybit الجماعية لكل فئة
+
+    - طلب واحد لكل فئة يعيد أسعار جميع الرموز، فتكلفة التحديث ثابتة مهما كان عدد الصفقات
+    - النتائج تُكتب في جدول price_bus المشترك مع وقت اللقطة
+    - طلب واحد فقط قيد التنفيذ لكل فئة (المستدعون المتزامنون ينتظرون نفس اللقطة)
+    """
+
+    exchange = 'bybit'
+
+    def __init__(self, base_url: str = None, max_age_seconds: float = None):
+        self.base_url = base_url or TICKER_SNAPSHOT_SETTINGS.get('base_url', 'https://api.bybit.com')
+        self.max_age_seconds = max_age_seconds or TICKER_SNAPSHOT_SETTINGS.get('max_age_seconds', 10)
+
+        self._last_refresh: Dict[str, float] = {}
+        self._locks = {'spot': threading.Lock(), 'futures': threading.Lock()}
+
+        self.refreshes = 0
+        self.failures = 0
+
+    @staticmethod
+    def _normalize_market_type(market_type: str) -> str:
+        return 'futures' if market_type in ('futures', 'linear') else 'spot'
+
+    def is_fresh(self, market_type: str) -> bool:
+        """هل آخر لقطة للفئة ما زالت صالحة"""
+        market_type = self._normalize_market_type(market_type)
+        return time.time() - self._last_refresh.get(market_type, 0.0) <= self.max_age_seconds
+
+    def refresh(self, market_type: str = 'spot') -> int:
+        """
+        جلب لقطة كاملة للفئة
+
+        Returns:
+            عدد الرموز المحدثة (0 عند الفشل)
+        """
+        market_type = self._normalize_market_type(market_type)
+        category = 'linear' if market_type == 'futures' else 'spot'
+
+        try:
+            response = http_transport.get(f"{self.base_url}/v5/market/tickers", params={'category': category})
+            if response.status_code != 200:
+                logger.warning(f"⚠️ فشل جلب لقطة الأسعار {category} (HTTP {response.status_code})")
+                self.failures += 1
+                return 0
+
+            data = response.json()
+            if data.get('retCode') != 0:
+                logger.warning(f"⚠️ فشل جلب لقطة الأسعار {category}: {data.get('retMsg')}")
+                self.failures += 1
+                return 0
+
+            prices = {}
+            for item in (data.get('result') or {}).get('list', []):
+                try:
+                    price = float(item.get('lastPrice') or 0)
+                except (TypeError, ValueError):
+                    continue
+                if item.get('symbol') and price > 0:
+                    prices[item['symbol']] = price
+
+            snapshot_time = time.time()
+            price_bus.publish_many(self.exchange, market_type, prices, snapshot_time)
+            self._last_refresh[market_type] = snapshot_time
+            self.refreshes += 1
+            logger.debug(f"📡 لقطة أسعار {category}: {len(prices)} رمز")
+            return len(prices)
+
+        except Exception as e:
+            logger.error(f"❌ خطأ في جلب لقطة الأسعار {category}: {e}")
+            self.failures += 1
+            return 0
+
+    def ensure_fresh(self, market_type: str = 'spot') -> bool:
+        """تحديث الفئة إذا كانت اللقطة قديمة (طلب واحد حتى مع تعدد المستدعين)"""
+        market_type = self._normalize_market_type(market_type)
+        if self.is_fresh(market_type):
+            return True
+        with self._locks[market_type]:
+            # ربما حدّثها مستدعٍ آخر أثناء الانتظار
+            if self.is_fresh(market_type):
+                return True
+            return self.refresh(market_type) > 0
+
+    def get_price(self, symbol: str, market_type: str = 'spot') -> Optional[float]:
+        """سعر رمز واحد من الجدول المشترك"""
+        return self.get_prices([symbol], market_type).get(symbol)
+
+    def get_prices(self, symbols: Iterable[str], market_type: str = 'spot') -> Dict[str, float]:
+        """
+        أسعار عدة رموز من الجدول المشترك
+
+        الأسعار الحديثة من WebSocket تُستخدم مباشرة، وإذا نقص أي رمز تُجلب لقطة الفئة كاملة مرة واحدة
+        """
+        market_type = self._normalize_market_type(market_type)
+        symbols = set(symbols)
+        prices = price_bus.get_prices(self.exchange, symbols, market_type, max_age=self.max_age_seconds)
+
+        if len(prices) < len(symbols) and self.ensure_fresh(market_type):
+            prices = price_bus.get_prices(self.exchange, symbols, market_type, max_age=self.max_age_seconds)
+        return prices
+
+    def get_stats(self) -> Dict:
+        """إحصائيات اللقطات"""
+        now = time.time()
+        return {
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'age_seconds': {market_type: round(now - refreshed_at, 1)
+                            for market_type, refreshed_at in self._last_refresh.items()},
+        }
+
+
+# مثيل عام
+ticker_snapshot = TickerSnapshot()
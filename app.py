@@ -8,6 +8,7 @@
 import os
 import sys
 import threading
+import contextvars
 import asyncio
 import time
 import logging
@@ -21,9 +22,15 @@ logger = logging.getLogger(__name__)
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # استيراد الوحدات المطلوبة
-from bybit_trading_bot import trading_bot
+from bybit_trading_bot import trading_bot, start_position_engine
 from web_server import WebServer
 from config import PORT
+from api.instrument_registry import instrument_registry
+from api.latency_tracer import latency_tracer
+from signals.signal_queue import signal_ingestion_queue
+from signals.signal_journal import signal_journal
+from systems.telegram_dispatcher import telegram_dispatcher
+from systems.account_snapshot import account_snapshots
 
 # استيراد النظام المحسن والنظام الجديد
 try:
@@ -59,6 +66,254 @@ web_server = None
 bot_thread = None
 enhanced_system = None
 
+def queue_full_response():
+    """رد 429 مع Retry-After عند امتلاء طابور الإشارات"""
+    retry_after = signal_ingestion_queue.retry_after()
+    return jsonify({
+        "status": "error",
+        "message": "Signal queue is full, retry later",
+        "retry_after": retry_after
+    }), 429, {'Retry-After': str(retry_after)}
+
+def build_user_settings(user_id, user_data):
+    """إعدادات التداول المستخدمة في تحويل وتنفيذ إشارة المستخدم"""
+    return {
+        'user_id': user_id,
+        'market_type': user_data.get('market_type', 'spot'),
+        'account_type': user_data.get('account_type', 'demo'),
+        'trade_amount': user_data.get('trade_amount', 100.0),
+        'leverage': user_data.get('leverage', 10),
+        'exchange': user_data.get('exchange', 'bybit')
+    }
+
+def resolve_webhook_user(user_id):
+    """
+    بيانات مستخدم الرابط الشخصي (مع التحميل من قاعدة البيانات إن لم يكن محملاً)
+    
+    Returns:
+        (user_data, None) أو (None, رد الخطأ)
+    """
+    from users.user_manager import user_manager
+    from users.database import db_manager
+    
+    if user_manager is None:
+        print("ERROR: User manager not initialized")
+        return None, (jsonify({"status": "error", "message": "User manager not initialized"}), 500)
+    
+    # التحقق من وجود المستخدم
+    user_data = user_manager.get_user(user_id)
+    
+    if not user_data:
+        # محاولة التحميل من قاعدة البيانات
+        user_data = db_manager.get_user(user_id)
+        if user_data:
+            user_manager.reload_user_data(user_id)
+            user_data = user_manager.get_user(user_id)
+            user_manager._create_user_accounts(user_id, user_data)
+    
+    if not user_data:
+        return None, (jsonify({"status": "error", "message": f"User {user_id} not found"}), 404)
+    
+    if not user_data.get('is_active', False):
+        return None, (jsonify({"status": "error", "message": f"User {user_id} is not active"}), 403)
+    
+    return user_data, None
+
+def make_public_signal_job(data, entry_id=None):
+    """مهمة معالجة إشارة الرابط العام (بحساب الأدمن) - تُستخدم من الـ webhook وعند إعادة السجل"""
+    # استخدام النظام الجديد لمعالجة الإشارات
+    from signals.signal_converter import convert_simple_signal
+    from signals.signal_executor import signal_executor as sig_executor
+    from users.user_manager import user_manager
+    from config import ADMIN_USER_ID
+    
+    # معالجة الإشارة في طابور الإشارات (عمال غير متزامنين على event loop مشترك)
+    async def process_signal():
+        # زمن الانتظار من استقبال الطلب حتى بدء المعالجة
+        latency_tracer.mark('webhook.dispatch')
+        signal_journal.mark_processing(entry_id)
+        
+        try:
+            # استخدام المستخدم الافتراضي (ADMIN) للإشارات العامة
+            user_id = ADMIN_USER_ID
+            user_data = user_manager.get_user(user_id) if user_manager else None
+            
+            if not user_data:
+                print(f"WARNING المستخدم {user_id} غير موجود")
+                signal_journal.mark_failed(entry_id, 'user not found')
+                return
+            
+            # تحويل الإشارة
+            user_settings = build_user_settings(user_id, user_data)
+            
+            print(f"{'='*60}")
+            print(f"⚙️ إعدادات المستخدم ADMIN المستخرجة:")
+            print(f"   - user_id: {user_settings['user_id']}")
+            print(f"   - market_type: {user_settings['market_type']}")
+            print(f"   - account_type: {user_settings['account_type']}")
+            print(f"   - trade_amount: {user_settings['trade_amount']} USDT")
+            print(f"   - leverage: {user_settings['leverage']}x")
+            print(f"   - exchange: {user_settings['exchange']}")
+            print(f"{'='*60}")
+            
+            converted_signal = convert_simple_signal(data, user_settings)
+            
+            if converted_signal:
+                # معرف أمر ثابت من السجل - إعادة الإشارة لا تكرر الأمر على المنصة
+                if entry_id:
+                    converted_signal['order_link_id'] = signal_journal.order_link_id(entry_id)
+                # تنفيذ الإشارة - استخدام user_settings بدلاً من user_data
+                result = await sig_executor.execute_signal(user_id, converted_signal, user_settings)
+                print(f"OK نتيجة تنفيذ الإشارة: {result}")
+                signal_journal.mark_done(entry_id, result)
+            else:
+                print(f"ERROR فشل تحويل الإشارة")
+                signal_journal.mark_failed(entry_id, 'conversion failed')
+                
+        except Exception as e:
+            print(f"ERROR خطأ في معالجة الإشارة: {e}")
+            signal_journal.mark_failed(entry_id, str(e))
+            import traceback
+            traceback.print_exc()
+        finally:
+            latency_tracer.finish_trace()
+    
+    return process_signal
+
+def make_personal_signal_job(user_id, data, user_settings_copy, entry_id=None):
+    """مهمة معالجة إشارة الرابط الشخصي - تُستخدم من الـ webhook وعند إعادة السجل"""
+    # معالجة الإشارة في طابور الإشارات (عمال غير متزامنين على event loop مشترك)
+    async def process_signal():
+        # زمن الانتظار من استقبال الطلب حتى بدء المعالجة
+        latency_tracer.mark('webhook.dispatch')
+        signal_journal.mark_processing(entry_id)
+        
+        try:
+            # استخدام النظام الجديد لمعالجة الإشارات
+            from signals.signal_converter import convert_simple_signal
+            from signals.signal_executor import signal_executor as sig_executor
+            
+            # تحويل الإشارة مع إعدادات المستخدم
+            converted_signal = convert_simple_signal(data, user_settings_copy)
+            
+            if converted_signal:
+                print(f"OK تم تحويل الإشارة: {converted_signal.get('action')} {converted_signal.get('symbol')}")
+                
+                # معرف أمر ثابت من السجل - إعادة الإشارة لا تكرر الأمر على المنصة
+                if entry_id:
+                    converted_signal['order_link_id'] = signal_journal.order_link_id(entry_id)
+                
+                # 🎯 تنفيذ الإشارة بناءً على نوع الحساب
+                account_type = user_settings_copy.get('account_type', 'demo')
+                
+                if account_type == 'real':
+                    # حساب حقيقي - استخدام signal_executor
+                    print(f"🔴 تنفيذ على حساب حقيقي عبر signal_executor")
+                    result = await sig_executor.execute_signal(user_id, converted_signal, user_settings_copy)
+                    print(f"OK نتيجة التنفيذ: {result}")
+                    signal_journal.mark_done(entry_id, result)
+                    
+                    # إرسال إشعار
+                    if result.get('success'):
+                        message = f"✅ تم تنفيذ إشارة على الحساب الحقيقي\n\n{converted_signal.get('action')} {converted_signal.get('symbol')}"
+                        telegram_dispatcher.send(user_id, message)
+                    else:
+                        print(f"ERROR فشل تنفيذ الإشارة: {result.get('message')}")
+                else:
+                    # حساب تجريبي - process_signal بإعدادات المستخدم
+                    print(f"🟢 تنفيذ على حساب تجريبي عبر TradingBot.process_signal")
+                    
+                    # TradingBot مؤقت بإعدادات المستخدم (كما في توزيع إشارات المطور على المتابعين)
+                    # فلا تُعدّل إعدادات trading_bot المشترك وتُنفذ إشارات المستخدمين المختلفين بالتوازي
+                    from bybit_trading_bot import trading_bot, TradingBot
+                    
+                    demo_bot = TradingBot()
+                    demo_bot.user_id = user_id
+                    demo_bot.user_settings = {**trading_bot.user_settings, **user_settings_copy}
+                    demo_bot.available_pairs = trading_bot.available_pairs
+                    demo_bot.last_pairs_update = trading_bot.last_pairs_update
+                    
+                    # تنفيذ الإشارة
+                    with latency_tracer.span('demo.process_signal'):
+                        await demo_bot.process_signal(converted_signal)
+                    trading_bot.signals_received += 1
+                    
+                    print(f"✅ تم تنفيذ الإشارة على الحساب التجريبي بنجاح")
+                    signal_journal.mark_done(entry_id, 'demo')
+                    
+                    # إرسال إشعار
+                    message = f"""
+✅ تم تنفيذ إشارة على الحساب التجريبي
+
+📊 الإجراء: {converted_signal.get('action')}
+💱 الرمز: {converted_signal.get('symbol')}
+💰 المبلغ: {user_settings_copy.get('trade_amount')} USDT
+🏪 السوق: {user_settings_copy.get('market_type').upper()}
+                    """
+                    
+                    if not telegram_dispatcher.send(user_id, message):
+                        print(f"WARNING فشل إرسال إشعار Telegram: الطابور ممتلئ")
+            else:
+                print(f"ERROR فشل تحويل الإشارة")
+                signal_journal.mark_failed(entry_id, 'conversion failed')
+                
+        except Exception as e:
+            print(f"❌ خطأ في معالجة الإشارة: {e}")
+            signal_journal.mark_failed(entry_id, str(e))
+            import traceback
+            traceback.print_exc()
+        finally:
+            latency_tracer.finish_trace()
+    
+    return process_signal
+
+def make_legacy_signal_job(data, entry_id=None):
+    """مهمة معالجة إشارة الرابط القديم (web_server.py) بإعدادات trading_bot - تُستخدم عند إعادة السجل"""
+    async def process_signal():
+        signal_journal.mark_processing(entry_id)
+        try:
+            signal = data
+            if 'signal' in data and 'action' not in data:
+                from signals.signal_converter import convert_simple_signal
+                signal = convert_simple_signal(data, trading_bot.user_settings)
+                if not signal:
+                    signal_journal.mark_failed(entry_id, 'conversion failed')
+                    return
+            
+            await trading_bot.process_signal(signal)
+            signal_journal.mark_done(entry_id)
+        except Exception as e:
+            print(f"ERROR خطأ في معالجة الإشارة: {e}")
+            signal_journal.mark_failed(entry_id, str(e))
+        finally:
+            latency_tracer.finish_trace()
+    
+    return process_signal
+
+def replay_journal_entry(entry):
+    """إعادة إشارة غير منتهية من السجل إلى طابور الإشارات (عند بدء التشغيل)"""
+    user_id = entry['user_id']
+    data = entry['payload']
+    
+    if entry['route'] == 'public':
+        job = make_public_signal_job(data, entry['id'])
+    elif entry['route'] == 'legacy':
+        # الرابط القديم في web_server.py: بدون مستخدم (user_id قد يكون None)
+        job = make_legacy_signal_job(data, entry['id'])
+    else:
+        from users.user_manager import user_manager
+        user_data = user_manager.get_user(user_id) if user_manager else None
+        if not user_data or not user_data.get('is_active', False):
+            signal_journal.mark_failed(entry['id'], 'user not found or inactive')
+            return False
+        job = make_personal_signal_job(user_id, data, build_user_settings(user_id, user_data), entry['id'])
+    
+    latency_tracer.start_trace('webhook', route=entry['route'], user_id=user_id, replay=True)
+    lane = signal_ingestion_queue.lane_key(user_id, data.get('symbol'))
+    accepted = signal_ingestion_queue.submit(job, name=f"replay:{entry['id']}", lane=lane)
+    latency_tracer.detach()
+    return accepted
+
 @app.route('/')
 def index():
     """الصفحة الرئيسية"""
@@ -104,75 +359,72 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/metrics/latency')
+def latency_metrics():
+    """زمن مراحل معالجة الإشارات (p50/p95/p99 ومدرج تكراري لكل مرحلة) وآخر التتبعات"""
+    limit = request.args.get('traces', default=10, type=int)
+    return jsonify({
+        "stages": latency_tracer.get_stats(),
+        "recent_traces": latency_tracer.get_recent_traces(limit),
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/metrics/queue')
+def queue_metrics():
+    """عمق طابور الإشارات وزمن الانتظار فيه"""
+    return jsonify(signal_ingestion_queue.get_stats())
+
+@app.route('/metrics/fanout')
+def fanout_metrics():
+    """زمن توزيع إشارات المطور على المتابعين (time-to-last-fill)"""
+    from developers.follower_fanout import follower_fanout
+    return jsonify(follower_fanout.get_stats())
+
+@app.route('/metrics/telegram')
+def telegram_metrics():
+    """طابور رسائل تلجرام الصادرة (العمق، المدمج، 429)"""
+    return jsonify(telegram_dispatcher.get_stats())
+
+@app.route('/metrics/enrichment')
+def enrichment_metrics():
+    """زمن التحليل المحسن (قبل التنفيذ أو في الخلفية)"""
+    from systems.enrichment_worker import enrichment_worker
+    return jsonify(enrichment_worker.get_stats())
+
+@app.route('/metrics/journal')
+def journal_metrics():
+    """حالة سجل الإشارات الدائم (المكرر، المعاد، عدد الإشارات لكل حالة)"""
+    return jsonify(signal_journal.get_stats())
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """استقبال إشارات TradingView (رابط عام)"""
     try:
+        latency_tracer.start_trace('webhook', route='public')
         data = request.get_json()
         print(f"[WEBHOOK] Received signal: {data}")
         
         if not data:
             return jsonify({"status": "error", "message": "No data received"}), 400
         
-        # استخدام النظام الجديد لمعالجة الإشارات
-        from signals.signal_converter import convert_simple_signal
-        from signals.signal_executor import signal_executor as sig_executor
-        from users.user_manager import user_manager
+        # تسجيل الإشارة في السجل الدائم قبل الرد (الإشارة المكررة لا تُنفذ مرة أخرى)
         from config import ADMIN_USER_ID
+        entry_id, is_new = signal_journal.append(ADMIN_USER_ID, data, route='public')
+        if not is_new:
+            latency_tracer.detach()
+            return jsonify({"status": "success", "message": "Duplicate signal ignored", "duplicate": True}), 200
         
-        # معالجة الإشارة في thread منفصل
-        def process_signal_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # استخدام المستخدم الافتراضي (ADMIN) للإشارات العامة
-                user_id = ADMIN_USER_ID
-                user_data = user_manager.get_user(user_id) if user_manager else None
-                
-                if not user_data:
-                    print(f"WARNING المستخدم {user_id} غير موجود")
-                    return
-                
-                # تحويل الإشارة
-                user_settings = {
-                    'user_id': user_id,
-                    'market_type': user_data.get('market_type', 'spot'),
-                    'account_type': user_data.get('account_type', 'demo'),
-                    'trade_amount': user_data.get('trade_amount', 100.0),
-                    'leverage': user_data.get('leverage', 10),
-                    'exchange': user_data.get('exchange', 'bybit')
-                }
-                
-                print(f"{'='*60}")
-                print(f"⚙️ إعدادات المستخدم ADMIN المستخرجة:")
-                print(f"   - user_id: {user_settings['user_id']}")
-                print(f"   - market_type: {user_settings['market_type']}")
-                print(f"   - account_type: {user_settings['account_type']}")
-                print(f"   - trade_amount: {user_settings['trade_amount']} USDT")
-                print(f"   - leverage: {user_settings['leverage']}x")
-                print(f"   - exchange: {user_settings['exchange']}")
-                print(f"{'='*60}")
-                
-                converted_signal = convert_simple_signal(data, user_settings)
-                
-                if converted_signal:
-                    # تنفيذ الإشارة - استخدام user_settings بدلاً من user_data
-                    result = loop.run_until_complete(
-                        sig_executor.execute_signal(user_id, converted_signal, user_settings)
-                    )
-                    print(f"OK نتيجة تنفيذ الإشارة: {result}")
-                else:
-                    print(f"ERROR فشل تحويل الإشارة")
-                    
-            except Exception as e:
-                print(f"ERROR خطأ في معالجة الإشارة: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                loop.close()
+        process_signal = make_public_signal_job(data, entry_id)
         
-        threading.Thread(target=process_signal_async, daemon=True).start()
+        # الطابور يحفظ سياق الطلب فينتقل تتبع الإشارة إلى العامل
+        # مسار المستخدم: إشارات نفس المستخدم تُنفذ بترتيب وصولها (فتح ثم إغلاق)
+        lane = signal_ingestion_queue.lane_key(ADMIN_USER_ID, data.get('symbol'))
+        if not signal_ingestion_queue.submit(process_signal, name='webhook', lane=lane):
+            latency_tracer.detach()
+            signal_journal.mark_rejected(entry_id, 'queue full')
+            return queue_full_response()
+        latency_tracer.mark('webhook.ack')
+        latency_tracer.detach()
         
         return jsonify({"status": "success", "message": "Signal processing started"}), 200
         
@@ -186,6 +438,7 @@ def webhook():
 def personal_webhook(user_id):
     """استقبال إشارات TradingView الشخصية لكل مستخدم"""
     try:
+        latency_tracer.start_trace('webhook', route='personal', user_id=user_id)
         print(f"\n{'='*60}")
         print(f"[WEBHOOK شخصي] استقبال طلب جديد")
         print(f"المستخدم: {user_id}")
@@ -197,40 +450,13 @@ def personal_webhook(user_id):
         if not data:
             return jsonify({"status": "error", "message": "No data received"}), 400
         
-        # التحقق من وجود user_manager
-        from users.user_manager import user_manager
-        from users.database import db_manager
-        
-        if user_manager is None:
-            print("ERROR: User manager not initialized")
-            return jsonify({"status": "error", "message": "User manager not initialized"}), 500
-        
-        # التحقق من وجود المستخدم
-        user_data = user_manager.get_user(user_id)
-        
-        if not user_data:
-            # محاولة التحميل من قاعدة البيانات
-            user_data = db_manager.get_user(user_id)
-            if user_data:
-                user_manager.reload_user_data(user_id)
-                user_data = user_manager.get_user(user_id)
-                user_manager._create_user_accounts(user_id, user_data)
-        
-        if not user_data:
-            return jsonify({"status": "error", "message": f"User {user_id} not found"}), 404
-        
-        if not user_data.get('is_active', False):
-            return jsonify({"status": "error", "message": f"User {user_id} is not active"}), 403
+        user_data, error_response = resolve_webhook_user(user_id)
+        if error_response:
+            latency_tracer.detach()
+            return error_response
         
         # إعدادات المستخدم
-        user_settings_copy = {
-            'user_id': user_id,
-            'market_type': user_data.get('market_type', 'spot'),
-            'account_type': user_data.get('account_type', 'demo'),
-            'trade_amount': user_data.get('trade_amount', 100.0),
-            'leverage': user_data.get('leverage', 10),
-            'exchange': user_data.get('exchange', 'bybit')
-        }
+        user_settings_copy = build_user_settings(user_id, user_data)
         
         print(f"{'='*60}")
         print(f"⚙️ إعدادات المستخدم {user_id} المستخرجة:")
@@ -241,99 +467,28 @@ def personal_webhook(user_id):
         print(f"   - exchange: {user_settings_copy['exchange']}")
         print(f"{'='*60}")
         
-        # معالجة الإشارة في thread منفصل
-        def process_signal_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                # استخدام النظام الجديد لمعالجة الإشارات
-                from signals.signal_converter import convert_simple_signal
-                from signals.signal_executor import signal_executor as sig_executor
-                
-                # تحويل الإشارة مع إعدادات المستخدم
-                converted_signal = convert_simple_signal(data, user_settings_copy)
-                
-                if converted_signal:
-                    print(f"OK تم تحويل الإشارة: {converted_signal.get('action')} {converted_signal.get('symbol')}")
-                    
-                    # 🎯 تنفيذ الإشارة بناءً على نوع الحساب
-                    account_type = user_settings_copy.get('account_type', 'demo')
-                    
-                    if account_type == 'real':
-                        # حساب حقيقي - استخدام signal_executor
-                        print(f"🔴 تنفيذ على حساب حقيقي عبر signal_executor")
-                        result = loop.run_until_complete(
-                            sig_executor.execute_signal(user_id, converted_signal, user_settings_copy)
-                        )
-                        print(f"OK نتيجة التنفيذ: {result}")
-                        
-                        # إرسال إشعار
-                        if result.get('success'):
-                            message = f"✅ تم تنفيذ إشارة على الحساب الحقيقي\n\n{converted_signal.get('action')} {converted_signal.get('symbol')}"
-                            try:
-                                from config import TELEGRAM_TOKEN
-                                import requests
-                                telegram_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-                                requests.post(telegram_url, json={'chat_id': user_id, 'text': message}, timeout=5)
-                            except:
-                                pass
-                        else:
-                            print(f"ERROR فشل تنفيذ الإشارة: {result.get('message')}")
-                    else:
-                        # حساب تجريبي - استخدام trading_bot.process_signal مباشرة
-                        print(f"🟢 تنفيذ على حساب تجريبي عبر trading_bot.process_signal")
-                        
-                        # الحصول على trading_bot
-                        from bybit_trading_bot import trading_bot
-                        
-                        # حفظ الإعدادات الأصلية
-                        original_settings = trading_bot.user_settings.copy()
-                        original_user_id = trading_bot.user_id
-                        
-                        try:
-                            # تطبيق إعدادات المستخدم مؤقتاً
-                            trading_bot.user_settings.update(user_settings_copy)
-                            trading_bot.user_id = user_id
-                            
-                            # تنفيذ الإشارة
-                            loop.run_until_complete(trading_bot.process_signal(converted_signal))
-                            
-                            print(f"✅ تم تنفيذ الإشارة على الحساب التجريبي بنجاح")
-                            
-                            # إرسال إشعار
-                            message = f"""
-✅ تم تنفيذ إشارة على الحساب التجريبي
-
-📊 الإجراء: {converted_signal.get('action')}
-💱 الرمز: {converted_signal.get('symbol')}
-💰 المبلغ: {user_settings_copy.get('trade_amount')} USDT
-🏪 السوق: {user_settings_copy.get('market_type').upper()}
-                            """
-                            
-                            try:
-                                from config import TELEGRAM_TOKEN
-                                import requests
-                                telegram_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-                                requests.post(telegram_url, json={'chat_id': user_id, 'text': message}, timeout=5)
-                            except Exception as e:
-                                print(f"WARNING فشل إرسال إشعار Telegram: {e}")
-                                
-                        finally:
-                            # استعادة الإعدادات الأصلية
-                            trading_bot.user_settings.update(original_settings)
-                            trading_bot.user_id = original_user_id
-                else:
-                    print(f"ERROR فشل تحويل الإشارة")
-                    
-            except Exception as e:
-                print(f"❌ خطأ في معالجة الإشارة: {e}")
-                import traceback
-                traceback.print_exc()
-            finally:
-                loop.close()
+        # تسجيل الإشارة في السجل الدائم قبل الرد (الإشارة المكررة لا تُنفذ مرة أخرى)
+        entry_id, is_new = signal_journal.append(user_id, data, route='personal')
+        if not is_new:
+            latency_tracer.detach()
+            return jsonify({
+                "status": "success",
+                "message": "Duplicate signal ignored",
+                "user_id": user_id,
+                "duplicate": True
+            }), 200
+        
+        process_signal = make_personal_signal_job(user_id, data, user_settings_copy, entry_id)
         
-        threading.Thread(target=process_signal_async, daemon=True).start()
+        # الطابور يحفظ سياق الطلب فينتقل تتبع الإشارة إلى العامل
+        # مسار المستخدم: إشارات نفس المستخدم تُنفذ بترتيب وصولها (فتح ثم إغلاق)
+        lane = signal_ingestion_queue.lane_key(user_id, data.get('symbol'))
+        if not signal_ingestion_queue.submit(process_signal, name=f'webhook:{user_id}', lane=lane):
+            latency_tracer.detach()
+            signal_journal.mark_rejected(entry_id, 'queue full')
+            return queue_full_response()
+        latency_tracer.mark('webhook.ack')
+        latency_tracer.detach()
         
         return jsonify({
             "status": "success",
@@ -347,6 +502,96 @@ def personal_webhook(user_id):
         traceback.print_exc()
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/personal/<int:user_id>/webhook/batch', methods=['POST'])
+def personal_webhook_batch(user_id):
+    """
+    استقبال دفعة إشارات شخصية في طلب واحد (مصفوفة JSON أو {"signals": [...]})
+    
+    المستخدم يُحمّل مرة واحدة، جميع الإشارات تُفحص قبل الإدخال، والدفعة تدخل الطابور كاملة:
+    إشارات الرمز الواحد تُنفذ بترتيبها والرموز المختلفة تُنفذ بالتوازي
+    """
+    try:
+        data = request.get_json(silent=True)
+        signals = data.get('signals') if isinstance(data, dict) else data
+        
+        if not isinstance(signals, list) or not signals:
+            return jsonify({"status": "error", "message": "Expected a non-empty JSON array of signals"}), 400
+        
+        if len(signals) > signal_ingestion_queue.max_batch_size:
+            return jsonify({
+                "status": "error",
+                "message": f"Batch too large ({len(signals)} > {signal_ingestion_queue.max_batch_size})"
+            }), 413
+        
+        print(f"[WEBHOOK دفعة] المستخدم {user_id}: {len(signals)} إشارة")
+        
+        user_data, error_response = resolve_webhook_user(user_id)
+        if error_response:
+            return error_response
+        
+        # إعدادات المستخدم مرة واحدة للدفعة كاملة
+        user_settings = build_user_settings(user_id, user_data)
+        
+        from signals.signal_converter import SignalConverter
+        
+        results = []
+        jobs = []
+        for index, item in enumerate(signals):
+            result = {"index": index}
+            results.append(result)
+            
+            if not isinstance(item, dict):
+                result.update(status="invalid", message="Signal must be a JSON object")
+                continue
+            result["symbol"] = item.get('symbol')
+            result["signal"] = item.get('signal')
+            
+            is_valid, message = SignalConverter.validate_signal(item)
+            if not is_valid:
+                result.update(status="invalid", message=message)
+                continue
+            
+            entry_id, is_new = signal_journal.append(user_id, item, route='personal')
+            result["entry_id"] = entry_id
+            if not is_new:
+                result.update(status="duplicate", message="Duplicate signal ignored")
+                continue
+            
+            # تتبع مستقل لكل إشارة (الطابور ينقل سياقها إلى العامل)
+            context = contextvars.copy_context()
+            context.run(latency_tracer.start_trace, 'webhook', route='batch', user_id=user_id,
+                        symbol=item.get('symbol'))
+            process_signal = make_personal_signal_job(user_id, item, dict(user_settings), entry_id)
+            # نفس مسار /personal/<id>/webhook - فلا يسبق إغلاقٌ في الدفعة فتحاً وصل من الرابط الفردي
+            lane = signal_ingestion_queue.lane_key(user_id, item.get('symbol'))
+            jobs.append((process_signal, f'batch:{user_id}:{index}', lane, context))
+            result["status"] = "accepted"
+        
+        if jobs and not signal_ingestion_queue.submit_many(jobs):
+            for result in results:
+                if result["status"] == "accepted":
+                    signal_journal.mark_rejected(result["entry_id"], 'queue full')
+            return queue_full_response()
+        
+        for job in jobs:
+            job[3].run(latency_tracer.mark, 'webhook.ack')
+        
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+        invalid = sum(1 for result in results if result["status"] == "invalid")
+        return jsonify({
+            "status": "error" if invalid == len(signals) else "success",
+            "message": f"{accepted}/{len(signals)} signals accepted for user {user_id}",
+            "user_id": user_id,
+            "accepted": accepted,
+            "results": results
+        }), 200
+        
+    except Exception as e:
+        print(f"ERROR خطأ في دفعة الإشارات: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 def setup_telegram_bot():
     """إعداد Telegram Bot بدون تشغيله"""
     global enhanced_system
@@ -399,23 +644,8 @@ def setup_telegram_bot():
 def send_telegram_notification(title, message_text):
     """إرسال إشعار تلجرام"""
     try:
-        from config import TELEGRAM_TOKEN, ADMIN_USER_ID
-        from telegram.ext import Application
-        
-        def run_send():
-            async def send():
-                try:
-                    application = Application.builder().token(TELEGRAM_TOKEN).build()
-                    await application.bot.send_message(chat_id=ADMIN_USER_ID, text=message_text)
-                except Exception as e:
-                    print(f"ERROR خطأ في إرسال الرسالة: {e}")
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(send())
-            loop.close()
-        
-        threading.Thread(target=run_send, daemon=True).start()
+        from config import ADMIN_USER_ID
+        telegram_dispatcher.send(ADMIN_USER_ID, message_text)
     except Exception as e:
         print(f"ERROR خطأ: {e}")
 
@@ -451,6 +681,23 @@ if __name__ == "__main__":
     bot_application = setup_telegram_bot()
     print("OK تم إعداد البوت")
     
+    # تحميل سجل الرموز وبدء تحديثه الدوري في الخلفية
+    instrument_registry.start()
+    
+    # تشغيل عمال طابور الإشارات قبل استقبال أول webhook
+    signal_ingestion_queue.start()
+    telegram_dispatcher.start()
+    
+    # إعادة الإشارات التي لم تكتمل قبل التوقف السابق (سجل الإشارات الدائم)
+    signal_journal.prune()
+    signal_journal.replay_pending(replay_journal_entry)
+    
+    # حفظ الحسابات التجريبية دورياً (لقطة + سجل تغييرات) لاستعادتها عند إعادة التشغيل
+    account_snapshots.start()
+    
+    # محرك الصفقات: تنفيذ TP/SL مع كل سعر وتحديث الربح/الخسارة دورياً
+    start_position_engine()
+    
     # تشغيل Flask في thread منفصل
     flask_thread = threading.Thread(target=run_flask_in_thread, daemon=True)
     flask_thread.start()
@@ -473,3 +720,6 @@ if __name__ == "__main__":
     # تشغيل البوت في الـ main thread
     print("🤖 بدء تشغيل البوت...")
     bot_application.run_polling(allowed_updates=['message', 'callback_query'], drop_pending_updates=False)
+    
+    # كتابة آخر تغييرات الحسابات قبل الخروج
+    account_snapshots.stop()
@@ -14,8 +14,9 @@ import threading
 import os
 from datetime import datetime, timedelta
 from decimal import Decimal, ROUND_DOWN
-from typing import Dict, List, Optional, Any, Union
+from typing import Callable, Dict, List, Optional, Any, Union
 from dataclasses import dataclass, field
+from functools import wraps
 import hashlib
 import hmac
 import requests
@@ -32,6 +33,12 @@ from config import *
 # استيراد بناة لوحات المفاتيح
 from buttons.keyboard_builders import *
 
+# طبقة HTTP المشتركة (اتصالات keep-alive مُجمّعة)
+from api.http_transport import http_transport
+from api.instrument_registry import instrument_registry
+from api.price_bus import price_bus
+from api.ticker_snapshot import ticker_snapshot
+
 # استيراد النظام المحسن
 try:
     from systems.simple_enhanced_system import SimpleEnhancedSystem
@@ -52,6 +59,14 @@ from systems.enhanced_portfolio_manager import portfolio_factory
 
 # استيراد نظام المطورين
 from developers.developer_manager import developer_manager
+from developers.follower_fanout import follower_fanout
+from systems.telegram_dispatcher import telegram_dispatcher
+from systems.enrichment_worker import enrichment_worker
+from systems.position_records import FuturesPosition, SpotPosition
+from systems.position_book import position_book
+from systems.trigger_index import TriggerIndex, TRIGGER_INDEX_SETTINGS, UP, DOWN
+from systems.position_engine import position_engine, POSITION_ENGINE_SETTINGS
+from systems.account_snapshot import account_snapshots
 import developers.init_developers
 
 # إعداد التسجيل
@@ -85,115 +100,22 @@ except Exception as e:
     advanced_stats = None
     logger.warning(f"⚠️ فشل تحميل نظام الإحصائيات: {e}")
 
-class FuturesPosition:
-    """فئة لإدارة صفقات الفيوتشر"""
-    
-    def __init__(self, symbol: str, side: str, margin_amount: float, entry_price: float, leverage: int, position_id: str):
-        self.position_id = position_id
-        self.symbol = symbol
-        self.side = side.lower()  # buy أو sell
-        self.leverage = leverage
-        self.entry_price = entry_price
-        self.margin_amount = margin_amount  # الهامش المحجوز
-        self.position_size = margin_amount * leverage  # حجم الصفقة الفعلي
-        self.contracts = self.position_size / entry_price  # عدد العقود
-        self.timestamp = datetime.now()
-        self.unrealized_pnl = 0.0
-        self.maintenance_margin_rate = 0.005  # 0.5% كمعدل افتراضي
-        self.liquidation_price = self.calculate_liquidation_price()
-        
-    def calculate_liquidation_price(self) -> float:
-        """حساب سعر التصفية باستخدام الصيغ الصحيحة مثل المنصات"""
-        try:
-            # استخدام الصيغة الصحيحة لـ Bybit
-            # Liquidation Price = Entry Price * (1 - (1/leverage) + maintenance_margin_rate) for Long
-            # Liquidation Price = Entry Price * (1 + (1/leverage) - maintenance_margin_rate) for Short
-            
-            if self.side == "buy":
-                # للصفقات الشرائية (Long)
-                # الصيغة: Entry * (1 - (1/leverage) + maintenance_margin_rate)
-                liquidation_price = self.entry_price * (1 - (1/self.leverage) + self.maintenance_margin_rate)
-            else:
-                # للصفقات البيعية (Short)  
-                # الصيغة: Entry * (1 + (1/leverage) - maintenance_margin_rate)
-                liquidation_price = self.entry_price * (1 + (1/self.leverage) - self.maintenance_margin_rate)
-            
-            # التأكد من أن السعر موجب
-            return max(liquidation_price, 0.000001)
-            
-        except Exception as e:
-            logger.error(f"خطأ في حساب سعر التصفية: {e}")
-            # في حالة الخطأ، استخدام حسابات تقريبية آمنة
-            if self.side == "buy":
-                return self.entry_price * (1 - (1/self.leverage) * 0.8)  # 80% من الهامش
-            else:
-                return self.entry_price * (1 + (1/self.leverage) * 0.8)  # 80% من الهامش
-    
-    def update_pnl(self, current_price: float) -> float:
-        """تحديث الربح/الخسارة غير المحققة"""
-        try:
-            if self.side == "buy":
-                # للصفقات الشرائية
-                self.unrealized_pnl = (current_price - self.entry_price) * self.contracts
-            else:
-                # للصفقات البيعية
-                self.unrealized_pnl = (self.entry_price - current_price) * self.contracts
-            
-            return self.unrealized_pnl
-            
-        except Exception as e:
-            logger.error(f"خطأ في تحديث PnL: {e}")
-            return 0.0
-    
-    def calculate_closing_pnl(self, closing_price: float) -> float:
-        """حساب الربح/الخسارة المحققة عند الإغلاق"""
-        try:
-            if self.side == "buy":
-                realized_pnl = (closing_price - self.entry_price) * self.contracts
-            else:
-                realized_pnl = (self.entry_price - closing_price) * self.contracts
-            
-            return realized_pnl
-            
-        except Exception as e:
-            logger.error(f"خطأ في حساب PnL المحقق: {e}")
-            return 0.0
-    
-    def check_liquidation(self, current_price: float) -> bool:
-        """فحص ما إذا كانت الصفقة تحتاج للتصفية"""
-        try:
-            if self.side == "buy":
-                return current_price <= self.liquidation_price
-            else:
-                return current_price >= self.liquidation_price
-        except Exception as e:
-            logger.error(f"خطأ في فحص التصفية: {e}")
-            return False
-    
-    def get_position_info(self) -> Dict:
-        """الحصول على معلومات الصفقة"""
-        return {
-            'position_id': self.position_id,
-            'symbol': self.symbol,
-            'side': self.side,
-            'leverage': self.leverage,
-            'entry_price': self.entry_price,
-            'margin_amount': self.margin_amount,
-            'position_size': self.position_size,
-            'contracts': self.contracts,
-            'liquidation_price': self.liquidation_price,
-            'unrealized_pnl': self.unrealized_pnl,
-            'timestamp': self.timestamp
-        }
+def _synchronized(method):
+    """تنفيذ الدالة تحت self.lock - محرك الصفقات يعدّل الحسابات والصفقات المدارة بالتوازي مع Telegram والتحديث الدوري"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class TradingAccount:
     """فئة لإدارة الحسابات التجريبية الداخلية مع دعم محسن للفيوتشر"""
     
-    def __init__(self, initial_balance: float = 10000.0, account_type: str = "spot"):
+    def __init__(self, initial_balance: float = 10000.0, account_type: str = "spot", use_position_book: bool = True):
         self.balance = initial_balance
         self.initial_balance = initial_balance
         self.account_type = account_type
-        self.positions: Dict[str, Union[FuturesPosition, Dict]] = {}
+        self.positions: Dict[str, Union[FuturesPosition, SpotPosition]] = {}
         self.trade_history: List[Dict] = []
         self.total_trades = 0
         self.winning_trades = 0
@@ -215,7 +137,105 @@ class TradingAccount:
         # نظام أسماء الصفقات المخصصة
         self.custom_position_names: Dict[str, str] = {}  # اسم مخصص -> ID الصفقة
         self.position_custom_names: Dict[str, str] = {}  # ID الصفقة -> اسم مخصص
-        
+        self.position_signal_ids: Dict[str, str] = {}  # ID الصفقة -> ID الإشارة
+        
+        # فهارس ثانوية (dict بدون قيم = مجموعة بترتيب الإضافة) حتى لا يمر البحث على كل الصفقات
+        self._ids_by_symbol: Dict[str, Dict[str, None]] = {}
+        self._ids_by_symbol_side: Dict[tuple, Dict[str, None]] = {}
+        self._ids_by_signal: Dict[str, Dict[str, None]] = {}
+        self._names_by_prefix: Dict[str, Dict[str, None]] = {}  # "BTC" -> {"BTC_BUY", "BTC_SELL"}
+        
+        # دفتر الصفقات المشترك: إعادة تقييم صفقات جميع الحسابات بتمريرة واحدة
+        self.position_book = position_book if use_position_book and position_book.enabled else None
+        
+        # يُستدعى بعد أي تغيير في حالة الحساب (لقطات الحسابات في systems/account_snapshot.py)
+        self.on_change: Optional[Callable[[], None]] = None
+        
+        # قفل الحساب: الفتح والإغلاق وإعادة التقييم من أكثر من thread (محرك الصفقات، Telegram، التحديث الدوري)
+        self.lock = threading.RLock()
+        
+    def mark_changed(self):
+        """إبلاغ لقطات الحسابات بتغير الحساب (وللتعديل المباشر على الرصيد من خارج الفئة)"""
+        if self.on_change is not None:
+            self.on_change()
+    
+    def _track_position(self, position_id: str, position):
+        """حفظ الصفقة في الحساب وفهارسه وفي دفتر الصفقات"""
+        previous = self.positions.get(position_id)
+        if previous is not None and previous is not position:
+            self._untrack_position(previous)
+        self.positions[position_id] = position
+        self._ids_by_symbol.setdefault(position.symbol, {})[position_id] = None
+        self._ids_by_symbol_side.setdefault((position.symbol, position.side), {})[position_id] = None
+        if self.position_book is not None:
+            self.position_book.add(position, self)
+        self.mark_changed()
+    
+    def _untrack_position(self, position):
+        position_id = position.position_id
+        self._discard_index(self._ids_by_symbol, position.symbol, position_id)
+        self._discard_index(self._ids_by_symbol_side, (position.symbol, position.side), position_id)
+        signal_id = self.position_signal_ids.pop(position_id, None)
+        if signal_id is not None:
+            self._discard_index(self._ids_by_signal, signal_id, position_id)
+        if self.position_book is not None:
+            self.position_book.remove(position)
+        self.mark_changed()
+    
+    @staticmethod
+    def _discard_index(index: Dict, key, value):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(value, None)
+            if not bucket:
+                del index[key]
+    
+    @staticmethod
+    def _name_prefixes(custom_name: str) -> List[str]:
+        """البادئات التي يبدأ بها الاسم متبوعة بـ _ ("BTC_LONG_BUY" -> "BTC"، "BTC_LONG")"""
+        return [custom_name[:i] for i, char in enumerate(custom_name) if char == '_']
+    
+    def _index_custom_name(self, custom_name: str):
+        for prefix in self._name_prefixes(custom_name):
+            self._names_by_prefix.setdefault(prefix, {})[custom_name] = None
+    
+    def _unindex_custom_name(self, custom_name: str):
+        for prefix in self._name_prefixes(custom_name):
+            self._discard_index(self._names_by_prefix, prefix, custom_name)
+    
+    def link_position_signal(self, position_id: str, signal_id: str) -> bool:
+        """ربط الصفقة بـ ID الإشارة (للإغلاق بالإشارة)"""
+        if position_id not in self.positions or not signal_id:
+            return False
+        previous = self.position_signal_ids.get(position_id)
+        if previous is not None:
+            self._discard_index(self._ids_by_signal, previous, position_id)
+        self.position_signal_ids[position_id] = signal_id
+        self._ids_by_signal.setdefault(signal_id, {})[position_id] = None
+        self.mark_changed()
+        return True
+    
+    def get_position_ids_by_symbol(self, symbol: str, side: str = None) -> List[str]:
+        """IDs الصفقات المفتوحة على الرمز (وبالجانب إن حُدد) بترتيب الفتح"""
+        if side:
+            return list(self._ids_by_symbol_side.get((symbol, side.lower()), ()))
+        return list(self._ids_by_symbol.get(symbol, ()))
+    
+    def get_position_ids_by_signal_id(self, signal_id: str) -> List[str]:
+        """IDs الصفقات المفتوحة المرتبطة بـ ID الإشارة"""
+        return list(self._ids_by_signal.get(signal_id, ()))
+    
+    def refresh_position(self, position):
+        """تحديث دفتر الصفقات بعد تعديل كمية الصفقة أو هامشها (إغلاق جزئي)"""
+        if self.position_book is not None:
+            self.position_book.refresh(position)
+        self.mark_changed()
+    
+    def sync_positions(self):
+        """نسخ آخر تقييم من دفتر الصفقات إلى كائنات صفقات الحساب"""
+        if self.position_book is not None and self.positions:
+            self.position_book.sync(self.positions.values())
+    
     def get_available_balance(self) -> float:
         """الحصول على الرصيد المتاح (الرصيد الكلي - الهامش المحجوز)"""
         return self.balance - self.margin_locked
@@ -233,6 +253,7 @@ class TradingAccount:
         # تحديث الرصيد الإجمالي إذا كانت العملة هي USDT
         if currency == 'USDT':
             self.balance += amount
+        self.mark_changed()
     
     def subtract_from_wallet(self, currency: str, amount: float) -> bool:
         """خصم عملة من المحفظة"""
@@ -244,6 +265,7 @@ class TradingAccount:
         # تحديث الرصيد الإجمالي إذا كانت العملة هي USDT
         if currency == 'USDT':
             self.balance -= amount
+        self.mark_changed()
         
         return True
     
@@ -266,6 +288,7 @@ class TradingAccount:
             'USDT': 0.0,
             base_currency: 0.0
         }
+        self.mark_changed()
         logger.info(f"تم إنشاء محفظة جديدة لصفقة الفيوتشر {position_id} مع العملة {base_currency}")
     
     def add_to_futures_position_wallet(self, position_id: str, currency: str, amount: float):
@@ -277,6 +300,7 @@ class TradingAccount:
             self.futures_position_wallets[position_id][currency] = 0.0
         
         self.futures_position_wallets[position_id][currency] += amount
+        self.mark_changed()
         
         # تحديث المحفظة الرئيسية إذا كانت العملة هي USDT
         if currency == 'USDT':
@@ -294,6 +318,7 @@ class TradingAccount:
             return False
         
         self.futures_position_wallets[position_id][currency] -= amount
+        self.mark_changed()
         
         # تحديث المحفظة الرئيسية إذا كانت العملة هي USDT
         if currency == 'USDT':
@@ -320,7 +345,8 @@ class TradingAccount:
         
         return wallet_summary
     
-    def open_futures_position(self, symbol: str, side: str, margin_amount: float, price: float, leverage: int = 1, custom_name: str = None, position_id: str = None) -> tuple[bool, str]:
+    @_synchronized
+    def open_futures_position(self, symbol: str, side: str, margin_amount: float, price: float, leverage: int = 1, custom_name: str = None, position_id: str = None, signal_id: str = None) -> tuple[bool, str]:
         """فتح صفقة فيوتشر جديدة - البيع والشراء صفقات منفصلة"""
         try:
             available_balance = self.get_available_balance()
@@ -346,7 +372,9 @@ class TradingAccount:
             
             # حجز الهامش
             self.margin_locked += margin_amount
-            self.positions[position_id] = position
+            self._track_position(position_id, position)
+            if signal_id:
+                self.link_position_signal(position_id, signal_id)
             
             # تعيين الاسم المخصص إذا تم تحديده (للاستخدام في الإغلاق والأهداف)
             if custom_name:
@@ -362,7 +390,8 @@ class TradingAccount:
             logger.error(f"خطأ في فتح صفقة الفيوتشر: {e}")
             return False, str(e)
     
-    def open_spot_position(self, symbol: str, side: str, amount: float, price: float, position_id: str = None, custom_name: str = None) -> tuple[bool, str]:
+    @_synchronized
+    def open_spot_position(self, symbol: str, side: str, amount: float, price: float, position_id: str = None, custom_name: str = None, signal_id: str = None) -> tuple[bool, str]:
         """فتح صفقة سبوت مع المحفظة الواحدة - البيع والشراء نفس الصفقة"""
         try:
             # إذا تم تحديد اسم مخصص، استخدمه للبحث عن صفقة موجودة
@@ -398,19 +427,15 @@ class TradingAccount:
                 self.add_to_wallet(base_currency, coins_bought)
                 
                 # حفظ معلومات الصفقة
-                position_info = {
-                    'symbol': symbol,
-                    'side': side,
-                    'amount': amount,
-                    'price': price,
-                    'leverage': 1,
-                    'market_type': 'spot',
-                    'timestamp': datetime.now(),
-                    'coins_bought': coins_bought,
-                    'base_currency': base_currency,
-                    'position_id': position_id,
-                    'unrealized_pnl': 0.0
-                }
+                position_info = SpotPosition(
+                    symbol=symbol,
+                    side=side,
+                    amount=amount,
+                    price=price,
+                    position_id=position_id,
+                    base_currency=base_currency,
+                    coins_bought=coins_bought
+                )
                 
                 logger.info(f"تم شراء {coins_bought:.8f} {base_currency} بسعر ${price:.2f} وإضافتها للمحفظة")
                 
@@ -429,24 +454,22 @@ class TradingAccount:
                 self.add_to_wallet('USDT', usdt_received)
                 
                 # حفظ معلومات الصفقة
-                position_info = {
-                    'symbol': symbol,
-                    'side': side,
-                    'amount': amount,
-                    'price': price,
-                    'leverage': 1,
-                    'market_type': 'spot',
-                    'timestamp': datetime.now(),
-                    'coins_sold': coins_to_sell,
-                    'base_currency': base_currency,
-                    'position_id': position_id,
-                    'usdt_received': usdt_received,
-                    'unrealized_pnl': 0.0
-                }
+                position_info = SpotPosition(
+                    symbol=symbol,
+                    side=side,
+                    amount=amount,
+                    price=price,
+                    position_id=position_id,
+                    base_currency=base_currency,
+                    coins_sold=coins_to_sell,
+                    usdt_received=usdt_received
+                )
                 
                 logger.info(f"تم بيع {coins_to_sell:.8f} {base_currency} بسعر ${price:.2f} وحصلنا على ${usdt_received:.2f}")
             
-            self.positions[position_id] = position_info
+            self._track_position(position_id, position_info)
+            if signal_id:
+                self.link_position_signal(position_id, signal_id)
             
             # تعيين الاسم المخصص إذا تم تحديده
             if custom_name:
@@ -459,6 +482,7 @@ class TradingAccount:
             logger.error(f"خطأ في فتح صفقة السبوت: {e}")
             return False, str(e)
     
+    @_synchronized
     def close_futures_position(self, position_id: str, closing_price: float, custom_name: str = None, side: str = None) -> tuple[bool, dict]:
         """إغلاق صفقة فيوتشر"""
         try:
@@ -488,9 +512,9 @@ class TradingAccount:
             # حساب الربح/الخسارة المحققة
             realized_pnl = position.calculate_closing_pnl(closing_price)
             
-            # إرجاع الهامش + الربح/الخسارة
+            # تحرير الهامش + إضافة الربح/الخسارة (الهامش لم يُخصم من الرصيد عند الفتح، بل حُجز فقط)
             self.margin_locked -= position.margin_amount
-            self.balance += position.margin_amount + realized_pnl
+            self.balance += realized_pnl
             
             # تسجيل الصفقة في التاريخ
             trade_record = {
@@ -518,6 +542,7 @@ class TradingAccount:
                 self.losing_trades += 1
             
             # حذف الصفقة والاسم المخصص
+            self._untrack_position(position)
             del self.positions[position_id]
             self.remove_custom_position_name(position_id)
             
@@ -528,6 +553,7 @@ class TradingAccount:
             logger.error(f"خطأ في إغلاق صفقة الفيوتشر: {e}")
             return False, {"error": str(e)}
     
+    @_synchronized
     def close_spot_position(self, position_id: str, closing_price: float, custom_name: str = None) -> tuple[bool, dict]:
         """إغلاق صفقة سبوت مع المحفظة الواحدة (كشخص حقيقي)"""
         try:
@@ -622,6 +648,7 @@ class TradingAccount:
                 self.losing_trades += 1
             
             # حذف الصفقة والاسم المخصص
+            self._untrack_position(position)
             del self.positions[position_id]
             self.remove_custom_position_name(position_id)
             
@@ -632,6 +659,7 @@ class TradingAccount:
             logger.error(f"خطأ في إغلاق صفقة السبوت: {e}")
             return False, {"error": str(e)}
     
+    @_synchronized
     def close_spot_position_partial(self, position_id: str, percentage: float, closing_price: float, custom_name: str = None) -> tuple[bool, dict]:
         """إغلاق جزئي لصفقة سبوت مع المحفظة الواحدة (كشخص حقيقي)"""
         try:
@@ -714,6 +742,8 @@ class TradingAccount:
                 
                 logger.info(f"تم شراء جزئي {coins_to_buy_back:.8f} {base_currency} من أصل {total_coins_sold:.8f} بسعر ${closing_price:.2f}")
             
+            self.refresh_position(position)
+            
             # تسجيل الصفقة الجزئية
             trade_record = {
                 'symbol': position['symbol'],
@@ -746,6 +776,73 @@ class TradingAccount:
             logger.error(f"خطأ في الإغلاق الجزئي لصفقة السبوت: {e}")
             return False, {"error": str(e)}
     
+    @_synchronized
+    def close_futures_position_partial(self, position_id: str, percentage: float, closing_price: float) -> tuple[bool, dict]:
+        """إغلاق جزئي لصفقة فيوتشر (تحرير نسبة من الهامش مع ربحها/خسارتها)"""
+        try:
+            if position_id not in self.positions:
+                return False, {"error": "الصفقة غير موجودة"}
+            
+            position = self.positions[position_id]
+            
+            if not isinstance(position, FuturesPosition):
+                return False, {"error": "الصفقة ليست صفقة فيوتشر"}
+            
+            if percentage <= 0 or percentage > 100:
+                return False, {"error": f"النسبة غير صحيحة: {percentage}%. يجب أن تكون بين 1 و 100"}
+            
+            if percentage >= 100:
+                return self.close_futures_position(position_id, closing_price)
+            
+            fraction = percentage / 100
+            partial_pnl = position.calculate_closing_pnl(closing_price) * fraction
+            released_margin = position.margin_amount * fraction
+            closed_size = position.position_size * fraction
+            closed_contracts = position.contracts * fraction
+            
+            # تحرير الهامش المغلق وإضافة الربح/الخسارة
+            self.margin_locked -= released_margin
+            self.balance += partial_pnl
+            
+            # تحديث الصفقة (سعر الدخول والتصفية لا يتغيران)
+            position.margin_amount -= released_margin
+            position.position_size -= closed_size
+            position.contracts -= closed_contracts
+            self.refresh_position(position)
+            
+            trade_record = {
+                'symbol': position.symbol,
+                'side': position.side,
+                'entry_price': position.entry_price,
+                'closing_price': closing_price,
+                'margin_amount': released_margin,
+                'position_size': closed_size,
+                'leverage': position.leverage,
+                'market_type': 'futures',
+                'contracts': closed_contracts,
+                'pnl': partial_pnl,
+                'liquidation_price': position.liquidation_price,
+                'timestamp': position.timestamp,
+                'close_timestamp': datetime.now(),
+                'partial_close_percentage': percentage,
+                'position_id': position_id
+            }
+            
+            self.trade_history.append(trade_record)
+            self.total_trades += 1
+            
+            if partial_pnl > 0:
+                self.winning_trades += 1
+            else:
+                self.losing_trades += 1
+            
+            logger.info(f"تم إغلاق جزئي لصفقة فيوتشر: {position.symbol} {percentage}% PnL: {partial_pnl:.2f}")
+            return True, trade_record
+            
+        except Exception as e:
+            logger.error(f"خطأ في الإغلاق الجزئي لصفقة الفيوتشر: {e}")
+            return False, {"error": str(e)}
+    
     def get_wallet_summary(self) -> dict:
         """الحصول على ملخص المحفظة"""
         wallet_summary = {}
@@ -773,10 +870,14 @@ class TradingAccount:
                 old_name = self.position_custom_names[position_id]
                 if old_name in self.custom_position_names:
                     del self.custom_position_names[old_name]
+                    self._unindex_custom_name(old_name)
             
             # تعيين الاسم الجديد
+            if custom_name not in self.custom_position_names:
+                self._index_custom_name(custom_name)
             self.custom_position_names[custom_name] = position_id
             self.position_custom_names[position_id] = custom_name
+            self.mark_changed()
             
             logger.info(f"تم تعيين الاسم المخصص '{custom_name}' للصفقة {position_id}")
             return True
@@ -796,10 +897,9 @@ class TradingAccount:
             side_specific_name = f"{custom_name}_{side.upper()}"
             return self.custom_position_names.get(side_specific_name, None)
         else:
-            # البحث عن أي صفقة بالاسم الأساسي
-            for name, position_id in self.custom_position_names.items():
-                if name.startswith(f"{custom_name}_"):
-                    return position_id
+            # أي صفقة بالاسم الأساسي (أول اسم يبدأ بـ custom_name_)
+            for name in self._names_by_prefix.get(custom_name, ()):
+                return self.custom_position_names[name]
             return None
     
     def get_custom_name_by_position(self, position_id: str) -> str:
@@ -813,6 +913,8 @@ class TradingAccount:
                 custom_name = self.position_custom_names[position_id]
                 del self.custom_position_names[custom_name]
                 del self.position_custom_names[position_id]
+                self._unindex_custom_name(custom_name)
+                self.mark_changed()
                 logger.info(f"تم إزالة الاسم المخصص '{custom_name}' للصفقة {position_id}")
                 return True
             return False
@@ -841,17 +943,19 @@ class TradingAccount:
             
             position = self.positions[position_id]
             custom_name = self.get_custom_name_by_position(position_id)
+            if self.position_book is not None:
+                self.position_book.sync([position])
             
             position_info = {
                 'position_id': position_id,
                 'custom_name': custom_name,
-                'symbol': position['symbol'],
-                'side': position['side'],
-                'amount': position['amount'],
-                'price': position['price'],
-                'market_type': position['market_type'],
-                'timestamp': position['timestamp'],
-                'unrealized_pnl': position.get('unrealized_pnl', 0.0)
+                'symbol': position.symbol,
+                'side': position.side,
+                'amount': position.margin_amount if isinstance(position, FuturesPosition) else position.amount,
+                'price': position.entry_price if isinstance(position, FuturesPosition) else position.price,
+                'market_type': position.market_type,
+                'timestamp': position.timestamp,
+                'unrealized_pnl': position.unrealized_pnl
             }
             
             return position_info
@@ -864,6 +968,7 @@ class TradingAccount:
         """عرض جميع الصفقات مع أسمائها المخصصة"""
         try:
             positions_info = {}
+            self.sync_positions()
             
             for position_id, position in self.positions.items():
                 custom_name = self.get_custom_name_by_position(position_id)
@@ -885,13 +990,13 @@ class TradingAccount:
                     # صفقة سبوت
                     positions_info[position_id] = {
                         'custom_name': custom_name,
-                        'symbol': position['symbol'],
-                        'side': position['side'],
-                        'amount': position['amount'],
-                        'price': position['price'],
+                        'symbol': position.symbol,
+                        'side': position.side,
+                        'amount': position.amount,
+                        'price': position.price,
                         'market_type': 'spot',
-                        'timestamp': position['timestamp'],
-                        'unrealized_pnl': position.get('unrealized_pnl', 0.0)
+                        'timestamp': position.timestamp,
+                        'unrealized_pnl': position.unrealized_pnl
                     }
             
             return {
@@ -904,9 +1009,17 @@ class TradingAccount:
             logger.error(f"خطأ في عرض الصفقات: {e}")
             return {"error": str(e)}
     
+    @_synchronized
     def update_positions_pnl(self, prices: Dict[str, float]):
         """تحديث الربح/الخسارة غير المحققة لجميع الصفقات"""
         try:
+            if self.position_book is not None:
+                # تمريرة واحدة على صفوف هذا الحساب في دفتر الصفقات (مع مزامنة الكائنات)
+                crossings = self.position_book.revalue(prices, positions=list(self.positions.values()))
+                for position, _ in crossings:
+                    logger.warning(f"تحذير: صفقة {position.symbol} قريبة من التصفية!")
+                return
+            
             for position_id, position in self.positions.items():
                 if isinstance(position, FuturesPosition):
                     # صفقة فيوتشر
@@ -917,25 +1030,11 @@ class TradingAccount:
                         # فحص التصفية
                         if position.check_liquidation(current_price):
                             logger.warning(f"تحذير: صفقة {position.symbol} قريبة من التصفية!")
-                elif isinstance(position, dict) and position.get('market_type') == 'spot':
-                    # صفقة سبوت
-                    current_price = prices.get(position['symbol'])
+                else:
+                    # صفقة سبوت (العقود = المبلغ / سعر الدخول، والسعر الحالي يُحفظ في الصفقة)
+                    current_price = prices.get(position.symbol)
                     if current_price:
-                        entry_price = position['price']
-                        amount = position.get('amount', 0)
-                        side = position['side']
-                        
-                        # حساب العقود بناءً على المبلغ والسعر
-                        contracts = amount / entry_price if entry_price > 0 else 0
-                        position['contracts'] = contracts
-                        
-                        if side.lower() == "buy":
-                            unrealized_pnl = (current_price - entry_price) * contracts
-                        else:
-                            unrealized_pnl = (entry_price - current_price) * contracts
-                        
-                        position['unrealized_pnl'] = unrealized_pnl
-                        position['current_price'] = current_price  # حفظ السعر الحالي
+                        position.update_pnl(current_price)
                         
         except Exception as e:
             logger.error(f"خطأ في تحديث PnL: {e}")
@@ -943,11 +1042,9 @@ class TradingAccount:
     def get_total_unrealized_pnl(self) -> float:
         """الحصول على مجموع الربح/الخسارة غير المحققة"""
         total_pnl = 0.0
+        self.sync_positions()
         for position in self.positions.values():
-            if isinstance(position, FuturesPosition):
-                total_pnl += position.unrealized_pnl
-            elif isinstance(position, dict):
-                total_pnl += position.get('unrealized_pnl', 0.0)
+            total_pnl += position.unrealized_pnl
         return total_pnl
     
     def get_margin_ratio(self) -> float:
@@ -965,16 +1062,79 @@ class TradingAccount:
         """تحديث رصيد الحساب"""
         self.balance = new_balance
         self.initial_balance = new_balance
+        self.mark_changed()
         
+    @_synchronized
     def reset_account(self):
         """إعادة تعيين الحساب"""
         self.balance = self.initial_balance
+        if self.position_book is not None:
+            self.position_book.remove_account(self)
         self.positions = {}
+        self.position_signal_ids = {}
+        self._ids_by_symbol = {}
+        self._ids_by_symbol_side = {}
+        self._ids_by_signal = {}
         self.trade_history = []
         self.total_trades = 0
         self.winning_trades = 0
         self.losing_trades = 0
         self.margin_locked = 0.0
+        self.mark_changed()
+    
+    @_synchronized
+    def export_state(self) -> Dict:
+        """حالة الحساب بأنواع أساسية (لقطات الحسابات) - سجل الصفقات المغلقة في قاعدة البيانات وليس هنا"""
+        futures_rows, spot_rows = [], []
+        for position in self.positions.values():
+            if isinstance(position, FuturesPosition):
+                futures_rows.append(position.to_row())
+            else:
+                spot_rows.append(position.to_row())
+        return {
+            'account_type': self.account_type,
+            'balance': self.balance,
+            'initial_balance': self.initial_balance,
+            'margin_locked': self.margin_locked,
+            'total_trades': self.total_trades,
+            'winning_trades': self.winning_trades,
+            'losing_trades': self.losing_trades,
+            'wallet': dict(self.wallet),
+            'futures_position_wallets': {position_id: dict(wallet)
+                                         for position_id, wallet in self.futures_position_wallets.items()},
+            'custom_position_names': dict(self.custom_position_names),
+            'position_signal_ids': dict(self.position_signal_ids),
+            'futures_positions': futures_rows,
+            'spot_positions': spot_rows,
+        }
+    
+    @_synchronized
+    def restore_state(self, state: Dict):
+        """استعادة حساب جديد من export_state() (قبل ربطه بلقطات الحسابات)"""
+        self.balance = state['balance']
+        self.initial_balance = state['initial_balance']
+        self.margin_locked = state['margin_locked']
+        self.total_trades = state['total_trades']
+        self.winning_trades = state['winning_trades']
+        self.losing_trades = state['losing_trades']
+        self.wallet = dict(state['wallet'])
+        self.futures_position_wallets = {position_id: dict(wallet)
+                                         for position_id, wallet in state['futures_position_wallets'].items()}
+        
+        for row in state['futures_positions']:
+            position = FuturesPosition.from_row(row)
+            self._track_position(position.position_id, position)
+        for row in state['spot_positions']:
+            position = SpotPosition.from_row(row)
+            self._track_position(position.position_id, position)
+        
+        for custom_name, position_id in state['custom_position_names'].items():
+            if position_id in self.positions:
+                self.custom_position_names[custom_name] = position_id
+                self.position_custom_names[position_id] = custom_name
+                self._index_custom_name(custom_name)
+        for position_id, signal_id in state['position_signal_ids'].items():
+            self.link_position_signal(position_id, signal_id)
     
     def get_account_info(self) -> Dict:
         """الحصول على معلومات الحساب"""
@@ -1001,10 +1161,11 @@ class TradingAccount:
 class BybitAPI:
     """فئة للتعامل مع Bybit API"""
     
-    def __init__(self, api_key: str, api_secret: str):
+    def __init__(self, api_key: str, api_secret: str, base_url: str = None):
         self.api_key = api_key
         self.api_secret = api_secret
-        self.base_url = "https://api.bybit.com"
+        # base_url قابل للتغيير (مثلاً إلى المحاكي المحلي)
+        self.base_url = (base_url or BYBIT_BASE_URL).rstrip('/')
         
     def _generate_signature(self, params: dict, timestamp: str) -> str:
         """إنشاء التوقيع للطلبات - نسخة محسنة ومصادق عليها"""
@@ -1057,10 +1218,10 @@ class BybitAPI:
             
             # إرسال الطلب
             if method.upper() == "GET":
-                response = requests.get(url, params=params, headers=headers, timeout=10)
+                response = http_transport.get(url, params=params, headers=headers)
             else:
                 # للمتطلبات POST، نرسل JSON في body
-                response = requests.post(url, json=params, headers=headers, timeout=10)
+                response = http_transport.post(url, json=params, headers=headers)
             
             # التحقق من الحالة
             response.raise_for_status()
@@ -1419,7 +1580,7 @@ class BybitAPI:
             
             # إرسال POST مع query string
             url_with_params = f"{url}?{param_str}"
-            response = requests.post(url_with_params, headers=headers, timeout=10)
+            response = http_transport.post(url_with_params, headers=headers)
             response.raise_for_status()
             
             result = response.json()
@@ -1549,6 +1710,10 @@ class PositionManagement:
     market_type: str  # spot or futures
     leverage: int = 1
     
+    # صاحب الصفقة ونوع حسابها (الإغلاق التلقائي يُنفذ على حسابه الحقيقي أو التجريبي)
+    owner_id: Optional[int] = None
+    is_real: bool = False
+    
     # أدوات الإدارة
     take_profits: List[TakeProfitLevel] = field(default_factory=list)
     stop_loss: Optional[StopLoss] = None
@@ -1558,6 +1723,47 @@ class PositionManagement:
     realized_pnl: float = 0.0
     closed_parts: List[Dict] = field(default_factory=list)
     
+    # يُستدعى عند تغيير المستويات (يعيّنه TradeToolsManager لتحديث فهرس التفعيل)
+    on_levels_changed: Optional[Any] = field(default=None, repr=False, compare=False)
+    
+    def levels_changed(self):
+        """إبلاغ المدير بتغيير الأهداف أو وقف الخسارة (بعد تعديلها مباشرة من الواجهة)"""
+        if self.on_levels_changed is not None:
+            self.on_levels_changed(self)
+    
+    def liquidation_price(self) -> Optional[float]:
+        """سعر التصفية التقريبي بنفس صيغة FuturesPosition (None للسبوت أو بدون رافعة)"""
+        if self.market_type != 'futures' or not self.leverage or self.leverage <= 1:
+            return None
+        rate = FuturesPosition.maintenance_margin_rate
+        if self.side.lower() == "buy":
+            return max(self.entry_price * (1 - (1 / self.leverage) + rate), 0.000001)
+        return self.entry_price * (1 + (1 / self.leverage) - rate)
+    
+    def trigger_levels(self) -> List[tuple]:
+        """
+        مستويات التفعيل الحالية لفهرس التفعيل: [(kind, tag, price, direction)]
+        
+        'trail' هو السعر الذي يبدأ عنده Trailing Stop بالتحرك (وقف الخسارة ÷ (1 ∓ المسافة))
+        """
+        buy = self.side.lower() == "buy"
+        levels = [('tp', i, tp.price, UP if buy else DOWN)
+                  for i, tp in enumerate(self.take_profits) if not tp.hit]
+        
+        sl = self.stop_loss
+        if sl:
+            levels.append(('sl', 0, sl.price, DOWN if buy else UP))
+            if sl.is_trailing and 0 < sl.trailing_distance < 100:
+                if buy:
+                    levels.append(('trail', 0, sl.price / (1 - sl.trailing_distance / 100), UP))
+                else:
+                    levels.append(('trail', 0, sl.price / (1 + sl.trailing_distance / 100), DOWN))
+        
+        liquidation = self.liquidation_price()
+        if liquidation is not None:
+            levels.append(('liquidation', 0, liquidation, DOWN if buy else UP))
+        return levels
+    
     def add_take_profit(self, price: float, percentage: float) -> bool:
         """إضافة مستوى هدف ربح"""
         try:
@@ -1579,6 +1785,7 @@ class PositionManagement:
             self.take_profits.append(tp)
             # ترتيب حسب السعر
             self.take_profits.sort(key=lambda x: x.price if self.side.lower() == "buy" else -x.price)
+            self.levels_changed()
             logger.info(f"✅ تم إضافة TP: {price:.6f} ({percentage}%)")
             return True
             
@@ -1605,6 +1812,7 @@ class PositionManagement:
                 trailing_distance=trailing_distance,
                 last_update=datetime.now()
             )
+            self.levels_changed()
             logger.info(f"✅ تم تعيين SL: {price:.6f} {'(Trailing)' if is_trailing else ''}")
             return True
             
@@ -1792,6 +2000,10 @@ class TradeToolsManager:
     
     def __init__(self):
         self.managed_positions: Dict[str, PositionManagement] = {}
+        # محرك الصفقات يفحص الأهداف في loop خاص بينما تعدّلها واجهة Telegram
+        self.lock = threading.RLock()
+        # فهرس مستويات TP/SL/Trailing/التصفية لكل رمز (systems/trigger_index.py)
+        self.trigger_index = TriggerIndex() if TRIGGER_INDEX_SETTINGS.get('enabled', True) else None
         # الإعدادات الافتراضية التلقائية
         self.auto_apply_enabled: bool = False
         self.default_tp_percentages: List[float] = []
@@ -1802,9 +2014,11 @@ class TradeToolsManager:
         self.auto_breakeven_on_tp1: bool = True
         logger.info("✅ تم تهيئة TradeToolsManager")
     
+    @_synchronized
     def create_managed_position(self, position_id: str, symbol: str, side: str,
                                entry_price: float, quantity: float, market_type: str,
-                               leverage: int = 1) -> Optional[PositionManagement]:
+                               leverage: int = 1, owner_id: int = None,
+                               is_real: bool = False) -> Optional[PositionManagement]:
         """إنشاء صفقة مدارة"""
         try:
             if position_id in self.managed_positions:
@@ -1819,10 +2033,13 @@ class TradeToolsManager:
                 quantity=quantity,
                 remaining_quantity=quantity,
                 market_type=market_type,
-                leverage=leverage
+                leverage=leverage,
+                owner_id=owner_id,
+                is_real=is_real
             )
             
             self.managed_positions[position_id] = pm
+            pm.on_levels_changed = self._index_position
             logger.info(f"✅ تم إنشاء إدارة للصفقة {position_id}")
             return pm
             
@@ -1834,22 +2051,46 @@ class TradeToolsManager:
         """الحصول على صفقة مدارة"""
         return self.managed_positions.get(position_id)
     
+    @_synchronized
     def remove_managed_position(self, position_id: str) -> bool:
         """إزالة صفقة مدارة"""
         if position_id in self.managed_positions:
-            del self.managed_positions[position_id]
+            pm = self.managed_positions.pop(position_id)
+            pm.on_levels_changed = None
+            if self.trigger_index is not None:
+                self.trigger_index.remove(position_id)
             logger.info(f"✅ تم إزالة إدارة الصفقة {position_id}")
             return True
         return False
     
-    def update_all_positions(self, prices: Dict[str, float]) -> Dict[str, List[Dict]]:
-        """تحديث جميع الصفقات المدارة"""
+    @_synchronized
+    def _index_position(self, pm: PositionManagement):
+        """تحديث مستويات الصفقة في فهرس التفعيل (تحريك ما تغير فقط)"""
+        if self.trigger_index is None or self.managed_positions.get(pm.position_id) is not pm:
+            return
+        self.trigger_index.set_levels(pm.position_id, pm.symbol, pm.market_type, pm.trigger_levels())
+    
+    @_synchronized
+    def update_all_positions(self, prices: Dict[str, float] = None,
+                             exchange: str = 'bybit') -> Dict[str, List[Dict]]:
+        """
+        تحديث جميع الصفقات المدارة
+        
+        إذا لم تُمرر الأسعار تُقرأ من ناقل الأسعار حسب نوع سوق كل صفقة.
+        مع فهرس التفعيل تُفحص فقط الصفقات التي عبر السعر أحد مستوياتها منذ التحديث السابق
+        """
+        if self.trigger_index is not None:
+            return self._update_crossed_positions(prices, exchange)
+        
         results = {}
         
         for position_id, pm in list(self.managed_positions.items()):
-            if pm.symbol in prices:
-                current_price = prices[pm.symbol]
-                
+            if prices is None:
+                current_price = price_bus.get_price(exchange, pm.symbol, pm.market_type)
+            else:
+                current_price = prices.get(pm.symbol)
+            
+            if current_price is not None:
                 # التحقق من الأهداف
                 tp_executions = pm.check_and_execute_tp(current_price)
                 
@@ -1859,7 +2100,8 @@ class TradeToolsManager:
                 if tp_executions or sl_execution:
                     results[position_id] = {
                         'take_profits': tp_executions,
-                        'stop_loss': sl_execution
+                        'stop_loss': sl_execution,
+                        'position': pm
                     }
                 
                 # إزالة الصفقة إذا تم إغلاقها بالكامل
@@ -1868,6 +2110,71 @@ class TradeToolsManager:
         
         return results
     
+    def _update_crossed_positions(self, prices: Optional[Dict[str, float]],
+                                  exchange: str) -> Dict[str, Dict]:
+        """سعر واحد لكل رمز في الفهرس، ثم فحص الصفقات التي عُبرت مستوياتها فقط"""
+        results = {}
+        for symbol, market_type in self.trigger_index.symbols():
+            if prices is None:
+                current_price = price_bus.get_price(exchange, symbol, market_type)
+            else:
+                current_price = prices.get(symbol)
+            if current_price is not None:
+                results.update(self.on_price(symbol, market_type, current_price))
+        return results
+    
+    @_synchronized
+    def on_price(self, symbol: str, market_type: str, current_price: float) -> Dict[str, Dict]:
+        """
+        سعر جديد لرمز واحد: فحص الصفقات التي عبر السعر أحد مستوياتها بنفس فحوصات الصفقة
+        
+        Returns:
+            {position_id: {'take_profits': [...], 'stop_loss': {...} أو None, 'liquidation': {...} أو None,
+                           'position': PositionManagement (تبقى متاحة للتنفيذ بعد إزالتها عند SL)}}
+        """
+        if self.trigger_index is None:
+            return {}
+        
+        crossed: Dict[str, set] = {}
+        for position_id, kind, _ in self.trigger_index.on_price(symbol, market_type, current_price):
+            crossed.setdefault(position_id, set()).add(kind)
+        
+        results = {}
+        for position_id, kinds in crossed.items():
+            pm = self.managed_positions.get(position_id)
+            if pm is None:
+                self.trigger_index.remove(position_id)
+                continue
+            
+            tp_executions = pm.check_and_execute_tp(current_price)
+            sl_execution = pm.check_stop_loss(current_price)
+            
+            liquidation = None
+            if 'liquidation' in kinds:
+                liquidation = {
+                    'type': 'liquidation',
+                    'price': current_price,
+                    'liquidation_price': pm.liquidation_price(),
+                    'time': datetime.now()
+                }
+                logger.warning(f"⚠️ الصفقة المدارة {position_id} ({pm.symbol}) تجاوزت سعر التصفية عند {current_price:.6f}")
+            
+            if tp_executions or sl_execution or liquidation:
+                results[position_id] = {
+                    'take_profits': tp_executions,
+                    'stop_loss': sl_execution,
+                    'liquidation': liquidation,
+                    'position': pm
+                }
+            
+            if pm.remaining_quantity <= 0 or sl_execution:
+                self.remove_managed_position(position_id)
+            else:
+                # الأهداف المحققة تخرج من الفهرس، و SL يتحرك (Trailing / التعادل)
+                self._index_position(pm)
+        
+        return results
+    
     def set_default_levels(self, position_id: str, tp_percentages: List[float] = None,
                           sl_percentage: float = 2.0, trailing: bool = False) -> bool:
         """تعيين مستويات افتراضية ذكية"""
@@ -2002,15 +2309,15 @@ class TradeToolsManager:
     
     def apply_auto_settings_to_position(self, position_id: str, symbol: str, side: str,
                                        entry_price: float, quantity: float, 
-                                       market_type: str, leverage: int = 1) -> bool:
-        """تطبيق الإعدادات التلقائية على صفقة جديدة"""
+                                       market_type: str, leverage: int = 1, owner_id: int = None) -> bool:
+        """تطبيق الإعدادات التلقائية على صفقة جديدة (تجريبية)"""
         if not self.auto_apply_enabled:
             return False
         
         try:
             # إنشاء إدارة الصفقة
             pm = self.create_managed_position(position_id, symbol, side, entry_price, 
-                                             quantity, market_type, leverage)
+                                             quantity, market_type, leverage, owner_id=owner_id)
             if not pm:
                 return False
             
@@ -2107,10 +2414,10 @@ class TradingBot:
         # قائمة الصفقات المفتوحة (مرتبطة بحسابات المستخدم)
         self.open_positions = {}  # {position_id: position_info}
         
-        # تهيئة النظام المحسن
+        # النظام المحسن: نسخة واحدة مشتركة (تستخدمها مرحلة التحليل في الخلفية)
         if ENHANCED_SYSTEM_AVAILABLE:
             try:
-                self.enhanced_system = SimpleEnhancedSystem()
+                self.enhanced_system = enrichment_worker.system
                 logger.info("Enhanced system initialized in TradingBot")
             except Exception as e:
                 logger.warning(f"Failed to initialize enhanced system: {e}")
@@ -2135,7 +2442,10 @@ class TradingBot:
     
     async def _get_demo_price_from_exchange(self, exchange: str, symbol: str, market_type: str) -> Optional[float]:
         """
-        جلب السعر من Public API للمنصة المختارة (بدون الحاجة لربط API)
+        جلب السعر للحساب التجريبي (بدون الحاجة لربط API)
+        
+        يُقرأ السعر من ناقل الأسعار أولاً، وعند عدم وجود سعر حديث يُجلب من Public API
+        ويُنشر في الناقل ليستفيد منه الطلب التالي
         
         Args:
             exchange: اسم المنصة (bybit, binance, bitget, okx)
@@ -2145,16 +2455,28 @@ class TradingBot:
         Returns:
             السعر الحالي أو None في حالة الفشل
         """
+        price = price_bus.get_price(exchange, symbol, market_type)
+        if price is not None:
+            logger.info(f"✅ تم جلب السعر من ناقل الأسعار: {price}")
+            return price
+        
+        price = await self._fetch_demo_price_rest(exchange, symbol, market_type)
+        if price:
+            price_bus.publish(exchange, market_type, symbol, price)
+        return price
+    
+    async def _fetch_demo_price_rest(self, exchange: str, symbol: str, market_type: str) -> Optional[float]:
+        """جلب السعر من Public API للمنصة المختارة"""
         try:
             exchange = exchange.lower()
             
             if exchange == 'bybit':
                 # Bybit Public API - لا يحتاج authentication
                 api_category = 'linear' if market_type == 'futures' else 'spot'
-                url = f"https://api.bybit.com/v5/market/tickers"
+                url = f"{BYBIT_BASE_URL}/v5/market/tickers"
                 params = {"category": api_category, "symbol": symbol}
                 
-                response = requests.get(url, params=params, timeout=5)
+                response = http_transport.get(url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('retCode') == 0:
@@ -2173,7 +2495,7 @@ class TradingBot:
                     url = f"https://api.binance.com/api/v3/ticker/price"
                 
                 params = {"symbol": symbol}
-                response = requests.get(url, params=params, timeout=5)
+                response = http_transport.get(url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if data and 'price' in data:
@@ -2190,7 +2512,7 @@ class TradingBot:
                     url = "https://api.bitget.com/api/spot/v1/market/ticker"
                     params = {"symbol": symbol}
                 
-                response = requests.get(url, params=params, timeout=5)
+                response = http_transport.get(url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('code') == '00000':
@@ -2209,7 +2531,7 @@ class TradingBot:
                     url = f"https://www.okx.com/api/v5/market/ticker"
                     params = {"instId": symbol + '-USDT'}
                 
-                response = requests.get(url, params=params, timeout=5)
+                response = http_transport.get(url, params=params)
                 if response.status_code == 200:
                     data = response.json()
                     if data.get('code') == '0':
@@ -2276,14 +2598,14 @@ class TradingBot:
                 market_type = position_info.get('account_type', 'spot')
                 symbols_to_update[symbol] = market_type
             
-            # الحصول على الأسعار الحالية
+            # مزامنة الاشتراكات في ناقل الأسعار مع الصفقات المفتوحة
+            self._sync_price_bus_subscriptions(symbols_to_update)
+            
+            # الحصول على الأسعار الحالية من الجدول المشترك (لقطة واحدة لكل فئة عند الحاجة)
             current_prices = {}
-            for symbol, market_type in symbols_to_update.items():
-                if self.bybit_api:
-                    category = "linear" if market_type == "futures" else "spot"
-                    price = self.bybit_api.get_ticker_price(symbol, category)
-                    if price:
-                        current_prices[symbol] = price
+            for market_type in set(symbols_to_update.values()):
+                symbols = [s for s, m in symbols_to_update.items() if m == market_type]
+                current_prices.update(await asyncio.to_thread(ticker_snapshot.get_prices, symbols, market_type))
             
             # تحديث الصفقات في الحسابات التجريبية
             if current_prices:
@@ -2316,12 +2638,36 @@ class TradingBot:
                             pnl_percent = ((entry_price - current_price) / entry_price) * 100
                         
                         position_info['pnl_percent'] = pnl_percent
+            
+            # فحص أهداف الربح ووقف الخسارة من نفس جدول الأسعار
+            # (محرك الصفقات يفحصها وينفذها مع وصول كل سعر، بما فيها أسعار هذه اللقطة)
+            if not position_engine.running:
+                tp_sl_results = trade_tools_manager.update_all_positions()
+                for position_id, result in tp_sl_results.items():
+                    if not (result.get('take_profits') or result.get('stop_loss')):
+                        continue
+                    # الأهداف والوقف حُسبت على الصفقة المدارة - يجب تنفيذ الإغلاق فعلياً وإلا تضيع
+                    executed = result.get('stop_loss') or result['take_profits'][0]
+                    logger.info(f"🎯 تفعيل TP/SL للصفقة {position_id}: {result}")
+                    await execute_managed_position_close(position_id, result, executed['price'])
                         
         except Exception as e:
             logger.error(f"خطأ في تحديث أسعار الصفقات: {e}")
             import traceback
             traceback.print_exc()
     
+    def _sync_price_bus_subscriptions(self, symbols: Dict[str, str]):
+        """الاشتراك في رموز الصفقات الجديدة وإلغاء اشتراك الرموز التي أُغلقت صفقاتها"""
+        current = set(symbols.items())
+        previous = getattr(self, '_price_bus_symbols', set())
+        
+        for symbol, market_type in current - previous:
+            price_bus.subscribe('bybit', [symbol], market_type)
+        for symbol, market_type in previous - current:
+            price_bus.unsubscribe('bybit', [symbol], market_type)
+        
+        self._price_bus_symbols = current
+    
     def get_available_pairs_message(self, category=None, brief=False, limit=50):
         """الحصول على رسالة الأزواج المتاحة"""
         try:
@@ -2367,6 +2713,8 @@ class TradingBot:
         """
         إرسال إشارة المطور لجميع المتابعين مع فتح صفقات تلقائية
         يدعم: market_type, leverage, amount من إعدادات الإشارة
+        
+        السعر يُجلب مرة واحدة، والمتابعون يُنفذون بالتوازي عبر follower_fanout
         """
         try:
             # الحصول على قائمة المتابعين
@@ -2379,85 +2727,77 @@ class TradingBot:
             logger.info(f"📡 إرسال إشارة المطور إلى {len(followers)} متابع")
             logger.info(f"📊 تفاصيل الإشارة: {signal_data}")
             
-            # الحصول على السعر الحالي للرمز
-            current_price = self.get_current_price(signal_data.get('symbol', 'BTCUSDT'))
-            price = current_price.get('price', 0) if current_price else 0
+            # الحصول على السعر الحالي للرمز (مرة واحدة لجميع المتابعين)
+            symbol = signal_data.get('symbol', 'BTCUSDT')
+            price = await self._get_demo_price_from_exchange('bybit', symbol, signal_data.get('market_type', 'spot')) or 0
             
-            # إرسال الإشارة لكل متابع
-            success_count = 0
-            failed_count = 0
+            # الأزواج المتاحة تُحدّث مرة واحدة وتُشارك مع بوتات المتابعين
+            await self.update_available_pairs()
             
+            # إضافة السعر للإشارة
+            enriched_signal = signal_data.copy()
+            enriched_signal['price'] = price
+            
+            # تجهيز المتابعين: التحقق من وجودهم ونشاطهم قبل بدء التنفيذ
+            follower_entries = []
             for follower_id in followers:
-                try:
-                    logger.info(f"🔍 معالجة المتابع {follower_id}...")
-                    
-                    # التحقق من وجود المتابع ونشاطه
-                    follower_data = user_manager.get_user(follower_id)
-                    if not follower_data:
-                        logger.warning(f"⚠️ المتابع {follower_id} غير موجود في user_manager")
-                        # محاولة التحميل من قاعدة البيانات
-                        from users.database import db_manager
-                        follower_data = db_manager.get_user(follower_id)
-                        if follower_data:
-                            logger.info(f"✅ تم تحميل المتابع {follower_id} من قاعدة البيانات")
-                        else:
-                            logger.error(f"❌ المتابع {follower_id} غير موجود في قاعدة البيانات أيضاً")
-                            failed_count += 1
-                            continue
+                follower_data = user_manager.get_user(follower_id)
+                if not follower_data:
+                    logger.warning(f"⚠️ المتابع {follower_id} غير موجود في user_manager")
+                    # محاولة التحميل من قاعدة البيانات
+                    from users.database import db_manager
+                    follower_data = db_manager.get_user(follower_id)
+                    if follower_data:
+                        logger.info(f"✅ تم تحميل المتابع {follower_id} من قاعدة البيانات")
+                
+                if not follower_data:
+                    logger.error(f"❌ المتابع {follower_id} غير موجود في قاعدة البيانات أيضاً")
+                    follower_entries.append({'user_id': follower_id, 'skip_reason': 'not found'})
+                    continue
+                
+                if not follower_data.get('is_active', False):
+                    logger.warning(f"⏸️ المتابع {follower_id} غير نشط (is_active=False) - تم التخطي")
+                    follower_entries.append({'user_id': follower_id, 'skip_reason': 'inactive'})
+                    continue
+                
+                exchange = follower_data.get('exchange', 'bybit') or 'bybit'
+                api_key = None
+                if follower_data.get('account_type') == 'real':
+                    api_key = follower_data.get(f'{exchange}_api_key') or follower_data.get('api_key')
+                follower_entries.append({'user_id': follower_id, 'exchange': exchange, 'api_key': api_key})
+            
+            async def execute_follower(follower):
+                follower_id = follower['user_id']
+                
+                # إنشاء TradingBot مؤقت للمتابع
+                follower_bot = TradingBot()
+                follower_bot.user_id = follower_id
+                follower_bot.available_pairs = self.available_pairs
+                follower_bot.last_pairs_update = self.last_pairs_update
+                
+                # الحصول على إعدادات المتابع
+                follower_settings = user_manager.get_user_settings(follower_id)
+                if follower_settings:
+                    follower_bot.user_settings = follower_settings
                     
-                    logger.info(f"📊 المتابع {follower_id}: is_active={follower_data.get('is_active')}, market_type={follower_data.get('market_type')}")
-                    
-                    if not follower_data.get('is_active', False):
-                        logger.warning(f"⏸️ المتابع {follower_id} غير نشط (is_active=False) - تم التخطي")
-                        failed_count += 1
-                        continue
-                    
-                    # إنشاء TradingBot مؤقت للمتابع
-                    logger.info(f"🤖 إنشاء bot للمتابع {follower_id}...")
-                    follower_bot = TradingBot()
-                    follower_bot.user_id = follower_id
-                    
-                    # الحصول على إعدادات المتابع
-                    follower_settings = user_manager.get_user_settings(follower_id)
-                    if follower_settings:
-                        logger.info(f"⚙️ إعدادات المتابع {follower_id}: {follower_settings}")
-                        follower_bot.user_settings = follower_settings
-                        
-                        # تطبيق إعدادات الإشارة (تجاوز إعدادات المستخدم إذا كانت موجودة في الإشارة)
-                        if 'market_type' in signal_data:
-                            follower_bot.user_settings['market_type'] = signal_data['market_type']
-                            logger.info(f"📊 تطبيق market_type من الإشارة: {signal_data['market_type']}")
-                        
-                        if 'leverage' in signal_data:
-                            follower_bot.user_settings['leverage'] = signal_data['leverage']
-                            logger.info(f"⚡ تطبيق leverage من الإشارة: {signal_data['leverage']}")
-                        
-                        if 'amount' in signal_data:
-                            follower_bot.user_settings['trade_amount'] = signal_data['amount']
-                            logger.info(f"💰 تطبيق trade_amount من الإشارة: {signal_data['amount']}")
-                    else:
-                        logger.warning(f"⚠️ لم يتم العثور على إعدادات للمتابع {follower_id}")
-                    
-                    # إضافة السعر للإشارة
-                    enriched_signal = signal_data.copy()
-                    enriched_signal['price'] = price
-                    
-                    logger.info(f"📡 إرسال الإشارة للمتابع {follower_id}: {enriched_signal}")
-                    
-                    # تنفيذ الإشارة على حساب المتابع
-                    await follower_bot.process_signal(enriched_signal)
-                    success_count += 1
-                    logger.info(f"✅ تم تنفيذ الإشارة بنجاح للمتابع {follower_id} - Market: {follower_bot.user_settings.get('market_type', 'spot')}")
-                    
-                    # إرسال إشعار للمتابع
-                    try:
-                        from telegram import Bot
-                        bot = Bot(token=TELEGRAM_TOKEN)
-                        
-                        market_emoji = "📈" if signal_data.get('market_type') == 'spot' else "🚀"
-                        action_emoji = "🟢" if signal_data.get('action') == 'buy' else "🔴"
-                        
-                        notification_message = f"""
+                    # تطبيق إعدادات الإشارة (تجاوز إعدادات المستخدم إذا كانت موجودة في الإشارة)
+                    if 'market_type' in signal_data:
+                        follower_bot.user_settings['market_type'] = signal_data['market_type']
+                    if 'leverage' in signal_data:
+                        follower_bot.user_settings['leverage'] = signal_data['leverage']
+                    if 'amount' in signal_data:
+                        follower_bot.user_settings['trade_amount'] = signal_data['amount']
+                else:
+                    logger.warning(f"⚠️ لم يتم العثور على إعدادات للمتابع {follower_id}")
+                
+                # تنفيذ الإشارة على حساب المتابع
+                await follower_bot.process_signal(enriched_signal.copy())
+                return follower_bot.user_settings.get('market_type', 'spot')
+            
+            market_emoji = "📈" if signal_data.get('market_type') == 'spot' else "🚀"
+            action_emoji = "🟢" if signal_data.get('action') == 'buy' else "🔴"
+            
+            notification_message = f"""
 📡 إشارة جديدة من Nagdat!
 
 {action_emoji} الإجراء: {signal_data.get('action', 'N/A').upper()}
@@ -2466,31 +2806,29 @@ class TradingBot:
 {market_emoji} السوق: {signal_data.get('market_type', 'spot').upper()}
 💰 المبلغ: {signal_data.get('amount', 100)}
 """
-                        if signal_data.get('market_type') == 'futures':
-                            notification_message += f"⚡ الرافعة: {signal_data.get('leverage', 10)}x\n"
-                        
-                        notification_message += "\n⚡ تم تنفيذ الصفقة تلقائياً على حسابك!"
-                        
-                        await bot.send_message(
-                            chat_id=follower_id,
-                            text=notification_message
-                        )
-                    except Exception as notify_error:
-                        logger.error(f"خطأ في إرسال الإشعار للمتابع {follower_id}: {notify_error}")
-                        
-                except Exception as e:
-                    logger.error(f"❌ خطأ في إرسال الإشارة للمتابع {follower_id}: {e}")
-                    failed_count += 1
+            if signal_data.get('market_type') == 'futures':
+                notification_message += f"⚡ الرافعة: {signal_data.get('leverage', 10)}x\n"
             
-            # إرسال تقرير مفصل للمطور
-            market_emoji = "📈" if signal_data.get('market_type') == 'spot' else "🚀"
+            notification_message += "\n⚡ تم تنفيذ الصفقة تلقائياً على حسابك!"
             
+            # الإشعارات تمر عبر موزع الرسائل فلا تؤخر تنفيذ باقي المتابعين
+            async def notify_follower(follower, result):
+                telegram_dispatcher.send(follower['user_id'], notification_message)
+            
+            summary = await follower_fanout.broadcast(
+                follower_entries, execute_follower, notify_follower, name=f'developer:{developer_id}'
+            )
+            success_count = summary['filled']
+            failed_count = summary['failed'] + summary['skipped']
+            
+            # إرسال تقرير مفصل للمطور
             message = f"""
 📡 تم توزيع الإشارة
 
 ✅ نجح: {success_count} 
 ❌ فشل: {failed_count}
 📊 الإجمالي: {len(followers)} متابع
+⏱️ زمن آخر تنفيذ: {summary['time_to_last_fill_ms'] or 0:.0f}ms
 
 📊 تفاصيل الإشارة:
 💎 الرمز: {signal_data.get('symbol', 'N/A')}
@@ -2507,7 +2845,9 @@ class TradingBot:
                 'success': True,
                 'sent_to': success_count,
                 'failed': failed_count,
-                'total_followers': len(followers)
+                'total_followers': len(followers),
+                'time_to_last_fill_ms': summary['time_to_last_fill_ms'],
+                'results': summary['results']
             }
             
         except Exception as e:
@@ -2528,21 +2868,8 @@ class TradingBot:
                 logger.info("البوت متوقف، تم تجاهل الإشارة")
                 return
             
-            # استخدام النظام المحسن إذا كان متاحاً
-            if self.enhanced_system:
-                logger.info("🚀 معالجة الإشارة باستخدام النظام المحسن...")
-                enhanced_result = self.enhanced_system.process_signal(self.user_id or 0, signal_data)
-                logger.info(f"✅ نتيجة النظام المحسن: {enhanced_result}")
-                
-                # إذا نجح النظام المحسن، نستخدم النتيجة ولكن نتابع التنفيذ العادي
-                if enhanced_result.get('status') == 'success':
-                    logger.info("✅ تم استخدام نتيجة النظام المحسن، نتابع التنفيذ العادي")
-                    # نستخدم النتيجة المحسنة ولكن نتابع التنفيذ العادي
-                    signal_data['enhanced_analysis'] = enhanced_result.get('analysis', {})
-                    signal_data['enhanced_risk_assessment'] = enhanced_result.get('risk_assessment', {})
-                    signal_data['enhanced_execution_plan'] = enhanced_result.get('execution_plan', {})
-                else:
-                    logger.warning("⚠️ فشل النظام المحسن، نعود للنظام العادي")
+            # التحليل المحسن لا يمنع الصفقة - يعمل في الخلفية (أو قبل التنفيذ إذا فعّله المستخدم)
+            enrichment_worker.enrich(self.user_id or 0, signal_data, stage='bot.signal')
             
             # تحويل الإشارة إذا كانت بالتنسيق الجديد
             from signals.signal_converter import convert_simple_signal, validate_simple_signal
@@ -2848,37 +3175,13 @@ class TradingBot:
     async def execute_real_trade(self, symbol: str, action: str, price: float, category: str):
         """تنفيذ صفقة حقيقية عبر Bybit API مع تطبيق TP/SL التلقائي"""
         try:
-            # استخدام النظام المحسن إذا كان متاحاً
-            if self.enhanced_system:
-                logger.info("🚀 تحليل الصفقة باستخدام النظام المحسن...")
-                enhanced_analysis = self.enhanced_system.process_signal(self.user_id or 0, {
-                    "action": action,
-                    "symbol": symbol,
-                    "price": price,
-                    "category": category
-                })
-                
-                if enhanced_analysis.get('status') == 'success':
-                    logger.info("✅ تم تحليل الصفقة باستخدام النظام المحسن")
-                    analysis = enhanced_analysis.get('analysis', {})
-                    risk_assessment = enhanced_analysis.get('risk_assessment', {})
-                    execution_plan = enhanced_analysis.get('execution_plan', {})
-                    
-                    # تطبيق التحليل المحسن
-                    if analysis.get('recommendation') == 'execute':
-                        logger.info(f"✅ النظام المحسن يوصي بالتنفيذ: {analysis.get('confidence_level', 0)*100:.1f}% ثقة")
-                    else:
-                        logger.warning(f"⚠️ النظام المحسن لا يوصي بالتنفيذ: {analysis.get('recommendation', 'unknown')}")
-                    
-                    # تطبيق تقييم المخاطر المحسن
-                    if risk_assessment.get('risk_level') == 'high':
-                        logger.warning(f"⚠️ تحذير من المخاطر العالية: {risk_assessment.get('recommendation', 'unknown')}")
-                    
-                    # تطبيق خطة التنفيذ المحسنة
-                    if execution_plan.get('strategy'):
-                        logger.info(f"🎯 استراتيجية التنفيذ المحسنة: {execution_plan.get('strategy', 'unknown')}")
-                else:
-                    logger.warning("⚠️ فشل في تحليل الصفقة باستخدام النظام المحسن")
+            # التحليل المحسن للصفقة (سجلات فقط) خارج مسار الأمر
+            enrichment_worker.enrich(self.user_id or 0, {
+                "action": action,
+                "symbol": symbol,
+                "price": price,
+                "category": category
+            }, stage='bot.real_trade')
             
             if not self.bybit_api:
                 await self.send_message_to_admin("❌ API غير متاح للتداول الحقيقي")
@@ -3033,41 +3336,41 @@ class TradingBot:
             logger.error(f"تفاصيل الخطأ: {traceback.format_exc()}")
             await self.send_message_to_admin(f"❌ خطأ في تنفيذ الصفقة الحقيقية: {e}")
     
+    def _find_signal_positions(self, account, user_positions: Dict, symbol: str, close_signal_id: str = None) -> List[str]:
+        """
+        الصفقات المفتوحة المطابقة لإشارة إغلاق: بنفس signal_id إن وُجد، وإلا جميع صفقات الرمز (السلوك القديم)
+        تُؤخذ من فهارس الحساب، ويُبحث في قائمة الصفقات كاملة فقط إن لم يجد الفهرس شيئاً
+        (صفقات مسجلة في القائمة دون الحساب)
+        """
+        if close_signal_id:
+            candidates = account.get_position_ids_by_signal_id(close_signal_id)
+            matches = lambda info: info.get('signal_id') == close_signal_id
+        else:
+            candidates = account.get_position_ids_by_symbol(symbol)
+            matches = lambda info: info.get('symbol') == symbol
+        
+        found = [pos_id for pos_id in candidates if pos_id in user_positions and matches(user_positions[pos_id])]
+        if not found:
+            found = [pos_id for pos_id, pos_info in user_positions.items() if matches(pos_info)]
+        
+        for pos_id in found:
+            if close_signal_id:
+                logger.info(f"✅ تم العثور على صفقة بنفس signal_id: {pos_id} (signal_id: {close_signal_id})")
+            else:
+                logger.info(f"✅ تم العثور على صفقة بنفس الرمز: {pos_id} (symbol: {symbol})")
+        return found
+    
     async def execute_demo_trade(self, symbol: str, action: str, price: float, category: str, market_type: str):
         """تنفيذ صفقة تجريبية داخلية مع دعم محسن للفيوتشر"""
         try:
-            # استخدام النظام المحسن إذا كان متاحاً
-            if self.enhanced_system:
-                logger.info("🚀 تحليل الصفقة التجريبية باستخدام النظام المحسن...")
-                enhanced_analysis = self.enhanced_system.process_signal(self.user_id or 0, {
-                    "action": action,
-                    "symbol": symbol,
-                    "price": price,
-                    "category": category,
-                    "market_type": market_type
-                })
-                
-                if enhanced_analysis.get('status') == 'success':
-                    logger.info("✅ تم تحليل الصفقة التجريبية باستخدام النظام المحسن")
-                    analysis = enhanced_analysis.get('analysis', {})
-                    risk_assessment = enhanced_analysis.get('risk_assessment', {})
-                    execution_plan = enhanced_analysis.get('execution_plan', {})
-                    
-                    # تطبيق التحليل المحسن
-                    if analysis.get('recommendation') == 'execute':
-                        logger.info(f"✅ النظام المحسن يوصي بالتنفيذ التجريبي: {analysis.get('confidence_level', 0)*100:.1f}% ثقة")
-                    else:
-                        logger.warning(f"⚠️ النظام المحسن لا يوصي بالتنفيذ التجريبي: {analysis.get('recommendation', 'unknown')}")
-                    
-                    # تطبيق تقييم المخاطر المحسن
-                    if risk_assessment.get('risk_level') == 'high':
-                        logger.warning(f"⚠️ تحذير من المخاطر العالية في الصفقة التجريبية: {risk_assessment.get('recommendation', 'unknown')}")
-                    
-                    # تطبيق خطة التنفيذ المحسنة
-                    if execution_plan.get('strategy'):
-                        logger.info(f"🎯 استراتيجية التنفيذ المحسنة للصفقة التجريبية: {execution_plan.get('strategy', 'unknown')}")
-                else:
-                    logger.warning("⚠️ فشل في تحليل الصفقة التجريبية باستخدام النظام المحسن")
+            # التحليل المحسن للصفقة (سجلات فقط) خارج مسار الأمر
+            enrichment_worker.enrich(self.user_id or 0, {
+                "action": action,
+                "symbol": symbol,
+                "price": price,
+                "category": category,
+                "market_type": market_type
+            }, stage='bot.demo_trade')
             
             # اختيار الحساب الصحيح بناءً على إعدادات المستخدم وليس على نوع السوق المكتشف
             user_market_type = self.user_settings['market_type']
@@ -3108,18 +3411,7 @@ class TradingBot:
                     logger.info(f"🆔 إشارة الإغلاق تحتوي على signal_id: {close_signal_id}")
                 
                 # البحث عن الصفقات المفتوحة بناءً على signal_id أو symbol
-                positions_to_close = []
-                for pos_id, pos_info in user_positions.items():
-                    # إذا كان هناك signal_id في إشارة الإغلاق، نبحث عن الصفقات التي تطابقه
-                    if close_signal_id:
-                        pos_signal_id = pos_info.get('signal_id')
-                        if pos_signal_id == close_signal_id:
-                            logger.info(f"✅ تم العثور على صفقة بنفس signal_id: {pos_id} (signal_id: {pos_signal_id})")
-                            positions_to_close.append(pos_id)
-                    # إذا لم يكن هناك signal_id، نغلق جميع الصفقات على هذا الرمز (السلوك القديم)
-                    elif pos_info.get('symbol') == symbol:
-                        logger.info(f"✅ تم العثور على صفقة بنفس الرمز: {pos_id} (symbol: {symbol})")
-                        positions_to_close.append(pos_id)
+                positions_to_close = self._find_signal_positions(account, user_positions, symbol, close_signal_id)
                 
                 if not positions_to_close:
                     search_criteria = f"signal_id: {close_signal_id}" if close_signal_id else f"symbol: {symbol}"
@@ -3248,18 +3540,7 @@ class TradingBot:
                     logger.info(f"🆔 إشارة الإغلاق الجزئي تحتوي على signal_id: {close_signal_id}")
                 
                 # البحث عن الصفقات المفتوحة بناءً على signal_id أو symbol
-                positions_to_partial_close = []
-                for pos_id, pos_info in user_positions.items():
-                    # إذا كان هناك signal_id في إشارة الإغلاق، نبحث عن الصفقات التي تطابقه
-                    if close_signal_id:
-                        pos_signal_id = pos_info.get('signal_id')
-                        if pos_signal_id == close_signal_id:
-                            logger.info(f"✅ تم العثور على صفقة للإغلاق الجزئي بنفس signal_id: {pos_id} (signal_id: {pos_signal_id})")
-                            positions_to_partial_close.append(pos_id)
-                    # إذا لم يكن هناك signal_id، نغلق جزئياً جميع الصفقات على هذا الرمز (السلوك القديم)
-                    elif pos_info.get('symbol') == symbol:
-                        logger.info(f"✅ تم العثور على صفقة للإغلاق الجزئي بنفس الرمز: {pos_id} (symbol: {symbol})")
-                        positions_to_partial_close.append(pos_id)
+                positions_to_partial_close = self._find_signal_positions(account, user_positions, symbol, close_signal_id)
                 
                 if not positions_to_partial_close:
                     search_criteria = f"signal_id: {close_signal_id}" if close_signal_id else f"symbol: {symbol}"
@@ -3298,6 +3579,7 @@ class TradingBot:
                             position.position_size = new_position_size
                             position.margin_amount = new_margin
                             position.contracts = new_contracts
+                            account.refresh_position(position)
                             
                             # تحرير الهامش المغلق وإضافة الربح/الخسارة
                             released_margin = position.margin_amount * (percentage / 100)
@@ -3364,7 +3646,8 @@ class TradingBot:
                     margin_amount=margin_amount,
                     price=price,
                     leverage=leverage,
-                    position_id=custom_position_id
+                    position_id=custom_position_id,
+                    signal_id=custom_position_id
                 )
                 
                 if success:
@@ -3500,7 +3783,7 @@ class TradingBot:
                         if trade_tools_manager.auto_apply_enabled:
                             auto_applied = trade_tools_manager.apply_auto_settings_to_position(
                                 position_id, symbol, action, price, position.position_size,
-                                user_market_type, leverage
+                                user_market_type, leverage, owner_id=self.user_id
                             )
                             if auto_applied:
                                 message += "\n\n🤖 تم تطبيق الإعدادات التلقائية!"
@@ -3528,7 +3811,8 @@ class TradingBot:
                     side=action,
                     amount=amount,
                     price=price,
-                    position_id=custom_position_id
+                    position_id=custom_position_id,
+                    signal_id=custom_position_id
                 )
                 
                 if success:
@@ -3735,7 +4019,7 @@ class TradingBot:
                     if trade_tools_manager.auto_apply_enabled:
                         auto_applied = trade_tools_manager.apply_auto_settings_to_position(
                             position_id, symbol, action, price, amount,
-                            user_market_type, 1
+                            user_market_type, 1, owner_id=self.user_id
                         )
                         if auto_applied:
                             message += "\n\n🤖 تم تطبيق الإعدادات التلقائية!"
@@ -3752,20 +4036,18 @@ class TradingBot:
             await self.send_message_to_admin(f"❌ خطأ في تنفيذ الصفقة التجريبية: {e}")
     
     async def send_message_to_admin(self, message: str):
-        """إرسال رسالة للمدير أو المستخدم الحالي"""
+        """إرسال رسالة للمدير أو المستخدم الحالي (عبر موزع الرسائل - لا ينتظر الإرسال)"""
         try:
-            application = Application.builder().token(TELEGRAM_TOKEN).build()
             # إرسال للمستخدم الحالي إذا كان محدداً، وإلا للأدمن
             chat_id = self.user_id if self.user_id else ADMIN_USER_ID
-            await application.bot.send_message(chat_id=chat_id, text=message)
+            telegram_dispatcher.send(chat_id, message)
         except Exception as e:
             logger.error(f"خطأ في إرسال الرسالة: {e}")
     
     async def send_message_to_user(self, user_id: int, message: str):
-        """إرسال رسالة لمستخدم محدد"""
+        """إرسال رسالة لمستخدم محدد (عبر موزع الرسائل - لا ينتظر الإرسال)"""
         try:
-            application = Application.builder().token(TELEGRAM_TOKEN).build()
-            await application.bot.send_message(chat_id=user_id, text=message)
+            telegram_dispatcher.send(user_id, message)
         except Exception as e:
             logger.error(f"خطأ في إرسال الرسالة للمستخدم {user_id}: {e}")
 
@@ -5293,15 +5575,7 @@ def check_risk_management(user_id: int, trade_result: dict) -> dict:
             
             # إرسال إشعار للمستخدم
             try:
-                from config import TELEGRAM_TOKEN, ADMIN_USER_ID
-                from telegram.ext import Application
-                
-                async def send_stop_notification():
-                    try:
-                        application = Application.builder().token(TELEGRAM_TOKEN).build()
-                        await application.initialize()
-                        
-                        stop_message = f"""
+                stop_message = f"""
 🚨 **تم إيقاف البوت تلقائياً**
 
 📊 **سبب الإيقاف:** {stop_reason}
@@ -5318,21 +5592,10 @@ def check_risk_management(user_id: int, trade_result: dict) -> dict:
 💸 الحد بالمبلغ: {max_loss_amount:.0f} USDT
 
 ⚠️ **لإعادة تشغيل البوت، اذهب إلى الإعدادات وافعل زر التشغيل**
-                        """
-                        
-                        await application.bot.send_message(
-                            chat_id=user_id,
-                            text=stop_message,
-                            parse_mode='Markdown'
-                        )
-                        
-                        await application.shutdown()
-                    except Exception as e:
-                        logger.error(f"خطأ في إرسال إشعار الإيقاف: {e}")
+                """
                 
-                # تشغيل الإشعار في الخلفية
-                import asyncio
-                asyncio.create_task(send_stop_notification())
+                # الإشعار يُرسل في الخلفية عبر موزع الرسائل
+                telegram_dispatcher.send(user_id, stop_message, parse_mode='Markdown', coalesce=False)
                 
             except Exception as e:
                 logger.error(f"خطأ في إعداد إشعار الإيقاف: {e}")
@@ -7090,8 +7353,9 @@ async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         log_file = LOGGING_SETTINGS.get('log_file', 'trading_bot.log')
         level_filter = None
         line_limit = 50
+        show_latency = False
 
-        # تحليل الوسائط: /logs [level] [lines]
+        # تحليل الوسائط: /logs [level] [lines] أو /logs latency
         args = context.args if hasattr(context, "args") else []
         for arg in args:
             low = str(arg).lower()
@@ -7099,6 +7363,14 @@ async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 line_limit = max(1, min(int(low), 1000))
             elif low in ["error", "warning", "info", "debug", "critical"]:
                 level_filter = low.upper()
+            elif low == "latency":
+                show_latency = True
+
+        # زمن مراحل الإشارات (p50/p95/p99) بدلاً من السجلات
+        if show_latency:
+            from api.latency_tracer import latency_tracer
+            await update.message.reply_text(latency_tracer.format_report())
+            return
 
         import os
         if not os.path.exists(log_file):
@@ -7497,6 +7769,201 @@ async def apply_tool_to_real_position(position_info: dict, tool_type: str, **kwa
         logger.error(f"خطأ في apply_tool_to_real_position: {e}")
         return False, f"❌ خطأ: {e}"
 
+def _find_open_position(position_id: str, owner_id: int = None) -> tuple:
+    """(user_id, position_info) لصفقة مفتوحة في صفقات المستخدمين أو الصفقات العامة (user_id = None)"""
+    if owner_id is not None and position_id in user_manager.user_positions.get(owner_id, {}):
+        return owner_id, user_manager.user_positions[owner_id][position_id]
+    for user_id, positions in user_manager.user_positions.items():
+        if position_id in positions:
+            return user_id, positions[position_id]
+    return None, trading_bot.open_positions.get(position_id)
+
+def _sync_user_partial_close(user_id, position_id: str, account: TradingAccount, record: dict):
+    """تحديث صفقة المستخدم في الذاكرة وقاعدة البيانات بعد إغلاق جزئي (كما في مسار الإغلاق الجزئي بالإشارة)"""
+    position = account.positions.get(position_id)
+    position_data = user_manager.user_positions.get(user_id, {}).get(position_id)
+    if position is None or position_data is None:
+        return
+    
+    if isinstance(position, FuturesPosition):
+        position_data['position_size'] = position.position_size
+        position_data['margin_amount'] = position.margin_amount
+        position_data['contracts'] = position.contracts
+        quantity = position.contracts
+    else:
+        position_data['amount'] = position['amount']
+        quantity = position.get('coins_bought') or position.get('coins_sold') or 0
+    position_data['quantity'] = quantity
+    
+    order = db_manager.get_order(position_id)
+    if order:
+        partial_close = order.get('partial_close', []) + [{
+            'percentage': record.get('partial_close_percentage'),
+            'price': record.get('closing_price'),
+            'pnl': record.get('pnl', 0),
+            'time': datetime.now().isoformat()
+        }]
+        db_manager.update_order(position_id, {'quantity': quantity, 'partial_close': partial_close})
+
+def _close_demo_position(user_id, position_id: str, market_type: str,
+                         percentage: float, closing_price: float) -> tuple[bool, dict]:
+    """
+    إغلاق كامل أو جزئي لصفقة تجريبية عبر حساب المستخدم أو الحساب التجريبي العام
+    
+    يُنفذ تحت قفل الحساب حتى لا يتداخل مع الفتح والإغلاق من Telegram أو إعادة التقييم الدورية
+    """
+    if user_id is not None:
+        account = user_manager.get_user_account(user_id, market_type)
+    else:
+        account = trading_bot.demo_account_futures if market_type == 'futures' else trading_bot.demo_account_spot
+    
+    if not account:
+        return False, {"error": "الحساب غير موجود"}
+    
+    with account.lock:
+        if user_id is not None and percentage >= 100:
+            return user_manager.close_user_position(user_id, position_id, closing_price)
+        
+        if market_type == 'futures':
+            if percentage >= 100:
+                success, record = account.close_futures_position(position_id, closing_price)
+            else:
+                success, record = account.close_futures_position_partial(position_id, percentage, closing_price)
+        else:
+            if percentage >= 100:
+                success, record = account.close_spot_position(position_id, closing_price)
+            else:
+                success, record = account.close_spot_position_partial(position_id, percentage, closing_price)
+        
+        if success:
+            if user_id is not None:
+                _sync_user_partial_close(user_id, position_id, account, record)
+                user_manager.update_user_balance(user_id, account.balance)
+            elif percentage >= 100:
+                trading_bot.open_positions.pop(position_id, None)
+        return success, record
+
+async def _close_real_position(user_id, position_info: dict, percentage: float) -> tuple[bool, dict]:
+    """
+    إغلاق كامل أو جزئي لصفقة حقيقية عبر الحساب غير المتزامن لصاحبها (وليس مفاتيح المدير)
+    بكمية الصفقة الفعلية على المنصة وقت الإغلاق
+    """
+    from api.bybit_api import real_account_manager
+    
+    account = real_account_manager.get_async_account(user_id) if user_id is not None else None
+    if account is None:
+        return False, {"error": "لا يوجد حساب حقيقي لصاحب الصفقة"}
+    
+    symbol = position_info['symbol']
+    if position_info.get('market_type', position_info.get('account_type')) == 'spot':
+        # السبوت لا يظهر في position/list فلا توجد كمية فعلية يُغلق منها تلقائياً
+        return False, {"error": "الإغلاق التلقائي غير مدعوم لصفقات السبوت الحقيقية"}
+    
+    side = position_info.get('side', '').lower()
+    positions = await account.get_positions('linear', symbol)
+    position = next((p for p in positions if p['symbol'] == symbol and (not side or p['side'].lower() == side)), None)
+    if not position:
+        return False, {"error": f"لا توجد صفقة مفتوحة على المنصة لـ {symbol}"}
+    
+    size = float(position['size'])
+    qty = size if percentage >= 100 else size * percentage / 100
+    close_side = 'Sell' if position['side'].lower() == 'buy' else 'Buy'
+    order = await account.place_order(category='linear', symbol=symbol, side=close_side,
+                                      order_type='Market', qty=qty, reduce_only=True)
+    if not order or order.get('error'):
+        return False, {"error": (order or {}).get('error', 'فشل وضع أمر الإغلاق')}
+    return True, order
+
+async def execute_managed_position_close(position_id: str, result: Dict, current_price: float) -> bool:
+    """
+    تنفيذ TP/SL لصفقة مدارة (يستدعيه محرك الصفقات) عبر نفس مسارات الإغلاق اليدوي:
+    الحساب التجريبي للصفقات التجريبية، وحساب صاحب الصفقة غير المتزامن للصفقات الحقيقية
+    
+    صاحب الصفقة ونوع حسابها من الصفقة المدارة نفسها: الصفقات الحقيقية تُدار من signal_position_manager
+    أو جدول الصفقات ولا توجد في user_positions
+    """
+    managed = result.get('position') or trade_tools_manager.get_managed_position(position_id)
+    if managed is not None and managed.is_real:
+        user_id = managed.owner_id
+        position_info = {'symbol': managed.symbol, 'side': managed.side, 'market_type': managed.market_type}
+    else:
+        user_id, position_info = _find_open_position(position_id, managed.owner_id if managed else None)
+    if not position_info:
+        logger.warning(f"⚠️ الصفقة المدارة {position_id} غير موجودة في الصفقات المفتوحة - إزالة إدارتها")
+        trade_tools_manager.remove_managed_position(position_id)
+        return False
+    
+    # نسب TP من الكمية الأصلية، والإغلاق الجزئي من المتبقي وقت كل هدف
+    if result.get('stop_loss') or managed is None:
+        percentages = [100.0]
+    else:
+        closed = managed.total_closed_percentage - sum(tp['percentage'] for tp in result['take_profits'])
+        percentages = []
+        for tp in result['take_profits']:
+            remaining = 100 - closed
+            percentages.append(min(100.0, tp['percentage'] / remaining * 100) if remaining > 0 else 100.0)
+            closed += tp['percentage']
+    
+    market_type = position_info.get('market_type', position_info.get('account_type', 'spot'))
+    is_real = managed.is_real if managed is not None else position_info.get('is_real_position', False)
+    symbol = position_info.get('symbol', '')
+    total_pnl = 0.0
+    
+    for percentage in percentages:
+        if is_real:
+            success, record = await _close_real_position(user_id, position_info, percentage)
+        else:
+            # الإغلاق التجريبي يحدّث الرصيد في قاعدة البيانات - خارج loop المحرك
+            success, record = await asyncio.to_thread(_close_demo_position, user_id, position_id, market_type,
+                                                      percentage, current_price)
+        
+        if not success:
+            logger.error(f"❌ فشل تنفيذ إغلاق {percentage:.1f}% للصفقة المدارة {position_id}: {record.get('error', record)}")
+            return False
+        if not is_real:
+            total_pnl += float(record.get('pnl', 0) or 0)
+    
+    if result.get('stop_loss'):
+        title = "🛑 تم تفعيل Stop Loss تلقائياً"
+        if result['stop_loss'].get('was_breakeven'):
+            title += " (التعادل)"
+    else:
+        title = "🎯 تم تحقيق هدف الربح تلقائياً"
+    
+    message = f"{title}\n\n"
+    message += f"📊 الرمز: {symbol}\n"
+    message += f"💲 سعر التنفيذ: {current_price:.6f}\n"
+    message += f"📉 المغلق: {'100' if percentages == [100.0] else ' + '.join(f'{p:.1f}' for p in percentages)}%\n"
+    if not is_real:
+        message += f"💰 الربح/الخسارة: {total_pnl:.2f}\n"
+    telegram_dispatcher.send(user_id or ADMIN_USER_ID, message)
+    
+    logger.info(f"✅ تم تنفيذ إغلاق الصفقة المدارة {position_id} ({symbol}) عند {current_price}")
+    return True
+
+def start_position_engine() -> bool:
+    """
+    تشغيل محرك الصفقات: فحص TP/SL مع كل سعر + التحديث الدوري للربح/الخسارة في loop واحد
+    
+    يُستدعى من main() ومن app.py (نقطة التشغيل على Railway)
+    
+    Returns:
+        bool: False إذا كان المحرك معطلاً في الإعدادات
+    """
+    if not POSITION_ENGINE_SETTINGS.get('enabled', True):
+        return False
+    
+    async def refresh_positions():
+        await trading_bot.update_open_positions_prices()
+        # صفقات المستخدمين من نفس لقطة الأسعار
+        await asyncio.to_thread(user_manager.update_all_users_positions_prices)
+    
+    position_engine.manager = trade_tools_manager
+    position_engine.executor = execute_managed_position_close
+    position_engine.add_periodic(refresh_positions, POSITION_ENGINE_SETTINGS.get('refresh_interval', 30))
+    position_engine.start()
+    return True
+
 async def manage_position_tools(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """عرض أدوات إدارة الصفقة (TP/SL/Partial Close) - يعمل مع الصفقات الحقيقية والتجريبية"""
     try:
@@ -7589,7 +8056,7 @@ async def manage_position_tools(update: Update, context: ContextTypes.DEFAULT_TY
         if not managed_pos:
             # إنشاء إدارة جديدة للصفقة
             quantity = position_info.get('amount', position_info.get('margin_amount', 100))
-            market_type = position_info.get('account_type', 'spot')
+            market_type = position_info.get('market_type', position_info.get('account_type', 'spot'))
             leverage = position_info.get('leverage', 1)
             
             managed_pos = trade_tools_manager.create_managed_position(
@@ -7599,7 +8066,9 @@ async def manage_position_tools(update: Update, context: ContextTypes.DEFAULT_TY
                 entry_price=entry_price,
                 quantity=quantity,
                 market_type=market_type,
-                leverage=leverage
+                leverage=leverage,
+                owner_id=user_id,
+                is_real=is_real
             )
         
         if managed_pos:
@@ -8059,6 +8528,7 @@ async def clear_take_profits(update: Update, context: ContextTypes.DEFAULT_TYPE)
             return
         
         managed_pos.take_profits.clear()
+        managed_pos.levels_changed()
         
         await query.edit_message_text(
             "✅ تم حذف جميع أهداف الربح",
@@ -8086,6 +8556,7 @@ async def clear_stop_loss(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         managed_pos.stop_loss = None
+        managed_pos.levels_changed()
         
         await query.edit_message_text(
             "✅ تم حذف Stop Loss\n\n⚠️ تحذير: الصفقة الآن بدون حماية!",
@@ -8119,6 +8590,7 @@ async def stop_trailing(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # تحويله إلى SL ثابت
         managed_pos.stop_loss.is_trailing = False
         managed_pos.stop_loss.trailing_distance = 0
+        managed_pos.levels_changed()
         
         await query.edit_message_text(
             f"✅ تم تعطيل Trailing Stop\n\n"
@@ -8285,6 +8757,7 @@ async def partial_close_position(update: Update, context: ContextTypes.DEFAULT_T
         else:  # futures
             account.balance += pnl
             account.margin_locked -= close_amount
+        account.mark_changed()
         
         pnl_emoji = "🟢💰" if pnl >= 0 else "🔴💸"
         message = f"""
@@ -8333,6 +8806,7 @@ async def move_sl_to_breakeven(update: Update, context: ContextTypes.DEFAULT_TYP
             return
         
         success = managed_pos.stop_loss.move_to_breakeven(managed_pos.entry_price)
+        managed_pos.levels_changed()
         
         if success:
             await query.edit_message_text(
@@ -8375,6 +8849,7 @@ async def enable_trailing_stop(update: Update, context: ContextTypes.DEFAULT_TYP
         else:
             managed_pos.stop_loss.is_trailing = True
             managed_pos.stop_loss.trailing_distance = 2.0
+            managed_pos.levels_changed()
         
         await query.edit_message_text(
             f"✅ تم تفعيل Trailing Stop!\n\n"
@@ -10793,13 +11268,10 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 all_users = user_manager.get_all_active_users()
                 success_count = 0
                 
+                # الموزع يرسل بحدود تلجرام في الخلفية - العدد هنا للرسائل المقبولة في الطابور
                 for uid in all_users:
-                    try:
-                        application = Application.builder().token(TELEGRAM_TOKEN).build()
-                        await application.bot.send_message(chat_id=uid, text=broadcast_message)
+                    if telegram_dispatcher.send(uid, broadcast_message):
                         success_count += 1
-                    except Exception as e:
-                        logger.error(f"خطأ في إرسال الإشعار للمستخدم {uid}: {e}")
                 
                 del user_input_state[user_id]
                 await update.message.reply_text(f"✅ تم إرسال الإشعار إلى {success_count} مستخدم من أصل {len(all_users)}")
@@ -11181,6 +11653,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     else:
                         account.balance += pnl
                         account.margin_locked -= close_amount
+                    account.mark_changed()
                     
                     pnl_emoji = "🟢💰" if pnl >= 0 else "🔴💸"
                     message = f"""
@@ -11347,6 +11820,7 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     # إلغاء SL الثابت إذا كان موجود
                     managed_pos.stop_loss.is_trailing = True
                     managed_pos.stop_loss.trailing_distance = trailing_distance
+                    managed_pos.levels_changed()
                 
                 del user_input_state[user_id]
                 
@@ -11759,6 +12233,9 @@ def main():
     except Exception as e:
         logger.error(f"خطأ في تحديث الأزواج: {e}")
     
+    # تحميل سجل الرموز (الحد الأدنى للكمية وخطوة الكمية) وبدء تحديثه في الخلفية
+    instrument_registry.start()
+    
     # بدء التحديث الدوري للأسعار
     def start_price_updates():
         """بدء التحديث الدوري للأسعار"""
@@ -11769,6 +12246,8 @@ def main():
                     asyncio.set_event_loop(loop)
                     loop.run_until_complete(trading_bot.update_open_positions_prices())
                     loop.close()
+                    # صفقات المستخدمين من نفس لقطة الأسعار
+                    user_manager.update_all_users_positions_prices()
                     time.sleep(30)  # تحديث كل 30 ثانية
                 except Exception as e:
                     logger.error(f"خطأ في التحديث الدوري: {e}")
@@ -11776,11 +12255,19 @@ def main():
         
         threading.Thread(target=update_prices, daemon=True).start()
     
-    # بدء التحديث الدوري
-    start_price_updates()
+    # محرك الصفقات: فحص TP/SL مع كل سعر + التحديث الدوري للربح/الخسارة في loop واحد
+    if not start_position_engine():
+        # بدء التحديث الدوري
+        start_price_updates()
+    
+    # حفظ الحسابات التجريبية دورياً (لقطة + سجل تغييرات) لاستعادتها عند إعادة التشغيل
+    account_snapshots.start()
     
     # تشغيل البوت
     application.run_polling(allowed_updates=Update.ALL_TYPES)
+    
+    # كتابة آخر تغييرات الحسابات قبل الخروج
+    account_snapshots.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
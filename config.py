@@ -30,7 +30,8 @@ else:
 # إعدادات Bybit API
 BYBIT_API_KEY = os.getenv('BYBIT_API_KEY', "")
 BYBIT_API_SECRET = os.getenv('BYBIT_API_SECRET', "")
-BYBIT_BASE_URL = "https://api.bybit.com"
+# يمكن توجيهه إلى محاكي Bybit المحلي (simulator/bybit_simulator.py) لاختبارات الأداء
+BYBIT_BASE_URL = os.getenv('BYBIT_BASE_URL', "https://api.bybit.com")
 
 
 # إعدادات Webhook
@@ -83,6 +84,234 @@ SECURITY_SETTINGS = {
     'rate_limit_delay': 0.1,            # تأخير بين الطلبات
 }
 
+# إعدادات طبقة HTTP المشتركة (اتصالات keep-alive مُجمّعة لكل منصة)
+HTTP_TRANSPORT_SETTINGS = {
+    'pool_connections': int(os.getenv('HTTP_POOL_CONNECTIONS', '10')),   # عدد المجمعات لكل جلسة
+    'pool_maxsize': int(os.getenv('HTTP_POOL_MAXSIZE', '32')),           # أقصى اتصالات مفتوحة لكل مضيف
+    'max_retries': 0,                    # إعادة المحاولة على مستوى الاتصال فقط (الطلبات الموقعة لا تُعاد)
+    'connect_timeout': float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05')), # مهلة فتح الاتصال بالثواني
+    'read_timeout': float(os.getenv('HTTP_READ_TIMEOUT', '10')),         # مهلة قراءة الاستجابة بالثواني
+}
+
+# إعدادات سجل الرموز (الحد الأدنى للكمية وخطوة الكمية لجميع الرموز)
+INSTRUMENT_REGISTRY_SETTINGS = {
+    'cache_file': os.getenv('INSTRUMENT_CACHE_FILE', 'instruments_cache.json'),  # ملف الحفظ على القرص
+    'ttl_seconds': int(os.getenv('INSTRUMENT_CACHE_TTL', '3600')),               # مدة صلاحية البيانات بالثواني
+    'refresh_check_interval': 60,        # فحص انتهاء الصلاحية كل دقيقة
+    'categories': ['spot', 'linear'],
+}
+
+# إعدادات ناقل الأسعار (اتصالات WebSocket العامة للأسعار اللحظية)
+PRICE_BUS_SETTINGS = {
+    'enabled': os.getenv('PRICE_BUS_ENABLED', 'true').lower() == 'true',
+    'max_age_seconds': float(os.getenv('PRICE_BUS_MAX_AGE', '15')),     # أقصى عمر للسعر قبل اعتباره قديماً
+    'heartbeat_interval': 20,            # رسالة ping كل 20 ثانية لإبقاء الاتصال مفتوحاً
+    'reconnect_delay': 1,                # التأخير الأول قبل إعادة الاتصال (يتضاعف حتى الحد الأقصى)
+    'max_reconnect_delay': 30,
+    'ws_urls': {                         # يمكن توجيهها إلى خادم محلي للاختبار
+        'bybit': {
+            'spot': os.getenv('BYBIT_WS_PUBLIC_SPOT', 'wss://stream.bybit.com/v5/public/spot'),
+            'futures': os.getenv('BYBIT_WS_PUBLIC_LINEAR', 'wss://stream.bybit.com/v5/public/linear'),
+        },
+        'bitget': {
+            'spot': os.getenv('BITGET_WS_PUBLIC', 'wss://ws.bitget.com/v2/ws/public'),
+            'futures': os.getenv('BITGET_WS_PUBLIC', 'wss://ws.bitget.com/v2/ws/public'),
+        },
+    },
+}
+
+# إعدادات لقطة الأسعار الجماعية (طلب واحد لكل فئة بدلاً من طلب لكل رمز)
+TICKER_SNAPSHOT_SETTINGS = {
+    'base_url': BYBIT_BASE_URL,
+    'max_age_seconds': float(os.getenv('TICKER_SNAPSHOT_MAX_AGE', '10')),  # عمر اللقطة قبل إعادة جلبها
+}
+
+# إعدادات البث الخاص للحسابات الحقيقية (order / execution / position / wallet)
+PRIVATE_STREAM_SETTINGS = {
+    'enabled': os.getenv('PRIVATE_STREAM_ENABLED', 'true').lower() == 'true',
+    'url': os.getenv('BYBIT_WS_PRIVATE', 'wss://stream.bybit.com/v5/private'),
+    'heartbeat_interval': 20,            # رسالة ping كل 20 ثانية
+    'resync_interval': 300,              # مزامنة REST احتياطية كل 5 دقائق
+    'reconnect_delay': 1,
+    'max_reconnect_delay': 30,
+    'max_executions': 200,               # عدد التنفيذات المحفوظة لكل حساب
+}
+
+# إعدادات محدد معدل الطلبات (دلو رموز لكل مفتاح API ومجموعة endpoints)
+RATE_LIMIT_SETTINGS = {
+    'enabled': os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    'max_retries': 2,                    # إعادة الطلب المرفوض بسبب تجاوز الحد بعد الانتظار
+    'max_wait_seconds': 30,              # أقصى انتظار لطلب واحد في الطابور
+    'penalty_seconds': 1.0,              # الإيقاف عند 429 بدون وقت إعادة تعيين من المنصة
+    'limits': {                          # طلبات في الثانية لكل مفتاح (تُعدل تلقائياً من رؤوس المنصة)
+        'bybit': {'order': 10, 'position': 10, 'account': 10, 'market': 50, 'default': 10},
+        'bitget': {'order': 10, 'position': 10, 'account': 10, 'market': 20, 'default': 10},
+    },
+}
+
+# إعدادات دمج الطلبات العامة المتطابقة (single-flight)
+COALESCER_SETTINGS = {
+    'enabled': os.getenv('COALESCER_ENABLED', 'true').lower() == 'true',
+    'freshness_seconds': float(os.getenv('COALESCER_FRESHNESS', '0.5')),  # مدة إعادة استخدام النتيجة بعد وصولها
+}
+
+# إعدادات محاكي Bybit المحلي (simulator/bybit_simulator.py) لاختبارات الحمل
+BYBIT_SIMULATOR_SETTINGS = {
+    'host': os.getenv('BYBIT_SIM_HOST', '127.0.0.1'),
+    'port': int(os.getenv('BYBIT_SIM_PORT', '8765')),
+    'latency_ms': float(os.getenv('BYBIT_SIM_LATENCY_MS', '0')),      # تأخير ثابت لكل طلب
+    'jitter_ms': float(os.getenv('BYBIT_SIM_JITTER_MS', '0')),        # تأخير عشوائي إضافي
+    'error_rate': float(os.getenv('BYBIT_SIM_ERROR_RATE', '0')),      # نسبة الطلبات التي تفشل (0-1)
+    'error_http_status': int(os.getenv('BYBIT_SIM_ERROR_STATUS', '200')),  # 200 = retCode 10016، أو 5xx
+    'rate_limits': {                     # طلبات/ثانية لكل مفتاح ومجموعة (0 = بدون حد)
+        'order': 10,
+        'position': 10,
+        'account': 10,
+        'market': 120,
+    },
+    'initial_balance': 10000.0,          # رصيد USDT الابتدائي لكل مفتاح API
+    'tick_interval': 0.5,                # ثواني بين تحديثات الأسعار في WebSocket
+    'volatility': 0.0005,                # الانحراف المعياري لحركة السعر في كل تحديث
+}
+
+# إعدادات تتبع زمن معالجة الإشارات (api/latency_tracer.py)
+TRACING_SETTINGS = {
+    'enabled': os.getenv('TRACING_ENABLED', 'true').lower() == 'true',
+    'window_size': 1000,                 # عدد آخر القياسات لكل مرحلة لحساب p50/p95/p99
+    'recent_traces': 50,                 # عدد آخر التتبعات الكاملة المحفوظة للعرض
+    'slow_trace_ms': 3000,               # تسجيل تحذير للإشارات الأبطأ من هذا الحد
+}
+
+# إعدادات طابور استقبال الإشارات (signals/signal_queue.py)
+SIGNAL_QUEUE_SETTINGS = {
+    'max_size': int(os.getenv('SIGNAL_QUEUE_MAX_SIZE', '500')),   # الحد الأقصى للإشارات المنتظرة (بعده 429)
+    'workers': int(os.getenv('SIGNAL_QUEUE_WORKERS', '8')),       # عدد العمال على الـ event loop المشترك
+    'job_timeout': 120,                  # مهلة معالجة الإشارة الواحدة بالثواني
+    'min_retry_after': 1,                # حدود رأس Retry-After بالثواني
+    'max_retry_after': 60,
+    'lane_by': os.getenv('SIGNAL_QUEUE_LANE_BY', 'user'),   # مسار لكل مستخدم (user) أو لكل مستخدم ورمز (user_symbol)
+    'max_batch_size': int(os.getenv('SIGNAL_QUEUE_MAX_BATCH_SIZE', '50')),   # أقصى عدد إشارات في طلب webhook الدفعات
+}
+
+# إعدادات سجل الإشارات الدائم (signals/signal_journal.py)
+SIGNAL_JOURNAL_SETTINGS = {
+    'db_path': os.getenv('SIGNAL_JOURNAL_DB', 'signal_journal.db'),
+    'dedup_window_seconds': 3600,        # نفس الإشارة (signal_id + المحتوى) خلال هذه المدة تُعتبر مكررة
+    'anonymous_dedup_window_seconds': 5, # الإشارة بدون id: تكرار نفس المحتوى خلال ثوانٍ فقط (إعادة إرسال الطلب)
+    'max_attempts': 3,                   # أقصى عدد لإعادة الإشارة بعد إعادة التشغيل
+    'retention_days': 7,                 # حذف الإشارات المنتهية الأقدم من ذلك
+    'synchronous': 'NORMAL',             # NORMAL مع WAL: آمن عند توقف العملية، FULL للأمان عند انقطاع الطاقة
+}
+
+# إعدادات توزيع إشارات المطور على المتابعين (developers/follower_fanout.py)
+FOLLOWER_FANOUT_SETTINGS = {
+    'max_concurrency': int(os.getenv('FANOUT_MAX_CONCURRENCY', '20')),  # أقصى عدد متابعين يُنفذون في نفس الوقت
+    'per_exchange_concurrency': {        # حد التوازي لكل منصة (حدود معدل الطلبات لكل مفتاح في RATE_LIMIT_SETTINGS)
+        'bybit': 10,
+        'bitget': 5,
+        'default': 5,
+    },
+    'follower_timeout': 60,              # مهلة تنفيذ الإشارة لمتابع واحد بالثواني
+    'recent_broadcasts': 20,             # عدد آخر عمليات التوزيع المحفوظة للعرض
+}
+
+# إعدادات موزع رسائل تلجرام الصادرة (systems/telegram_dispatcher.py)
+TELEGRAM_DISPATCHER_SETTINGS = {
+    'api_url': os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org'),
+    'global_per_second': 25,             # حد تلجرام ~30 رسالة/ثانية لجميع المحادثات
+    'private_chat_interval': 1.0,        # رسالة واحدة في الثانية لكل محادثة خاصة
+    'group_chat_interval': 3.0,          # 20 رسالة في الدقيقة للمجموعات
+    'max_queue_size': 10000,             # الحد الأقصى للرسائل المنتظرة
+    'senders': 4,                        # عدد الطلبات المتزامنة إلى تلجرام
+    'max_retries': 3,                    # إعادة المحاولة عند 429 أو أخطاء الشبكة
+    'coalesce': True,                    # دمج الرسائل المنتظرة لنفس المحادثة في رسالة واحدة
+    'coalesce_separator': '\n\n➖➖➖➖➖➖\n\n',
+    'request_timeout': 10,
+}
+
+# إعدادات التحليل المحسن بعد التنفيذ (systems/enrichment_worker.py)
+ENRICHMENT_SETTINGS = {
+    'enabled': os.getenv('ENRICHMENT_ENABLED', 'true').lower() == 'true',
+    'blocking_default': False,           # True: التحليل قبل التنفيذ لجميع المستخدمين (العمود enhanced_analysis_blocking يتجاوزه لكل مستخدم)
+    'max_queue_size': 1000,              # التحليلات المنتظرة في الخلفية (الزائد يُتخطى)
+    'recent_results': 50,
+}
+
+# إعدادات محرك الاختبار التاريخي (simulator/backtest_engine.py)
+BACKTEST_SETTINGS = {
+    'data_dir': os.getenv('BACKTEST_DATA_DIR', 'backtest_data'),   # ملفات <SYMBOL>.csv / <SYMBOL>.npy
+    'initial_balance': 10000.0,          # رصيد الحساب التجريبي في بداية الاختبار
+    'user_settings': {                   # إعدادات المستخدم المطبقة على الإشارات (مثل build_user_settings)
+        'market_type': 'futures',
+        'trade_amount': 100.0,
+        'leverage': 10,
+    },
+    'management': {                      # الأهداف ووقف الخسارة (نفس مفاتيح auto_apply_settings)
+        'tp_percentages': [],
+        'tp_close_percentages': [],
+        'sl_percentage': 0,
+        'trailing_enabled': False,
+        'trailing_distance': 2.0,
+    },
+    'fee_rate': 0.0,                     # رسوم التنفيذ من قيمة الصفقة (الحساب التجريبي بدون رسوم)
+    'slippage_bps': 0.0,                 # الانزلاق بنقاط الأساس ضد المتداول
+    'intrabar': 'worst',                 # worst: وقف الخسارة قبل الهدف في نفس الشمعة، best: العكس
+    'equity_interval_minutes': 60,       # الفاصل بين نقاط منحنى رأس المال
+    'close_open_at_end': True,           # إغلاق الصفقات المفتوحة بآخر سعر عند نهاية البيانات
+    'cache_npy': True,                   # حفظ نسخة .npy من ملفات CSV لقراءتها بـ mmap
+    'quiet': True,                       # خفض سجلات التداول إلى WARNING أثناء الاختبار
+}
+
+# إعدادات دفتر صفقات الحسابات التجريبية (systems/position_book.py)
+POSITION_BOOK_SETTINGS = {
+    'enabled': os.getenv('POSITION_BOOK_ENABLED', 'true').lower() == 'true',  # إعادة تقييم جميع الصفقات بتمريرة NumPy واحدة
+    'initial_capacity': int(os.getenv('POSITION_BOOK_CAPACITY', '1024')),      # عدد الصفوف المحجوزة مبدئياً (يتضاعف عند الحاجة)
+    'scalar_threshold': 256,             # حساب بصفقات أقل من هذا يُقيم بحلقة على الكائنات (أسرع للحسابات الصغيرة)
+}
+
+# إعدادات فهرس مستويات التفعيل لأدوات إدارة الصفقات (systems/trigger_index.py)
+TRIGGER_INDEX_SETTINGS = {
+    'enabled': True,  # False = فحص كل صفقة مدارة في كل تحديث أسعار (السلوك السابق)
+}
+
+# إعدادات محرك إدارة الصفقات المدفوع بالأسعار (systems/position_engine.py)
+POSITION_ENGINE_SETTINGS = {
+    'enabled': True,                  # False = حلقة التحديث كل 30 ثانية في خيط منفصل (السلوك السابق)
+    'exchange': 'bybit',              # منصة الأسعار التي تُفحص عليها الصفقات المدارة
+    'refresh_interval': 30,           # ثواني بين تحديثات الربح/الخسارة الدورية من لقطات الأسعار
+    'subscription_sync_interval': 5,  # ثواني بين مزامنة اشتراكات رموز الصفقات المدارة في ناقل الأسعار
+    'error_backoff': 60,              # انتظار بعد خطأ في مهمة دورية
+}
+
+# إعدادات لقطات الحسابات التجريبية (systems/account_snapshot.py)
+ACCOUNT_SNAPSHOT_SETTINGS = {
+    'enabled': True,                     # False = إعادة إنشاء الحسابات من رصيد قاعدة البيانات عند التشغيل (السلوك السابق)
+    'snapshot_path': os.getenv('ACCOUNT_SNAPSHOT_PATH', 'demo_accounts.snap'),
+    'log_path': os.getenv('ACCOUNT_SNAPSHOT_LOG', 'demo_accounts.log'),
+    'flush_interval': 2,                 # ثواني بين إلحاق الحسابات المتغيرة بسجل التغييرات
+    'snapshot_interval': 600,            # ثواني بين اللقطات الكاملة (تفرغ سجل التغييرات)
+    'max_log_records': 20000,            # لقطة كاملة مبكرة عندما يصل السجل لهذا العدد من التغييرات
+    'fsync': True,                       # مزامنة الملفات مع القرص بعد كل كتابة
+}
+
+# إعدادات قياس أداء webhooks الإشارات (simulator/webhook_benchmark.py)
+WEBHOOK_BENCHMARK_SETTINGS = {
+    'requests': int(os.getenv('WEBHOOK_BENCH_REQUESTS', '2000')),        # عدد الطلبات المقاسة
+    'warmup': int(os.getenv('WEBHOOK_BENCH_WARMUP', '100')),             # طلبات تسخين لا تدخل في القياس
+    'concurrency': int(os.getenv('WEBHOOK_BENCH_CONCURRENCY', '32')),    # عدد العملاء المتزامنين
+    'users': int(os.getenv('WEBHOOK_BENCH_USERS', '20')),                # عدد المستخدمين المؤقتين
+    'mix': {'buy': 0.4, 'sell': 0.3, 'close': 0.3},                     # مزيج أنواع الإشارات
+    'routes': {'personal': 0.8, 'public': 0.2},                         # مزيج /personal/<user_id>/webhook و /webhook
+    'symbols': ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'XRPUSDT', 'BNBUSDT'],
+    'trade_amount': 10.0,
+    'leverage': 5,
+    'market_type': 'futures',
+    'drain_timeout': 300,                # أقصى انتظار لانتهاء معالجة الإشارات المقبولة (ثانية)
+    'sample_interval': 0.25,             # فاصل قراءة RSS وعدد الخيوط (ثانية)
+    'tolerance_pct': 10.0,               # نسبة التراجع المسموحة عند المقارنة مع تشغيل سابق
+    'seed': 42,
+}
+
 # إعدادات التسجيل
 LOGGING_SETTINGS = {
     'log_file': 'trading_bot.log',
@@ -13,8 +13,15 @@ try:
 except ImportError:
     pass
 
+try:
+    from .follower_fanout import FollowerFanout, follower_fanout
+except ImportError:
+    pass
+
 __all__ = [
     'DeveloperManager',
     'developer_manager',
-    'DeveloperConfig'
+    'DeveloperConfig',
+    'FollowerFanout',
+    'follower_fanout'
 ]
@@ -402,6 +402,13 @@ class DeveloperManager:
                 user_manager.user_positions.clear()
                 logger.info(f"🗑️ تم حذف {deleted_positions} صفقة من user_manager.user_positions")
                 
+                # حذف لقطات الحسابات التجريبية حتى لا تُستعاد بعد إعادة التشغيل
+                try:
+                    from systems.account_snapshot import account_snapshots
+                    account_snapshots.clear()
+                except Exception as e:
+                    logger.warning(f"⚠️ لم يتم حذف لقطات الحسابات: {e}")
+                
                 # 5. حذف جميع الحسابات الحقيقية من real_account_manager
                 try:
                     from api.bybit_api import real_account_manager
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Follower Fan-out - توزيع إشارة المطور على المتابعين
+تنفيذ الإشارة لجميع المتابعين بشكل متزامن بحد أقصى للتوازي (عام ولكل منصة)،
+مع تسلسل المتابعين الذين يشتركون في نفس مفتاح API وقياس زمن كل متابع حتى آخر تنفيذ
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from api.latency_tracer import latency_tracer
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import FOLLOWER_FANOUT_SETTINGS
+except ImportError:
+    FOLLOWER_FANOUT_SETTINGS = {
+        'max_concurrency': 20,
+        'per_exchange_concurrency': {'bybit': 10, 'bitget': 5, 'default': 5},
+        'follower_timeout': 60,
+        'recent_broadcasts': 20,
+    }
+
+# نتيجة كل متابع
+STATUS_FILLED = 'filled'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_SKIPPED = 'skipped'
+
+
+class FollowerFanout:
+    """
+    محرك توزيع الإشارة
+
+    - broadcast() يستقبل قائمة المتابعين (user_id, exchange, api_key, skip_reason) ودالة التنفيذ
+    - التوازي محدود بـ max_concurrency وبحد لكل منصة؛ حدود معدل الطلبات لكل مفتاح
+      تطبقها عملاء المنصات نفسها عبر rate_limiter
+    - المتابعون بنفس المفتاح يُنفذون بالتتابع (نفس الحساب على المنصة)
+    - الإشعارات تُرسل بعد التنفيذ خارج حدود التوازي ولا تدخل في زمن التنفيذ
+    """
+
+    def __init__(self, settings: Dict = None):
+        settings = settings or FOLLOWER_FANOUT_SETTINGS
+        self.max_concurrency = settings.get('max_concurrency', 20)
+        self.per_exchange_concurrency = settings.get('per_exchange_concurrency', {'default': 5})
+        self.follower_timeout = settings.get('follower_timeout', 60)
+
+        self._recent: Deque[Dict] = deque(maxlen=settings.get('recent_broadcasts', 20))
+        self.broadcasts = 0
+        self.followers_filled = 0
+        self.followers_failed = 0
+
+    def _exchange_limit(self, exchange: str) -> int:
+        limits = self.per_exchange_concurrency
+        return limits.get(exchange, limits.get('default', self.max_concurrency))
+
+    async def broadcast(self, followers: List[Dict],
+                        execute: Callable[[Dict], Awaitable],
+                        notify: Optional[Callable[[Dict, Dict], Awaitable]] = None,
+                        name: str = 'broadcast') -> Dict:
+        """
+        تنفيذ الإشارة لجميع المتابعين
+
+        Args:
+            followers: [{'user_id', 'exchange', 'api_key', 'skip_reason'}] - skip_reason يعني عدم التنفيذ
+            execute: coroutine لتنفيذ الإشارة على حساب متابع (الاستثناء = فشل)
+            notify: coroutine اختيارية تُستدعى بعد التنفيذ الناجح (follower, result)
+            name: اسم للسجلات
+
+        Returns:
+            ملخص التوزيع مع نتيجة وزمن كل متابع و time_to_last_fill_ms
+        """
+        started = time.perf_counter()
+        global_slots = asyncio.Semaphore(self.max_concurrency)
+        exchange_slots: Dict[str, asyncio.Semaphore] = {}
+        key_locks: Dict[tuple, asyncio.Lock] = {}
+
+        for follower in followers:
+            exchange = (follower.get('exchange') or 'bybit').lower()
+            if exchange not in exchange_slots:
+                exchange_slots[exchange] = asyncio.Semaphore(self._exchange_limit(exchange))
+            if follower.get('api_key'):
+                key_locks.setdefault((exchange, follower['api_key']), asyncio.Lock())
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 2)
+
+        async def run_follower(follower: Dict) -> Dict:
+            user_id = follower.get('user_id')
+            exchange = (follower.get('exchange') or 'bybit').lower()
+            result = {'user_id': user_id, 'exchange': exchange}
+
+            if follower.get('skip_reason'):
+                result.update(status=STATUS_SKIPPED, error=follower['skip_reason'])
+                return result
+
+            # قفل المفتاح قبل حجز المكان حتى لا يشغل المتابع المنتظر مكاناً عن غيره
+            key_lock = key_locks.get((exchange, follower.get('api_key')))
+            if key_lock is not None:
+                await key_lock.acquire()
+            try:
+                async with global_slots, exchange_slots[exchange]:
+                    result['wait_ms'] = elapsed_ms()
+                    exec_started = time.perf_counter()
+                    try:
+                        outcome = await asyncio.wait_for(execute(follower), timeout=self.follower_timeout)
+                        result.update(status=STATUS_FILLED, outcome=outcome)
+                    except asyncio.TimeoutError:
+                        result.update(status=STATUS_TIMEOUT, error=f'timeout after {self.follower_timeout}s')
+                    except Exception as e:
+                        result.update(status=STATUS_FAILED, error=str(e))
+                    result['execution_ms'] = round((time.perf_counter() - exec_started) * 1000, 2)
+                    result['latency_ms'] = elapsed_ms()
+            finally:
+                if key_lock is not None:
+                    key_lock.release()
+
+            latency_tracer.record('fanout.follower', result['latency_ms'])
+            if result['status'] == STATUS_FILLED:
+                logger.info(f"✅ [{name}] المتابع {user_id} نُفذ بعد {result['latency_ms']}ms")
+                if notify is not None:
+                    try:
+                        await notify(follower, result)
+                    except Exception as e:
+                        logger.error(f"❌ خطأ في إشعار المتابع {user_id}: {e}")
+            else:
+                logger.warning(f"⚠️ [{name}] المتابع {user_id}: {result['status']} - {result.get('error')}")
+            return result
+
+        results = await asyncio.gather(*(run_follower(follower) for follower in followers))
+        summary = self._summarize(name, results, elapsed_ms())
+        logger.info(f"📡 [{name}] {summary['filled']}/{summary['total']} متابع - "
+                    f"زمن آخر تنفيذ {summary['time_to_last_fill_ms']}ms")
+        return summary
+
+    def _summarize(self, name: str, results: List[Dict], total_ms: float) -> Dict:
+        fills = sorted(r['latency_ms'] for r in results if r['status'] == STATUS_FILLED)
+        filled = len(fills)
+        failed = sum(1 for r in results if r['status'] in (STATUS_FAILED, STATUS_TIMEOUT))
+        skipped = sum(1 for r in results if r['status'] == STATUS_SKIPPED)
+
+        summary = {
+            'name': name,
+            'started_at': time.time() - total_ms / 1000,
+            'total': len(results),
+            'filled': filled,
+            'failed': failed,
+            'skipped': skipped,
+            'duration_ms': total_ms,
+            'time_to_first_fill_ms': fills[0] if fills else None,
+            'time_to_last_fill_ms': fills[-1] if fills else None,
+            'p50_fill_ms': fills[len(fills) // 2] if fills else None,
+            'results': results,
+        }
+
+        self.broadcasts += 1
+        self.followers_filled += filled
+        self.followers_failed += failed
+        if fills:
+            latency_tracer.record('fanout.time_to_last_fill', fills[-1])
+        self._recent.append({k: v for k, v in summary.items() if k != 'results'})
+        return summary
+
+    def get_stats(self) -> Dict:
+        """العدادات وملخص آخر عمليات التوزيع"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'per_exchange_concurrency': self.per_exchange_concurrency,
+            'broadcasts': self.broadcasts,
+            'followers_filled': self.followers_filled,
+            'followers_failed': self.followers_failed,
+            'time_to_last_fill': latency_tracer.get_stats().get('fanout.time_to_last_fill', {}),
+            'recent': list(self._recent),
+        }
+
+
+# مثيل عام
+follower_fanout = FollowerFanout()
@@ -24,9 +24,23 @@ try:
 except ImportError:
     pass
 
+try:
+    from .signal_queue import SignalIngestionQueue, signal_ingestion_queue
+except ImportError:
+    pass
+
+try:
+    from .signal_journal import SignalJournal, signal_journal
+except ImportError:
+    pass
+
 __all__ = [
     'SignalExecutor',
     'signal_executor',
     'convert_simple_signal',
-    'signal_position_manager'
+    'signal_position_manager',
+    'SignalIngestionQueue',
+    'signal_ingestion_queue',
+    'SignalJournal',
+    'signal_journal'
 ]
@@ -14,6 +14,8 @@ import logging
 from typing import Dict, Optional
 from datetime import datetime
 
+from api.latency_tracer import latency_tracer
+
 logger = logging.getLogger(__name__)
 
 # استيراد النظام المحسن
@@ -67,25 +69,7 @@ class SignalConverter:
                 except Exception as e:
                     logger.warning(f"⚠️ خطأ في معالجة ID الإشارة: {e}")
             
-            # استخدام النظام المحسن إذا كان متاحاً
-            if ENHANCED_SYSTEM_AVAILABLE:
-                try:
-                    enhanced_system = SimpleEnhancedSystem()
-                    logger.info("🚀 تحويل الإشارة باستخدام النظام المحسن في signal_converter...")
-                    enhanced_result = enhanced_system.process_signal(0, signal_data)
-                    logger.info(f"✅ نتيجة النظام المحسن في signal_converter: {enhanced_result}")
-                    
-                    # إذا نجح النظام المحسن، نستخدم النتيجة ولكن نتابع التحويل العادي
-                    if enhanced_result.get('status') == 'success':
-                        logger.info("✅ تم استخدام نتيجة النظام المحسن في signal_converter، نتابع التحويل العادي")
-                        # نستخدم النتيجة المحسنة ولكن نتابع التحويل العادي
-                        signal_data['enhanced_analysis'] = enhanced_result.get('analysis', {})
-                        signal_data['enhanced_risk_assessment'] = enhanced_result.get('risk_assessment', {})
-                        signal_data['enhanced_execution_plan'] = enhanced_result.get('execution_plan', {})
-                    else:
-                        logger.warning("⚠️ فشل النظام المحسن في signal_converter، نعود للنظام العادي")
-                except Exception as e:
-                    logger.warning(f"⚠️ خطأ في النظام المحسن في signal_converter: {e}")
+            # التحليل المحسن يتم مرة واحدة في مرحلة التنفيذ (enrichment_worker) وليس أثناء التحويل
             
             # التحقق من صحة البيانات الأساسية
             if not signal_data:
@@ -358,6 +342,7 @@ signal_converter = SignalConverter()
 
 
 # دالة مساعدة للاستخدام السريع
+@latency_tracer.traced('signal.convert')
 def convert_simple_signal(signal_data: Dict, user_settings: Optional[Dict] = None) -> Optional[Dict]:
     """
     دالة مساعدة لتحويل الإشارة البسيطة
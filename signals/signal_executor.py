@@ -8,6 +8,10 @@ import logging
 from typing import Dict, Optional
 from datetime import datetime
 from api.bybit_api import real_account_manager
+from api.instrument_registry import instrument_registry
+from api.latency_tracer import latency_tracer
+from systems.telegram_dispatcher import telegram_dispatcher
+from systems.enrichment_worker import enrichment_worker
 from signals.signal_position_manager import signal_position_manager
 
 logger = logging.getLogger(__name__)
@@ -53,6 +57,7 @@ class SignalExecutor:
     """منفذ الإشارات على الحسابات الحقيقية"""
     
     @staticmethod
+    @latency_tracer.traced('signal.execute')
     async def execute_signal(user_id: int, signal_data: Dict, user_data: Dict) -> Dict:
         """
         تنفيذ إشارة تداول
@@ -66,25 +71,9 @@ class SignalExecutor:
             نتيجة التنفيذ
         """
         try:
-            # استخدام النظام المحسن إذا كان متاحاً
+            # التحليل المحسن لا يمنع الصفقة - يعمل في الخلفية (أو قبل التنفيذ إذا فعّله المستخدم)
             if ENHANCED_SYSTEM_AVAILABLE:
-                try:
-                    enhanced_system = SimpleEnhancedSystem()
-                    logger.info("🚀 معالجة الإشارة باستخدام النظام المحسن في signal_executor...")
-                    enhanced_result = enhanced_system.process_signal(user_id, signal_data)
-                    logger.info(f"✅ نتيجة النظام المحسن في signal_executor: {enhanced_result}")
-                    
-                    # إذا نجح النظام المحسن، نستخدم النتيجة ولكن نتابع التنفيذ العادي
-                    if enhanced_result.get('status') == 'success':
-                        logger.info("✅ تم استخدام نتيجة النظام المحسن في signal_executor، نتابع التنفيذ العادي")
-                        # نستخدم النتيجة المحسنة ولكن نتابع التنفيذ العادي
-                        signal_data['enhanced_analysis'] = enhanced_result.get('analysis', {})
-                        signal_data['enhanced_risk_assessment'] = enhanced_result.get('risk_assessment', {})
-                        signal_data['enhanced_execution_plan'] = enhanced_result.get('execution_plan', {})
-                    else:
-                        logger.warning("⚠️ فشل النظام المحسن في signal_executor، نعود للنظام العادي")
-                except Exception as e:
-                    logger.warning(f"⚠️ خطأ في النظام المحسن في signal_executor: {e}")
+                enrichment_worker.enrich(user_id, signal_data, stage='executor')
             
             account_type = user_data.get('account_type', 'demo')
             exchange = user_data.get('exchange', 'bybit')
@@ -102,10 +91,11 @@ class SignalExecutor:
                     'is_demo': True
                 }
             
-            # الحصول على الحساب الحقيقي
+            # الحصول على الحساب الحقيقي (النسخة غير المتزامنة لعدم حجز الـ event loop)
             real_account = real_account_manager.get_account(user_id)
+            async_account = real_account_manager.get_async_account(user_id)
             
-            if not real_account:
+            if not real_account or not async_account:
                 logger.error(f"❌ حساب حقيقي غير مفعّل للمستخدم {user_id}")
                 return {
                     'success': False,
@@ -148,7 +138,7 @@ class SignalExecutor:
                     
                     # جلب السعر من Bybit
                     category = 'linear' if market_type == 'futures' else 'spot'
-                    ticker = real_account.get_ticker(category, symbol)
+                    ticker = await async_account.get_ticker(category, symbol)
                     if ticker and 'lastPrice' in ticker:
                         price = float(ticker['lastPrice'])
                         logger.info(f"✅ السعر الحالي: {price}")
@@ -190,7 +180,7 @@ class SignalExecutor:
             # تنفيذ الإشارة حسب المنصة
             if exchange == 'bybit':
                 result = await SignalExecutor._execute_bybit_signal(
-                    real_account, signal_data, market_type, 
+                    async_account, signal_data, market_type, 
                     trade_amount, leverage, user_id
                 )
             else:
@@ -244,26 +234,6 @@ class SignalExecutor:
                                    trade_amount: float, leverage: int, user_id: int) -> Dict:
         """تنفيذ إشارة على Bybit"""
         try:
-            # استخدام النظام المحسن إذا كان متاحاً
-            if ENHANCED_SYSTEM_AVAILABLE:
-                try:
-                    enhanced_system = SimpleEnhancedSystem()
-                    logger.info("🚀 تحليل إشارة Bybit باستخدام النظام المحسن...")
-                    enhanced_result = enhanced_system.process_signal(user_id, signal_data)
-                    logger.info(f"✅ نتيجة النظام المحسن في Bybit: {enhanced_result}")
-                    
-                    # إذا نجح النظام المحسن، نستخدم النتيجة ولكن نتابع التنفيذ العادي
-                    if enhanced_result.get('status') == 'success':
-                        logger.info("✅ تم استخدام نتيجة النظام المحسن في Bybit، نتابع التنفيذ العادي")
-                        # نستخدم النتيجة المحسنة ولكن نتابع التنفيذ العادي
-                        signal_data['enhanced_analysis'] = enhanced_result.get('analysis', {})
-                        signal_data['enhanced_risk_assessment'] = enhanced_result.get('risk_assessment', {})
-                        signal_data['enhanced_execution_plan'] = enhanced_result.get('execution_plan', {})
-                    else:
-                        logger.warning("⚠️ فشل النظام المحسن في Bybit، نعود للنظام العادي")
-                except Exception as e:
-                    logger.warning(f"⚠️ خطأ في النظام المحسن في Bybit: {e}")
-            
             action = signal_data.get('action', '').lower()
             symbol = signal_data.get('symbol', '')
             
@@ -291,13 +261,13 @@ class SignalExecutor:
                     )
                 else:
                     # إغلاق الصفقات بالطريقة التقليدية
-                    positions = account.get_open_positions(category)
+                    positions = await account.get_open_positions(category)
                     
                     # البحث عن أي صفقة مفتوحة على هذا الرمز
                     target_position = next((p for p in positions if p['symbol'] == symbol), None)
                     
                     if target_position:
-                        result = account.close_position(category, symbol, target_position['side'])
+                        result = await account.close_position(category, symbol, target_position['side'])
                         if result:
                             logger.info(f"✅ تم إغلاق صفقة {symbol} بالكامل بنجاح")
                             return {
@@ -331,7 +301,7 @@ class SignalExecutor:
                     )
                 else:
                     # إغلاق جزئي بالطريقة التقليدية
-                    positions = account.get_open_positions(category)
+                    positions = await account.get_open_positions(category)
                     
                     # البحث عن أي صفقة مفتوحة على هذا الرمز
                     target_position = next((p for p in positions if p['symbol'] == symbol), None)
@@ -345,7 +315,7 @@ class SignalExecutor:
                             # تنفيذ إغلاق جزئي عبر وضع أمر معاكس
                             opposite_side = 'Sell' if target_position['side'] == 'Buy' else 'Buy'
                             
-                            result = account.place_order(
+                            result = await account.place_order(
                                 category=category,
                                 symbol=symbol,
                                 side=opposite_side,
@@ -398,7 +368,8 @@ class SignalExecutor:
             
             try:
                 logger.info(f"🔍 جلب السعر الحالي من المنصة...")
-                current_price = account.get_ticker_price(symbol)
+                with latency_tracer.span('exchange.get_price'):
+                    current_price = await account.get_ticker_price(symbol, category)
                 price = float(current_price)
                 logger.info(f"✅ تم جلب السعر الحقيقي من المنصة: {price} USDT")
             except Exception as e:
@@ -488,8 +459,14 @@ class SignalExecutor:
             
             # تطبيق التقريب الذكي مباشرة لضمان قبول المنصة
             logger.info(f"🧠 تطبيق التقريب الذكي المحسن...")
+            try:
+                instrument_info = await account.get_instrument_info(symbol, category)
+            except Exception as e:
+                logger.warning(f"⚠️ فشل جلب معلومات الرمز: {e}")
+                instrument_info = None
             final_qty = SignalExecutor._smart_quantity_rounding(
-                qty, price, trade_amount, leverage, market_type, symbol, account
+                qty, price, trade_amount, leverage, market_type, symbol,
+                instrument_info=instrument_info
             )
             
             # فحص إضافي للرصيد (مستوحى من الملفات المرفقة)
@@ -498,7 +475,7 @@ class SignalExecutor:
                 
                 # فحص الرصيد المتاح لضمان إمكانية التنفيذ
                 try:
-                    balance_info = account.get_wallet_balance('unified')
+                    balance_info = await account.get_wallet_balance('unified')
                     if balance_info and 'coins' in balance_info:
                         # إصلاح: استخدام 'coins' بدلاً من 'list'
                         usdt_coin = balance_info['coins'].get('USDT')
@@ -561,7 +538,7 @@ class SignalExecutor:
             
             # فحص شامل للرصيد قبل تنفيذ الصفقة
             try:
-                balance_info = account.get_wallet_balance('unified')
+                balance_info = await account.get_wallet_balance('unified')
                 if balance_info and 'coins' in balance_info:
                     usdt_coin = balance_info['coins'].get('USDT')
                     if usdt_coin:
@@ -627,7 +604,7 @@ class SignalExecutor:
                 found_position = None
                 try:
                     # جلب الصفقات المفتوحة من Bybit
-                    positions = account.get_open_positions('linear')
+                    positions = await account.get_open_positions('linear')
                     logger.info(f"🔍 جلب الصفقات المفتوحة من Bybit...")
                     
                     # البحث عن الصفقة الجديدة
@@ -749,7 +726,7 @@ class SignalExecutor:
             for position in positions:
                 try:
                     # إغلاق الصفقة على المنصة
-                    result = account.close_position(category, symbol, position['side'])
+                    result = await account.close_position(category, symbol, position['side'])
                     
                     if result:
                         # تحديث حالة الصفقة في قاعدة البيانات
@@ -826,7 +803,7 @@ class SignalExecutor:
                     # تنفيذ إغلاق جزئي عبر وضع أمر معاكس
                     opposite_side = 'Sell' if position['side'] == 'Buy' else 'Buy'
                     
-                    result = account.place_order(
+                    result = await account.place_order(
                         category=category,
                         symbol=symbol,
                         side=opposite_side,
@@ -888,6 +865,7 @@ class SignalExecutor:
             }
     
     @staticmethod
+    @latency_tracer.traced('signal.spot_order')
     async def _handle_spot_order(account, signal_data: Dict, side: str, qty: float, 
                                 price: float, market_type: str, user_id: int) -> Dict:
         """معالجة أمر السبوت كمحفظة حقيقية"""
@@ -899,12 +877,13 @@ class SignalExecutor:
             # في السبوت: الشراء يزيد الكمية، البيع يقلل الكمية
             if side.lower() == 'buy':
                 # شراء: إضافة كمية للمحفظة
-                result = account.place_order(
+                result = await account.place_order(
                     category='spot',
                     symbol=symbol,
                     side=side,
                     order_type='Market',
-                    qty=round(qty, 4)
+                    qty=round(qty, 4),
+                    order_link_id=signal_data.get('order_link_id')
                 )
                 
                 # معالجة محسنة للأخطاء
@@ -958,7 +937,8 @@ class SignalExecutor:
                             'notes': f'Spot order - {side} {qty} {symbol}'
                         }
                         
-                        db_manager.create_order(order_data)
+                        with latency_tracer.span('db.create_order'):
+                            db_manager.create_order(order_data)
                         logger.info(f"✅ تم حفظ صفقة سبوت في قاعدة البيانات")
                         
                         # إذا كان لديه signal_id، حفظه أيضاً في signal_positions
@@ -980,7 +960,8 @@ class SignalExecutor:
                                 'notes': f'Spot portfolio - buy {qty} {symbol}'
                             }
                             
-                            portfolio_manager.add_position(position_data)
+                            with latency_tracer.span('db.add_position'):
+                                portfolio_manager.add_position(position_data)
                             logger.info(f"✅ تم حفظ الصفقة في signal_positions أيضاً")
                     except Exception as e:
                         logger.error(f"❌ فشل حفظ صفقة سبوت: {e}")
@@ -988,7 +969,7 @@ class SignalExecutor:
             else:  # sell
                 # بيع: تقليل كمية من المحفظة
                 # التحقق من وجود رصيد كافي
-                positions = account.get_open_positions('spot')
+                positions = await account.get_open_positions('spot')
                 symbol_position = next((p for p in positions if p['symbol'] == symbol), None)
                 
                 if not symbol_position:
@@ -1007,12 +988,13 @@ class SignalExecutor:
                     }
                 
                 # تنفيذ البيع
-                result = account.place_order(
+                result = await account.place_order(
                     category='spot',
                     symbol=symbol,
                     side=side,
                     order_type='Market',
-                    qty=round(qty, 4)
+                    qty=round(qty, 4),
+                    order_link_id=signal_data.get('order_link_id')
                 )
                 
                 # معالجة محسنة للأخطاء
@@ -1066,7 +1048,8 @@ class SignalExecutor:
                     
                     from systems.enhanced_portfolio_manager import portfolio_factory
                     portfolio_manager = portfolio_factory.get_portfolio_manager(user_id)
-                    portfolio_manager.add_position(position_data)
+                    with latency_tracer.span('db.add_position'):
+                        portfolio_manager.add_position(position_data)
             
             return result
             
@@ -1177,7 +1160,8 @@ class SignalExecutor:
 
     @staticmethod
     def _smart_quantity_rounding(qty: float, price: float, trade_amount: float,
-                                leverage: int, market_type: str, symbol: str, account=None) -> float:
+                                leverage: int, market_type: str, symbol: str, account=None,
+                                instrument_info: Optional[Dict] = None) -> float:
         """
         دالة التقريب الذكي المحسنة - تبحث عن أقرب كمية مسموحة للمبلغ المحدد
         
@@ -1199,7 +1183,8 @@ class SignalExecutor:
             leverage: الرافعة المالية
             market_type: نوع السوق (spot/futures)
             symbol: رمز العملة
-            account: حساب Bybit للحصول على معلومات الرمز
+            account: حساب Bybit متزامن للحصول على معلومات الرمز
+            instrument_info: معلومات الرمز إذا تم جلبها مسبقاً (من العميل غير المتزامن)
             
         Returns:
             الكمية المقربة والمحسنة
@@ -1221,21 +1206,26 @@ class SignalExecutor:
             instrument_min_qty = None
             instrument_qty_step = None
             
-            if account:
+            category = 'linear' if market_type == 'futures' else 'spot'
+            
+            # سجل الرموز في الذاكرة أولاً (O(1) بدون طلب شبكة)
+            if instrument_info is None:
+                instrument_info = instrument_registry.get_instrument_info(symbol, category)
+            
+            if instrument_info is None and account:
                 try:
-                    category = 'linear' if market_type == 'futures' else 'spot'
                     instrument_info = account.get_instrument_info(symbol, category)
-                    
-                    if instrument_info:
-                        instrument_min_qty = instrument_info['min_order_qty']
-                        instrument_qty_step = instrument_info['qty_step']
-                        
-                        logger.info(f"📋 معلومات الرمز من Bybit:")
-                        logger.info(f"   الحد الأدنى للكمية: {instrument_min_qty}")
-                        logger.info(f"   خطوة الكمية: {instrument_qty_step}")
                 except Exception as e:
                     logger.warning(f"⚠️ فشل جلب معلومات الرمز: {e}")
             
+            if instrument_info:
+                instrument_min_qty = instrument_info.get('min_order_qty')
+                instrument_qty_step = instrument_info.get('qty_step')
+                
+                logger.info(f"📋 معلومات الرمز من Bybit:")
+                logger.info(f"   الحد الأدنى للكمية: {instrument_min_qty}")
+                logger.info(f"   خطوة الكمية: {instrument_qty_step}")
+            
             # إذا لم نحصل على معلومات من API، استخدم قيم افتراضية
             if not instrument_min_qty or not instrument_qty_step:
                 logger.warning(f"⚠️ استخدام قيم افتراضية للتقريب")
@@ -1369,6 +1359,7 @@ class SignalExecutor:
         return SignalExecutor._smart_quantity_rounding(qty, price, trade_amount, leverage, 'futures', 'UNKNOWN')
     
     @staticmethod
+    @latency_tracer.traced('signal.futures_order')
     async def _handle_futures_order(account, signal_data: Dict, side: str, qty: float,
                                    leverage: int, take_profit: float, stop_loss: float,
                                    market_type: str, user_id: int, qty_was_adjusted: bool = False,
@@ -1391,7 +1382,8 @@ class SignalExecutor:
             
             # البحث عن صفقة موجودة بنفس ID
             from users.database import db_manager
-            existing_position = db_manager.get_position_by_signal_id(signal_id, user_id, symbol)
+            with latency_tracer.span('db.get_position'):
+                existing_position = db_manager.get_position_by_signal_id(signal_id, user_id, symbol)
             
             if existing_position:
                 # فحص الرصيد قبل تجميع الصفقات
@@ -1400,12 +1392,12 @@ class SignalExecutor:
                     current_price = price if price > 0 else signal_data.get('price', 0)
                     if not current_price or current_price == 0:
                         # جلب السعر من API
-                        ticker = account.get_ticker('linear' if market_type == 'futures' else 'spot', symbol)
+                        ticker = await account.get_ticker('linear' if market_type == 'futures' else 'spot', symbol)
                         if ticker and 'lastPrice' in ticker:
                             current_price = float(ticker['lastPrice'])
                     
                     if current_price and current_price > 0:
-                        balance_info = account.get_wallet_balance('unified')
+                        balance_info = await account.get_wallet_balance('unified')
                         if balance_info and 'coins' in balance_info:
                             usdt_coin = balance_info['coins'].get('USDT')
                             if usdt_coin:
@@ -1434,7 +1426,7 @@ class SignalExecutor:
                 if side.lower() == 'buy' and existing_position['side'].lower() == 'buy':
                     # تعزيز Long - زيادة الكمية
                     new_qty = existing_position['quantity'] + qty
-                    result = account.place_order(
+                    result = await account.place_order(
                         category='linear',
                         symbol=symbol,
                         side=side,
@@ -1442,13 +1434,14 @@ class SignalExecutor:
                         qty=round(qty, 4),  # الكمية الإضافية فقط
                         leverage=leverage,
                         take_profit=take_profit,
-                        stop_loss=stop_loss
+                        stop_loss=stop_loss,
+                        order_link_id=signal_data.get('order_link_id')
                     )
                     
                 elif side.lower() == 'sell' and existing_position['side'].lower() == 'sell':
                     # تعزيز Short - زيادة الكمية
                     new_qty = existing_position['quantity'] + qty
-                    result = account.place_order(
+                    result = await account.place_order(
                         category='linear',
                         symbol=symbol,
                         side=side,
@@ -1456,12 +1449,13 @@ class SignalExecutor:
                         qty=round(qty, 4),  # الكمية الإضافية فقط
                         leverage=leverage,
                         take_profit=take_profit,
-                        stop_loss=stop_loss
+                        stop_loss=stop_loss,
+                        order_link_id=signal_data.get('order_link_id')
                     )
                     
                 else:
                     # اتجاه معاكس - إنشاء صفقة منفصلة
-                    result = account.place_order(
+                    result = await account.place_order(
                         category='linear',
                         symbol=symbol,
                         side=side,
@@ -1469,7 +1463,8 @@ class SignalExecutor:
                         qty=round(qty, 4),
                         leverage=leverage,
                         take_profit=take_profit,
-                        stop_loss=stop_loss
+                        stop_loss=stop_loss,
+                        order_link_id=signal_data.get('order_link_id')
                     )
             else:
                 # صفقة جديدة - تنفيذ مباشر بالكمية المعدلة
@@ -1481,7 +1476,7 @@ class SignalExecutor:
                 
                 # تنفيذ الصفقة مرة واحدة بالكمية المعدلة
                 logger.info(f"📤 وضع أمر على Bybit: {side} {symbol} - كمية: {qty}")
-                result = account.place_order(
+                result = await account.place_order(
                     category='linear',
                     symbol=symbol,
                     side=side,
@@ -1489,7 +1484,8 @@ class SignalExecutor:
                     qty=round(qty, 4),
                     leverage=leverage,
                     take_profit=take_profit,
-                    stop_loss=stop_loss
+                    stop_loss=stop_loss,
+                    order_link_id=signal_data.get('order_link_id')
                 )
                 
                 logger.info(f"🔍 نتيجة تنفيذ الصفقة: {result}")
@@ -1554,7 +1550,8 @@ class SignalExecutor:
                         'notes': f'Futures order - {side} {qty} {symbol}'
                     }
                     
-                    db_manager.create_order(order_data)
+                    with latency_tracer.span('db.create_order'):
+                        db_manager.create_order(order_data)
                     logger.info(f"✅ تم حفظ صفقة فيوتشر في قاعدة البيانات")
                     
                     # إذا كان لديه signal_id، حفظه أيضاً في signal_positions
@@ -1577,7 +1574,8 @@ class SignalExecutor:
                                 'notes': f'Futures position - {side} {qty} {symbol} (ID: {signal_id})'
                             }
                             
-                            portfolio_manager.add_position(position_data)
+                            with latency_tracer.span('db.add_position'):
+                                portfolio_manager.add_position(position_data)
                             logger.info(f"✅ تم حفظ الصفقة في signal_positions أيضاً")
                         except Exception as e:
                             logger.warning(f"⚠️ فشل حفظ في signal_positions: {e}")
@@ -1612,10 +1610,6 @@ class SignalExecutor:
     async def _send_error_notification(user_id: int, error_message: str, signal_data: Dict):
         """إرسال إشعار خطأ للمستخدم"""
         try:
-            # استيراد الوحدات المطلوبة
-            from config import TELEGRAM_TOKEN
-            from telegram.ext import Application
-            
             # إنشاء رسالة مفصلة
             symbol = signal_data.get('symbol', 'غير محدد')
             action = signal_data.get('action', 'غير محدد')
@@ -1665,12 +1659,8 @@ class SignalExecutor:
 
 للمساعدة: تواصل مع الدعم الفني""".strip()
             
-            # إرسال الرسالة بدون parse_mode لتجنب أخطاء التنسيق
-            application = Application.builder().token(TELEGRAM_TOKEN).build()
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=notification_text
-            )
+            # إرسال الرسالة بدون parse_mode لتجنب أخطاء التنسيق (عبر موزع الرسائل - لا يؤخر التنفيذ)
+            telegram_dispatcher.send(user_id, notification_text)
             
             logger.info(f"✅ تم إرسال إشعار فشل الصفقة للمستخدم {user_id}")
             
@@ -1682,9 +1672,6 @@ class SignalExecutor:
                                      closed_count: int, close_type: str, percentage: float = None):
         """إرسال إشعار نجاح الإغلاق"""
         try:
-            from telegram.ext import Application
-            from config import TELEGRAM_TOKEN
-            
             # تحديد نوع الإغلاق
             if close_type == 'partial':
                 close_text = f"إغلاق جزئي {percentage}%"
@@ -1708,13 +1695,8 @@ class SignalExecutor:
 
 💡 تم تنفيذ العملية على حسابك الحقيقي في Bybit""".strip()
             
-            # إرسال الإشعار
-            application = Application.builder().token(TELEGRAM_TOKEN).build()
-            await application.bot.send_message(
-                chat_id=user_id,
-                text=notification_text,
-                parse_mode='Markdown'
-            )
+            # إرسال الإشعار عبر موزع الرسائل
+            telegram_dispatcher.send(user_id, notification_text, parse_mode='Markdown')
             
             logger.info(f"✅ تم إرسال إشعار {close_type} للمستخدم {user_id}")
             
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Signal Journal - سجل الإشارات الدائم (write-ahead)
+كل إشارة تُكتب في جدول SQLite بوضع WAL قبل الرد على الـ webhook،
+مع منع التكرار (signal_id + بصمة المحتوى) وإعادة تشغيل الإشارات المعلقة عند بدء التشغيل
+"""
+
+import hashlib
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import SIGNAL_JOURNAL_SETTINGS
+except ImportError:
+    SIGNAL_JOURNAL_SETTINGS = {
+        'db_path': 'signal_journal.db',
+        'dedup_window_seconds': 3600,
+        'anonymous_dedup_window_seconds': 5,
+        'max_attempts': 3,
+        'retention_days': 7,
+        'synchronous': 'NORMAL',
+    }
+
+# حالات الإشارة في السجل
+STATUS_PENDING = 'pending'          # استُلمت ولم تبدأ معالجتها
+STATUS_PROCESSING = 'processing'    # بدأت المعالجة (إذا بقيت هكذا بعد إعادة التشغيل تُعاد)
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_REJECTED = 'rejected'        # لم تُقبل (مثلاً الطابور ممتلئ) - لا تدخل في منع التكرار
+
+UNFINISHED_STATUSES = (STATUS_PENDING, STATUS_PROCESSING)
+
+
+class SignalJournal:
+    """
+    سجل الإشارات
+
+    - append() قبل الرد: يعيد (entry_id, is_new)؛ الإشارة المكررة خلال نافذة منع التكرار لا تُنفذ مرة أخرى
+      (الإشارة بدون id لها نافذة قصيرة تلتقط إعادة إرسال نفس الطلب فقط، فلا تُحجب buy → close → buy)
+    - mark_processing / mark_done / mark_failed أثناء المعالجة
+    - replay_pending() عند بدء التشغيل: الإشارات غير المنتهية تُعاد (at-least-once)
+    - order_link_id() معرف ثابت للإشارة يُرسل مع الأمر فترفض المنصة تنفيذه مرتين عند الإعادة
+    """
+
+    def __init__(self, db_path: str = None, settings: Dict = None):
+        settings = settings or SIGNAL_JOURNAL_SETTINGS
+        self.db_path = db_path or settings.get('db_path', 'signal_journal.db')
+        self.dedup_window_seconds = settings.get('dedup_window_seconds', 3600)
+        self.anonymous_dedup_window_seconds = settings.get('anonymous_dedup_window_seconds', 5)
+        self.max_attempts = settings.get('max_attempts', 3)
+        self.retention_days = settings.get('retention_days', 7)
+        self.synchronous = settings.get('synchronous', 'NORMAL')
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._install_id: Optional[str] = None
+        self._lock = threading.Lock()
+
+        self.appended = 0
+        self.duplicates = 0
+        self.replayed = 0
+
+    # ==================== قاعدة البيانات ====================
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            # WAL: الكتابة إلحاق بملف السجل بدون حجب القراءة، و NORMAL يكفي للنجاة من توقف العملية
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS signal_journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dedup_key TEXT NOT NULL,
+                    user_id INTEGER,
+                    route TEXT,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER DEFAULT 0,
+                    received_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    result TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_signal_journal_dedup ON signal_journal (dedup_key, received_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_signal_journal_status ON signal_journal (status)')
+            # بادئة عشوائية لكل ملف سجل: عند حذف الملف تبدأ الأرقام من 1 مجدداً لكن بادئة جديدة
+            conn.execute('CREATE TABLE IF NOT EXISTS signal_journal_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO signal_journal_meta (key, value) VALUES (?, ?)',
+                         ('install_id', secrets.token_hex(6)))
+            self._install_id = conn.execute(
+                "SELECT value FROM signal_journal_meta WHERE key = 'install_id'"
+            ).fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _signal_id(payload: Dict) -> str:
+        return str(payload.get('id') or payload.get('signal_id') or '')
+
+    @staticmethod
+    def dedup_key(user_id, payload: Dict) -> str:
+        """مفتاح منع التكرار: المستخدم + signal_id + بصمة المحتوى"""
+        canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+        digest = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+        return f"{user_id}:{SignalJournal._signal_id(payload)}:{digest}"
+
+    def dedup_window(self, payload: Dict) -> float:
+        """نافذة منع التكرار: كاملة مع signal_id صريح، وقصيرة (إعادة إرسال الطلب) بدونه"""
+        if self._signal_id(payload):
+            return self.dedup_window_seconds
+        return self.anonymous_dedup_window_seconds
+
+    def order_link_id(self, entry_id: int) -> str:
+        """معرف الأمر الثابت للإشارة - فريد عبر ملفات السجل (حد Bybit: 36 حرفاً)"""
+        if self._install_id is None:
+            with self._lock:
+                self._connection()
+        return f"sj-{self._install_id}-{entry_id}"
+
+    # ==================== الكتابة ====================
+
+    def append(self, user_id, payload: Dict, route: str = 'personal') -> Tuple[Optional[int], bool]:
+        """
+        تسجيل إشارة مستلمة
+
+        Returns:
+            (entry_id, is_new) - is_new=False للإشارة المكررة (entry_id للإشارة الأصلية)
+        """
+        key = self.dedup_key(user_id, payload)
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                existing = conn.execute(
+                    'SELECT id FROM signal_journal WHERE dedup_key = ? AND received_at >= ? AND status != ? '
+                    'ORDER BY id DESC LIMIT 1',
+                    (key, now - self.dedup_window(payload), STATUS_REJECTED)
+                ).fetchone()
+                if existing:
+                    self.duplicates += 1
+                    logger.info(f"🔁 إشارة مكررة للمستخدم {user_id} - تم تجاهلها (السجل {existing[0]})")
+                    return existing[0], False
+
+                cursor = conn.execute(
+                    'INSERT INTO signal_journal (dedup_key, user_id, route, payload, status, received_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, user_id, route, json.dumps(payload, ensure_ascii=False, default=str),
+                     STATUS_PENDING, now, now)
+                )
+                self.appended += 1
+                return cursor.lastrowid, True
+        except Exception as e:
+            # السجل لا يجب أن يوقف استقبال الإشارات
+            logger.error(f"❌ خطأ في كتابة سجل الإشارات: {e}")
+            return None, True
+
+    def _set_status(self, entry_id: Optional[int], status: str, result=None, count_attempt: bool = False):
+        if entry_id is None:
+            return
+        try:
+            result_text = json.dumps(result, ensure_ascii=False, default=str)[:2000] if result is not None else None
+            with self._lock:
+                self._connection().execute(
+                    'UPDATE signal_journal SET status = ?, updated_at = ?, '
+                    'attempts = attempts + ?, result = COALESCE(?, result) WHERE id = ?',
+                    (status, time.time(), 1 if count_attempt else 0, result_text, entry_id)
+                )
+        except Exception as e:
+            logger.error(f"❌ خطأ في تحديث سجل الإشارة {entry_id}: {e}")
+
+    def mark_processing(self, entry_id: Optional[int]):
+        self._set_status(entry_id, STATUS_PROCESSING, count_attempt=True)
+
+    def mark_done(self, entry_id: Optional[int], result=None):
+        self._set_status(entry_id, STATUS_DONE, result)
+
+    def mark_failed(self, entry_id: Optional[int], error=None):
+        self._set_status(entry_id, STATUS_FAILED, error)
+
+    def mark_rejected(self, entry_id: Optional[int], reason: str = None):
+        """الإشارة لم تُقبل - إعادة إرسالها من TradingView لن تُعتبر تكراراً"""
+        self._set_status(entry_id, STATUS_REJECTED, reason)
+
+    # ==================== الإعادة ====================
+
+    def pending_entries(self) -> List[Dict]:
+        """الإشارات غير المنتهية بترتيب الاستلام"""
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT id, user_id, route, payload, status, attempts, received_at FROM signal_journal '
+                'WHERE status IN (?, ?) ORDER BY id',
+                UNFINISHED_STATUSES
+            ).fetchall()
+        return [{
+            'id': row[0],
+            'user_id': row[1],
+            'route': row[2],
+            'payload': json.loads(row[3]),
+            'status': row[4],
+            'attempts': row[5],
+            'received_at': row[6],
+        } for row in rows]
+
+    def replay_pending(self, handler: Callable[[Dict], bool]) -> int:
+        """
+        إعادة الإشارات غير المنتهية عبر handler(entry) (يعيد True إذا قُبلت للمعالجة)
+
+        الإشارات التي تجاوزت max_attempts تُعلَّم فاشلة بدلاً من إعادتها بلا نهاية
+        """
+        try:
+            entries = self.pending_entries()
+        except Exception as e:
+            logger.error(f"❌ خطأ في قراءة سجل الإشارات: {e}")
+            return 0
+
+        replayed = 0
+        for entry in entries:
+            if entry['attempts'] >= self.max_attempts:
+                logger.warning(f"⚠️ الإشارة {entry['id']} تجاوزت {self.max_attempts} محاولات - لن تُعاد")
+                self.mark_failed(entry['id'], 'max attempts exceeded')
+                continue
+            try:
+                if handler(entry):
+                    replayed += 1
+            except Exception as e:
+                logger.error(f"❌ خطأ في إعادة الإشارة {entry['id']}: {e}")
+
+        self.replayed += replayed
+        if entries:
+            logger.info(f"🔁 إعادة {replayed} من {len(entries)} إشارة غير منتهية من السجل")
+        return replayed
+
+    def prune(self) -> int:
+        """حذف الإشارات المنتهية الأقدم من retention_days"""
+        cutoff = time.time() - self.retention_days * 86400
+        try:
+            with self._lock:
+                cursor = self._connection().execute(
+                    'DELETE FROM signal_journal WHERE received_at < ? AND status NOT IN (?, ?)',
+                    (cutoff, *UNFINISHED_STATUSES)
+                )
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"❌ خطأ في تنظيف سجل الإشارات: {e}")
+            return 0
+
+    def get_stats(self) -> Dict:
+        """عدد الإشارات لكل حالة والعدادات"""
+        try:
+            with self._lock:
+                rows = self._connection().execute(
+                    'SELECT status, COUNT(*) FROM signal_journal GROUP BY status'
+                ).fetchall()
+            by_status = dict(rows)
+        except Exception:
+            by_status = {}
+        return {
+            'appended': self.appended,
+            'duplicates': self.duplicates,
+            'replayed': self.replayed,
+            'by_status': by_status,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# مثيل عام
+signal_journal = SignalJournal()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Signal Ingestion Queue - طابور استقبال الإشارات
+طابور محدود الحجم ومجموعة ثابتة من العمال على event loop واحد طويل العمر،
+بدلاً من خيط و event loop جديدين لكل webhook
+
+الإشارات مقسمة إلى مسارات (lanes) لكل مستخدم: إشارات المسار الواحد تُنفذ بالترتيب (FIFO)
+والمسارات المختلفة تُنفذ بالتوازي على نفس العمال
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from api.latency_tracer import latency_tracer
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import SIGNAL_QUEUE_SETTINGS
+except ImportError:
+    SIGNAL_QUEUE_SETTINGS = {
+        'max_size': 500,
+        'workers': 8,
+        'job_timeout': 120,
+        'min_retry_after': 1,
+        'max_retry_after': 60,
+        'lane_by': 'user',
+        'max_batch_size': 50,
+    }
+
+
+class _Job:
+    """إشارة في الطابور مع سياقها (لتمرير تتبع الزمن) ووقت دخولها ومسارها"""
+
+    __slots__ = ('name', 'factory', 'lane', 'context', 'enqueued_at', 'ready_at')
+
+    def __init__(self, name: str, factory: Callable[[], Awaitable], lane: Optional[Hashable],
+                 context: Optional[contextvars.Context] = None):
+        self.name = name
+        self.factory = factory
+        self.lane = lane
+        self.context = context or contextvars.copy_context()
+        self.enqueued_at = time.perf_counter()
+        # لحظة وصول الإشارة إلى رأس مسارها (قبلها كانت محجوزة خلف إشارة سابقة لنفس المستخدم)
+        self.ready_at = self.enqueued_at
+
+
+class SignalIngestionQueue:
+    """
+    طابور استقبال الإشارات
+
+    - submit() من خيوط Flask: يعيد False فوراً إذا امتلأ الطابور (الرد 429 مع Retry-After)
+    - العمال يعملون على event loop واحد في خيط خلفي وينفذون الإشارات بشكل غير متزامن
+    - submit(lane=...) يضع الإشارة في مسار: لا تبدأ إشارة قبل انتهاء السابقة في نفس المسار،
+      وعند انتهائها تدخل التالية في نهاية طابور الجاهزة (عدالة بين المستخدمين)
+    - submit_many() يدخل دفعة إشارات كاملة أو يرفضها كاملة (webhook الدفعات)
+    - المقاييس: العمق الحالي والأقصى، عمق المسارات، زمن الحجز خلف رأس المسار،
+      زمن الانتظار في الطابور، زمن المعالجة، المرفوض والفاشل
+    """
+
+    def __init__(self, max_size: int = None, workers: int = None, settings: Dict = None):
+        settings = settings or SIGNAL_QUEUE_SETTINGS
+        self.max_size = max_size or settings.get('max_size', 500)
+        self.workers = workers or settings.get('workers', 8)
+        self.job_timeout = settings.get('job_timeout', 120)
+        self.min_retry_after = settings.get('min_retry_after', 1)
+        self.max_retry_after = settings.get('max_retry_after', 60)
+        self.lane_by = settings.get('lane_by', 'user')
+        self.max_batch_size = settings.get('max_batch_size', 50)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+        # العمق يُحسب عند الإدخال (قبل وصول العنصر إلى الـ loop) ليكون الرفض فورياً ودقيقاً
+        self._depth = 0
+        self._busy = 0
+        self._avg_service = 0.0
+
+        # المسارات النشطة: الإشارات المنتظرة خلف الإشارة الجارية (تُعدل داخل الـ loop فقط)
+        self._lanes: Dict[Hashable, Deque[_Job]] = {}
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.max_depth = 0
+        self.max_lane_depth = 0
+        self.lane_blocked = 0
+        self.batches = 0
+
+    # ==================== التشغيل ====================
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        """الـ event loop المشترك (لاستخدامه من مكونات أخرى عند الحاجة)"""
+        return self._loop
+
+    def start(self):
+        """تشغيل الـ loop والعمال في خيط خلفي (مرة واحدة)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name='SignalIngestionQueue', daemon=True)
+            self._thread.start()
+        self._ready.wait(timeout=10)
+        logger.info(f"✅ طابور الإشارات يعمل: {self.workers} عامل، السعة {self.max_size}")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        for index in range(self.workers):
+            self._loop.create_task(self._worker(index))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+            self._loop = None
+
+    def stop(self):
+        """إيقاف العمال (الإشارات المتبقية في الطابور تُهمل)"""
+        loop = self._loop
+        if loop is None:
+            return
+
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        logger.info("🔌 تم إيقاف طابور الإشارات")
+
+    # ==================== الإدخال ====================
+
+    def lane_key(self, user_id, symbol: str = None, lane_by: str = None) -> Hashable:
+        """مفتاح المسار حسب lane_by: المستخدم، أو المستخدم والرمز"""
+        if (lane_by or self.lane_by) == 'user_symbol' and symbol:
+            return (user_id, str(symbol).upper())
+        return user_id
+
+    def submit(self, factory: Callable[[], Awaitable], name: str = 'signal',
+               lane: Optional[Hashable] = None) -> bool:
+        """
+        إدخال إشارة للطابور
+
+        Args:
+            factory: دالة تعيد coroutine المعالجة (تُستدعى داخل العامل)
+            name: اسم للسجلات
+            lane: مفتاح المسار (مثلاً lane_key(user_id)) - None للإشارات المستقلة
+
+        Returns:
+            False إذا كان الطابور ممتلئاً
+        """
+        if self._loop is None:
+            self.start()
+
+        with self._lock:
+            if self._depth >= self.max_size:
+                self.rejected += 1
+                logger.warning(f"⚠️ طابور الإشارات ممتلئ ({self._depth}/{self.max_size}) - رفض {name}")
+                return False
+            self._depth += 1
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self._depth)
+
+        self._loop.call_soon_threadsafe(self._accept, _Job(name, factory, lane))
+        return True
+
+    def submit_many(self, jobs: List[Tuple[Callable[[], Awaitable], str, Optional[Hashable]]]) -> bool:
+        """
+        إدخال دفعة إشارات: تُقبل كلها أو تُرفض كلها
+
+        Args:
+            jobs: [(factory, name, lane)] أو [(factory, name, lane, context)] بترتيب الدفعة
+                  (الترتيب محفوظ داخل كل مسار؛ context لتتبع كل إشارة على حدة)
+
+        Returns:
+            False إذا لم يتسع الطابور للدفعة كاملة
+        """
+        if not jobs:
+            return True
+        if self._loop is None:
+            self.start()
+
+        with self._lock:
+            if self._depth + len(jobs) > self.max_size:
+                self.rejected += len(jobs)
+                logger.warning(f"⚠️ طابور الإشارات لا يتسع لدفعة من {len(jobs)} إشارة "
+                               f"({self._depth}/{self.max_size}) - رفض الدفعة")
+                return False
+            self._depth += len(jobs)
+            self.submitted += len(jobs)
+            self.batches += 1
+            self.max_depth = max(self.max_depth, self._depth)
+
+        # استدعاء واحد للـ loop للدفعة كاملة
+        batch = [_Job(name, factory, lane, *context) for factory, name, lane, *context in jobs]
+        self._loop.call_soon_threadsafe(self._accept_many, batch)
+        return True
+
+    def _accept(self, job: _Job):
+        """توجيه الإشارة (داخل الـ loop): إلى طابور الجاهزة، أو خلف الإشارة الجارية في مسارها"""
+        if job.lane is None:
+            self._queue.put_nowait(job)
+            return
+        waiting = self._lanes.get(job.lane)
+        if waiting is None:
+            self._lanes[job.lane] = deque()
+            self._queue.put_nowait(job)
+            return
+        waiting.append(job)
+        self.max_lane_depth = max(self.max_lane_depth, len(waiting) + 1)
+
+    def _accept_many(self, jobs: List[_Job]):
+        for job in jobs:
+            self._accept(job)
+
+    def _advance_lane(self, lane: Hashable):
+        """بعد انتهاء إشارة: التالية في المسار تدخل طابور الجاهزة، أو يُغلق المسار"""
+        waiting = self._lanes.get(lane)
+        if waiting:
+            job = waiting.popleft()
+            job.ready_at = time.perf_counter()
+            blocked_ms = (job.ready_at - job.enqueued_at) * 1000
+            self.lane_blocked += 1
+            job.context.run(latency_tracer.record, 'ingestion.lane_blocked', blocked_ms, job.enqueued_at)
+            self._queue.put_nowait(job)
+        else:
+            self._lanes.pop(lane, None)
+
+    def retry_after(self) -> int:
+        """تقدير الثواني حتى يتوفر مكان (للرأس Retry-After)"""
+        estimate = self._depth * (self._avg_service or 1.0) / max(1, self.workers)
+        return int(min(self.max_retry_after, max(self.min_retry_after, math.ceil(estimate))))
+
+    # ==================== العمال ====================
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            with self._lock:
+                self._depth -= 1
+                self._busy += 1
+
+            # الانتظار في طابور الجاهزة فقط (زمن الحجز خلف المسار يُسجل في ingestion.lane_blocked)
+            wait_ms = (time.perf_counter() - job.ready_at) * 1000
+            started = time.perf_counter()
+            try:
+                # المهمة تعمل داخل سياق الـ webhook فيستمر تتبع الزمن
+                job.context.run(latency_tracer.record, 'ingestion.queue_wait', wait_ms, job.enqueued_at)
+                task = self._loop.create_task(job.factory(), context=job.context)
+                await asyncio.wait_for(task, timeout=self.job_timeout)
+                self.completed += 1
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                logger.error(f"❌ تجاوزت معالجة {job.name} المهلة ({self.job_timeout} ثانية)")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"❌ خطأ في معالجة {job.name} (العامل {index}): {e}")
+            finally:
+                service = time.perf_counter() - started
+                self._avg_service = service if not self._avg_service else 0.9 * self._avg_service + 0.1 * service
+                latency_tracer.record('ingestion.service', service * 1000)
+                with self._lock:
+                    self._busy -= 1
+                if job.lane is not None:
+                    self._advance_lane(job.lane)
+                self._queue.task_done()
+
+    # ==================== الإحصائيات ====================
+
+    def get_lane_depths(self, limit: int = 10) -> Dict[str, int]:
+        """أعمق المسارات الحالية (الإشارة الجارية + المنتظرة خلفها)"""
+        try:
+            depths = [(str(lane), len(waiting) + 1) for lane, waiting in list(self._lanes.items())]
+        except RuntimeError:
+            return {}
+        depths.sort(key=lambda item: item[1], reverse=True)
+        return dict(depths[:limit])
+
+    def get_stats(self) -> Dict:
+        """عمق الطابور والمسارات وزمن الانتظار والعدادات"""
+        stages = latency_tracer.get_stats()
+        return {
+            'running': self._loop is not None,
+            'workers': self.workers,
+            'busy_workers': self._busy,
+            'capacity': self.max_size,
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'submitted': self.submitted,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'avg_service_ms': round(self._avg_service * 1000, 2),
+            'queue_wait': stages.get('ingestion.queue_wait', {}),
+            'lane_by': self.lane_by,
+            'active_lanes': len(self._lanes),
+            'max_lane_depth': self.max_lane_depth,
+            'lane_blocked': self.lane_blocked,
+            'deepest_lanes': self.get_lane_depths(),
+            'head_of_line_blocking': stages.get('ingestion.lane_blocked', {}),
+        }
+
+
+# مثيل عام
+signal_ingestion_queue = SignalIngestionQueue()
@@ -0,0 +1,26 @@
+# Simulator Module - محاكيات المنصات
+"""
+هذا المجلد يحتوي على محاكيات محلية للمنصات لاختبارات الحمل والقياس بدون اتصال
+"""
+
+try:
+    from .bybit_simulator import BybitSimulator
+except ImportError:
+    pass
+
+try:
+    from .backtest_engine import BacktestEngine, OHLCVStore
+except ImportError:
+    pass
+
+try:
+    from .webhook_benchmark import WebhookBenchmark
+except ImportError:
+    pass
+
+__all__ = [
+    'BybitSimulator',
+    'BacktestEngine',
+    'OHLCVStore',
+    'WebhookBenchmark'
+]
@@ -0,0 +1,922 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backtest Engine - محرك إعادة تشغيل الإشارات والاختبار التاريخي
+يعيد تشغيل سجل إشارات تاريخي على بيانات OHLCV محلية عبر نفس مسارات الحساب التجريبي:
+SignalConverter.convert_signal، TradingAccount.open/close_futures_position،
+PositionManagement.check_and_execute_tp/check_stop_loss وفحص التصفية في FuturesPosition
+
+الساعة المحاكاة لا تمر على كل شمعة لكل رمز: لكل صفقة مفتوحة يُبحث (بـ numpy) عن أول شمعة
+تلمس هدفاً أو وقف خسارة أو سعر تصفية، وتُعالج الأحداث بترتيبها الزمني من طابور أولويات
+
+الاستخدام:
+    python -m simulator.backtest_engine --signals signals.jsonl --data backtest_data --out backtest_results
+    python -m simulator.backtest_engine --signals signal_journal.db --data backtest_data \\
+        --sweep '{"leverage": [5, 10, 20], "sl_percentage": [1, 2, 3]}' --processes 8
+
+ملفات البيانات: <data_dir>/<SYMBOL>.csv بالأعمدة timestamp,open,high,low,close[,volume]
+(الوقت بالثواني أو الميلي ثانية أو ISO)؛ تُحفظ نسخة <SYMBOL>.npy بجانبها وتُقرأ لاحقاً بـ mmap
+
+سجل الإشارات: JSON Lines (سطر لكل إشارة مع timestamp أو received_at، والإشارة نفسها أو في payload)،
+مصفوفة JSON، أو قاعدة signal_journal.db
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import BACKTEST_SETTINGS
+except ImportError:
+    BACKTEST_SETTINGS = {
+        'data_dir': 'backtest_data',
+        'initial_balance': 10000.0,
+        'user_settings': {
+            'market_type': 'futures',
+            'trade_amount': 100.0,
+            'leverage': 10,
+        },
+        'management': {
+            'tp_percentages': [],
+            'tp_close_percentages': [],
+            'sl_percentage': 0,
+            'trailing_enabled': False,
+            'trailing_distance': 2.0,
+        },
+        'fee_rate': 0.0,
+        'slippage_bps': 0.0,
+        'intrabar': 'worst',
+        'equity_interval_minutes': 60,
+        'close_open_at_end': True,
+        'cache_npy': True,
+        'quiet': True,
+    }
+
+# سجلات مسارات التداول الحقيقية (سطور INFO لكل إشارة وصفقة) تُخفض أثناء الاختبار
+QUIET_LOGGERS = ('bybit_trading_bot', 'signals.signal_converter', 'signals.signal_id_manager')
+
+# أسماء عمود الوقت المقبولة في ملفات CSV
+TIME_COLUMNS = ('timestamp', 'time', 'open_time', 'date', 'datetime', 'ts')
+
+EPSILON = 1e-12
+
+
+def parse_time(value) -> Optional[float]:
+    """تحويل الوقت (ثوانٍ، ميلي ثانية، أو نص ISO) إلى ميلي ثانية"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = str(value).strip()
+        try:
+            number = float(text)
+        except ValueError:
+            parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            return parsed.timestamp() * 1000
+    # أقل من 1e11 = ثوانٍ (حتى عام 5138)
+    return number * 1000 if number < 1e11 else number
+
+
+# ==================== البيانات ====================
+
+class PriceSeries:
+    """شموع رمز واحد كأعمدة numpy (قد تكون mmap من ملف .npy)"""
+
+    __slots__ = ('symbol', 'ts', 'open', 'high', 'low', 'close')
+
+    def __init__(self, symbol: str, columns: np.ndarray):
+        self.symbol = symbol
+        self.ts, self.open, self.high, self.low, self.close = columns[:5]
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def index_at(self, ts_ms: float) -> int:
+        """أول شمعة تبدأ عند ts_ms أو بعده (شمعة التنفيذ لإشارة وصلت في ts_ms)"""
+        return int(np.searchsorted(self.ts, ts_ms, side='left'))
+
+    def last_index_at(self, ts_ms: float) -> int:
+        """آخر شمعة بدأت عند ts_ms أو قبله (-1 إن لم توجد)"""
+        return int(np.searchsorted(self.ts, ts_ms, side='right')) - 1
+
+
+class OHLCVStore:
+    """قراءة ملفات OHLCV من القرص مع تخزين نسخة .npy عمودية تُقرأ بـ mmap"""
+
+    def __init__(self, data_dir: str, cache_npy: bool = True):
+        self.data_dir = data_dir
+        self.cache_npy = cache_npy
+        self._series: Dict[str, Optional[PriceSeries]] = {}
+
+    def load(self, symbol: str) -> Optional[PriceSeries]:
+        symbol = symbol.upper()
+        if symbol not in self._series:
+            self._series[symbol] = self._load(symbol)
+        return self._series[symbol]
+
+    def _load(self, symbol: str) -> Optional[PriceSeries]:
+        csv_path = os.path.join(self.data_dir, f"{symbol}.csv")
+        npy_path = os.path.join(self.data_dir, f"{symbol}.npy")
+
+        has_csv = os.path.exists(csv_path)
+        if os.path.exists(npy_path) and (not has_csv or os.path.getmtime(npy_path) >= os.path.getmtime(csv_path)):
+            return PriceSeries(symbol, np.load(npy_path, mmap_mode='r'))
+        if not has_csv:
+            logger.warning(f"⚠️ لا توجد بيانات للرمز {symbol} في {self.data_dir}")
+            return None
+
+        started = time.perf_counter()
+        columns = self._read_csv(csv_path)
+        # ترتيب زمني وحذف الشموع المكررة
+        order = np.argsort(columns[0], kind='stable')
+        columns = columns[:, order]
+        keep = np.concatenate(([True], np.diff(columns[0]) > 0))
+        columns = np.ascontiguousarray(columns[:, keep])
+
+        if self.cache_npy:
+            try:
+                np.save(npy_path, columns)
+                columns = np.load(npy_path, mmap_mode='r')
+            except OSError as e:
+                logger.warning(f"⚠️ تعذر حفظ {npy_path}: {e}")
+        logger.info(f"📥 {symbol}: {columns.shape[1]} شمعة ({time.perf_counter() - started:.2f} ثانية)")
+        return PriceSeries(symbol, columns)
+
+    @staticmethod
+    def _read_csv(path: str) -> np.ndarray:
+        """قراءة CSV إلى مصفوفة (5, n): ts بالميلي ثانية ثم open, high, low, close"""
+        with open(path, 'r', encoding='utf-8') as f:
+            first = f.readline().strip().split(',')
+
+        header = None
+        try:
+            [float(value) for value in first[:5]]
+        except ValueError:
+            header = [name.strip().lower() for name in first]
+
+        if header:
+            time_column = next((header.index(name) for name in TIME_COLUMNS if name in header), 0)
+            usecols = [time_column] + [header.index(name) for name in ('open', 'high', 'low', 'close')]
+        else:
+            usecols = [0, 1, 2, 3, 4]
+
+        try:
+            data = np.loadtxt(path, delimiter=',', skiprows=1 if header else 0,
+                              usecols=usecols, dtype=np.float64, ndmin=2)
+            columns = data.T.copy()
+            if len(columns[0]) and np.nanmax(columns[0]) < 1e11:
+                columns[0] *= 1000
+        except ValueError:
+            # أوقات نصية (ISO) - قراءة أبطأ مرة واحدة ثم تُستخدم نسخة .npy
+            rows = []
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                reader = csv.reader(f)
+                if header:
+                    next(reader, None)
+                for row in reader:
+                    if row:
+                        rows.append([parse_time(row[usecols[0]])] + [float(row[i]) for i in usecols[1:]])
+            columns = np.array(rows, dtype=np.float64).reshape(-1, 5).T.copy()
+        return columns
+
+
+def load_signals(path: str, start_ms: float = None, end_ms: float = None) -> List[Tuple[float, Dict]]:
+    """
+    قراءة سجل الإشارات مرتباً زمنياً
+
+    Returns:
+        [(ts_ms, payload)]
+    """
+    signals = []
+
+    if path.endswith('.db'):
+        # قاعدة سجل الإشارات الدائم (signals/signal_journal.py)
+        conn = sqlite3.connect(path)
+        try:
+            for received_at, payload in conn.execute('SELECT received_at, payload FROM signal_journal ORDER BY id'):
+                signals.append((received_at * 1000, json.loads(payload)))
+        finally:
+            conn.close()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read().strip()
+        if content.startswith('['):
+            records = json.loads(content)
+        else:
+            records = [json.loads(line) for line in content.splitlines() if line.strip()]
+
+        for record in records:
+            stamp = next((record[key] for key in ('timestamp', 'time', 'received_at') if key in record), None)
+            ts_ms = parse_time(stamp)
+            if ts_ms is None:
+                continue
+            payload = record.get('payload')
+            if not isinstance(payload, dict):
+                payload = {k: v for k, v in record.items() if k not in ('timestamp', 'time', 'received_at')}
+            signals.append((ts_ms, payload))
+
+    signals = [(ts, payload) for ts, payload in signals
+               if (start_ms is None or ts >= start_ms) and (end_ms is None or ts <= end_ms)]
+    signals.sort(key=lambda item: item[0])
+    return signals
+
+
+@contextmanager
+def quiet_trading_logs(enabled: bool = True):
+    """خفض سجلات مسارات التداول إلى WARNING أثناء الاختبار"""
+    if not enabled:
+        yield
+        return
+    previous = {}
+    for name in QUIET_LOGGERS:
+        target = logging.getLogger(name)
+        previous[name] = target.level
+        target.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        for name, level in previous.items():
+            logging.getLogger(name).setLevel(level)
+
+
+# ==================== المحرك ====================
+
+class _OpenPosition:
+    """صفقة مفتوحة في الاختبار: FuturesPosition من الحساب + PositionManagement لأدوات الإدارة"""
+
+    __slots__ = ('position_id', 'symbol', 'series', 'position', 'management', 'index',
+                 'version', 'opened_at', 'realized_pnl', 'fees')
+
+    def __init__(self, position_id, symbol, series, position, management, index, opened_at):
+        self.position_id = position_id
+        self.symbol = symbol
+        self.series = series
+        self.position = position
+        self.management = management
+        # أول شمعة لم تُفحص بعد
+        self.index = index
+        # يزيد عند كل تغيير - أحداث الطابور القديمة تُهمل
+        self.version = 0
+        self.opened_at = opened_at
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+
+
+class BacktestEngine:
+    """
+    محرك الاختبار التاريخي
+
+    - الإشارة تُحول بـ SignalConverter.convert_signal وتُنفذ عند افتتاح أول شمعة بعد وصولها
+    - الفتح والإغلاق عبر TradingAccount (نفس الحساب التجريبي)؛ الأهداف ووقف الخسارة عبر PositionManagement
+    - إعدادات الإدارة (management) بنفس مفاتيح auto_apply_settings للمستخدم
+    - intrabar='worst': إذا لمست الشمعة الهدف ووقف الخسارة معاً يُفترض الوقف أولاً ('best' للعكس)
+    - السوق الفوري يُحاكى كفيوتشر برافعة 1 (الرافعة التي يضعها المحول للسوق الفوري)
+    """
+
+    def __init__(self, store: OHLCVStore, settings: Dict = None):
+        settings = {**BACKTEST_SETTINGS, **(settings or {})}
+        self.store = store
+        self.settings = settings
+        self.initial_balance = settings.get('initial_balance', 10000.0)
+        self.user_settings = {'account_type': 'demo', 'exchange': 'bybit',
+                              **settings.get('user_settings', {})}
+        self.management = settings.get('management', {})
+        self.fee_rate = settings.get('fee_rate', 0.0)
+        self.slippage = settings.get('slippage_bps', 0.0) / 10000
+        self.intrabar = settings.get('intrabar', 'worst')
+        self.equity_interval_ms = settings.get('equity_interval_minutes', 60) * 60000
+        self.close_open_at_end = settings.get('close_open_at_end', True)
+        self.quiet = settings.get('quiet', True)
+
+    # ==================== التشغيل ====================
+
+    def run(self, signals: List[Tuple[float, Dict]]) -> Dict:
+        """
+        تشغيل الاختبار على قائمة الإشارات (من load_signals)
+
+        Returns:
+            {'summary', 'trades', 'equity_curve', 'skipped'}
+        """
+        from bybit_trading_bot import TradingAccount
+        from signals.signal_converter import SignalConverter
+
+        started = time.perf_counter()
+        self._account = TradingAccount(initial_balance=self.initial_balance, account_type='futures',
+                                       use_position_book=False)
+        self._open: Dict[str, _OpenPosition] = {}
+        self._by_symbol: Dict[str, Dict[str, _OpenPosition]] = {}
+        self._events: List = []
+        self._sequence = itertools.count()
+        self._trades: List[Dict] = []
+        self._equity: List[Tuple[float, float]] = []
+        self._skipped: List[Dict] = []
+        self._closed_positions = 0
+        self._wins = 0
+        self._liquidations = 0
+        self._fees = 0.0
+        self._bars_scanned = 0
+
+        if not signals:
+            return self._result(started, 0)
+
+        next_sample = signals[0][0]
+        end_ms = signals[-1][0]
+        position = 0
+
+        with quiet_trading_logs(self.quiet):
+            while True:
+                signal_ts = signals[position][0] if position < len(signals) else math.inf
+                trigger = self._peek_trigger()
+                trigger_ts = trigger[0] if trigger else math.inf
+                event_ts = min(signal_ts, trigger_ts)
+                if event_ts == math.inf:
+                    break
+
+                while next_sample < event_ts:
+                    self._sample_equity(next_sample)
+                    next_sample += self.equity_interval_ms
+
+                # حدث الشمعة يسبق الإشارة التي تصل في نفس اللحظة (الإشارة تُنفذ على الشمعة التالية)
+                if trigger_ts <= signal_ts:
+                    heapq.heappop(self._events)
+                    self._process_trigger(trigger[3], trigger[4])
+                else:
+                    ts_ms, payload = signals[position]
+                    position += 1
+                    self._process_signal(ts_ms, payload, SignalConverter)
+                end_ms = max(end_ms, event_ts)
+
+            if self.close_open_at_end:
+                for op in list(self._open.values()):
+                    last = len(op.series) - 1
+                    end_ms = max(end_ms, float(op.series.ts[last]))
+                    self._close(op, float(op.series.close[last]), 'end_of_backtest', float(op.series.ts[last]))
+
+            while next_sample < end_ms:
+                self._sample_equity(next_sample)
+                next_sample += self.equity_interval_ms
+            self._sample_equity(end_ms)
+
+        return self._result(started, len(signals))
+
+    # ==================== الإشارات ====================
+
+    def _process_signal(self, ts_ms: float, payload: Dict, converter):
+        converted = converter.convert_signal(dict(payload), dict(self.user_settings))
+        if not converted:
+            self._skip(ts_ms, payload, 'conversion failed')
+            return
+
+        symbol = converted['symbol'].upper()
+        series = self.store.load(symbol)
+        if series is None:
+            self._skip(ts_ms, payload, 'no price data')
+            return
+        index = series.index_at(ts_ms)
+        if index >= len(series):
+            self._skip(ts_ms, payload, 'signal after end of price data')
+            return
+
+        action = converted.get('action')
+        price = float(series.open[index])
+        bar_ts = float(series.ts[index])
+
+        if action in ('buy', 'sell'):
+            self._open_position(converted, series, index, price, bar_ts)
+        elif action in ('close', 'partial_close'):
+            targets = self._close_targets(symbol, converted)
+            if not targets:
+                self._skip(ts_ms, payload, 'no open position')
+                return
+            for op in targets:
+                fill = self._slipped(price, op.position.side, closing=True)
+                if action == 'close':
+                    self._close(op, fill, 'signal', bar_ts)
+                else:
+                    self._reduce(op, float(converted.get('percentage', 50)) / 100, fill, 'partial_close', bar_ts)
+                    if op.position_id in self._open:
+                        self._schedule(op, index)
+
+    def _close_targets(self, symbol: str, converted: Dict) -> List[_OpenPosition]:
+        """الصفقات المستهدفة: برقم الصفقة المرتبط بـ ID الإشارة، وإلا كل صفقات الرمز (حسب الجانب)"""
+        position_id = converted.get('position_id')
+        if position_id and position_id in self._open:
+            return [self._open[position_id]]
+        side = {'close_long': 'buy', 'close_short': 'sell'}.get(converted.get('signal_type'))
+        return [op for op in self._by_symbol.get(symbol, {}).values()
+                if side is None or op.position.side == side]
+
+    def _open_position(self, converted: Dict, series: PriceSeries, index: int, price: float, bar_ts: float):
+        from bybit_trading_bot import PositionManagement
+
+        side = converted['action']
+        leverage = int(converted.get('leverage') or 1)
+        margin = float(converted.get('amount') or 0)
+        fill = self._slipped(price, side, closing=False)
+
+        position_id = converted.get('position_id') or f"{series.symbol}_{side}"
+        if position_id in self._open or position_id in self._account.positions:
+            position_id = f"{position_id}#{next(self._sequence)}"
+
+        success, result = self._account.open_futures_position(
+            series.symbol, side, margin, fill, leverage, position_id=position_id
+        )
+        if not success:
+            self._skip(bar_ts, converted.get('original_signal', {}), result)
+            return
+
+        position = self._account.positions[position_id]
+        management = PositionManagement(
+            position_id=position_id,
+            symbol=series.symbol,
+            side=side,
+            entry_price=fill,
+            quantity=position.contracts,
+            remaining_quantity=position.contracts,
+            market_type='futures',
+            leverage=leverage
+        )
+        self._apply_management(management, fill)
+
+        op = _OpenPosition(position_id, series.symbol, series, position, management, index, bar_ts)
+        self._open[position_id] = op
+        self._by_symbol.setdefault(series.symbol, {})[position_id] = op
+        self._charge_fee(op, position.position_size)
+        self._schedule(op, index)
+
+    def _apply_management(self, management, entry_price: float):
+        """الأهداف ووقف الخسارة بنفس حسابات TradeToolsManager.apply_auto_settings_to_position"""
+        settings = self.management
+        buy = management.side == 'buy'
+        for tp_pct, close_pct in zip(settings.get('tp_percentages') or [], settings.get('tp_close_percentages') or []):
+            tp_price = entry_price * (1 + tp_pct / 100) if buy else entry_price * (1 - tp_pct / 100)
+            management.add_take_profit(tp_price, close_pct)
+
+        sl_pct = settings.get('sl_percentage') or 0
+        if sl_pct > 0:
+            sl_price = entry_price * (1 - sl_pct / 100) if buy else entry_price * (1 + sl_pct / 100)
+            management.set_stop_loss(sl_price,
+                                     is_trailing=settings.get('trailing_enabled', False),
+                                     trailing_distance=settings.get('trailing_distance', 2.0))
+
+    # ==================== الأحداث ====================
+
+    def _schedule(self, op: _OpenPosition, start: int):
+        """البحث عن أول شمعة تفعّل حدثاً للصفقة ووضعها في الطابور"""
+        op.version += 1
+        op.index = start
+        index = self._find_trigger(op, start)
+        if index is not None:
+            heapq.heappush(self._events, (float(op.series.ts[index]), next(self._sequence),
+                                          op.version, op, index))
+
+    def _peek_trigger(self):
+        """أقرب حدث صالح (الأحداث القديمة لصفقات تغيرت أو أُغلقت تُحذف)"""
+        while self._events:
+            event = self._events[0]
+            op = event[3]
+            if op.version == event[2] and op.position_id in self._open:
+                return event
+            heapq.heappop(self._events)
+        return None
+
+    @staticmethod
+    def _next_take_profit(management) -> Optional[float]:
+        for tp in management.take_profits:
+            if not tp.hit:
+                return tp.price
+        return None
+
+    def _find_trigger(self, op: _OpenPosition, start: int) -> Optional[int]:
+        """أول شمعة من start تلمس التصفية أو وقف الخسارة أو الهدف التالي (بحث numpy على دفعات)"""
+        series = op.series
+        total = len(series)
+        buy = op.position.side == 'buy'
+        liquidation = op.position.liquidation_price
+        take_profit = self._next_take_profit(op.management)
+        stop = op.management.stop_loss
+        trailing = stop is not None and stop.is_trailing and stop.trailing_distance > 0
+        factor = 1.0
+        if trailing:
+            factor = (1 - stop.trailing_distance / 100) if buy else (1 + stop.trailing_distance / 100)
+        extreme = -math.inf if buy else math.inf
+
+        chunk = 1024
+        index = start
+        while index < total:
+            end = min(total, index + chunk)
+            low = series.low[index:end]
+            high = series.high[index:end]
+            self._bars_scanned += end - index
+
+            if buy:
+                mask = low <= liquidation
+                if take_profit is not None:
+                    mask |= high >= take_profit
+                if stop is not None:
+                    if trailing:
+                        # الوقف المتحرك في كل شمعة يعتمد على أعلى سعر في الشموع السابقة لها
+                        peaks = np.maximum.accumulate(high)
+                        previous = np.empty_like(peaks)
+                        previous[0] = extreme
+                        previous[1:] = np.maximum(peaks[:-1], extreme)
+                        mask |= low <= np.maximum(stop.price, previous * factor)
+                        extreme = max(extreme, float(peaks[-1]))
+                    else:
+                        mask |= low <= stop.price
+            else:
+                mask = high >= liquidation
+                if take_profit is not None:
+                    mask |= low <= take_profit
+                if stop is not None:
+                    if trailing:
+                        troughs = np.minimum.accumulate(low)
+                        previous = np.empty_like(troughs)
+                        previous[0] = extreme
+                        previous[1:] = np.minimum(troughs[:-1], extreme)
+                        mask |= high >= np.minimum(stop.price, previous * factor)
+                        extreme = min(extreme, float(troughs[-1]))
+                    else:
+                        mask |= high >= stop.price
+
+            if mask.any():
+                return index + int(mask.argmax())
+            index = end
+            chunk = min(chunk * 4, 1 << 20)
+        return None
+
+    def _process_trigger(self, op: _OpenPosition, index: int):
+        """معالجة الشمعة التي لمست مستوى: عبر check_liquidation / check_stop_loss / check_and_execute_tp"""
+        series = op.series
+        position = op.position
+        management = op.management
+        buy = position.side == 'buy'
+        bar_open = float(series.open[index])
+        high = float(series.high[index])
+        low = float(series.low[index])
+        bar_ts = float(series.ts[index])
+        stop = management.stop_loss
+
+        # تحريك الوقف المتحرك حتى الشمعة السابقة (نفس ما يفعله التحديث الدوري في البوت)
+        if stop is not None and stop.is_trailing and index > op.index:
+            window = series.high[op.index:index] if buy else series.low[op.index:index]
+            stop.update_trailing(float(window.max() if buy else window.min()), position.side)
+
+        if self.intrabar == 'best' and self._take_profits(op, bar_open, high, low, bar_ts):
+            if op.position_id not in self._open:
+                return
+        if self._exits(op, bar_open, high, low, bar_ts):
+            return
+        if self.intrabar != 'best':
+            self._take_profits(op, bar_open, high, low, bar_ts)
+        if op.position_id not in self._open:
+            return
+
+        if stop is not None and stop.is_trailing:
+            stop.update_trailing(high if buy else low, position.side)
+        self._schedule(op, index + 1)
+
+    def _exits(self, op: _OpenPosition, bar_open: float, high: float, low: float, bar_ts: float) -> bool:
+        """وقف الخسارة أو التصفية في الشمعة؛ يعيد True إذا أُغلقت الصفقة"""
+        position = op.position
+        stop = op.management.stop_loss
+        buy = position.side == 'buy'
+        adverse = low if buy else high
+
+        liquidated = position.check_liquidation(adverse)
+        stop_hit = stop is not None and (adverse <= stop.price if buy else adverse >= stop.price)
+        # الوقف يسبق التصفية إذا كان أقرب لسعر الدخول
+        stop_first = stop_hit and (not liquidated or
+                                   (stop.price > position.liquidation_price if buy
+                                    else stop.price < position.liquidation_price))
+
+        if stop_first:
+            fill = min(bar_open, stop.price) if buy else max(bar_open, stop.price)
+            if op.management.check_stop_loss(fill):
+                self._close(op, self._slipped(fill, position.side, closing=True), 'stop_loss', bar_ts)
+                return True
+        if liquidated:
+            self._liquidations += 1
+            self._close(op, position.liquidation_price, 'liquidation', bar_ts)
+            return True
+        return False
+
+    def _take_profits(self, op: _OpenPosition, bar_open: float, high: float, low: float, bar_ts: float) -> bool:
+        """تنفيذ الأهداف التي لمستها الشمعة بالترتيب؛ يعيد True إذا نُفذ هدف"""
+        management = op.management
+        buy = op.position.side == 'buy'
+        executed_any = False
+
+        while op.position_id in self._open:
+            target = self._next_take_profit(management)
+            if target is None or (high < target if buy else low > target):
+                break
+            fill = max(bar_open, target) if buy else min(bar_open, target)
+            executions = management.check_and_execute_tp(fill)
+            if not executions:
+                break
+            executed_any = True
+            for execution in executions:
+                if op.position_id not in self._open:
+                    break
+                fraction = execution['quantity'] / op.position.contracts if op.position.contracts > EPSILON else 1.0
+                self._reduce(op, fraction, self._slipped(fill, op.position.side, closing=True),
+                             'take_profit', bar_ts)
+            if op.position_id in self._open and management.remaining_quantity <= EPSILON:
+                self._close(op, fill, 'take_profit', bar_ts)
+        return executed_any
+
+    # ==================== الحساب ====================
+
+    def _slipped(self, price: float, side: str, closing: bool) -> float:
+        if not self.slippage:
+            return price
+        # الانزلاق ضد المتداول: الشراء أعلى والبيع أقل
+        buying = (side == 'buy') != closing
+        return price * (1 + self.slippage) if buying else price * (1 - self.slippage)
+
+    def _charge_fee(self, op: _OpenPosition, notional: float):
+        if self.fee_rate:
+            fee = notional * self.fee_rate
+            self._account.balance -= fee
+            op.fees += fee
+            self._fees += fee
+
+    def _reduce(self, op: _OpenPosition, fraction: float, price: float, reason: str, ts_ms: float):
+        """إغلاق جزء من الصفقة بنفس حساب الإغلاق الجزئي في البوت (تحرير الهامش + إضافة الربح)"""
+        if fraction >= 1 - 1e-9:
+            self._close(op, price, reason, ts_ms)
+            return
+        position = op.position
+        pnl = position.calculate_closing_pnl(price) * fraction
+        released = position.margin_amount * fraction
+        notional = position.contracts * fraction * price
+
+        position.margin_amount -= released
+        position.contracts *= (1 - fraction)
+        position.position_size = position.margin_amount * position.leverage
+        self._account.margin_locked -= released
+        self._account.balance += pnl
+        op.management.remaining_quantity = min(op.management.remaining_quantity, position.contracts)
+        op.realized_pnl += pnl
+        self._charge_fee(op, notional)
+        self._record_fill(op, price, reason, ts_ms, pnl, fraction)
+
+    def _close(self, op: _OpenPosition, price: float, reason: str, ts_ms: float):
+        """إغلاق الصفقة بالكامل عبر TradingAccount.close_futures_position"""
+        notional = op.position.contracts * price
+        success, record = self._account.close_futures_position(op.position_id, price)
+        pnl = record.get('pnl', 0.0) if success else 0.0
+        op.realized_pnl += pnl
+        self._charge_fee(op, notional)
+        self._record_fill(op, price, reason, ts_ms, pnl, 1.0)
+
+        self._open.pop(op.position_id, None)
+        symbol_positions = self._by_symbol.get(op.symbol)
+        if symbol_positions is not None:
+            symbol_positions.pop(op.position_id, None)
+            if not symbol_positions:
+                del self._by_symbol[op.symbol]
+        op.version += 1
+
+        self._closed_positions += 1
+        if op.realized_pnl - op.fees > 0:
+            self._wins += 1
+
+    def _record_fill(self, op: _OpenPosition, price: float, reason: str, ts_ms: float, pnl: float, fraction: float):
+        self._trades.append({
+            'position_id': op.position_id,
+            'symbol': op.symbol,
+            'side': op.position.side,
+            'leverage': op.position.leverage,
+            'entry_time': op.opened_at,
+            'exit_time': ts_ms,
+            'entry_price': op.position.entry_price,
+            'exit_price': price,
+            'fraction': round(fraction, 6),
+            'reason': reason,
+            'pnl': pnl,
+            'balance': self._account.balance,
+        })
+
+    def _skip(self, ts_ms: float, payload: Dict, reason):
+        self._skipped.append({'time': ts_ms, 'signal': payload, 'reason': str(reason)})
+
+    def _sample_equity(self, ts_ms: float):
+        """الرصيد + الربح غير المحقق بسعر إغلاق آخر شمعة (FuturesPosition.update_pnl)"""
+        unrealized = 0.0
+        for op in self._open.values():
+            index = op.series.last_index_at(ts_ms)
+            if index >= 0:
+                unrealized += op.position.update_pnl(float(op.series.close[index]))
+        self._equity.append((ts_ms, self._account.balance + unrealized))
+
+    # ==================== النتائج ====================
+
+    def _result(self, started: float, signal_count: int) -> Dict:
+        elapsed = time.perf_counter() - started
+        equity = np.array([value for _, value in self._equity]) if self._equity else np.array([self.initial_balance])
+        peaks = np.maximum.accumulate(equity)
+        drawdowns = (peaks - equity) / np.where(peaks > 0, peaks, 1)
+
+        gains = sum(t['pnl'] for t in self._trades if t['pnl'] > 0)
+        losses = -sum(t['pnl'] for t in self._trades if t['pnl'] < 0)
+        final_equity = float(equity[-1])
+        positions = self._closed_positions
+
+        summary = {
+            'initial_balance': self.initial_balance,
+            'final_equity': round(final_equity, 4),
+            'total_return_pct': round((final_equity / self.initial_balance - 1) * 100, 4),
+            'max_drawdown_pct': round(float(drawdowns.max()) * 100, 4),
+            'positions': positions,
+            'wins': self._wins,
+            'losses': positions - self._wins,
+            'win_rate': round(self._wins / positions * 100, 2) if positions else 0.0,
+            'profit_factor': round(gains / losses, 4) if losses else None,
+            'liquidations': self._liquidations,
+            'fees': round(self._fees, 4),
+            'fills': len(self._trades),
+            'open_positions': len(self._open),
+            'signals': signal_count,
+            'skipped_signals': len(self._skipped),
+            'bars_scanned': self._bars_scanned,
+            'elapsed_seconds': round(elapsed, 3),
+            'signals_per_second': round(signal_count / elapsed, 1) if elapsed > 0 else None,
+        }
+        return {
+            'summary': summary,
+            'trades': self._trades,
+            'equity_curve': self._equity,
+            'skipped': self._skipped,
+        }
+
+
+# ==================== المسح على المعاملات ====================
+
+# حالة العامل في مسح المعاملات (تُحمّل مرة واحدة لكل عملية)
+_sweep_state: Dict = {}
+
+
+def _sweep_init(signals_path: str, data_dir: str, start_ms, end_ms, cache_npy: bool):
+    _sweep_state['signals'] = load_signals(signals_path, start_ms, end_ms)
+    _sweep_state['store'] = OHLCVStore(data_dir, cache_npy)
+
+
+def _sweep_run(params: Dict) -> Dict:
+    settings = apply_params(BACKTEST_SETTINGS, params)
+    result = BacktestEngine(_sweep_state['store'], settings).run(_sweep_state['signals'])
+    return {'params': params, 'summary': result['summary']}
+
+
+def apply_params(base: Dict, params: Dict) -> Dict:
+    """دمج معاملات المسح في الإعدادات (مفاتيح user_settings و management تُوضع في مكانها)"""
+    settings = {**base,
+                'user_settings': dict(base.get('user_settings', {})),
+                'management': dict(base.get('management', {}))}
+    for key, value in params.items():
+        if key in ('market_type', 'trade_amount', 'leverage'):
+            settings['user_settings'][key] = value
+        elif key in ('tp_percentages', 'tp_close_percentages', 'sl_percentage',
+                     'trailing_enabled', 'trailing_distance'):
+            settings['management'][key] = value
+        else:
+            settings[key] = value
+    return settings
+
+
+def run_sweep(signals_path: str, data_dir: str, grid: Dict[str, List],
+              processes: int = None, start_ms: float = None, end_ms: float = None) -> List[Dict]:
+    """
+    تشغيل الاختبار لكل تركيبة من معاملات grid على عدة عمليات
+
+    ملفات .npy تُقرأ بـ mmap فتتشارك العمليات نفس صفحات البيانات في الذاكرة
+    """
+    keys = list(grid)
+    combinations = [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    cache_npy = BACKTEST_SETTINGS.get('cache_npy', True)
+
+    # تحويل CSV إلى .npy مرة واحدة قبل توزيع العمل
+    store = OHLCVStore(data_dir, cache_npy)
+    for ts_ms, payload in load_signals(signals_path, start_ms, end_ms):
+        if payload.get('symbol'):
+            store.load(str(payload['symbol']))
+
+    processes = processes or os.cpu_count() or 1
+    init_args = (signals_path, data_dir, start_ms, end_ms, cache_npy)
+    if processes <= 1:
+        _sweep_init(*init_args)
+        return [_sweep_run(params) for params in combinations]
+    with multiprocessing.Pool(processes, initializer=_sweep_init, initargs=init_args) as pool:
+        return pool.map(_sweep_run, combinations, chunksize=1)
+
+
+# ==================== الحفظ ====================
+
+def write_results(result: Dict, out_dir: str):
+    """حفظ summary.json و trades.csv و equity.csv"""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'summary': result['summary'], 'skipped': result['skipped'][:1000]},
+                  f, ensure_ascii=False, indent=2, default=str)
+
+    with open(os.path.join(out_dir, 'trades.csv'), 'w', encoding='utf-8', newline='') as f:
+        fields = ['position_id', 'symbol', 'side', 'leverage', 'entry_time', 'exit_time',
+                  'entry_price', 'exit_price', 'fraction', 'reason', 'pnl', 'balance']
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(result['trades'])
+
+    with open(os.path.join(out_dir, 'equity.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp', 'equity'])
+        writer.writerows((int(ts), round(value, 6)) for ts, value in result['equity_curve'])
+
+
+def _float_list(text: str) -> List[float]:
+    return [float(value) for value in text.split(',') if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='محرك إعادة تشغيل الإشارات والاختبار التاريخي')
+    parser.add_argument('--signals', required=True, help='سجل الإشارات (.jsonl / .json / signal_journal.db)')
+    parser.add_argument('--data', default=BACKTEST_SETTINGS.get('data_dir', 'backtest_data'))
+    parser.add_argument('--out', default='backtest_results')
+    parser.add_argument('--start', default=None, help='بداية الفترة (ISO أو epoch)')
+    parser.add_argument('--end', default=None, help='نهاية الفترة (ISO أو epoch)')
+    parser.add_argument('--balance', type=float, default=None)
+    parser.add_argument('--trade-amount', type=float, default=None)
+    parser.add_argument('--leverage', type=int, default=None)
+    parser.add_argument('--market-type', choices=['futures', 'spot'], default=None)
+    parser.add_argument('--tp', type=_float_list, default=None, help='نسب الأهداف مثل 1.5,3,5')
+    parser.add_argument('--tp-close', type=_float_list, default=None, help='نسب الإغلاق مثل 50,30,20')
+    parser.add_argument('--sl', type=float, default=None, help='نسبة وقف الخسارة')
+    parser.add_argument('--trailing', type=float, default=None, help='تفعيل الوقف المتحرك بهذه المسافة %%')
+    parser.add_argument('--fee-rate', type=float, default=None)
+    parser.add_argument('--slippage-bps', type=float, default=None)
+    parser.add_argument('--intrabar', choices=['worst', 'best'], default=None)
+    parser.add_argument('--sweep', default=None, help='شبكة معاملات JSON مثل {"leverage": [5, 10]}')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    start_ms = parse_time(args.start)
+    end_ms = parse_time(args.end)
+
+    params = {key: value for key, value in {
+        'initial_balance': args.balance,
+        'trade_amount': args.trade_amount,
+        'leverage': args.leverage,
+        'market_type': args.market_type,
+        'tp_percentages': args.tp,
+        'tp_close_percentages': args.tp_close,
+        'sl_percentage': args.sl,
+        'trailing_enabled': True if args.trailing else None,
+        'trailing_distance': args.trailing,
+        'fee_rate': args.fee_rate,
+        'slippage_bps': args.slippage_bps,
+        'intrabar': args.intrabar,
+    }.items() if value is not None}
+
+    if args.sweep:
+        grid = {key: value for key, value in json.loads(args.sweep).items()}
+        # المعاملات الثابتة من سطر الأوامر تدخل في كل تركيبة
+        grid = {**{key: [value] for key, value in params.items()}, **grid}
+        results = run_sweep(args.signals, args.data, grid, args.processes, start_ms, end_ms)
+        results.sort(key=lambda item: item['summary']['total_return_pct'], reverse=True)
+        os.makedirs(args.out, exist_ok=True)
+        with open(os.path.join(args.out, 'sweep.json'), 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+        for item in results[:10]:
+            summary = item['summary']
+            print(f"{summary['total_return_pct']:>10.2f}%  DD {summary['max_drawdown_pct']:>7.2f}%  "
+                  f"{summary['positions']:>6} صفقة  {item['params']}")
+        return
+
+    store = OHLCVStore(args.data, BACKTEST_SETTINGS.get('cache_npy', True))
+    signals = load_signals(args.signals, start_ms, end_ms)
+    result = BacktestEngine(store, apply_params(BACKTEST_SETTINGS, params)).run(signals)
+    write_results(result, args.out)
+    print(json.dumps(result['summary'], ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
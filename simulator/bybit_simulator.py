@@ -0,0 +1,832 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bybit v5 Simulator - محاكي Bybit v5 المحلي
+خادم aiohttp يحاكي endpoints الـ REST المستخدمة في البوت وقناة tickers العامة عبر WebSocket،
+مع حقن تأخير وأخطاء وحدود معدل لاختبارات الحمل بدون الاتصال بالمنصة الحقيقية
+
+الاستخدام:
+    python -m simulator.bybit_simulator --port 8765 --latency-ms 20 --error-rate 0.01
+
+ثم توجيه البوت إليه:
+    BYBIT_BASE_URL=http://127.0.0.1:8765
+    BYBIT_WS_PUBLIC_SPOT=ws://127.0.0.1:8765/v5/public/spot
+    BYBIT_WS_PUBLIC_LINEAR=ws://127.0.0.1:8765/v5/public/linear
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from aiohttp import WSMsgType, web
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import BYBIT_SIMULATOR_SETTINGS
+except ImportError:
+    BYBIT_SIMULATOR_SETTINGS = {
+        'host': '127.0.0.1',
+        'port': 8765,
+        'latency_ms': 0.0,
+        'jitter_ms': 0.0,
+        'error_rate': 0.0,
+        'error_http_status': 200,
+        'rate_limits': {'order': 10, 'position': 10, 'account': 10, 'market': 120},
+        'initial_balance': 10000.0,
+        'tick_interval': 0.5,
+        'volatility': 0.0005,
+    }
+
+# الأسعار الابتدائية للرموز المتاحة في المحاكي
+DEFAULT_SYMBOLS = {
+    'BTCUSDT': 60000.0,
+    'ETHUSDT': 3000.0,
+    'BNBUSDT': 550.0,
+    'SOLUSDT': 150.0,
+    'XRPUSDT': 0.6,
+    'ADAUSDT': 0.45,
+    'DOGEUSDT': 0.15,
+    'AVAXUSDT': 35.0,
+    'LINKUSDT': 15.0,
+    'DOTUSDT': 7.0,
+    'LTCUSDT': 80.0,
+    'TRXUSDT': 0.12,
+}
+
+# أكواد أخطاء Bybit التي يعيدها المحاكي
+RET_OK = 0
+RET_PARAMS_ERROR = 10001
+RET_INVALID_API_KEY = 10003
+RET_RATE_LIMIT = 10006
+RET_SERVER_ERROR = 10016
+RET_INSUFFICIENT_BALANCE = 110007
+RET_REDUCE_ONLY_ZERO = 110017
+RET_DUPLICATE_ORDER_LINK_ID = 110072
+RET_LEVERAGE_NOT_MODIFIED = 110043
+
+CATEGORIES = ('spot', 'linear')
+
+
+def _endpoint_group(path: str) -> str:
+    """مجموعة الـ endpoint لحدود المعدل (نفس تقسيم api/rate_limiter.py)"""
+    if '/market/' in path:
+        return 'market'
+    if '/order/' in path:
+        return 'order'
+    if '/position/' in path:
+        return 'position'
+    return 'account'
+
+
+def _fmt(value: float) -> str:
+    """تنسيق رقمي مثل Bybit (نص بدون أصفار زائدة)"""
+    text = f"{value:.8f}".rstrip('0').rstrip('.')
+    return text if text not in ('', '-0') else '0'
+
+
+def _to_float(value, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class _SimAccount:
+    """حساب محاكى لمفتاح API واحد (حساب موحد USDT + صفقات linear بوضع one-way)"""
+
+    def __init__(self, initial_balance: float):
+        self.usdt = float(initial_balance)
+        self.coins: Dict[str, float] = {}
+        self.positions: Dict[str, Dict] = {}
+        self.leverage: Dict[str, int] = {}
+        self.orders = []
+        self.order_link_ids: Set[str] = set()
+
+    def used_margin(self) -> float:
+        return sum(p['size'] * p['avgPrice'] / p['leverage'] for p in self.positions.values())
+
+    def unrealised_pnl(self, prices: Dict[str, float]) -> float:
+        return sum(self._position_pnl(p, prices.get(symbol, p['avgPrice']))
+                   for symbol, p in self.positions.items())
+
+    @staticmethod
+    def _position_pnl(position: Dict, mark_price: float) -> float:
+        direction = 1 if position['side'] == 'Buy' else -1
+        return (mark_price - position['avgPrice']) * position['size'] * direction
+
+
+class BybitSimulator:
+    """
+    محاكي Bybit v5
+
+    REST:
+        GET  /v5/market/tickers, /v5/market/instruments-info
+        GET  /v5/position/list, /v5/account/wallet-balance, /v5/order/realtime, /v5/order/history
+        POST /v5/order/create, /v5/position/set-leverage, /v5/position/trading-stop
+    WebSocket:
+        /v5/public/spot و /v5/public/linear (op: subscribe / unsubscribe / ping، topic: tickers.SYMBOL)
+    Telegram:
+        POST /bot<token>/sendMessage (بديل محلي لـ Bot API عند توجيه TELEGRAM_API_URL إلى المحاكي)
+    تحكم:
+        GET /sim/stats، POST /sim/config (تعديل حقن التأخير والأخطاء والحدود أثناء التشغيل)، POST /sim/reset
+
+    - الأوامر تُنفذ فوراً (Market بآخر سعر، Limit بسعرها) والكمية دائماً بعملة الأساس
+    - الطلبات الخاصة تتطلب X-BAPI-API-KEY لكن التوقيع لا يُتحقق منه
+    - كل مفتاح API له حساب مستقل يُنشأ عند أول طلب
+    """
+
+    def __init__(self, host: str = None, port: int = None, settings: Dict = None,
+                 symbols: Dict[str, float] = None, seed: int = None):
+        settings = dict(BYBIT_SIMULATOR_SETTINGS, **(settings or {}))
+        self.host = host or settings.get('host', '127.0.0.1')
+        self.port = settings.get('port', 8765) if port is None else port
+        self.latency_ms = float(settings.get('latency_ms', 0.0))
+        self.jitter_ms = float(settings.get('jitter_ms', 0.0))
+        self.error_rate = float(settings.get('error_rate', 0.0))
+        self.error_http_status = int(settings.get('error_http_status', 200))
+        self.rate_limits = dict(settings.get('rate_limits', {}))
+        self.initial_balance = float(settings.get('initial_balance', 10000.0))
+        self.tick_interval = float(settings.get('tick_interval', 0.5))
+        self.volatility = float(settings.get('volatility', 0.0005))
+
+        self._random = random.Random(seed)
+        self.prices: Dict[str, float] = dict(symbols or DEFAULT_SYMBOLS)
+        self._accounts: Dict[str, _SimAccount] = {}
+        # (api_key, group) -> [بداية النافذة بالثواني، عدد الطلبات]
+        self._windows: Dict[tuple, list] = {}
+        self._ws_clients: Dict[web.WebSocketResponse, Dict] = {}
+        self._order_ids = itertools.count(1)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._ticker_task = None
+        self._ready = threading.Event()
+        self._stopped: Optional[asyncio.Event] = None
+
+        self.stats = {
+            'requests': 0,
+            'by_endpoint': {},
+            'errors_injected': 0,
+            'rate_limited': 0,
+            'orders': 0,
+            'ws_messages': 0,
+            'telegram_messages': 0,
+        }
+
+    # ==================== التشغيل ====================
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def ws_url(self, market_type: str = 'spot') -> str:
+        category = 'linear' if market_type in ('futures', 'linear') else 'spot'
+        return f"ws://{self.host}:{self.port}/v5/public/{category}"
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._injection_middleware])
+        app.router.add_get('/v5/market/tickers', self._handle_tickers)
+        app.router.add_get('/v5/market/instruments-info', self._handle_instruments)
+        app.router.add_get('/v5/position/list', self._handle_position_list)
+        app.router.add_get('/v5/account/wallet-balance', self._handle_wallet_balance)
+        app.router.add_get('/v5/order/realtime', self._handle_open_orders)
+        app.router.add_get('/v5/order/history', self._handle_order_history)
+        app.router.add_post('/v5/order/create', self._handle_order_create)
+        app.router.add_post('/v5/position/set-leverage', self._handle_set_leverage)
+        app.router.add_post('/v5/position/trading-stop', self._handle_trading_stop)
+        app.router.add_get('/v5/public/spot', self._handle_ws)
+        app.router.add_get('/v5/public/linear', self._handle_ws)
+        app.router.add_post('/bot{token}/sendMessage', self._handle_telegram_send)
+        app.router.add_get('/sim/stats', self._handle_stats)
+        app.router.add_post('/sim/config', self._handle_config)
+        app.router.add_post('/sim/reset', self._handle_reset)
+        return app
+
+    async def start_async(self):
+        """تشغيل الخادم على الـ event loop الحالي"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # المنفذ 0 يعني منفذاً عشوائياً متاحاً
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+        self._ticker_task = asyncio.create_task(self._ticker_loop())
+        logger.info(f"✅ محاكي Bybit يعمل على {self.base_url}")
+
+    async def stop_async(self):
+        if self._ticker_task:
+            self._ticker_task.cancel()
+            self._ticker_task = None
+        for ws in list(self._ws_clients):
+            await ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        logger.info("🔌 تم إيقاف محاكي Bybit")
+
+    def start(self) -> str:
+        """تشغيل المحاكي في خيط خلفي وإرجاع base_url"""
+        if self._thread and self._thread.is_alive():
+            return self.base_url
+
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run_thread, name='BybitSimulator', daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout=10):
+            raise RuntimeError("فشل تشغيل محاكي Bybit")
+        return self.base_url
+
+    def _run_thread(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stopped = asyncio.Event()
+
+        async def main():
+            await self.start_async()
+            self._ready.set()
+            await self._stopped.wait()
+            await self.stop_async()
+
+        try:
+            self._loop.run_until_complete(main())
+        except Exception as e:
+            logger.error(f"❌ خطأ في محاكي Bybit: {e}")
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    def stop(self):
+        """إيقاف المحاكي الذي يعمل في الخيط الخلفي"""
+        if self._loop and self._stopped:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def configure(self, **kwargs):
+        """تعديل إعدادات الحقن أثناء التشغيل (latency_ms, jitter_ms, error_rate, rate_limits, ...)"""
+        for key, value in kwargs.items():
+            if key == 'rate_limits':
+                self.rate_limits.update(value)
+            elif key in ('latency_ms', 'jitter_ms', 'error_rate', 'tick_interval', 'volatility'):
+                setattr(self, key, float(value))
+            elif key == 'error_http_status':
+                self.error_http_status = int(value)
+
+    def reset(self):
+        """مسح الحسابات والعدادات"""
+        self._accounts.clear()
+        self._windows.clear()
+        for key in ('requests', 'errors_injected', 'rate_limited', 'orders', 'ws_messages', 'telegram_messages'):
+            self.stats[key] = 0
+        self.stats['by_endpoint'] = {}
+
+    # ==================== الحقن ====================
+
+    @web.middleware
+    async def _injection_middleware(self, request: web.Request, handler):
+        path = request.path
+        if not path.startswith('/v5/') or path.startswith('/v5/public/'):
+            return await handler(request)
+
+        self.stats['requests'] += 1
+        self.stats['by_endpoint'][path] = self.stats['by_endpoint'].get(path, 0) + 1
+
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+
+        api_key = request.headers.get('X-BAPI-API-KEY', '')
+        group = _endpoint_group(path)
+        limit_headers, allowed = self._check_rate_limit(api_key, group)
+
+        if not allowed:
+            self.stats['rate_limited'] += 1
+            response = self._reply(RET_RATE_LIMIT, 'Too many visits!')
+        elif self.error_rate > 0 and self._random.random() < self.error_rate:
+            self.stats['errors_injected'] += 1
+            if self.error_http_status != 200:
+                response = web.Response(status=self.error_http_status, text='Simulated server error')
+            else:
+                response = self._reply(RET_SERVER_ERROR, 'Server error (simulated)')
+        elif group != 'market' and not api_key:
+            response = self._reply(RET_INVALID_API_KEY, 'API key is invalid.')
+        else:
+            response = await handler(request)
+
+        response.headers.update(limit_headers)
+        return response
+
+    def _check_rate_limit(self, api_key: str, group: str):
+        """نافذة ثابتة مدتها ثانية لكل (مفتاح، مجموعة) مع رؤوس X-Bapi-Limit*"""
+        limit = int(self.rate_limits.get(group, 0) or 0)
+        if limit <= 0:
+            return {}, True
+
+        now = time.time()
+        window_start = math.floor(now)
+        window = self._windows.get((api_key, group))
+        if window is None or window[0] != window_start:
+            window = self._windows[(api_key, group)] = [window_start, 0]
+        window[1] += 1
+
+        allowed = window[1] <= limit
+        headers = {
+            'X-Bapi-Limit': str(limit),
+            'X-Bapi-Limit-Status': str(max(0, limit - window[1])),
+            'X-Bapi-Limit-Reset-Timestamp': str(int((window_start + 1) * 1000)),
+        }
+        return headers, allowed
+
+    @staticmethod
+    def _reply(ret_code: int = RET_OK, ret_msg: str = 'OK', result: Dict = None) -> web.Response:
+        return web.json_response({
+            'retCode': ret_code,
+            'retMsg': ret_msg,
+            'result': result if result is not None else {},
+            'retExtInfo': {},
+            'time': int(time.time() * 1000),
+        })
+
+    # ==================== الأسعار ====================
+
+    def _step_prices(self):
+        for symbol, price in self.prices.items():
+            self.prices[symbol] = max(price * (1 + self._random.gauss(0, self.volatility)), 1e-8)
+
+    async def _ticker_loop(self):
+        """حركة أسعار عشوائية وبثها لمشتركي WebSocket"""
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            self._step_prices()
+            ts = int(time.time() * 1000)
+            for ws, client in list(self._ws_clients.items()):
+                for symbol in list(client['symbols']):
+                    price = self.prices.get(symbol)
+                    if price is None:
+                        continue
+                    message = {
+                        'topic': f"tickers.{symbol}",
+                        'ts': ts,
+                        'type': 'snapshot',
+                        'cs': ts,
+                        'data': self._ticker_item(symbol, client['category']),
+                    }
+                    try:
+                        await ws.send_str(json.dumps(message))
+                        self.stats['ws_messages'] += 1
+                    except Exception:
+                        self._ws_clients.pop(ws, None)
+                        break
+
+    def _ticker_item(self, symbol: str, category: str) -> Dict:
+        price = self.prices[symbol]
+        spread = price * 0.0001
+        item = {
+            'symbol': symbol,
+            'lastPrice': _fmt(price),
+            'bid1Price': _fmt(price - spread),
+            'ask1Price': _fmt(price + spread),
+            'prevPrice24h': _fmt(price),
+            'price24hPcnt': '0',
+            'volume24h': '1000000',
+            'turnover24h': _fmt(price * 1000000),
+        }
+        if category == 'linear':
+            item['markPrice'] = _fmt(price)
+            item['indexPrice'] = _fmt(price)
+            item['fundingRate'] = '0.0001'
+        return item
+
+    @staticmethod
+    def _instrument_spec(price: float) -> Dict:
+        """خطوة الكمية وحجم التيك حسب مستوى السعر"""
+        if price >= 1000:
+            qty_step = 0.001
+        elif price >= 10:
+            qty_step = 0.01
+        elif price >= 1:
+            qty_step = 0.1
+        else:
+            qty_step = 1.0
+        tick_size = 10 ** (math.floor(math.log10(price)) - 4)
+        return {'qty_step': qty_step, 'tick_size': tick_size}
+
+    def _instrument_item(self, symbol: str, category: str) -> Dict:
+        spec = self._instrument_spec(self.prices[symbol])
+        base_coin = symbol[:-4] if symbol.endswith('USDT') else symbol
+        lot = {'minOrderQty': _fmt(spec['qty_step']), 'maxOrderQty': '1000000'}
+        if category == 'spot':
+            lot.update({'basePrecision': _fmt(spec['qty_step']), 'minOrderAmt': '1'})
+        else:
+            lot.update({'qtyStep': _fmt(spec['qty_step']), 'minNotionalValue': '5'})
+        return {
+            'symbol': symbol,
+            'status': 'Trading',
+            'baseCoin': base_coin,
+            'quoteCoin': 'USDT',
+            'lotSizeFilter': lot,
+            'priceFilter': {'tickSize': _fmt(spec['tick_size'])},
+        }
+
+    # ==================== REST: السوق ====================
+
+    @staticmethod
+    def _category(request: web.Request, data: Dict = None) -> Optional[str]:
+        category = (data or request.query).get('category')
+        return category if category in CATEGORIES else None
+
+    async def _handle_tickers(self, request: web.Request) -> web.Response:
+        category = self._category(request)
+        if not category:
+            return self._reply(RET_PARAMS_ERROR, 'params error: category invalid')
+        symbol = request.query.get('symbol')
+        if symbol and symbol not in self.prices:
+            return self._reply(RET_PARAMS_ERROR, 'params error: symbol invalid')
+        symbols = [symbol] if symbol else list(self.prices)
+        return self._reply(result={
+            'category': category,
+            'list': [self._ticker_item(s, category) for s in symbols],
+        })
+
+    async def _handle_instruments(self, request: web.Request) -> web.Response:
+        category = self._category(request)
+        if not category:
+            return self._reply(RET_PARAMS_ERROR, 'params error: category invalid')
+        symbol = request.query.get('symbol')
+        symbols = [symbol] if symbol else list(self.prices)
+        return self._reply(result={
+            'category': category,
+            'list': [self._instrument_item(s, category) for s in symbols if s in self.prices],
+            'nextPageCursor': '',
+        })
+
+    # ==================== REST: الحساب ====================
+
+    def _account(self, request: web.Request) -> _SimAccount:
+        api_key = request.headers.get('X-BAPI-API-KEY', '')
+        account = self._accounts.get(api_key)
+        if account is None:
+            account = self._accounts[api_key] = _SimAccount(self.initial_balance)
+        return account
+
+    @staticmethod
+    async def _read_json(request: web.Request) -> Dict:
+        try:
+            data = await request.json()
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    async def _handle_wallet_balance(self, request: web.Request) -> web.Response:
+        account = self._account(request)
+        upnl = account.unrealised_pnl(self.prices)
+        margin = account.used_margin()
+        equity = account.usdt + upnl
+
+        coins = [{
+            'coin': 'USDT',
+            'equity': _fmt(equity),
+            'walletBalance': _fmt(account.usdt),
+            'availableToWithdraw': _fmt(max(0.0, account.usdt - margin)),
+            'unrealisedPnl': _fmt(upnl),
+            'usdValue': _fmt(equity),
+        }]
+        total_equity = equity
+        for coin, amount in account.coins.items():
+            value = amount * self.prices.get(f"{coin}USDT", 0.0)
+            total_equity += value
+            coins.append({
+                'coin': coin,
+                'equity': _fmt(amount),
+                'walletBalance': _fmt(amount),
+                'availableToWithdraw': _fmt(amount),
+                'unrealisedPnl': '0',
+                'usdValue': _fmt(value),
+            })
+
+        return self._reply(result={'list': [{
+            'accountType': 'UNIFIED',
+            'totalEquity': _fmt(total_equity),
+            'totalWalletBalance': _fmt(account.usdt),
+            'totalAvailableBalance': _fmt(max(0.0, equity - margin)),
+            'totalPerpUPL': _fmt(upnl),
+            'totalInitialMargin': _fmt(margin),
+            'coin': coins,
+        }]})
+
+    def _position_item(self, symbol: str, position: Dict) -> Dict:
+        mark = self.prices.get(symbol, position['avgPrice'])
+        direction = 1 if position['side'] == 'Buy' else -1
+        liq_price = position['avgPrice'] * (1 - direction / position['leverage'])
+        return {
+            'positionIdx': 0,
+            'symbol': symbol,
+            'side': position['side'],
+            'size': _fmt(position['size']),
+            'avgPrice': _fmt(position['avgPrice']),
+            'markPrice': _fmt(mark),
+            'positionValue': _fmt(position['size'] * position['avgPrice']),
+            'unrealisedPnl': _fmt(_SimAccount._position_pnl(position, mark)),
+            'leverage': str(position['leverage']),
+            'liqPrice': _fmt(max(0.0, liq_price)),
+            'takeProfit': position.get('takeProfit', '0'),
+            'stopLoss': position.get('stopLoss', '0'),
+            'createdTime': position['createdTime'],
+            'updatedTime': str(int(time.time() * 1000)),
+        }
+
+    async def _handle_position_list(self, request: web.Request) -> web.Response:
+        category = self._category(request)
+        if category != 'linear':
+            return self._reply(RET_PARAMS_ERROR, 'params error: category only support linear')
+        account = self._account(request)
+        symbol = request.query.get('symbol')
+        items = [self._position_item(s, p) for s, p in account.positions.items()
+                 if not symbol or s == symbol]
+        return self._reply(result={'category': category, 'list': items, 'nextPageCursor': ''})
+
+    async def _handle_open_orders(self, request: web.Request) -> web.Response:
+        # جميع الأوامر تُنفذ فوراً فلا توجد أوامر معلقة
+        return self._reply(result={'category': request.query.get('category', ''), 'list': [],
+                                   'nextPageCursor': ''})
+
+    async def _handle_order_history(self, request: web.Request) -> web.Response:
+        account = self._account(request)
+        category = request.query.get('category')
+        limit = int(_to_float(request.query.get('limit'), 50))
+        orders = [o for o in reversed(account.orders) if not category or o['category'] == category]
+        return self._reply(result={'category': category or '', 'list': orders[:limit],
+                                   'nextPageCursor': ''})
+
+    # ==================== REST: التداول ====================
+
+    async def _handle_order_create(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        category = self._category(request, data)
+        symbol = data.get('symbol')
+        side = str(data.get('side', '')).capitalize()
+        order_type = str(data.get('orderType', 'Market')).capitalize()
+        qty = _to_float(data.get('qty'))
+
+        if not category or symbol not in self.prices or side not in ('Buy', 'Sell') or qty <= 0:
+            return self._reply(RET_PARAMS_ERROR, 'params error: invalid order parameters')
+
+        spec = self._instrument_spec(self.prices[symbol])
+        if qty < spec['qty_step'] - 1e-12:
+            return self._reply(RET_PARAMS_ERROR, 'Order quantity below the minimum')
+
+        price = self.prices[symbol]
+        if order_type == 'Limit' and _to_float(data.get('price')) > 0:
+            price = _to_float(data.get('price'))
+
+        account = self._account(request)
+        order_link_id = data.get('orderLinkId', '')
+        if order_link_id and order_link_id in account.order_link_ids:
+            return self._reply(RET_DUPLICATE_ORDER_LINK_ID, 'OrderLinkedID is duplicate')
+
+        if category == 'spot':
+            error = self._fill_spot(account, symbol, side, qty, price)
+        else:
+            error = self._fill_linear(account, symbol, side, qty, price, data)
+        if error:
+            return self._reply(*error)
+
+        if order_link_id:
+            account.order_link_ids.add(order_link_id)
+        order_id = str(uuid.UUID(int=next(self._order_ids)))
+        now_ms = str(int(time.time() * 1000))
+        account.orders.append({
+            'orderId': order_id,
+            'orderLinkId': order_link_id,
+            'category': category,
+            'symbol': symbol,
+            'side': side,
+            'orderType': order_type,
+            'qty': _fmt(qty),
+            'price': _fmt(price),
+            'avgPrice': _fmt(price),
+            'cumExecQty': _fmt(qty),
+            'orderStatus': 'Filled',
+            'createdTime': now_ms,
+            'updatedTime': now_ms,
+        })
+        if len(account.orders) > 1000:
+            del account.orders[:-1000]
+        self.stats['orders'] += 1
+
+        return self._reply(result={'orderId': order_id, 'orderLinkId': order_link_id})
+
+    @staticmethod
+    def _fill_spot(account: _SimAccount, symbol: str, side: str, qty: float, price: float):
+        coin = symbol[:-4] if symbol.endswith('USDT') else symbol
+        if side == 'Buy':
+            cost = qty * price
+            if cost > account.usdt - account.used_margin():
+                return RET_INSUFFICIENT_BALANCE, 'ab not enough for new order'
+            account.usdt -= cost
+            account.coins[coin] = account.coins.get(coin, 0.0) + qty
+        else:
+            if account.coins.get(coin, 0.0) < qty - 1e-12:
+                return RET_INSUFFICIENT_BALANCE, 'Insufficient balance'
+            account.coins[coin] -= qty
+            account.usdt += qty * price
+            if account.coins[coin] <= 1e-12:
+                del account.coins[coin]
+        return None
+
+    def _fill_linear(self, account: _SimAccount, symbol: str, side: str, qty: float,
+                     price: float, data: Dict):
+        position = account.positions.get(symbol)
+        leverage = account.leverage.get(symbol, 1)
+        reduce_only = str(data.get('reduceOnly', '')).lower() in ('true', '1')
+
+        if reduce_only and (position is None or position['side'] == side):
+            return RET_REDUCE_ONLY_ZERO, 'current position is zero, cannot fix reduce-only order qty'
+
+        # الجزء الذي يغلق صفقة معاكسة
+        closing = 0.0
+        if position is not None and position['side'] != side:
+            closing = min(qty, position['size'])
+        opening = 0.0 if reduce_only else qty - closing
+
+        if opening > 0 and opening * price / leverage > account.usdt - account.used_margin() + \
+                min(0.0, account.unrealised_pnl(self.prices)):
+            return RET_INSUFFICIENT_BALANCE, 'ab not enough for new order'
+
+        if closing > 0:
+            direction = 1 if position['side'] == 'Buy' else -1
+            account.usdt += (price - position['avgPrice']) * closing * direction
+            position['size'] -= closing
+            if position['size'] <= 1e-12:
+                del account.positions[symbol]
+                position = None
+
+        if opening > 0:
+            if position is None:
+                account.positions[symbol] = {
+                    'side': side,
+                    'size': opening,
+                    'avgPrice': price,
+                    'leverage': leverage,
+                    'createdTime': str(int(time.time() * 1000)),
+                }
+                position = account.positions[symbol]
+            else:
+                total = position['size'] + opening
+                position['avgPrice'] = (position['avgPrice'] * position['size'] + price * opening) / total
+                position['size'] = total
+
+        if position is not None:
+            if data.get('takeProfit'):
+                position['takeProfit'] = str(data['takeProfit'])
+            if data.get('stopLoss'):
+                position['stopLoss'] = str(data['stopLoss'])
+        return None
+
+    async def _handle_set_leverage(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        symbol = data.get('symbol')
+        leverage = int(_to_float(data.get('buyLeverage')))
+        if self._category(request, data) != 'linear' or symbol not in self.prices or not 1 <= leverage <= 100:
+            return self._reply(RET_PARAMS_ERROR, 'params error: invalid leverage parameters')
+
+        account = self._account(request)
+        if account.leverage.get(symbol, 1) == leverage:
+            return self._reply(RET_LEVERAGE_NOT_MODIFIED, 'leverage not modified')
+        account.leverage[symbol] = leverage
+        if symbol in account.positions:
+            account.positions[symbol]['leverage'] = leverage
+        return self._reply()
+
+    async def _handle_trading_stop(self, request: web.Request) -> web.Response:
+        data = await self._read_json(request)
+        account = self._account(request)
+        position = account.positions.get(data.get('symbol'))
+        if position is None:
+            return self._reply(RET_REDUCE_ONLY_ZERO, 'can not set tp/sl/ts for zero position')
+        for key in ('takeProfit', 'stopLoss'):
+            if data.get(key):
+                position[key] = str(data[key])
+        return self._reply()
+
+    # ==================== WebSocket ====================
+
+    async def _handle_ws(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        conn_id = uuid.uuid4().hex[:16]
+        client = {'category': request.path.rsplit('/', 1)[-1], 'symbols': set()}
+        self._ws_clients[ws] = client
+
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    payload = json.loads(msg.data)
+                except ValueError:
+                    continue
+                reply = self._handle_ws_op(payload, client['symbols'], conn_id)
+                if reply:
+                    await ws.send_str(json.dumps(reply))
+        finally:
+            self._ws_clients.pop(ws, None)
+        return ws
+
+    def _handle_ws_op(self, payload: Dict, symbols: Set[str], conn_id: str) -> Optional[Dict]:
+        op = payload.get('op')
+        reply = {'success': True, 'ret_msg': '', 'conn_id': conn_id, 'op': op,
+                 'req_id': payload.get('req_id', '')}
+        if op == 'ping':
+            reply['ret_msg'] = 'pong'
+            return reply
+        if op in ('subscribe', 'unsubscribe'):
+            for topic in payload.get('args', []):
+                if not str(topic).startswith('tickers.'):
+                    reply.update(success=False, ret_msg=f"Invalid topic: {topic}")
+                    continue
+                symbol = topic[len('tickers.'):]
+                if op == 'subscribe':
+                    symbols.add(symbol)
+                else:
+                    symbols.discard(symbol)
+            return reply
+        return None
+
+    # ==================== Telegram ====================
+
+    async def _handle_telegram_send(self, request: web.Request) -> web.Response:
+        payload = await self._read_json(request)
+        self.stats['telegram_messages'] += 1
+        return web.json_response({'ok': True, 'result': {
+            'message_id': self.stats['telegram_messages'],
+            'chat': {'id': payload.get('chat_id')},
+            'date': int(time.time()),
+            'text': payload.get('text', ''),
+        }})
+
+    # ==================== التحكم ====================
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, accounts=len(self._accounts), ws_clients=len(self._ws_clients),
+                    latency_ms=self.latency_ms, jitter_ms=self.jitter_ms, error_rate=self.error_rate,
+                    rate_limits=self.rate_limits)
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.get_stats())
+
+    async def _handle_config(self, request: web.Request) -> web.Response:
+        self.configure(**await self._read_json(request))
+        return web.json_response(self.get_stats())
+
+    async def _handle_reset(self, request: web.Request) -> web.Response:
+        self.reset()
+        return web.json_response(self.get_stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='محاكي Bybit v5 المحلي')
+    parser.add_argument('--host', default=BYBIT_SIMULATOR_SETTINGS.get('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=BYBIT_SIMULATOR_SETTINGS.get('port', 8765))
+    parser.add_argument('--latency-ms', type=float, default=None)
+    parser.add_argument('--jitter-ms', type=float, default=None)
+    parser.add_argument('--error-rate', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = {key: value for key, value in {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'error_rate': args.error_rate,
+    }.items() if value is not None}
+
+    simulator = BybitSimulator(args.host, args.port, settings=settings, seed=args.seed)
+
+    async def serve():
+        await simulator.start_async()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await simulator.stop_async()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Position Memory Benchmark - قياس ذاكرة صفقات الحساب التجريبي
+يقارن ذاكرة وزمن تحديث 100 ألف صفقة مفتوحة بين الشكل السابق (dict للسبوت و FuturesPosition بدون __slots__)
+والسجلات الثابتة في systems/position_records.py
+
+الاستخدام:
+    python -m simulator.position_memory_benchmark                       # السجلات فقط (بدون تلجرام)
+    python -m simulator.position_memory_benchmark --positions 100000 --users 1000 --accounts
+    python -m simulator.position_memory_benchmark --out position_memory.json
+
+- records: بناء الصفقات مباشرة بالشكلين ثم تحديث الربح/الخسارة بنفس منطق update_positions_pnl
+- accounts: فتح الصفقات عبر TradingAccount لكل مستخدم (حساب سبوت وحساب فيوتشر) كما في البوت
+- الذاكرة بـ tracemalloc بعد أول تحديث أسعار (السبوت في الشكل السابق يضيف contracts و current_price عنده)
+"""
+
+import argparse
+import gc
+import json
+import logging
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+from systems.position_records import FuturesPosition, SpotPosition, symbol_table
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POSITIONS = 100000
+DEFAULT_USERS = 1000
+DEFAULT_SYMBOLS = 50
+DEFAULT_TICKS = 5
+
+
+# ==================== الشكل السابق (للمقارنة) ====================
+
+class LegacyFuturesPosition:
+    """FuturesPosition كما كانت قبل __slots__ (نفس الحقول في __dict__)"""
+
+    def __init__(self, symbol: str, side: str, margin_amount: float, entry_price: float, leverage: int, position_id: str):
+        self.position_id = position_id
+        self.symbol = symbol
+        self.side = side.lower()
+        self.leverage = leverage
+        self.entry_price = entry_price
+        self.margin_amount = margin_amount
+        self.position_size = margin_amount * leverage
+        self.contracts = self.position_size / entry_price
+        self.timestamp = datetime.now()
+        self.unrealized_pnl = 0.0
+        self.maintenance_margin_rate = 0.005
+        if self.side == "buy":
+            self.liquidation_price = entry_price * (1 - (1 / leverage) + self.maintenance_margin_rate)
+        else:
+            self.liquidation_price = entry_price * (1 + (1 / leverage) - self.maintenance_margin_rate)
+
+    def update_pnl(self, current_price: float) -> float:
+        if self.side == "buy":
+            self.unrealized_pnl = (current_price - self.entry_price) * self.contracts
+        else:
+            self.unrealized_pnl = (self.entry_price - current_price) * self.contracts
+        return self.unrealized_pnl
+
+    def check_liquidation(self, current_price: float) -> bool:
+        if self.side == "buy":
+            return current_price <= self.liquidation_price
+        return current_price >= self.liquidation_price
+
+
+def legacy_spot_position(symbol: str, side: str, amount: float, price: float, position_id: str) -> Dict:
+    """صفقة السبوت كما كانت تُحفظ في open_spot_position"""
+    coins = amount / price
+    position = {
+        'symbol': symbol,
+        'side': side,
+        'amount': amount,
+        'price': price,
+        'leverage': 1,
+        'market_type': 'spot',
+        'timestamp': datetime.now(),
+        'base_currency': symbol[:-4] if symbol.endswith('USDT') else 'USDT',
+        'position_id': position_id,
+        'unrealized_pnl': 0.0
+    }
+    if side == 'buy':
+        position['coins_bought'] = coins
+    else:
+        position['coins_sold'] = coins
+        position['usdt_received'] = amount
+    return position
+
+
+def legacy_update_pnl(positions: Dict, prices: Dict[str, float]):
+    """نفس حلقة update_positions_pnl السابقة"""
+    for position_id, position in positions.items():
+        if isinstance(position, LegacyFuturesPosition):
+            current_price = prices.get(position.symbol)
+            if current_price:
+                position.update_pnl(current_price)
+                position.check_liquidation(current_price)
+        elif isinstance(position, dict) and position.get('market_type') == 'spot':
+            current_price = prices.get(position['symbol'])
+            if current_price:
+                entry_price = position['price']
+                amount = position.get('amount', 0)
+                contracts = amount / entry_price if entry_price > 0 else 0
+                position['contracts'] = contracts
+                if position['side'].lower() == "buy":
+                    position['unrealized_pnl'] = (current_price - entry_price) * contracts
+                else:
+                    position['unrealized_pnl'] = (entry_price - current_price) * contracts
+                position['current_price'] = current_price
+
+
+def slotted_update_pnl(positions: Dict, prices: Dict[str, float]):
+    """نفس حلقة TradingAccount.update_positions_pnl الحالية"""
+    for position_id, position in positions.items():
+        current_price = prices.get(position.symbol)
+        if current_price:
+            position.update_pnl(current_price)
+            if isinstance(position, FuturesPosition):
+                position.check_liquidation(current_price)
+
+
+# ==================== توليد الصفقات ====================
+
+def make_universe(symbols: int, seed: int) -> Dict[str, float]:
+    rng = random.Random(seed)
+    return {f"COIN{index:03d}USDT": round(rng.uniform(0.05, 60000), 4) for index in range(symbols)}
+
+
+def plan_positions(count: int, users: int, universe: Dict[str, float], seed: int) -> List[Tuple]:
+    """(user_index, market_type, symbol, side, amount, price, position_id) لكل صفقة"""
+    rng = random.Random(seed)
+    names = list(universe)
+    plan = []
+    for index in range(count):
+        symbol = rng.choice(names)
+        side = rng.choice(('BUY', 'SELL'))
+        market_type = 'futures' if rng.random() < 0.7 else 'spot'
+        plan.append((index % users, market_type, symbol, side, round(rng.uniform(10, 500), 2),
+                     universe[symbol], f"{symbol}_{side.lower()}_{1700000000000000 + index}"))
+    return plan
+
+
+def _fresh(text: str) -> str:
+    """نسخة جديدة من النص كما تصل من JSON كل إشارة (ليس نفس الكائن)"""
+    return text.encode('utf-8').decode('utf-8')
+
+
+# ==================== القياس ====================
+
+def _measure(build: Callable[[], object], tick: Callable[[object, Dict[str, float]], None],
+             prices: Dict[str, float], ticks: int) -> Tuple[object, Dict]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    container = build()
+    build_seconds = time.perf_counter() - started
+    tick(container, prices)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+    durations = []
+    moved = dict(prices)
+    for _ in range(ticks):
+        moved = {symbol: price * 1.001 for symbol, price in moved.items()}
+        started = time.perf_counter()
+        tick(container, moved)
+        durations.append((time.perf_counter() - started) * 1000)
+    durations.sort()
+    return container, {
+        'retained_mb': round(retained / 1024 / 1024, 2),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+        'build_seconds': round(build_seconds, 3),
+        'tick_ms_median': round(durations[len(durations) // 2], 2) if durations else None,
+        'tick_ms_max': round(durations[-1], 2) if durations else None,
+    }
+
+
+def run_records(plan: List[Tuple], prices: Dict[str, float], ticks: int) -> Dict:
+    """الشكل السابق مقابل السجلات الثابتة بدون TradingAccount"""
+
+    def build_legacy():
+        positions = {}
+        for _, market_type, symbol, side, amount, price, position_id in plan:
+            symbol, side = _fresh(symbol), side.lower()
+            if market_type == 'futures':
+                positions[position_id] = LegacyFuturesPosition(symbol, side, amount, price, 10, position_id)
+            else:
+                positions[position_id] = legacy_spot_position(symbol, side, amount, price, position_id)
+        return positions
+
+    def build_slotted():
+        positions = {}
+        for _, market_type, symbol, side, amount, price, position_id in plan:
+            symbol, side = _fresh(symbol), side.lower()
+            if market_type == 'futures':
+                positions[position_id] = FuturesPosition(symbol, side, amount, price, 10, position_id)
+            else:
+                coins = amount / price
+                positions[position_id] = SpotPosition(
+                    symbol, side, amount, price, position_id, symbol[:-4],
+                    coins_bought=coins if side == 'buy' else None,
+                    coins_sold=coins if side == 'sell' else None,
+                    usdt_received=amount if side == 'sell' else None,
+                )
+        return positions
+
+    _, legacy = _measure(build_legacy, legacy_update_pnl, prices, ticks)
+    _, slotted = _measure(build_slotted, slotted_update_pnl, prices, ticks)
+    return {'legacy': legacy, 'slotted': slotted}
+
+
+def run_accounts(plan: List[Tuple], prices: Dict[str, float], users: int, ticks: int) -> Dict:
+    """فتح الصفقات عبر TradingAccount (حساب سبوت وحساب فيوتشر لكل مستخدم) كما في البوت"""
+    from bybit_trading_bot import TradingAccount
+    from simulator.backtest_engine import quiet_trading_logs
+
+    def build():
+        accounts = {}
+        for user_index in range(users):
+            accounts[user_index] = {
+                'spot': TradingAccount(initial_balance=10 ** 9, account_type='spot'),
+                'futures': TradingAccount(initial_balance=10 ** 9, account_type='futures'),
+            }
+        for user_index, market_type, symbol, side, amount, price, position_id in plan:
+            account = accounts[user_index][market_type]
+            symbol, side = _fresh(symbol), side.lower()
+            if market_type == 'futures':
+                account.open_futures_position(symbol, side, amount, price, 10, position_id=position_id)
+            else:
+                base_currency = account.extract_base_currency(symbol)
+                if side == 'sell':
+                    # البيع في السبوت يحتاج رصيداً من العملة
+                    account.add_to_wallet(base_currency, amount / price)
+                account.open_spot_position(symbol, side, amount, price, position_id=position_id)
+        return accounts
+
+    def tick(accounts, tick_prices):
+        for pair in accounts.values():
+            pair['spot'].update_positions_pnl(tick_prices)
+            pair['futures'].update_positions_pnl(tick_prices)
+
+    with quiet_trading_logs():
+        accounts, result = _measure(build, tick, prices, ticks)
+    result['open_positions'] = sum(len(pair['spot'].positions) + len(pair['futures'].positions)
+                                   for pair in accounts.values())
+
+    # تمريرة واحدة على دفتر الصفقات لجميع الحسابات (كما في التحديث الدوري)
+    from systems.position_book import position_book
+    if position_book.enabled:
+        durations = []
+        moved = dict(prices)
+        for _ in range(max(1, ticks)):
+            moved = {symbol: price * 0.999 for symbol, price in moved.items()}
+            started = time.perf_counter()
+            position_book.revalue(moved, 'futures')
+            position_book.revalue(moved, 'spot')
+            durations.append((time.perf_counter() - started) * 1000)
+        durations.sort()
+        result['book_revalue_ms_median'] = round(durations[len(durations) // 2], 2)
+        result['book_memory_mb'] = round(position_book.get_stats()['memory_bytes'] / 1024 / 1024, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس ذاكرة صفقات الحساب التجريبي')
+    parser.add_argument('--positions', type=int, default=DEFAULT_POSITIONS)
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--symbols', type=int, default=DEFAULT_SYMBOLS)
+    parser.add_argument('--ticks', type=int, default=DEFAULT_TICKS)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--accounts', action='store_true', help='القياس عبر TradingAccount أيضاً (يتطلب بيئة البوت)')
+    parser.add_argument('--out', default=None, help='حفظ النتائج JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    universe = make_universe(args.symbols, args.seed)
+    plan = plan_positions(args.positions, args.users, universe, args.seed)
+
+    report = {
+        'config': {'positions': args.positions, 'users': args.users, 'symbols': args.symbols,
+                   'ticks': args.ticks, 'seed': args.seed},
+        'records': run_records(plan, universe, args.ticks),
+        'symbol_table_size': len(symbol_table),
+    }
+    if args.accounts:
+        report['accounts'] = run_accounts(plan, universe, args.users, args.ticks)
+
+    per_position = 1024 * 1024 / args.positions
+    print(f"\n📊 {args.positions} صفقة، {args.users} مستخدم، {args.symbols} رمز")
+    for name, result in [(f"records/{key}", value) for key, value in report['records'].items()] + \
+            ([('accounts', report['accounts'])] if 'accounts' in report else []):
+        print(f"  {name:16} {result['retained_mb']:>8} MB ({result['retained_mb'] * per_position:.0f} بايت/صفقة) | "
+              f"بناء {result['build_seconds']}s | تحديث الأسعار {result['tick_ms_median']}ms")
+    legacy, slotted = report['records']['legacy'], report['records']['slotted']
+    if 'book_revalue_ms_median' in report.get('accounts', {}):
+        print(f"  دفتر الصفقات: تمريرة واحدة لجميع الحسابات {report['accounts']['book_revalue_ms_median']}ms "
+              f"({report['accounts']['book_memory_mb']} MB)")
+    if legacy['retained_mb']:
+        print(f"  التوفير: {(1 - slotted['retained_mb'] / legacy['retained_mb']) * 100:.1f}%")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 النتائج: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
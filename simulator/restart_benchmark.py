@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Restart Benchmark - قياس زمن استعادة الحسابات التجريبية عند إعادة التشغيل
+يقارن عند 10 آلاف مستخدم بين المسار السابق (جلب المستخدمين ثم استعلام الصفقات المفتوحة لكل مستخدم من جدول orders
+وإعادة بناء صفقاته) ولقطات systems/account_snapshot.py (قراءة متتالية للقطة ثم سجل التغييرات)
+
+الاستخدام:
+    python -m simulator.restart_benchmark                                   # السجلات فقط (بدون تلجرام)
+    python -m simulator.restart_benchmark --users 10000 --positions 5 --accounts
+    python -m simulator.restart_benchmark --dirty 0.2 --out restart.json
+
+- database: قاعدة بيانات مؤقتة بجداول users/database.py (المستخدمون وإعداداتهم وصفقاتهم المفتوحة)
+- legacy: get_all_active_users() ثم get_user_orders() لكل مستخدم وبناء FuturesPosition / SpotPosition من كل صف
+- snapshot: get_all_active_users() ثم load() (لقطة + سجل تغييرات لنسبة --dirty من المستخدمين) وبناء الصفقات من الصفوف
+- accounts: نفس المقارنة عبر TradingAccount (فتح الصفقات من الصفوف مقابل restore_state) - يتطلب بيئة البوت
+- الملفات في نظام ملفات مؤقت وذاكرة التخزين المؤقت للنظام دافئة في المسارين
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from simulator.position_memory_benchmark import make_universe
+from systems.account_snapshot import AccountSnapshotStore
+from systems.position_records import FuturesPosition, SpotPosition
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USERS = 10000
+DEFAULT_POSITIONS = 5       # صفقات مفتوحة لكل مستخدم
+DEFAULT_SYMBOLS = 50
+DEFAULT_DIRTY = 0.05        # نسبة المستخدمين الذين تغيرت حساباتهم بعد آخر لقطة
+DEFAULT_BALANCE = 10000.0
+LEVERAGE = 10
+
+
+# ==================== توليد البيانات ====================
+
+def plan_users(users: int, positions: int, universe: Dict[str, float], seed: int) -> Dict[int, List[Tuple]]:
+    """{user_id: [(position_id, market_type, symbol, side, amount, price)]}"""
+    rng = random.Random(seed)
+    names = list(universe)
+    plan = {}
+    for user_id in range(1, users + 1):
+        rows = []
+        for index in range(positions):
+            symbol = rng.choice(names)
+            market_type = 'futures' if rng.random() < 0.7 else 'spot'
+            side = rng.choice(('buy', 'sell')) if market_type == 'futures' else 'buy'
+            rows.append((f"{symbol}_{side}_{user_id}_{index}", market_type, symbol, side,
+                         round(rng.uniform(10, 500), 2), universe[symbol]))
+        plan[user_id] = rows
+    return plan
+
+
+def _base_currency(symbol: str) -> str:
+    return symbol[:-4] if symbol.endswith('USDT') else 'USDT'
+
+
+def _open_position(position_id: str, market_type: str, symbol: str, side: str, amount: float, price: float):
+    if market_type == 'futures':
+        return FuturesPosition(symbol, side, amount, price, LEVERAGE, position_id)
+    return SpotPosition(symbol, side, amount, price, position_id, _base_currency(symbol),
+                        coins_bought=amount / price)
+
+
+def seed_database(db_path: str, plan: Dict[int, List[Tuple]]):
+    """المستخدمون وصفقاتهم المفتوحة في قاعدة بيانات بنفس جداول البوت"""
+    from users.database import DatabaseManager
+
+    database = DatabaseManager(db_path)
+    orders = []
+    for user_id, rows in plan.items():
+        for position_id, market_type, symbol, side, amount, price in rows:
+            position = _open_position(position_id, market_type, symbol, side, amount, price)
+            orders.append((position_id, user_id, symbol, side.upper(), price, position.contracts, 'OPEN',
+                           market_type, LEVERAGE if market_type == 'futures' else 1, amount, 'demo'))
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.executemany("INSERT INTO users (user_id, balance) VALUES (?, ?)",
+                         [(user_id, DEFAULT_BALANCE) for user_id in plan])
+        conn.executemany("INSERT INTO user_settings (user_id, market_type) VALUES (?, 'futures')",
+                         [(user_id,) for user_id in plan])
+        conn.executemany("""
+            INSERT INTO orders (order_id, user_id, symbol, side, entry_price, quantity, status,
+                                market_type, leverage, margin_amount, account_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, orders)
+        conn.commit()
+    finally:
+        conn.close()
+    return database
+
+
+def position_from_order(order: Dict):
+    """صفقة من صف في جدول orders (كما تُعاد بناؤها في المسار السابق)"""
+    side = order['side'].lower()
+    if order.get('market_type') == 'futures':
+        return FuturesPosition(order['symbol'], side, order['margin_amount'], order['entry_price'],
+                               order['leverage'], order['order_id'])
+    amount = order['quantity'] * order['entry_price']
+    return SpotPosition(order['symbol'], side, amount, order['entry_price'], order['order_id'],
+                        _base_currency(order['symbol']), coins_bought=order['quantity'])
+
+
+# ==================== كتابة اللقطة ====================
+
+class _SavedAccount:
+    """حساب بحالة جاهزة بشكل TradingAccount.export_state() (بدون بيئة البوت)"""
+
+    __slots__ = ('state', 'on_change')
+
+    def __init__(self, state: Dict):
+        self.state = state
+        self.on_change = None
+
+    def export_state(self) -> Dict:
+        return self.state
+
+
+class _SavedUsers:
+    """مصدر اللقطة بشكل UserManager (user_accounts و user_positions)"""
+
+    def __init__(self):
+        self.user_accounts: Dict[int, Dict] = {}
+        self.user_positions: Dict[int, Dict] = {}
+
+
+def account_state(account_type: str, rows: List[Tuple]) -> Dict:
+    """نفس شكل TradingAccount.export_state() لصفقات الخطة"""
+    positions = [_open_position(*row) for row in rows if row[1] == account_type]
+    locked = sum(row[4] for row in rows if row[1] == account_type and account_type == 'futures')
+    return {
+        'account_type': account_type,
+        'balance': DEFAULT_BALANCE,
+        'initial_balance': DEFAULT_BALANCE,
+        'margin_locked': locked,
+        'total_trades': 0,
+        'winning_trades': 0,
+        'losing_trades': 0,
+        'wallet': {'USDT': DEFAULT_BALANCE, 'BTC': 0.0, 'ETH': 0.0, 'BNB': 0.0},
+        'futures_position_wallets': {},
+        'custom_position_names': {},
+        'position_signal_ids': {p.position_id: p.position_id for p in positions},
+        'futures_positions': [p.to_row() for p in positions if isinstance(p, FuturesPosition)],
+        'spot_positions': [p.to_row() for p in positions if isinstance(p, SpotPosition)],
+    }
+
+
+def write_snapshot(store: AccountSnapshotStore, plan: Dict[int, List[Tuple]], dirty: float, seed: int) -> Dict:
+    """لقطة لجميع المستخدمين ثم سجل تغييرات لنسبة dirty منهم"""
+    source = _SavedUsers()
+    for user_id, rows in plan.items():
+        source.user_accounts[user_id] = {
+            'spot': _SavedAccount(account_state('spot', rows)),
+            'futures': _SavedAccount(account_state('futures', rows)),
+        }
+        source.user_positions[user_id] = {
+            row[0]: {'symbol': row[2], 'side': row[3], 'entry_price': row[5], 'market_type': row[1],
+                     'signal_id': row[0]}
+            for row in rows
+        }
+    store.bind(source)
+
+    started = time.perf_counter()
+    store.snapshot()
+    snapshot_seconds = time.perf_counter() - started
+
+    rng = random.Random(seed)
+    changed = rng.sample(list(plan), int(len(plan) * dirty))
+    for user_id in changed:
+        source.user_accounts[user_id]['futures'].state['balance'] += 1.0
+        store.mark_dirty(user_id)
+    started = time.perf_counter()
+    store.flush()
+    flush_seconds = time.perf_counter() - started
+
+    return {
+        'snapshot_seconds': round(snapshot_seconds, 3),
+        'snapshot_mb': round(os.path.getsize(store.snapshot_path) / 1024 / 1024, 2),
+        'log_records': len(changed),
+        'log_mb': round(os.path.getsize(store.log_path) / 1024 / 1024, 2),
+        'flush_seconds': round(flush_seconds, 3),
+    }
+
+
+# ==================== الاستعادة ====================
+
+def _timed(restore: Callable[[], int]) -> Dict:
+    gc.collect()
+    started = time.perf_counter()
+    positions = restore()
+    return {'seconds': round(time.perf_counter() - started, 3), 'positions': positions}
+
+
+def restore_legacy(database) -> int:
+    """المسار السابق: استعلام لكل مستخدم وبناء صفقاته من الصفوف"""
+    restored = 0
+    for user in database.get_all_active_users():
+        for order in database.get_user_orders(user['user_id'], status='OPEN'):
+            position_from_order(order)
+            restored += 1
+    return restored
+
+
+def restore_snapshot(database, store: AccountSnapshotStore) -> int:
+    """المسار الجديد: استعلام المستخدمين مرة واحدة ثم اللقطة وسجل التغييرات"""
+    database.get_all_active_users()
+    restored = 0
+    for state in store.load().values():
+        for account in state['accounts'].values():
+            for row in account['futures_positions']:
+                FuturesPosition.from_row(row)
+            for row in account['spot_positions']:
+                SpotPosition.from_row(row)
+            restored += len(account['futures_positions']) + len(account['spot_positions'])
+    return restored
+
+
+def run_accounts(database, store: AccountSnapshotStore) -> Dict:
+    """نفس المقارنة عبر TradingAccount كما في UserManager._create_user_accounts"""
+    from bybit_trading_bot import TradingAccount
+    from simulator.backtest_engine import quiet_trading_logs
+
+    def new_accounts(balance: float) -> Dict:
+        return {'spot': TradingAccount(initial_balance=balance, account_type='spot'),
+                'futures': TradingAccount(initial_balance=balance, account_type='futures')}
+
+    def legacy() -> int:
+        restored = 0
+        for user in database.get_all_active_users():
+            accounts = new_accounts(user.get('balance', DEFAULT_BALANCE))
+            for order in database.get_user_orders(user['user_id'], status='OPEN'):
+                side = order['side'].lower()
+                if order.get('market_type') == 'futures':
+                    accounts['futures'].open_futures_position(order['symbol'], side, order['margin_amount'],
+                                                              order['entry_price'], order['leverage'],
+                                                              position_id=order['order_id'])
+                else:
+                    accounts['spot'].open_spot_position(order['symbol'], side,
+                                                        order['quantity'] * order['entry_price'],
+                                                        order['entry_price'], position_id=order['order_id'])
+                restored += 1
+        return restored
+
+    def snapshot() -> int:
+        states = store.load()
+        restored = 0
+        for user in database.get_all_active_users():
+            accounts = new_accounts(user.get('balance', DEFAULT_BALANCE))
+            state = states.get(user['user_id'])
+            if state:
+                for market_type, account in accounts.items():
+                    account.restore_state(state['accounts'][market_type])
+                    restored += len(account.positions)
+        return restored
+
+    with quiet_trading_logs():
+        return {'legacy': _timed(legacy), 'snapshot': _timed(snapshot)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس زمن استعادة الحسابات التجريبية عند إعادة التشغيل')
+    parser.add_argument('--users', type=int, default=DEFAULT_USERS)
+    parser.add_argument('--positions', type=int, default=DEFAULT_POSITIONS, help='صفقات مفتوحة لكل مستخدم')
+    parser.add_argument('--symbols', type=int, default=DEFAULT_SYMBOLS)
+    parser.add_argument('--dirty', type=float, default=DEFAULT_DIRTY, help='نسبة المستخدمين في سجل التغييرات')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--accounts', action='store_true', help='القياس عبر TradingAccount أيضاً (يتطلب بيئة البوت)')
+    parser.add_argument('--out', default=None, help='حفظ النتائج JSON')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    for name in ('users.database', 'systems.account_snapshot'):
+        logging.getLogger(name).setLevel(logging.ERROR)
+
+    workdir = tempfile.mkdtemp(prefix='restart_bench_')
+    try:
+        universe = make_universe(args.symbols, args.seed)
+        plan = plan_users(args.users, args.positions, universe, args.seed)
+
+        started = time.perf_counter()
+        database = seed_database(os.path.join(workdir, 'trading_bot.db'), plan)
+        seed_seconds = time.perf_counter() - started
+
+        store = AccountSnapshotStore({
+            'enabled': True,
+            'snapshot_path': os.path.join(workdir, 'demo_accounts.snap'),
+            'log_path': os.path.join(workdir, 'demo_accounts.log'),
+            'max_log_records': args.users + 1,
+            'fsync': True,
+        })
+        write = write_snapshot(store, plan, args.dirty, args.seed)
+
+        report = {
+            'config': {'users': args.users, 'positions_per_user': args.positions, 'symbols': args.symbols,
+                       'dirty': args.dirty, 'seed': args.seed},
+            'seed_seconds': round(seed_seconds, 3),
+            'write': write,
+            'records': {
+                'legacy': _timed(lambda: restore_legacy(database)),
+                'snapshot': _timed(lambda: restore_snapshot(database, store)),
+            },
+        }
+        if args.accounts:
+            report['accounts'] = run_accounts(database, store)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n📊 {args.users} مستخدم، {args.positions} صفقة لكل مستخدم، "
+          f"{int(args.dirty * 100)}% من المستخدمين في سجل التغييرات")
+    print(f"  الكتابة: لقطة {write['snapshot_mb']} MB في {write['snapshot_seconds']}s | "
+          f"سجل {write['log_records']} تغيير ({write['log_mb']} MB) في {write['flush_seconds']}s")
+    for name in ('records', 'accounts'):
+        if name not in report:
+            continue
+        legacy, snapshot = report[name]['legacy'], report[name]['snapshot']
+        speedup = legacy['seconds'] / snapshot['seconds'] if snapshot['seconds'] else float('inf')
+        print(f"  {name:8} السابق {legacy['seconds']}s ({legacy['positions']} صفقة) | "
+              f"اللقطة {snapshot['seconds']}s ({snapshot['positions']} صفقة) | x{speedup:.1f}")
+
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 النتائج: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
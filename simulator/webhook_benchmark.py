@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook Benchmark - قياس إنتاجية وزمن مسار استقبال الإشارات
+يشغل app.py أو web_server.py في عملية منفصلة (بقاعدة بيانات ومستخدمين مؤقتين) موجهة إلى محاكي Bybit المحلي،
+ويرسل إليها إشارات /webhook و /personal/<user_id>/webhook بتوازي ومزيج إشارات وعدد مستخدمين محددين،
+ثم يقيس الإشارات المعالجة في الثانية، p99 من الاستقبال حتى انتهاء المعالجة، عدد الخيوط و RSS للخادم
+
+الاستخدام:
+    python -m simulator.webhook_benchmark --target app --account-type demo --requests 2000 --concurrency 32
+    python -m simulator.webhook_benchmark --target app,web_server --account-type demo,real --out bench.json
+    python -m simulator.webhook_benchmark --target app --baseline bench.json   # مقارنة مع تشغيل سابق
+
+- demo: مستخدمو الحساب التجريبي (trading_bot.process_signal) مع أسعار من المحاكي
+- real: مستخدمو الحساب الحقيقي (signal_executor) بمفاتيح API يقبلها المحاكي بدلاً من المنصة
+- الإشارات مولدة بـ seed ثابت، و warmup يُستبعد من القياس، ليكون التشغيلان قابلين للمقارنة
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    from config import WEBHOOK_BENCHMARK_SETTINGS
+except ImportError:
+    WEBHOOK_BENCHMARK_SETTINGS = {
+        'requests': 2000,
+        'warmup': 100,
+        'concurrency': 32,
+        'users': 20,
+        'mix': {'buy': 0.4, 'sell': 0.3, 'close': 0.3},
+        'routes': {'personal': 0.8, 'public': 0.2},
+        'symbols': ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'XRPUSDT', 'BNBUSDT'],
+        'trade_amount': 10.0,
+        'leverage': 5,
+        'market_type': 'futures',
+        'drain_timeout': 300,
+        'sample_interval': 0.25,
+        'tolerance_pct': 10.0,
+        'seed': 42,
+    }
+
+# أول معرف للمستخدمين المؤقتين (بعيد عن معرفات تلجرام الحقيقية في قاعدة البيانات المؤقتة)
+FIRST_USER_ID = 900000001
+
+# المقاييس المقارنة مع التشغيل السابق: (المسار في النتيجة، الأعلى أفضل؟)
+COMPARED_METRICS = (
+    ('throughput.sustained_signals_per_sec', True),
+    ('end_to_end.p99_ms', False),
+    ('ack.p99_ms', False),
+    ('server.threads_peak', False),
+    ('server.rss_peak_mb', False),
+)
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 2)
+
+
+def read_process_usage() -> Tuple[Optional[float], int]:
+    """RSS بالميجابايت وعدد خيوط العملية الحالية (من /proc على Linux)"""
+    try:
+        rss_kb, threads = None, None
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_kb = int(line.split()[1])
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+        return (rss_kb / 1024 if rss_kb else None), (threads or threading.active_count())
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, threading.active_count()
+
+
+# ==================== العمليات المساعدة ====================
+
+def _run_simulator(port: int, seed: int, ready, stop):
+    """محاكي Bybit في عملية خاصة حتى لا ينافس مولد الحمل أو الخادم على نفس المفسر"""
+    sys.path.insert(0, ROOT_DIR)
+    logging.basicConfig(level=logging.WARNING)
+    from simulator.bybit_simulator import BybitSimulator
+
+    simulator = BybitSimulator('127.0.0.1', port, seed=seed)
+    simulator.start()
+    ready.set()
+    stop.wait()
+    simulator.stop()
+
+
+def _serve_target(target: str, port: int, workdir: str, users: List[int], user_settings: Dict,
+                  sample_interval: float, conn):
+    """
+    الخادم المقاس (app أو web_server) في عملية منفصلة
+
+    يستقبل الأوامر عبر conn: reset (مسح القياسات)، stats (القياسات الحالية)، stop
+    """
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(workdir)
+    # مخرجات print في مسار الإشارات تذهب لملف بدلاً من الطرفية
+    sys.stdout = open(os.path.join(workdir, 'server.log'), 'a', buffering=1, encoding='utf-8')
+    logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+
+    from werkzeug.serving import make_server
+    from users.database import db_manager
+    from users.user_manager import user_manager
+
+    for user_id in users:
+        db_manager.create_user(user_id, f"bench-{user_id}", 'benchmark', initial_settings=user_settings)
+        db_manager.update_user_data(user_id, {
+            'is_active': True,
+            'exchange': 'bybit',
+            'bybit_api_key': f"bench-{user_id}",
+            'bybit_api_secret': 'benchmark',
+        })
+        user_manager.reload_user_data(user_id)
+
+    if target == 'app':
+        import app as app_module
+        flask_app = app_module.app
+    else:
+        from bybit_trading_bot import trading_bot
+        from web_server import WebServer
+        trading_bot.user_id = users[0]
+        flask_app = WebServer(trading_bot).app
+
+    from api.latency_tracer import latency_tracer
+    from signals.signal_queue import signal_ingestion_queue
+    from systems.telegram_dispatcher import telegram_dispatcher
+
+    signal_ingestion_queue.start()
+    telegram_dispatcher.start()
+
+    server = make_server('127.0.0.1', port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='BenchmarkServer', daemon=True).start()
+
+    samples: List[Tuple[float, int]] = []
+    sampling = threading.Event()
+
+    def sampler():
+        while True:
+            if sampling.is_set():
+                samples.append(read_process_usage())
+            time.sleep(sample_interval)
+
+    threading.Thread(target=sampler, name='BenchmarkSampler', daemon=True).start()
+    conn.send({'ready': True})
+
+    while True:
+        command = conn.recv()
+        if command == 'reset':
+            # نافذة المدرج تتسع لكل إشارات التشغيل فيكون p99 محسوباً على جميعها
+            latency_tracer.window_size = max(latency_tracer.window_size, 1000000)
+            latency_tracer.reset()
+            samples.clear()
+            sampling.set()
+            conn.send({'completed': signal_ingestion_queue.completed})
+        elif command == 'stats':
+            queue_stats = signal_ingestion_queue.get_stats()
+            rss_values = [rss for rss, _ in samples if rss is not None]
+            thread_values = [threads for _, threads in samples]
+            rss_now, threads_now = read_process_usage()
+            conn.send({
+                'queue': {key: queue_stats[key] for key in
+                          ('depth', 'busy_workers', 'submitted', 'completed', 'failed', 'timed_out', 'rejected')},
+                'stages': {stage: {k: v for k, v in data.items() if k != 'histogram'}
+                           for stage, data in latency_tracer.get_stats().items()},
+                'telegram': {key: value for key, value in telegram_dispatcher.get_stats().items()
+                             if key != 'queue_wait'},
+                'rss_mb': rss_now,
+                'threads': threads_now,
+                'rss_peak_mb': max(rss_values) if rss_values else rss_now,
+                'rss_mean_mb': sum(rss_values) / len(rss_values) if rss_values else rss_now,
+                'threads_peak': max(thread_values) if thread_values else threads_now,
+                'threads_mean': sum(thread_values) / len(thread_values) if thread_values else threads_now,
+            })
+        elif command == 'stop':
+            sampling.clear()
+            server.shutdown()
+            conn.send({'stopped': True})
+            return
+
+
+# ==================== مولد الحمل ====================
+
+class PayloadPlan:
+    """تسلسل ثابت (seed) من الطلبات: المسار، المستخدم، ونص الإشارة"""
+
+    def __init__(self, users: List[int], mix: Dict[str, float], routes: Dict[str, float],
+                 symbols: List[str], seed: int, run_id: str):
+        self.users = users
+        self.mix = mix
+        self.routes = routes
+        self.symbols = symbols
+        self.run_id = run_id
+        self._random = random.Random(seed)
+        self._open_ids: Dict[Tuple, List[str]] = {}
+
+    def build(self, count: int, offset: int = 0) -> List[Tuple[str, Dict]]:
+        requests_plan = []
+        route_names, route_weights = zip(*self.routes.items())
+        signal_names, signal_weights = zip(*self.mix.items())
+        for index in range(offset, offset + count):
+            route = self._random.choices(route_names, route_weights)[0]
+            user_id = self.users[0] if route == 'public' else self._random.choice(self.users)
+            symbol = self._random.choice(self.symbols)
+            signal = self._random.choices(signal_names, signal_weights)[0]
+            key = (route, user_id, symbol)
+
+            signal_id = f"BENCH-{self.run_id}-{index}"
+            if signal in ('close', 'close_long', 'close_short', 'partial_close') and self._open_ids.get(key):
+                # الإغلاق بنفس ID الإشارة التي فتحت الصفقة (كما ترسله استراتيجيات TradingView)
+                signal_id = self._open_ids[key].pop()
+            elif signal in ('buy', 'sell', 'long', 'short'):
+                self._open_ids.setdefault(key, []).append(signal_id)
+
+            payload = {'signal': signal, 'symbol': symbol, 'id': signal_id,
+                       'bench_seq': f"{self.run_id}-{index}"}
+            path = '/webhook' if route == 'public' else f"/personal/{user_id}/webhook"
+            requests_plan.append((path, payload))
+        return requests_plan
+
+
+async def drive_load(base_url: str, plan: List[Tuple[str, Dict]], concurrency: int) -> Dict:
+    """إرسال الطلبات بعدد ثابت من العملاء المتزامنين (حلقة مغلقة) وقياس زمن الرد"""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    duplicates = 0
+    position = 0
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def client():
+            nonlocal position, duplicates
+            while position < len(plan):
+                path, payload = plan[position]
+                position += 1
+                started = time.perf_counter()
+                try:
+                    async with session.post(base_url + path, json=payload) as response:
+                        body = await response.read()
+                        status = str(response.status)
+                        if response.status == 200 and b'"duplicate"' in body:
+                            duplicates += 1
+                except Exception as e:
+                    status = type(e).__name__
+                latencies.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'sent': len(plan),
+        'elapsed_seconds': round(elapsed, 3),
+        'requests_per_sec': round(len(plan) / elapsed, 1) if elapsed > 0 else None,
+        'statuses': statuses,
+        'duplicates': duplicates,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+
+# ==================== التشغيل ====================
+
+class WebhookBenchmark:
+    """تشغيل واحد: هدف (app / web_server) × نوع حساب (demo / real)"""
+
+    def __init__(self, target: str, account_type: str, settings: Dict = None):
+        self.target = target
+        self.account_type = account_type
+        self.settings = {**WEBHOOK_BENCHMARK_SETTINGS, **(settings or {})}
+
+    def _request(self, conn, command: str, timeout: float = 60):
+        conn.send(command)
+        if not conn.poll(timeout):
+            raise RuntimeError(f"الخادم لم يرد على {command}")
+        return conn.recv()
+
+    def _wait_drained(self, conn, expected_completed: int, timeout: float) -> Tuple[Dict, float]:
+        """انتظار انتهاء معالجة جميع الإشارات المقبولة"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            stats = self._request(conn, 'stats')
+            queue = stats['queue']
+            finished = queue['completed'] + queue['failed'] + queue['timed_out']
+            if (queue['depth'] == 0 and queue['busy_workers'] == 0 and finished >= expected_completed) \
+                    or time.perf_counter() > deadline:
+                return stats, time.perf_counter()
+            time.sleep(0.05)
+
+    def run(self) -> Dict:
+        settings = self.settings
+        context = multiprocessing.get_context('spawn')
+        workdir = tempfile.mkdtemp(prefix=f"webhook_bench_{self.target}_{self.account_type}_")
+        users = [FIRST_USER_ID + index for index in range(settings['users'])]
+        sim_port, server_port = free_port(), free_port()
+        sim_url = f"http://127.0.0.1:{sim_port}"
+
+        # بيئة الخادم المقاس: كل الاتصالات الخارجية إلى المحاكي، والملفات في مجلد مؤقت
+        os.environ.update({
+            'BYBIT_BASE_URL': sim_url,
+            'BYBIT_WS_PUBLIC_SPOT': f"ws://127.0.0.1:{sim_port}/v5/public/spot",
+            'BYBIT_WS_PUBLIC_LINEAR': f"ws://127.0.0.1:{sim_port}/v5/public/linear",
+            'TELEGRAM_API_URL': sim_url,
+            'TELEGRAM_TOKEN': 'benchmark',
+            'ADMIN_USER_ID': str(users[0]),
+            'SIGNAL_JOURNAL_DB': os.path.join(workdir, 'signal_journal.db'),
+            'PORT': str(server_port),
+        })
+
+        sim_ready, sim_stop = context.Event(), context.Event()
+        simulator = context.Process(target=_run_simulator, args=(sim_port, settings['seed'], sim_ready, sim_stop),
+                                    daemon=True)
+        simulator.start()
+        if not sim_ready.wait(30):
+            raise RuntimeError("فشل تشغيل محاكي Bybit")
+
+        user_settings = {
+            'market_type': settings['market_type'],
+            'trade_amount': settings['trade_amount'],
+            'leverage': settings['leverage'],
+            'account_type': self.account_type,
+            'exchange': 'bybit',
+        }
+        parent_conn, child_conn = context.Pipe()
+        server = context.Process(target=_serve_target, daemon=True, args=(
+            self.target, server_port, workdir, users, user_settings, settings['sample_interval'], child_conn))
+        server.start()
+
+        try:
+            if not parent_conn.poll(120):
+                raise RuntimeError(f"الخادم {self.target} لم يبدأ (السجل: {workdir}/server.log)")
+            parent_conn.recv()
+
+            base_url = f"http://127.0.0.1:{server_port}"
+            plan = PayloadPlan(users, settings['mix'], settings['routes'], settings['symbols'],
+                               settings['seed'], f"{int(time.time())}")
+            warmup = plan.build(settings['warmup'])
+            measured = plan.build(settings['requests'], offset=settings['warmup'])
+
+            if warmup:
+                asyncio.run(drive_load(base_url, warmup, settings['concurrency']))
+                self._wait_drained(parent_conn, 0, settings['drain_timeout'])
+
+            baseline_completed = self._request(parent_conn, 'reset')['completed']
+            started = time.perf_counter()
+            ack = asyncio.run(drive_load(base_url, measured, settings['concurrency']))
+            accepted = ack['statuses'].get('200', 0) - ack['duplicates']
+            stats, drained_at = self._wait_drained(parent_conn, baseline_completed + accepted,
+                                                   settings['drain_timeout'])
+            self._request(parent_conn, 'stop')
+        finally:
+            server.join(timeout=10)
+            if server.is_alive():
+                server.terminate()
+            sim_stop.set()
+            simulator.join(timeout=10)
+
+        processed = stats['queue']['completed'] - baseline_completed
+        duration = drained_at - started
+        end_to_end = stats['stages'].get('webhook.end_to_end', {})
+        return {
+            'target': self.target,
+            'account_type': self.account_type,
+            'config': {key: settings[key] for key in
+                       ('requests', 'warmup', 'concurrency', 'users', 'mix', 'routes', 'symbols',
+                        'trade_amount', 'leverage', 'market_type', 'seed')},
+            'ack': ack,
+            'throughput': {
+                'accepted': accepted,
+                'processed': processed,
+                'drain_seconds': round(duration, 3),
+                'sustained_signals_per_sec': round(processed / duration, 1) if duration > 0 else None,
+            },
+            'end_to_end': {key: end_to_end.get(key) for key in ('count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms')},
+            'stages': stats['stages'],
+            'queue': stats['queue'],
+            'telegram': stats['telegram'],
+            'server': {
+                'threads_peak': stats['threads_peak'],
+                'threads_mean': round(stats['threads_mean'], 1),
+                'rss_peak_mb': round(stats['rss_peak_mb'], 1) if stats['rss_peak_mb'] else None,
+                'rss_mean_mb': round(stats['rss_mean_mb'], 1) if stats['rss_mean_mb'] else None,
+            },
+            'workdir': workdir,
+        }
+
+
+def environment_info() -> Dict:
+    """معلومات البيئة لمقارنة التشغيلات"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def _metric(result: Dict, path: str):
+    value = result
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(results: List[Dict], baseline: Dict, tolerance_pct: float) -> List[str]:
+    """مقارنة مع تشغيل سابق؛ تعيد قائمة التراجعات التي تتجاوز tolerance_pct"""
+    previous = {(run['target'], run['account_type']): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in results:
+        key = (run['target'], run['account_type'])
+        if key not in previous:
+            continue
+        print(f"\n📊 مقارنة {key[0]}/{key[1]} مع {baseline.get('environment', {}).get('commit')}:")
+        for path, higher_is_better in COMPARED_METRICS:
+            old, new = _metric(previous[key], path), _metric(run, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = '❌' if worse > tolerance_pct else '✅'
+            print(f"  {flag} {path}: {old} → {new} ({change:+.1f}%)")
+            if worse > tolerance_pct:
+                regressions.append(f"{key[0]}/{key[1]} {path} {change:+.1f}%")
+    return regressions
+
+
+def print_report(result: Dict):
+    ack, throughput, e2e, server = result['ack'], result['throughput'], result['end_to_end'], result['server']
+    print(f"\n{'=' * 60}")
+    print(f"🎯 {result['target']} / {result['account_type']} - "
+          f"{result['config']['requests']} طلب، توازي {result['config']['concurrency']}، "
+          f"{result['config']['users']} مستخدم")
+    print(f"{'=' * 60}")
+    print(f"الردود: {ack['statuses']} (مكرر {ack['duplicates']}) - {ack['requests_per_sec']} طلب/ثانية")
+    print(f"زمن الرد (ms): p50 {ack['p50_ms']} | p95 {ack['p95_ms']} | p99 {ack['p99_ms']} | max {ack['max_ms']}")
+    print(f"المعالجة: {throughput['processed']}/{throughput['accepted']} في {throughput['drain_seconds']}s "
+          f"= {throughput['sustained_signals_per_sec']} إشارة/ثانية")
+    print(f"من الاستقبال حتى انتهاء المعالجة (ms): p50 {e2e['p50_ms']} | p95 {e2e['p95_ms']} | "
+          f"p99 {e2e['p99_ms']} | max {e2e['max_ms']}")
+    print(f"الخادم: خيوط {server['threads_peak']} (متوسط {server['threads_mean']}) | "
+          f"RSS {server['rss_peak_mb']}MB (متوسط {server['rss_mean_mb']}MB)")
+
+
+def _weights(text: str) -> Dict[str, float]:
+    """buy:0.4,sell:0.3,close:0.3"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition(':')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس إنتاجية وزمن webhooks الإشارات')
+    parser.add_argument('--target', default='app', help='app, web_server أو كلاهما مفصولين بفاصلة')
+    parser.add_argument('--account-type', default='demo', help='demo, real أو كلاهما مفصولين بفاصلة')
+    parser.add_argument('--requests', type=int, default=None)
+    parser.add_argument('--warmup', type=int, default=None)
+    parser.add_argument('--concurrency', type=int, default=None)
+    parser.add_argument('--users', type=int, default=None)
+    parser.add_argument('--mix', type=_weights, default=None, help='مزيج الإشارات مثل buy:0.4,sell:0.3,close:0.3')
+    parser.add_argument('--routes', type=_weights, default=None, help='مزيج المسارات مثل personal:0.8,public:0.2')
+    parser.add_argument('--symbols', default=None, help='BTCUSDT,ETHUSDT,...')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default=None, help='حفظ النتائج JSON')
+    parser.add_argument('--baseline', default=None, help='نتائج تشغيل سابق للمقارنة')
+    parser.add_argument('--tolerance', type=float, default=None, help='نسبة التراجع المسموحة %%')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    settings = {key: value for key, value in {
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'concurrency': args.concurrency,
+        'users': args.users,
+        'mix': args.mix,
+        'routes': args.routes,
+        'symbols': [symbol.strip().upper() for symbol in args.symbols.split(',')] if args.symbols else None,
+        'seed': args.seed,
+    }.items() if value is not None}
+
+    runs = []
+    for target in [name.strip() for name in args.target.split(',')]:
+        for account_type in [name.strip() for name in args.account_type.split(',')]:
+            result = WebhookBenchmark(target, account_type, settings).run()
+            print_report(result)
+            runs.append(result)
+
+    report = {'environment': environment_info(), 'runs': runs}
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 النتائج: {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        tolerance = args.tolerance if args.tolerance is not None else WEBHOOK_BENCHMARK_SETTINGS['tolerance_pct']
+        regressions = compare(runs, baseline, tolerance)
+        if regressions:
+            print(f"\n❌ تراجع في {len(regressions)} مقياس: {regressions}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
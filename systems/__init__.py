@@ -18,11 +18,61 @@ try:
 except ImportError:
     pass
 
+try:
+    from .telegram_dispatcher import TelegramDispatcher, telegram_dispatcher
+except ImportError:
+    pass
+
+try:
+    from .enrichment_worker import EnrichmentWorker, enrichment_worker
+except ImportError:
+    pass
+
+try:
+    from .position_records import FuturesPosition, SpotPosition, SymbolTable, symbol_table
+except ImportError:
+    pass
+
+try:
+    from .position_book import PositionBook, position_book
+except ImportError:
+    pass
+
+try:
+    from .trigger_index import TriggerIndex
+except ImportError:
+    pass
+
+try:
+    from .position_engine import PositionEngine, position_engine
+except ImportError:
+    pass
+
+try:
+    from .account_snapshot import AccountSnapshotStore, account_snapshots
+except ImportError:
+    pass
+
 __all__ = [
     'SimpleEnhancedSystem',
     'simple_enhanced_system',
     'EnhancedPortfolioManager',
     'portfolio_factory',
     'IntegratedSignalSystem',
-    'integrated_signal_system'
+    'integrated_signal_system',
+    'TelegramDispatcher',
+    'telegram_dispatcher',
+    'EnrichmentWorker',
+    'enrichment_worker',
+    'FuturesPosition',
+    'SpotPosition',
+    'SymbolTable',
+    'symbol_table',
+    'PositionBook',
+    'position_book',
+    'TriggerIndex',
+    'PositionEngine',
+    'position_engine',
+    'AccountSnapshotStore',
+    'account_snapshots'
 ]
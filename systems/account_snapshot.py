@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Account Snapshot - لقطات الحسابات التجريبية وسجل التغييرات
+حالة الحسابات التجريبية لجميع المستخدمين (الأرصدة، المحافظ، محافظ صفقات الفيوتشر، الصفقات، الأسماء المخصصة)
+في لقطة ثنائية واحدة + سجل تغييرات يُلحق به كل حساب تغير، فيُستعاد كل شيء عند إعادة التشغيل
+بقراءة متتالية لملفين بدلاً من إعادة بناء الحسابات وصفقاتها لكل مستخدم على حدة
+"""
+
+import io
+import logging
+import numbers
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import ACCOUNT_SNAPSHOT_SETTINGS
+except ImportError:
+    ACCOUNT_SNAPSHOT_SETTINGS = {
+        'enabled': True,
+        'snapshot_path': 'demo_accounts.snap',
+        'log_path': 'demo_accounts.log',
+        'flush_interval': 2,
+        'snapshot_interval': 600,
+        'max_log_records': 20000,
+        'fsync': True,
+    }
+
+MAGIC = b'BBSNAP01'
+FORMAT_VERSION = 1
+
+# اللقطة: magic، الإصدار، وقت الكتابة، آخر رقم تسلسل في السجل شملته، عدد المستخدمين، طول البيانات، crc32
+_HEADER = struct.Struct('<8sHdQIQI')
+# سجل التغييرات: طول البيانات، crc32، رقم التسلسل ثم (user_id, state)
+_FRAME = struct.Struct('<IIQ')
+
+_SKIP = object()
+
+
+class _PlainUnpickler(pickle.Unpickler):
+    """أنواع Python الأساسية فقط - الملف لا يستطيع استدعاء أي فئة أو دالة عند القراءة"""
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError(f"نوع غير مسموح في لقطة الحسابات: {module}.{name}")
+
+
+def _dumps(value) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _loads(data: bytes):
+    return _PlainUnpickler(io.BytesIO(data)).load()
+
+
+def _plain(value):
+    """نسخة بأنواع أساسية فقط (أرقام NumPy تُحول، وما لا يُحول مثل datetime يُحذف)"""
+    if value is None or type(value) in (bool, int, float, str):
+        return value
+    if isinstance(value, dict):
+        plain = {}
+        for key, item in value.items():
+            item = _plain(item)
+            if item is not _SKIP and type(key) in (int, str):
+                plain[key] = item
+        return plain
+    if isinstance(value, (list, tuple)):
+        items = [item for item in map(_plain, value) if item is not _SKIP]
+        return items if isinstance(value, list) else tuple(items)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, str):
+        return str(value)
+    return _SKIP
+
+
+class AccountSnapshotStore:
+    """
+    لقطات الحسابات التجريبية
+
+    - watch() يربط حسابي المستخدم (on_change) فيُسجل المستخدم كمتغير عند أي تعديل
+    - flush() كل flush_interval: حالة كل مستخدم متغير تُلحق بالسجل (إطار برقم تسلسل و crc32)
+    - snapshot() كل snapshot_interval أو بعد max_log_records إطار: لقطة كاملة (ملف مؤقت ثم os.replace)
+      ثم تفريغ السجل
+    - load() عند التشغيل: اللقطة ثم إطارات السجل بعدها؛ الإطار الأخير غير المكتمل (توقف أثناء الكتابة) يُتجاهل
+    - الحالة لكل مستخدم: {'accounts': {'spot': ..., 'futures': ...}, 'positions': {position_id: {...}}}
+      من TradingAccount.export_state() و user_positions
+    """
+
+    def __init__(self, settings: Dict = None):
+        settings = settings or ACCOUNT_SNAPSHOT_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        self.snapshot_path = settings.get('snapshot_path', 'demo_accounts.snap')
+        self.log_path = settings.get('log_path', 'demo_accounts.log')
+        self.flush_interval = settings.get('flush_interval', 2)
+        self.snapshot_interval = settings.get('snapshot_interval', 600)
+        self.max_log_records = settings.get('max_log_records', 20000)
+        self.fsync = settings.get('fsync', True)
+
+        self._manager = None
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+        self._io_lock = threading.RLock()
+        self._sequence = 0
+        self._log_records = 0
+        self._last_snapshot = time.time()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+        self.flushes = 0
+        self.records_written = 0
+        self.snapshots = 0
+        self.loaded_users = 0
+        self.replayed_records = 0
+        self.corrupt_frames = 0
+        self.last_load_ms = 0.0
+        self.last_flush_ms = 0.0
+        self.last_snapshot_ms = 0.0
+        self.last_snapshot_bytes = 0
+
+    # ==================== الربط ====================
+
+    def bind(self, manager):
+        """مصدر الحالة: UserManager (user_accounts و user_positions)"""
+        self._manager = manager
+
+    def watch(self, user_id: int, accounts: Dict):
+        """تسجيل المستخدم كمتغير عند أي تعديل في أحد حساباته"""
+        for account in accounts.values():
+            account.on_change = lambda user_id=user_id: self.mark_dirty(user_id)
+
+    def mark_dirty(self, user_id: int):
+        with self._lock:
+            self._dirty.add(user_id)
+
+    def _user_state(self, user_id: int) -> Optional[Dict]:
+        accounts = self._manager.user_accounts.get(user_id)
+        if not accounts:
+            return None
+        return _plain({
+            'accounts': {market_type: account.export_state() for market_type, account in accounts.items()},
+            'positions': self._manager.user_positions.get(user_id, {}),
+        })
+
+    def _collect(self, user_ids) -> list:
+        """[(user_id, state)] - المستخدم الذي تغير أثناء القراءة يُعاد تسجيله للدفعة التالية"""
+        states = []
+        for user_id in user_ids:
+            for _ in range(3):
+                try:
+                    state = self._user_state(user_id)
+                    break
+                except RuntimeError:
+                    # تعديل متزامن (dictionary changed size during iteration)
+                    state = _SKIP
+            if state is _SKIP:
+                self.mark_dirty(user_id)
+            elif state is not None:
+                states.append((user_id, state))
+        return states
+
+    # ==================== الكتابة ====================
+
+    def flush(self) -> int:
+        """إلحاق حالة المستخدمين المتغيرين بسجل التغييرات"""
+        if self._manager is None:
+            return 0
+        with self._io_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return 0
+            started = time.perf_counter()
+            frames = []
+            for user_id, state in self._collect(dirty):
+                self._sequence += 1
+                payload = _dumps((user_id, state))
+                frames.append(_FRAME.pack(len(payload), zlib.crc32(payload), self._sequence) + payload)
+            if not frames:
+                return 0
+            try:
+                with open(self.log_path, 'ab') as f:
+                    f.write(b''.join(frames))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+            except OSError:
+                with self._lock:
+                    self._dirty |= dirty
+                raise
+            self._log_records += len(frames)
+            self.flushes += 1
+            self.records_written += len(frames)
+            self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+            if self._log_records >= self.max_log_records:
+                self.snapshot()
+            return len(frames)
+
+    def snapshot(self) -> int:
+        """لقطة كاملة لجميع الحسابات ثم تفريغ سجل التغييرات"""
+        if self._manager is None:
+            return 0
+        with self._io_lock:
+            started = time.perf_counter()
+            # التغييرات من هنا فصاعداً تذهب للسجل بعد اللقطة
+            with self._lock:
+                self._dirty = set()
+            users = self._collect(list(self._manager.user_accounts))
+            payload = _dumps(users)
+            header = _HEADER.pack(MAGIC, FORMAT_VERSION, time.time(), self._sequence,
+                                  len(users), len(payload), zlib.crc32(payload))
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(header)
+                f.write(payload)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+            # إطارات السجل حتى _sequence أصبحت في اللقطة (وإن بقيت بعد توقف هنا تُتجاهل عند التحميل)
+            open(self.log_path, 'wb').close()
+
+            self._log_records = 0
+            self._last_snapshot = time.time()
+            self.snapshots += 1
+            self.last_snapshot_bytes = len(header) + len(payload)
+            self.last_snapshot_ms = (time.perf_counter() - started) * 1000
+            logger.info(f"💾 لقطة الحسابات التجريبية: {len(users)} مستخدم، "
+                        f"{self.last_snapshot_bytes / 1024:.0f} KB في {self.last_snapshot_ms:.0f}ms")
+            return len(users)
+
+    def clear(self):
+        """حذف الحالة المحفوظة (بعد حذف جميع المستخدمين من الذاكرة)"""
+        with self._io_lock:
+            with self._lock:
+                self._dirty = set()
+            for path in (self.snapshot_path, self.log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_records = 0
+        logger.warning("🗑️ تم حذف لقطات الحسابات التجريبية")
+
+    # ==================== القراءة ====================
+
+    def _read_snapshot(self, states: Dict[int, Dict]) -> int:
+        """قراءة اللقطة إلى states وإعادة رقم التسلسل الذي شملته (0 إن لم توجد أو كانت تالفة)"""
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            logger.warning("⚠️ لقطة الحسابات ناقصة - سيتم تجاهلها")
+            return 0
+        magic, version, created_at, sequence, count, length, crc = _HEADER.unpack_from(data)
+        payload = data[_HEADER.size:_HEADER.size + length]
+        if magic != MAGIC or version != FORMAT_VERSION or len(payload) != length or zlib.crc32(payload) != crc:
+            logger.warning("⚠️ لقطة الحسابات تالفة أو بإصدار مختلف - سيتم تجاهلها")
+            return 0
+        for user_id, state in _loads(payload):
+            states[user_id] = state
+        logger.info(f"📂 لقطة الحسابات: {count} مستخدم من {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created_at))}")
+        return sequence
+
+    def _replay_log(self, states: Dict[int, Dict], after_sequence: int) -> Tuple[int, int]:
+        """تطبيق إطارات السجل بعد اللقطة - يعيد (عدد الإطارات المطبقة، آخر رقم تسلسل)"""
+        if not os.path.exists(self.log_path):
+            return 0, after_sequence
+        with open(self.log_path, 'rb') as f:
+            data = f.read()
+        offset, applied, last_sequence = 0, 0, after_sequence
+        while offset + _FRAME.size <= len(data):
+            length, crc, sequence = _FRAME.unpack_from(data, offset)
+            payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                self.corrupt_frames += 1
+                break
+            offset += _FRAME.size + length
+            if sequence <= after_sequence:
+                continue
+            user_id, state = _loads(payload)
+            states[user_id] = state
+            applied += 1
+            last_sequence = sequence
+        if offset < len(data):
+            # الإطارات الجديدة تُلحق بعد آخر إطار سليم وليس بعد البقايا
+            logger.warning(f"⚠️ تجاهل {len(data) - offset} بايت غير مكتملة في آخر سجل تغييرات الحسابات")
+            os.truncate(self.log_path, offset)
+        return applied, last_sequence
+
+    def load(self) -> Dict[int, Dict]:
+        """حالة الحسابات المحفوظة {user_id: state} (اللقطة ثم سجل التغييرات)"""
+        if not self.enabled:
+            return {}
+        started = time.perf_counter()
+        states: Dict[int, Dict] = {}
+        with self._io_lock:
+            try:
+                sequence = self._read_snapshot(states)
+                applied, sequence = self._replay_log(states, sequence)
+            except Exception as e:
+                logger.error(f"❌ خطأ في قراءة لقطات الحسابات: {e}")
+                return {}
+            self._sequence = max(self._sequence, sequence)
+            self._log_records = applied
+
+        self.loaded_users = len(states)
+        self.replayed_records = applied
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+        if states:
+            logger.warning(f"📂 تم تحميل {len(states)} حساب مستخدم من اللقطات "
+                           f"({applied} تغيير من السجل) في {self.last_load_ms:.0f}ms")
+        return states
+
+    # ==================== التشغيل ====================
+
+    def start(self):
+        """الكتابة الدورية في خيط خلفي (مرة واحدة)"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='AccountSnapshot', daemon=True)
+        self._thread.start()
+        logger.info("✅ لقطات الحسابات التجريبية تعمل")
+
+    def _run(self):
+        # السجل المُعاد عند التحميل يُدمج في لقطة جديدة أولاً
+        if self._log_records:
+            self._safe(self.snapshot)
+        while not self._stop_event.wait(self.flush_interval):
+            self._safe(self.flush)
+            if time.time() - self._last_snapshot >= self.snapshot_interval:
+                self._safe(self.snapshot)
+
+    def _safe(self, job):
+        try:
+            job()
+        except Exception as e:
+            logger.error(f"❌ خطأ في لقطات الحسابات: {e}")
+
+    def stop(self):
+        """إيقاف الخيط مع كتابة آخر التغييرات"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._safe(self.flush)
+
+    def get_stats(self) -> Dict:
+        """حجم السجل وأزمنة القراءة والكتابة"""
+        return {
+            'enabled': self.enabled,
+            'running': bool(self._thread and self._thread.is_alive()),
+            'dirty_users': len(self._dirty),
+            'sequence': self._sequence,
+            'log_records': self._log_records,
+            'flushes': self.flushes,
+            'records_written': self.records_written,
+            'snapshots': self.snapshots,
+            'loaded_users': self.loaded_users,
+            'replayed_records': self.replayed_records,
+            'corrupt_frames': self.corrupt_frames,
+            'last_load_ms': round(self.last_load_ms, 2),
+            'last_flush_ms': round(self.last_flush_ms, 2),
+            'last_snapshot_ms': round(self.last_snapshot_ms, 2),
+            'last_snapshot_bytes': self.last_snapshot_bytes,
+        }
+
+
+# مثيل عام
+account_snapshots = AccountSnapshotStore()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Enrichment Worker - تحليل الإشارات بعد التنفيذ
+تحليل النظام المحسن (SimpleEnhancedSystem) لا يمنع الصفقة ويضيف معلومات فقط،
+لذلك يعمل في خيط خلفي بنسخة واحدة مشتركة بدلاً من إنشاء نظام جديد قبل كل أمر
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from api.latency_tracer import latency_tracer
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import ENRICHMENT_SETTINGS
+except ImportError:
+    ENRICHMENT_SETTINGS = {
+        'enabled': True,
+        'blocking_default': False,
+        'max_queue_size': 1000,
+        'recent_results': 50,
+    }
+
+
+class EnrichmentWorker:
+    """
+    مرحلة التحليل المحسن
+
+    - enrich() في مسار التنفيذ: يضع الإشارة في طابور الخيط الخلفي ويعود فوراً
+    - المستخدم الذي فعّل enhanced_analysis_blocking يُحلل قبل التنفيذ (السلوك السابق)
+      وتُضاف نتيجة التحليل إلى الإشارة (enhanced_analysis, enhanced_risk_assessment, enhanced_execution_plan)
+    - القياسات: enrichment.blocking (زمن التحليل داخل مسار الأمر)، enrichment.enqueue،
+      enrichment.background (زمن التحليل في الخلفية) و enrichment.lag (من الإدخال حتى انتهاء التحليل)
+    """
+
+    def __init__(self, settings: Dict = None, system=None):
+        settings = settings or ENRICHMENT_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        self.blocking_default = settings.get('blocking_default', False)
+
+        self._system = system
+        self._system_lock = threading.Lock()
+        self._analyze_lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=settings.get('max_queue_size', 1000))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._recent: Deque[Dict] = deque(maxlen=settings.get('recent_results', 50))
+
+        self.blocking_runs = 0
+        self.background_runs = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @property
+    def system(self):
+        """نسخة النظام المحسن المشتركة (تُنشأ مرة واحدة)"""
+        if self._system is None:
+            with self._system_lock:
+                if self._system is None:
+                    from systems.simple_enhanced_system import simple_enhanced_system
+                    self._system = simple_enhanced_system
+        return self._system
+
+    # ==================== التشغيل ====================
+
+    def start(self):
+        """تشغيل الخيط الخلفي (مرة واحدة)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='EnrichmentWorker', daemon=True)
+            self._thread.start()
+        logger.info("✅ خيط التحليل المحسن يعمل في الخلفية")
+
+    def _run(self):
+        while True:
+            user_id, signal_data, stage, enqueued_at = self._queue.get()
+            try:
+                started = time.perf_counter()
+                self._analyze(user_id, signal_data, stage)
+                finished = time.perf_counter()
+                self.background_runs += 1
+                latency_tracer.record('enrichment.background', (finished - started) * 1000)
+                latency_tracer.record('enrichment.lag', (finished - enqueued_at) * 1000)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ خطأ في التحليل المحسن ({stage}): {e}")
+            finally:
+                self._queue.task_done()
+
+    # ==================== التحليل ====================
+
+    def is_blocking(self, user_id) -> bool:
+        """هل فعّل المستخدم التحليل قبل التنفيذ (enhanced_analysis_blocking)"""
+        if not user_id:
+            return self.blocking_default
+        try:
+            from users.user_manager import user_manager
+            user_data = user_manager.get_user(user_id) if user_manager else None
+        except Exception:
+            user_data = None
+        if not user_data or user_data.get('enhanced_analysis_blocking') is None:
+            return self.blocking_default
+        return bool(user_data.get('enhanced_analysis_blocking'))
+
+    def _analyze(self, user_id, signal_data: Dict, stage: str) -> Dict[str, Any]:
+        # النظام المشترك يعدل إحصائياته وذاكرته - تحليل واحد في كل لحظة
+        system = self.system
+        with self._analyze_lock:
+            result = system.process_signal(user_id or 0, signal_data)
+
+        if result.get('status') == 'success':
+            analysis = result.get('analysis', {})
+            risk_assessment = result.get('risk_assessment', {})
+            if analysis.get('recommendation') != 'execute':
+                logger.warning(f"⚠️ النظام المحسن لا يوصي بالتنفيذ ({stage}): {analysis.get('recommendation', 'unknown')}")
+            if risk_assessment.get('risk_level') == 'high':
+                logger.warning(f"⚠️ تحذير من المخاطر العالية ({stage}): {risk_assessment.get('recommendation', 'unknown')}")
+
+        self._recent.append({
+            'user_id': user_id,
+            'stage': stage,
+            'symbol': signal_data.get('symbol'),
+            'action': signal_data.get('action'),
+            'status': result.get('status'),
+            'recommendation': result.get('analysis', {}).get('recommendation'),
+            'risk_level': result.get('risk_assessment', {}).get('risk_level'),
+            'at': time.time(),
+        })
+        return result
+
+    def enrich(self, user_id, signal_data: Dict, stage: str = 'signal') -> Optional[Dict[str, Any]]:
+        """
+        تحليل الإشارة بالنظام المحسن
+
+        Returns:
+            نتيجة التحليل في الوضع المتزامن (بعد إضافتها للإشارة)، أو None عند التحليل في الخلفية
+        """
+        if not self.enabled or not signal_data:
+            return None
+
+        if self.is_blocking(user_id):
+            started = time.perf_counter()
+            try:
+                result = self._analyze(user_id, signal_data, stage)
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"⚠️ خطأ في التحليل المحسن ({stage}): {e}")
+                return None
+            finally:
+                latency_tracer.record('enrichment.blocking', (time.perf_counter() - started) * 1000, started)
+            self.blocking_runs += 1
+            if result.get('status') == 'success':
+                signal_data['enhanced_analysis'] = result.get('analysis', {})
+                signal_data['enhanced_risk_assessment'] = result.get('risk_assessment', {})
+                signal_data['enhanced_execution_plan'] = result.get('execution_plan', {})
+            return result
+
+        if self._thread is None:
+            self.start()
+        started = time.perf_counter()
+        try:
+            # نسخة من الإشارة - التنفيذ قد يعدل الأصل أثناء التحليل
+            self._queue.put_nowait((user_id, dict(signal_data), stage, started))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"⚠️ طابور التحليل المحسن ممتلئ - تخطي تحليل {signal_data.get('symbol')}")
+        latency_tracer.record('enrichment.enqueue', (time.perf_counter() - started) * 1000, started)
+        return None
+
+    # ==================== الإحصائيات ====================
+
+    def get_stats(self) -> Dict:
+        """العدادات وزمن التحليل في الوضعين"""
+        stages = latency_tracer.get_stats()
+        return {
+            'enabled': self.enabled,
+            'blocking_default': self.blocking_default,
+            'queue_depth': self._queue.qsize(),
+            'blocking_runs': self.blocking_runs,
+            'background_runs': self.background_runs,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'latency': {
+                stage: stages[stage] for stage in
+                ('enrichment.blocking', 'enrichment.enqueue', 'enrichment.background', 'enrichment.lag')
+                if stage in stages
+            },
+            'recent': list(self._recent)[-10:],
+        }
+
+
+# مثيل عام
+enrichment_worker = EnrichmentWorker()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Position Book - دفتر صفقات الحسابات التجريبية بأعمدة NumPy
+جميع صفقات الحسابات التجريبية لجميع المستخدمين في أعمدة (سعر الدخول، الكمية، الجانب، الرافعة، الهامش، رقم الرمز)
+تُعاد قيمتها بتمريرة واحدة لكل تحديث أسعار بدلاً من حلقة Python على كل صفقة في كل حساب
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from api.latency_tracer import latency_tracer
+from systems.position_records import FuturesPosition, symbol_table
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import POSITION_BOOK_SETTINGS
+except ImportError:
+    POSITION_BOOK_SETTINGS = {
+        'enabled': True,
+        'initial_capacity': 1024,
+        'scalar_threshold': 256,
+    }
+
+# الأعمدة ونوع كل عمود
+COLUMNS = {
+    'symbol_id': np.int32,
+    'side': np.int8,            # 1 شراء، -1 بيع
+    'futures': np.bool_,
+    'entry_price': np.float64,
+    'contracts': np.float64,    # الكمية بعملة الأساس
+    'leverage': np.float64,
+    'margin': np.float64,       # الهامش (فيوتشر) أو المبلغ (سبوت)
+    'liquidation_price': np.float64,
+    'unrealized_pnl': np.float64,
+    'mark_price': np.float64,   # آخر سعر أُعيد التقييم به (NaN قبل أول تقييم)
+    'crossed': np.bool_,        # السعر تجاوز سعر التصفية في آخر تقييم
+}
+
+
+class PositionBook:
+    """
+    دفتر الصفقات
+
+    - TradingAccount يضيف الصفقة عند الفتح ويحذفها عند الإغلاق، و refresh() بعد تعديلها (إغلاق جزئي)
+    - revalue() يعيد تقييم كل الصفقات (أو صفقات حساب واحد) بتمريرة واحدة ويعيد الصفقات
+      التي تجاوزت سعر التصفية في هذا التقييم
+    - الربح/الخسارة في كائنات الصفقات يُحدث عند الطلب فقط (sync) وليس في كل تقييم
+    - الحذف ينقل آخر صف مكان الصف المحذوف، ورقم الصف محفوظ في الصفقة (book_row)
+    """
+
+    def __init__(self, settings: Dict = None):
+        settings = settings or POSITION_BOOK_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        capacity = max(16, int(settings.get('initial_capacity', 1024)))
+        # حساب واحد بصفقات قليلة: حلقة على الكائنات أسرع من تجهيز المصفوفات
+        self.scalar_threshold = settings.get('scalar_threshold', 256)
+
+        self._lock = threading.RLock()
+        self._columns: Dict[str, np.ndarray] = {name: np.zeros(capacity, dtype=dtype)
+                                                for name, dtype in COLUMNS.items()}
+        self._positions: List = []
+        self._accounts: List = []
+        self._size = 0
+
+        self.revaluations = 0
+        self.liquidation_crossings = 0
+        self.last_revalue_ms = 0.0
+        self.last_revalued_rows = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, position) -> bool:
+        row = getattr(position, 'book_row', -1)
+        return 0 <= row < self._size and self._positions[row] is position
+
+    # ==================== الإضافة والحذف ====================
+
+    def _grow(self):
+        capacity = len(self._columns['side']) * 2
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _write(self, row: int, position):
+        columns = self._columns
+        is_futures = isinstance(position, FuturesPosition)
+        columns['symbol_id'][row] = symbol_table.id_of(position.symbol)
+        columns['side'][row] = 1 if position.side == 'buy' else -1
+        columns['futures'][row] = is_futures
+        columns['contracts'][row] = position.contracts
+        columns['leverage'][row] = position.leverage
+        if is_futures:
+            columns['entry_price'][row] = position.entry_price
+            columns['margin'][row] = position.margin_amount
+            columns['liquidation_price'][row] = position.liquidation_price
+        else:
+            columns['entry_price'][row] = position.price
+            columns['margin'][row] = position.amount
+            columns['liquidation_price'][row] = np.nan
+
+        mark = columns['mark_price'][row]
+        if np.isnan(mark):
+            columns['unrealized_pnl'][row] = position.unrealized_pnl
+        else:
+            columns['unrealized_pnl'][row] = (mark - columns['entry_price'][row]) * columns['contracts'][row] * columns['side'][row]
+
+    def add(self, position, account=None) -> int:
+        """إضافة صفقة (أو تحديثها إن كانت موجودة)"""
+        with self._lock:
+            if position in self:
+                self._write(position.book_row, position)
+                return position.book_row
+            if self._size == len(self._columns['side']):
+                self._grow()
+            row = self._size
+            self._columns['mark_price'][row] = np.nan
+            self._columns['crossed'][row] = False
+            self._write(row, position)
+            self._positions.append(position)
+            self._accounts.append(account)
+            self._size += 1
+            position.book_row = row
+            return row
+
+    def refresh(self, position):
+        """إعادة قراءة حقول الصفقة بعد تعديلها (الكمية والهامش بعد إغلاق جزئي)"""
+        with self._lock:
+            if position in self:
+                self._write(position.book_row, position)
+
+    def remove(self, position) -> bool:
+        """حذف صفقة (بعد مزامنة ربحها/خسارتها إلى الكائن)"""
+        with self._lock:
+            if position not in self:
+                return False
+            row = position.book_row
+            self._sync_row(row)
+            last = self._size - 1
+            if row != last:
+                for column in self._columns.values():
+                    column[row] = column[last]
+                moved = self._positions[last]
+                self._positions[row] = moved
+                self._accounts[row] = self._accounts[last]
+                moved.book_row = row
+            self._positions.pop()
+            self._accounts.pop()
+            self._size = last
+            position.book_row = -1
+            return True
+
+    def remove_account(self, account) -> int:
+        """حذف جميع صفقات حساب (عند إعادة تعيينه)"""
+        with self._lock:
+            positions = [p for p, a in zip(self._positions, self._accounts) if a is account]
+            for position in positions:
+                self.remove(position)
+            return len(positions)
+
+    # ==================== إعادة التقييم ====================
+
+    def _price_vector(self, prices: Dict[str, float]) -> np.ndarray:
+        vector = np.full(len(symbol_table), np.nan)
+        for symbol, price in prices.items():
+            if price and symbol in symbol_table:
+                vector[symbol_table.id_of(symbol)] = price
+        return vector
+
+    def revalue(self, prices: Dict[str, float], market_type: str = None,
+                positions: Iterable = None) -> List[Tuple[object, object]]:
+        """
+        إعادة تقييم الصفقات بالأسعار
+
+        Args:
+            prices: {symbol: price}
+            market_type: 'spot' أو 'futures' لتقييم صفقات سوق واحد فقط (أسعار السوقين مختلفة)
+            positions: صفقات محددة (حساب واحد) - تُزامن كائناتها مباشرة بعد التقييم
+
+        Returns:
+            [(position, account)] للصفقات التي تجاوزت سعر التصفية في هذا التقييم ولم تكن قد تجاوزته
+        """
+        if not prices:
+            return []
+        if positions is not None:
+            positions = list(positions)
+            if len(positions) < self.scalar_threshold:
+                return self._revalue_scalar(prices, market_type, positions)
+
+        started = time.perf_counter()
+        with self._lock:
+            if positions is None:
+                rows = slice(0, self._size)
+            else:
+                rows = np.fromiter((p.book_row for p in positions if p in self), dtype=np.intp)
+            columns = self._columns
+            symbol_ids = columns['symbol_id'][rows]
+            if len(symbol_ids) == 0:
+                return []
+
+            marks = self._price_vector(prices)[symbol_ids]
+            valid = ~np.isnan(marks)
+            futures = columns['futures'][rows]
+            if market_type is not None:
+                valid &= futures if market_type == 'futures' else ~futures
+
+            side = columns['side'][rows]
+            liquidation = columns['liquidation_price'][rows]
+            pnl = (marks - columns['entry_price'][rows]) * columns['contracts'][rows] * side
+            crossed_now = valid & futures & np.where(side > 0, marks <= liquidation, marks >= liquidation)
+            previous = columns['crossed'][rows]
+            newly_crossed = crossed_now & ~previous
+
+            columns['unrealized_pnl'][rows] = np.where(valid, pnl, columns['unrealized_pnl'][rows])
+            columns['mark_price'][rows] = np.where(valid, marks, columns['mark_price'][rows])
+            columns['crossed'][rows] = np.where(valid, crossed_now, previous)
+
+            offsets = np.flatnonzero(newly_crossed)
+            absolute = offsets if positions is None else rows[offsets]
+            crossings = [(self._positions[row], self._accounts[row]) for row in absolute]
+
+            if positions is not None:
+                for row in rows[valid]:
+                    self._sync_row(row)
+
+            self.revaluations += 1
+            self.liquidation_crossings += len(crossings)
+            self.last_revalued_rows = int(valid.sum())
+
+        self.last_revalue_ms = (time.perf_counter() - started) * 1000
+        latency_tracer.record('position_book.revalue', self.last_revalue_ms)
+        return crossings
+
+    def _revalue_scalar(self, prices: Dict[str, float], market_type: Optional[str],
+                        positions: List) -> List[Tuple[object, object]]:
+        """نفس revalue لصفقات حساب واحد عبر update_pnl لكل كائن مع تحديث صفوفها"""
+        crossings = []
+        pnl_column = self._columns['unrealized_pnl']
+        mark_column = self._columns['mark_price']
+        crossed_column = self._columns['crossed']
+        with self._lock:
+            rows = self._positions
+            size = self._size
+            for position in positions:
+                if market_type is not None and position.market_type != market_type:
+                    continue
+                current_price = prices.get(position.symbol)
+                if not current_price:
+                    continue
+                pnl = position.update_pnl(current_price)
+                crossed = position.market_type == 'futures' and position.check_liquidation(current_price)
+                row = position.book_row
+                if not (0 <= row < size and rows[row] is position):
+                    continue
+                if crossed and not crossed_column[row]:
+                    crossings.append((position, self._accounts[row]))
+                pnl_column[row] = pnl
+                mark_column[row] = current_price
+                crossed_column[row] = crossed
+            self.liquidation_crossings += len(crossings)
+        return crossings
+
+    # ==================== المزامنة ====================
+
+    def _sync_row(self, row: int):
+        mark = self._columns['mark_price'][row]
+        if np.isnan(mark):
+            return
+        position = self._positions[row]
+        position.unrealized_pnl = float(self._columns['unrealized_pnl'][row])
+        if not isinstance(position, FuturesPosition):
+            position.current_price = float(mark)
+
+    def sync(self, positions: Iterable):
+        """نسخ آخر تقييم إلى كائنات الصفقات (قبل قراءة unrealized_pnl منها)"""
+        with self._lock:
+            for position in positions:
+                if position in self:
+                    self._sync_row(position.book_row)
+
+    def symbols(self, market_type: str = None) -> set:
+        """رموز الصفقات المفتوحة في الدفتر (لسوق واحد أو للكل)"""
+        with self._lock:
+            futures = self._columns['futures'][:self._size]
+            symbol_ids = self._columns['symbol_id'][:self._size]
+            if market_type is not None:
+                symbol_ids = symbol_ids[futures if market_type == 'futures' else ~futures]
+            return {symbol_table.symbol_of(int(symbol_id)) for symbol_id in np.unique(symbol_ids)}
+
+    def get_stats(self) -> Dict:
+        """حجم الدفتر وزمن آخر تقييم"""
+        with self._lock:
+            futures = self._columns['futures'][:self._size]
+            return {
+                'enabled': self.enabled,
+                'positions': self._size,
+                'futures_positions': int(futures.sum()),
+                'capacity': len(self._columns['side']),
+                'crossed': int(self._columns['crossed'][:self._size].sum()),
+                'revaluations': self.revaluations,
+                'liquidation_crossings': self.liquidation_crossings,
+                'last_revalue_ms': round(self.last_revalue_ms, 3),
+                'last_revalued_rows': self.last_revalued_rows,
+                'memory_bytes': sum(column.nbytes for column in self._columns.values()),
+            }
+
+
+# مثيل عام
+position_book = PositionBook()
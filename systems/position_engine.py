@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Position Engine - محرك إدارة الصفقات المدفوع بتحديثات الأسعار
+يفحص أهداف الربح ووقف الخسارة و Trailing للصفقات المدارة عند وصول كل سعر من ناقل الأسعار
+بدلاً من انتظار التحديث الدوري كل 30 ثانية، مع دمج التحديثات المتتالية لنفس الرمز
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api.latency_tracer import latency_tracer
+from api.price_bus import price_bus
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import POSITION_ENGINE_SETTINGS
+except ImportError:
+    POSITION_ENGINE_SETTINGS = {
+        'enabled': True,
+        'exchange': 'bybit',
+        'refresh_interval': 30,
+        'subscription_sync_interval': 5,
+        'error_backoff': 60,
+    }
+
+# (position_id, result, current_price) -> تم التنفيذ؟
+Executor = Callable[[str, Dict, float], Awaitable[bool]]
+
+
+class PositionEngine:
+    """
+    محرك الصفقات المدارة
+
+    - مستمع على price_bus: يحفظ آخر سعر لكل رمز له مستويات في فهرس التفعيل ويوقظ الـ loop
+      (تحديثات نفس الرمز قبل الفحص تُدمج في فحص واحد بآخر سعر)
+    - الفحص عبر TradeToolsManager.on_price (نفس فحوصات PositionManagement)
+    - التنفيذ عبر executor يمرره البوت (نفس مسارات الإغلاق في الحساب التجريبي أو API المنصة)،
+      والإغلاقات المتتالية لنفس الصفقة تُنفذ بالترتيب
+    - مهام دورية (تحديث الربح/الخسارة من لقطات الأسعار) في نفس الـ loop بدلاً من loop جديد كل دورة
+    - القياسات: position_engine.evaluate و position_engine.trigger_to_close (من وصول السعر حتى انتهاء الإغلاق)
+    """
+
+    def __init__(self, manager=None, executor: Executor = None, settings: Dict = None, bus=None):
+        settings = settings or POSITION_ENGINE_SETTINGS
+        self.enabled = settings.get('enabled', True)
+        self.exchange = settings.get('exchange', 'bybit')
+        self.error_backoff = settings.get('error_backoff', 60)
+        self.subscription_sync_interval = settings.get('subscription_sync_interval', 5)
+
+        # يعيّنهما البوت: TradeToolsManager ودالة الإغلاق
+        self.manager = manager
+        self.executor = executor
+        self._bus = bus or price_bus
+        self._periodic: List[Tuple[Callable[[], Awaitable], float]] = []
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # (symbol, market_type) -> (آخر سعر، وقت أول تحديث لم يُفحص بعد)
+        self._pending: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing: Dict[str, asyncio.Task] = {}
+        self._subscribed: set = set()
+
+        self.ticks = 0
+        self.coalesced = 0
+        self.evaluations = 0
+        self.triggers = 0
+        self.closed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    # ==================== التشغيل ====================
+
+    def add_periodic(self, job: Callable[[], Awaitable], interval: float):
+        """إضافة مهمة دورية (coroutine function) تعمل في loop المحرك كل interval ثانية"""
+        self._periodic.append((job, interval))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.create_task, self._run_periodic(job, interval))
+
+    def start(self):
+        """تشغيل الـ loop في خيط خلفي والاشتراك في تحديثات الأسعار (مرة واحدة)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready_event.clear()
+            self._thread = threading.Thread(target=self._run, name='PositionEngine', daemon=True)
+            self._thread.start()
+        self._ready_event.wait(timeout=10)
+        self._bus.add_listener(self._on_tick)
+        logger.info(f"✅ محرك إدارة الصفقات يعمل على تحديثات أسعار {self.exchange}")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._loop.create_task(self._evaluator())
+        self._loop.create_task(self._run_periodic(self._sync_subscriptions, self.subscription_sync_interval))
+        for job, interval in self._periodic:
+            self._loop.create_task(self._run_periodic(job, interval))
+        self._ready_event.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+            self._loop = None
+
+    def stop(self):
+        """إلغاء الاشتراك وإيقاف الـ loop"""
+        self._bus.remove_listener(self._on_tick)
+        for symbol, market_type in self._subscribed:
+            self._bus.unsubscribe(self.exchange, [symbol], market_type)
+        self._subscribed = set()
+        loop = self._loop
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        logger.info("🔌 تم إيقاف محرك إدارة الصفقات")
+
+    async def _run_periodic(self, job: Callable[[], Awaitable], interval: float):
+        while True:
+            try:
+                await job()
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"خطأ في التحديث الدوري: {e}")
+                await asyncio.sleep(self.error_backoff)
+
+    async def _sync_subscriptions(self):
+        """الاشتراك في أسعار رموز الصفقات المدارة (وإلغاؤه بعد خروجها من الفهرس)"""
+        index = self.manager.trigger_index if self.manager is not None else None
+        current = set(index.symbols()) if index is not None else set()
+        for symbol, market_type in current - self._subscribed:
+            self._bus.subscribe(self.exchange, [symbol], market_type)
+        for symbol, market_type in self._subscribed - current:
+            self._bus.unsubscribe(self.exchange, [symbol], market_type)
+        self._subscribed = current
+
+    # ==================== الأسعار ====================
+
+    def _on_tick(self, exchange: str, market_type: str, symbol: str, price: float):
+        """مستمع ناقل الأسعار (من خيط WebSocket أو من لقطة REST)"""
+        if exchange != self.exchange or self._loop is None or self.manager is None:
+            return
+        index = self.manager.trigger_index
+        if index is None or not index.watches(symbol, market_type):
+            return
+
+        key = (symbol, market_type)
+        with self._lock:
+            self.ticks += 1
+            previous = self._pending.get(key)
+            if previous is not None:
+                # تحديث لم يُفحص بعد: يُدمج مع الاحتفاظ بوقت أول تحديث
+                self._pending[key] = (price, previous[1])
+                self.coalesced += 1
+                return
+            self._pending[key] = (price, time.perf_counter())
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _evaluator(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            for (symbol, market_type), (price, received_at) in pending.items():
+                started = time.perf_counter()
+                try:
+                    results = self.manager.on_price(symbol, market_type, price)
+                except Exception as e:
+                    logger.error(f"❌ خطأ في فحص مستويات {symbol}: {e}")
+                    continue
+                self.evaluations += 1
+                latency_tracer.record('position_engine.evaluate', (time.perf_counter() - started) * 1000)
+
+                for position_id, result in results.items():
+                    self.triggers += 1
+                    logger.info(f"🎯 تفعيل TP/SL للصفقة {position_id} عند {price}: {result}")
+                    if self.executor is None or not (result.get('take_profits') or result.get('stop_loss')):
+                        continue
+                    previous = self._closing.get(position_id)
+                    task = self._loop.create_task(self._close(position_id, result, price, received_at, previous))
+                    self._closing[position_id] = task
+                    task.add_done_callback(lambda done, pid=position_id: self._closing.pop(pid, None)
+                                           if self._closing.get(pid) is done else None)
+
+    async def _close(self, position_id: str, result: Dict, price: float, received_at: float,
+                     previous: Optional[asyncio.Task]):
+        """تنفيذ الإغلاق بعد انتهاء الإغلاق السابق لنفس الصفقة"""
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        try:
+            success = await self.executor(position_id, result, price)
+        except Exception as e:
+            logger.error(f"❌ خطأ في تنفيذ إغلاق الصفقة المدارة {position_id}: {e}")
+            success = False
+
+        if success:
+            self.closed += 1
+            latency_tracer.record('position_engine.trigger_to_close', (time.perf_counter() - received_at) * 1000)
+        else:
+            self.failed += 1
+
+    # ==================== الإحصائيات ====================
+
+    def get_stats(self) -> Dict:
+        """العدادات وأزمنة الفحص والإغلاق"""
+        stats = latency_tracer.get_stats()
+        return {
+            'running': self.running,
+            'exchange': self.exchange,
+            'ticks': self.ticks,
+            'coalesced': self.coalesced,
+            'evaluations': self.evaluations,
+            'triggers': self.triggers,
+            'closed': self.closed,
+            'failed': self.failed,
+            'closing': len(self._closing),
+            'evaluate': stats.get('position_engine.evaluate', {}),
+            'trigger_to_close': stats.get('position_engine.trigger_to_close', {}),
+        }
+
+
+# مثيل عام
+position_engine = PositionEngine()
@@ -9,6 +9,9 @@ from typing import Dict, List, Optional, Any
 from datetime import datetime
 import time
 
+from api.ticker_snapshot import ticker_snapshot
+from api.private_stream import private_stream_manager
+
 logger = logging.getLogger(__name__)
 
 class PositionFetcher:
@@ -18,6 +21,7 @@ class PositionFetcher:
         self.db_manager = db_manager
         self.signal_id_manager = signal_id_manager
         self.last_fetch_time = {}
+        self.last_real_positions = {}  # آخر نتيجة لكل مستخدم تُعاد عند تفعيل debounce
         self.debounce_seconds = 2  # تأخير بين التحديثات
         
     def _should_fetch(self, user_id: int) -> bool:
@@ -83,14 +87,16 @@ class PositionFetcher:
             return {}
     
     def update_demo_positions_prices(self, positions: Dict, api_client) -> Dict:
-        """تحديث أسعار الصفقات التجريبية من API"""
+        """تحديث أسعار الصفقات التجريبية من لقطة الأسعار المشتركة (وAPI كاحتياط)"""
         try:
-            if not api_client:
-                logger.warning("لا يوجد API client لتحديث الأسعار")
-                return positions
-            
             logger.info(f"🔄 تحديث أسعار {len(positions)} صفقة تجريبية")
             
+            # لقطة واحدة لكل نوع سوق بدلاً من طلب لكل صفقة
+            prices_by_market = {}
+            for market_type in {p.get('market_type', 'spot') for p in positions.values()}:
+                symbols = {p['symbol'] for p in positions.values() if p.get('market_type', 'spot') == market_type}
+                prices_by_market[market_type] = ticker_snapshot.get_prices(symbols, market_type)
+            
             for position_id, position_info in positions.items():
                 try:
                     symbol = position_info['symbol']
@@ -99,8 +105,10 @@ class PositionFetcher:
                     # تحديد category حسب market_type
                     category = "linear" if market_type == "futures" else "spot"
                     
-                    # جلب السعر الحالي من API
-                    current_price = api_client.get_ticker_price(symbol, category)
+                    current_price = prices_by_market.get(market_type, {}).get(symbol)
+                    if not current_price and api_client:
+                        # جلب السعر الحالي من API
+                        current_price = api_client.get_ticker_price(symbol, category)
                     
                     if current_price:
                         position_info['current_price'] = current_price
@@ -157,10 +165,14 @@ class PositionFetcher:
                 logger.warning("لا يوجد API client للحساب الحقيقي")
                 return {}
             
-            # التحقق من debounce
-            if not self._should_fetch(user_id):
-                logger.info("تم تخطي الجلب بسبب debounce")
-                return {}
+            # التحقق من debounce (لا حاجة له عند القراءة من البث الخاص)
+            mirror_live = private_stream_manager.get_live_mirror(getattr(api_client, 'api_key', None)) is not None
+            if not mirror_live and not self._should_fetch(user_id):
+                logger.info("تم تخطي الجلب بسبب debounce - إرجاع آخر نتيجة")
+                cached = self.last_real_positions.get(user_id, {})
+                if market_type:
+                    return {k: v for k, v in cached.items() if v.get('market_type') == market_type}
+                return dict(cached)
             
             logger.info(f"📊 جلب الصفقات الحقيقية للمستخدم {user_id}")
             
@@ -239,6 +251,13 @@ class PositionFetcher:
                     logger.error(f"خطأ في جلب صفقات Futures الحقيقية: {e}")
             
             logger.info(f"✅ تم جلب {len(positions)} صفقة حقيقية مفتوحة")
+            if market_type:
+                cached = {k: v for k, v in self.last_real_positions.get(user_id, {}).items()
+                          if v.get('market_type') != market_type}
+                cached.update(positions)
+                self.last_real_positions[user_id] = cached
+            else:
+                self.last_real_positions[user_id] = dict(positions)
             return positions
             
         except Exception as e:
@@ -295,8 +314,8 @@ class PositionFetcher:
                 # جلب الصفقات التجريبية من قاعدة البيانات
                 positions = self.get_demo_positions(user_id, market_type)
                 
-                # تحديث الأسعار من API
-                if api_client:
+                # تحديث الأسعار من لقطة الأسعار المشتركة (لا تحتاج API مربوط)
+                if positions:
                     positions = self.update_demo_positions_prices(positions, api_client)
                 
             elif account_type == 'real':
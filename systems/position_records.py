@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Position Records - سجلات صفقات الحساب التجريبي
+صفقات السبوت والفيوتشر بحقول ثابتة (__slots__) بدلاً من dict و __dict__ لكل صفقة،
+مع جدول رموز مشترك حتى لا تحمل كل صفقة نسخة خاصة من نص الرمز والعملة
+"""
+
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolTable:
+    """
+    جدول الرموز المشترك
+
+    - intern() يعيد نفس كائن النص لكل رمز، فالصفقات المفتوحة على BTCUSDT تشير لنص واحد
+    - id_of() / symbol_of() رقم ثابت لكل رمز (للفهارس والمصفوفات)
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._lock = threading.Lock()
+
+    def id_of(self, symbol: str) -> int:
+        symbol_id = self._ids.get(symbol)
+        if symbol_id is None:
+            with self._lock:
+                symbol_id = self._ids.get(symbol)
+                if symbol_id is None:
+                    symbol_id = len(self._symbols)
+                    self._symbols.append(symbol)
+                    self._ids[symbol] = symbol_id
+        return symbol_id
+
+    def intern(self, symbol: Optional[str]) -> Optional[str]:
+        if symbol is None:
+            return None
+        return self._symbols[self.id_of(symbol)]
+
+    def symbol_of(self, symbol_id: int) -> str:
+        return self._symbols[symbol_id]
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self._ids
+
+
+def normalize_side(side: str) -> str:
+    """الجانب بحروف صغيرة كنص مشترك ('Buy' و 'BUY' -> نفس كائن 'buy')"""
+    return sys.intern(side.lower())
+
+
+class FuturesPosition:
+    """فئة لإدارة صفقات الفيوتشر"""
+
+    __slots__ = ('position_id', 'symbol', 'side', 'leverage', 'entry_price', 'margin_amount',
+                 'position_size', 'contracts', 'opened_at', 'unrealized_pnl', 'liquidation_price', 'book_row')
+
+    market_type = 'futures'
+    maintenance_margin_rate = 0.005  # 0.5% كمعدل افتراضي
+
+    def __init__(self, symbol: str, side: str, margin_amount: float, entry_price: float, leverage: int, position_id: str):
+        self.position_id = position_id
+        self.symbol = symbol_table.intern(symbol)
+        self.side = normalize_side(side)  # buy أو sell
+        self.leverage = leverage
+        self.entry_price = entry_price
+        self.margin_amount = margin_amount  # الهامش المحجوز
+        self.position_size = margin_amount * leverage  # حجم الصفقة الفعلي
+        self.contracts = self.position_size / entry_price  # عدد العقود
+        self.opened_at = time.time()
+        self.unrealized_pnl = 0.0
+        self.liquidation_price = self.calculate_liquidation_price()
+        self.book_row = -1  # الصف في دفتر الصفقات (systems/position_book.py)
+
+    @property
+    def timestamp(self) -> datetime:
+        """وقت الفتح (يُخزن كرقم ويُعرض كـ datetime)"""
+        return datetime.fromtimestamp(self.opened_at)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime):
+        self.opened_at = value.timestamp()
+
+    def calculate_liquidation_price(self) -> float:
+        """حساب سعر التصفية باستخدام الصيغ الصحيحة مثل المنصات"""
+        try:
+            # استخدام الصيغة الصحيحة لـ Bybit
+            # Liquidation Price = Entry Price * (1 - (1/leverage) + maintenance_margin_rate) for Long
+            # Liquidation Price = Entry Price * (1 + (1/leverage) - maintenance_margin_rate) for Short
+
+            if self.side == "buy":
+                # للصفقات الشرائية (Long)
+                # الصيغة: Entry * (1 - (1/leverage) + maintenance_margin_rate)
+                liquidation_price = self.entry_price * (1 - (1/self.leverage) + self.maintenance_margin_rate)
+            else:
+                # للصفقات البيعية (Short)
+                # الصيغة: Entry * (1 + (1/leverage) - maintenance_margin_rate)
+                liquidation_price = self.entry_price * (1 + (1/self.leverage) - self.maintenance_margin_rate)
+
+            # التأكد من أن السعر موجب
+            return max(liquidation_price, 0.000001)
+
+        except Exception as e:
+            logger.error(f"خطأ في حساب سعر التصفية: {e}")
+            # في حالة الخطأ، استخدام حسابات تقريبية آمنة
+            if self.side == "buy":
+                return self.entry_price * (1 - (1/self.leverage) * 0.8)  # 80% من الهامش
+            else:
+                return self.entry_price * (1 + (1/self.leverage) * 0.8)  # 80% من الهامش
+
+    def update_pnl(self, current_price: float) -> float:
+        """تحديث الربح/الخسارة غير المحققة"""
+        try:
+            if self.side == "buy":
+                # للصفقات الشرائية
+                self.unrealized_pnl = (current_price - self.entry_price) * self.contracts
+            else:
+                # للصفقات البيعية
+                self.unrealized_pnl = (self.entry_price - current_price) * self.contracts
+
+            return self.unrealized_pnl
+
+        except Exception as e:
+            logger.error(f"خطأ في تحديث PnL: {e}")
+            return 0.0
+
+    def calculate_closing_pnl(self, closing_price: float) -> float:
+        """حساب الربح/الخسارة المحققة عند الإغلاق"""
+        try:
+            if self.side == "buy":
+                realized_pnl = (closing_price - self.entry_price) * self.contracts
+            else:
+                realized_pnl = (self.entry_price - closing_price) * self.contracts
+
+            return realized_pnl
+
+        except Exception as e:
+            logger.error(f"خطأ في حساب PnL المحقق: {e}")
+            return 0.0
+
+    def check_liquidation(self, current_price: float) -> bool:
+        """فحص ما إذا كانت الصفقة تحتاج للتصفية"""
+        try:
+            if self.side == "buy":
+                return current_price <= self.liquidation_price
+            else:
+                return current_price >= self.liquidation_price
+        except Exception as e:
+            logger.error(f"خطأ في فحص التصفية: {e}")
+            return False
+
+    def to_row(self) -> Tuple:
+        """الحقول الدائمة كـ tuple (لقطات الحسابات في systems/account_snapshot.py)"""
+        return (self.position_id, self.symbol, self.side, self.leverage, self.entry_price, self.margin_amount,
+                self.position_size, self.contracts, self.opened_at, self.liquidation_price)
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> 'FuturesPosition':
+        """إعادة بناء الصفقة من to_row() (الحجم والعقود كما كانت بعد الإغلاقات الجزئية)"""
+        (position_id, symbol, side, leverage, entry_price, margin_amount,
+         position_size, contracts, opened_at, liquidation_price) = row
+        position = cls(symbol, side, margin_amount, entry_price, leverage, position_id)
+        position.position_size = position_size
+        position.contracts = contracts
+        position.opened_at = opened_at
+        position.liquidation_price = liquidation_price
+        return position
+
+    def get_position_info(self) -> Dict:
+        """الحصول على معلومات الصفقة"""
+        return {
+            'position_id': self.position_id,
+            'symbol': self.symbol,
+            'side': self.side,
+            'leverage': self.leverage,
+            'entry_price': self.entry_price,
+            'margin_amount': self.margin_amount,
+            'position_size': self.position_size,
+            'contracts': self.contracts,
+            'liquidation_price': self.liquidation_price,
+            'unrealized_pnl': self.unrealized_pnl,
+            'timestamp': self.timestamp
+        }
+
+
+class SpotPosition:
+    """
+    صفقة سبوت بحقول ثابتة
+
+    تدعم القراءة والكتابة كـ dict (position['price']، position.get('coins_bought', 0)) كما كانت،
+    والحقول غير المستخدمة في الصفقة (coins_sold لصفقة شراء مثلاً) قيمتها None وتُعامل كغير موجودة.
+    المفاتيح خارج FIELDS غير مسموحة
+    """
+
+    __slots__ = ('position_id', 'symbol', 'side', 'amount', 'price', 'opened_at', 'base_currency',
+                 'coins_bought', 'coins_sold', 'usdt_received', 'unrealized_pnl', 'current_price', 'book_row')
+
+    market_type = 'spot'
+    leverage = 1
+
+    # المفاتيح المتاحة بصيغة dict (الحقول + الخصائص المحسوبة)
+    FIELDS = ('position_id', 'symbol', 'side', 'amount', 'price', 'leverage', 'market_type', 'timestamp',
+              'base_currency', 'coins_bought', 'coins_sold', 'usdt_received', 'unrealized_pnl',
+              'contracts', 'current_price')
+    _KEYS = frozenset(FIELDS)
+    _READ_ONLY = frozenset(('leverage', 'market_type', 'contracts'))
+
+    def __init__(self, symbol: str, side: str, amount: float, price: float, position_id: str,
+                 base_currency: str, coins_bought: float = None, coins_sold: float = None,
+                 usdt_received: float = None, opened_at: float = None):
+        self.position_id = position_id
+        self.symbol = symbol_table.intern(symbol)
+        self.side = normalize_side(side)
+        self.amount = amount
+        self.price = price
+        self.opened_at = opened_at if opened_at is not None else time.time()
+        self.base_currency = symbol_table.intern(base_currency)
+        self.coins_bought = coins_bought
+        self.coins_sold = coins_sold
+        self.usdt_received = usdt_received
+        self.unrealized_pnl = 0.0
+        self.current_price = None
+        self.book_row = -1
+
+    @property
+    def timestamp(self) -> datetime:
+        return datetime.fromtimestamp(self.opened_at)
+
+    @timestamp.setter
+    def timestamp(self, value: datetime):
+        self.opened_at = value.timestamp()
+
+    @property
+    def contracts(self) -> float:
+        """الكمية بعملة الأساس حسب المبلغ وسعر الدخول"""
+        return self.amount / self.price if self.price > 0 else 0
+
+    def update_pnl(self, current_price: float) -> float:
+        """تحديث الربح/الخسارة غير المحققة والسعر الحالي"""
+        if self.side == "buy":
+            self.unrealized_pnl = (current_price - self.price) * self.contracts
+        else:
+            self.unrealized_pnl = (self.price - current_price) * self.contracts
+        self.current_price = current_price
+        return self.unrealized_pnl
+
+    # ==================== واجهة dict ====================
+
+    def __getitem__(self, key: str):
+        if key in self._KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key not in self._KEYS or key in self._READ_ONLY:
+            raise KeyError(f"حقل غير قابل للتعديل في صفقة السبوت: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._KEYS and getattr(self, key) is not None
+
+    def get(self, key: str, default=None):
+        if key in self._KEYS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        return default
+
+    def keys(self) -> Iterator[str]:
+        return (key for key in self.FIELDS if getattr(self, key) is not None)
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        return ((key, getattr(self, key)) for key in self.keys())
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+    def get_position_info(self) -> Dict:
+        """الحصول على معلومات الصفقة"""
+        return self.to_dict()
+
+    def to_row(self) -> Tuple:
+        """الحقول الدائمة كـ tuple (لقطات الحسابات في systems/account_snapshot.py)"""
+        return (self.position_id, self.symbol, self.side, self.amount, self.price, self.opened_at,
+                self.base_currency, self.coins_bought, self.coins_sold, self.usdt_received)
+
+    @classmethod
+    def from_row(cls, row: Tuple) -> 'SpotPosition':
+        """إعادة بناء الصفقة من to_row()"""
+        (position_id, symbol, side, amount, price, opened_at,
+         base_currency, coins_bought, coins_sold, usdt_received) = row
+        return cls(symbol, side, amount, price, position_id, base_currency,
+                   coins_bought=coins_bought, coins_sold=coins_sold,
+                   usdt_received=usdt_received, opened_at=opened_at)
+
+    def __repr__(self) -> str:
+        return f"SpotPosition({self.position_id}, {self.symbol} {self.side} {self.amount} @ {self.price})"
+
+
+# مثيل عام
+symbol_table = SymbolTable()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Telegram Dispatcher - موزع رسائل تلجرام الصادرة
+عميل واحد وطابور واحد لجميع الرسائل الصادرة مع احترام حدود تلجرام (العامة ولكل محادثة)،
+إعادة المحاولة عند 429 حسب retry_after، ودمج الرسائل المتتالية لنفس المحادثة
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Set, Tuple
+
+import requests
+
+from api.http_transport import async_http_transport
+from api.latency_tracer import latency_tracer
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import TELEGRAM_TOKEN
+except ImportError:
+    TELEGRAM_TOKEN = None
+
+try:
+    from config import TELEGRAM_DISPATCHER_SETTINGS
+except ImportError:
+    TELEGRAM_DISPATCHER_SETTINGS = {
+        'api_url': 'https://api.telegram.org',
+        'global_per_second': 25,
+        'private_chat_interval': 1.0,
+        'group_chat_interval': 3.0,
+        'max_queue_size': 10000,
+        'senders': 4,
+        'max_retries': 3,
+        'coalesce': True,
+        'coalesce_separator': '\n\n➖➖➖➖➖➖\n\n',
+        'request_timeout': 10,
+    }
+
+# الحد الأقصى لطول رسالة تلجرام
+MAX_MESSAGE_LENGTH = 4096
+
+
+class _Message:
+    """رسالة في الطابور (قد تحتوي عدة رسائل مدمجة لنفس المحادثة)"""
+
+    __slots__ = ('chat_id', 'text', 'parse_mode', 'coalesce', 'parts', 'attempts', 'enqueued_at')
+
+    def __init__(self, chat_id, text: str, parse_mode: Optional[str], coalesce: bool):
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.coalesce = coalesce
+        self.parts = 1
+        self.attempts = 0
+        self.enqueued_at = time.perf_counter()
+
+
+class TelegramDispatcher:
+    """
+    موزع الرسائل الصادرة
+
+    - send() من أي خيط أو event loop: لا ينتظر الإرسال، يعيد False فقط إذا امتلأ الطابور
+    - طابور لكل محادثة؛ المحادثة لا تستقبل أكثر من رسالة كل private_chat_interval (أو group_chat_interval للمجموعات)
+    - الرسائل التي تنتظر دورها لنفس المحادثة تُدمج في رسالة واحدة (حتى 4096 حرفاً)
+    - حد عام لعدد الرسائل في الثانية لجميع المحادثات؛ رد 429 يوقف الإرسال مدة retry_after ثم يعيد الرسالة
+    """
+
+    def __init__(self, token: str = None, settings: Dict = None):
+        settings = settings or TELEGRAM_DISPATCHER_SETTINGS
+        self.token = token or TELEGRAM_TOKEN
+        self.api_url = settings.get('api_url', 'https://api.telegram.org').rstrip('/')
+        self.global_interval = 1.0 / max(1, settings.get('global_per_second', 25))
+        self.private_chat_interval = settings.get('private_chat_interval', 1.0)
+        self.group_chat_interval = settings.get('group_chat_interval', 3.0)
+        self.max_queue_size = settings.get('max_queue_size', 10000)
+        self.senders = settings.get('senders', 4)
+        self.max_retries = settings.get('max_retries', 3)
+        self.coalesce_enabled = settings.get('coalesce', True)
+        self.coalesce_separator = settings.get('coalesce_separator', '\n\n')
+        self.request_timeout = settings.get('request_timeout', 10)
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # حالة الجدولة (تُعدل فقط داخل الـ loop الخاص بالموزع)
+        self._ready: Optional[asyncio.Queue] = None
+        self._pending: Dict[object, Deque[_Message]] = {}
+        self._scheduled: Set[object] = set()
+        self._chat_next_at: Dict[object, float] = {}
+        self._global_next_at = 0.0
+        self._paused_until = 0.0
+
+        self._depth = 0
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.retried = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    # ==================== التشغيل ====================
+
+    def start(self):
+        """تشغيل الـ loop والمرسلين في خيط خلفي (مرة واحدة)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._ready_event.clear()
+            self._thread = threading.Thread(target=self._run, name='TelegramDispatcher', daemon=True)
+            self._thread.start()
+        self._ready_event.wait(timeout=10)
+        logger.info(f"✅ موزع رسائل تلجرام يعمل: {self.senders} مرسل")
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready = asyncio.Queue()
+        for index in range(self.senders):
+            self._loop.create_task(self._sender(index))
+        self._ready_event.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.run_until_complete(async_http_transport.close())
+            self._loop.close()
+            self._loop = None
+
+    def stop(self):
+        """إيقاف المرسلين (الرسائل المتبقية تُهمل)"""
+        loop = self._loop
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        logger.info("🔌 تم إيقاف موزع رسائل تلجرام")
+
+    # ==================== الإدخال ====================
+
+    def send(self, chat_id, text: str, parse_mode: str = None, coalesce: bool = True) -> bool:
+        """
+        إضافة رسالة للطابور
+
+        Args:
+            chat_id: معرف المحادثة
+            text: نص الرسالة
+            parse_mode: Markdown / HTML (اختياري)
+            coalesce: السماح بدمجها مع رسائل أخرى تنتظر لنفس المحادثة
+
+        Returns:
+            False إذا كان الطابور ممتلئاً
+        """
+        if not chat_id or not text:
+            return False
+        if self._loop is None:
+            self.start()
+
+        with self._lock:
+            if self._depth >= self.max_queue_size:
+                self.dropped += 1
+                logger.warning(f"⚠️ طابور رسائل تلجرام ممتلئ ({self._depth}) - إهمال رسالة للمحادثة {chat_id}")
+                return False
+            self._depth += 1
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._depth)
+
+        message = _Message(chat_id, str(text)[:MAX_MESSAGE_LENGTH], parse_mode, coalesce and self.coalesce_enabled)
+        self._loop.call_soon_threadsafe(self._accept, message)
+        return True
+
+    def _accept(self, message: _Message):
+        """إضافة الرسالة لطابور المحادثة (داخل الـ loop) مع الدمج إن أمكن"""
+        queue = self._pending.setdefault(message.chat_id, deque())
+        if queue and message.coalesce:
+            last = queue[-1]
+            merged_length = len(last.text) + len(self.coalesce_separator) + len(message.text)
+            if last.coalesce and last.parse_mode == message.parse_mode and merged_length <= MAX_MESSAGE_LENGTH:
+                last.text = f"{last.text}{self.coalesce_separator}{message.text}"
+                last.parts += 1
+                self.coalesced += 1
+                with self._lock:
+                    self._depth -= 1
+                return
+        queue.append(message)
+        self._schedule(message.chat_id)
+
+    def _schedule(self, chat_id):
+        """وضع المحادثة في طابور الجاهزة عند حلول دورها"""
+        if chat_id in self._scheduled:
+            return
+        self._scheduled.add(chat_id)
+        delay = self._chat_next_at.get(chat_id, 0.0) - self._loop.time()
+        if delay > 0:
+            self._loop.call_later(delay, self._ready.put_nowait, chat_id)
+        else:
+            self._ready.put_nowait(chat_id)
+
+    def _chat_interval(self, chat_id) -> float:
+        try:
+            is_group = int(chat_id) < 0
+        except (TypeError, ValueError):
+            is_group = True
+        return self.group_chat_interval if is_group else self.private_chat_interval
+
+    # ==================== الإرسال ====================
+
+    async def _wait_global_slot(self):
+        """الحد العام: فاصل ثابت بين الرسائل + التوقف بعد 429"""
+        now = self._loop.time()
+        slot = max(now, self._global_next_at, self._paused_until)
+        self._global_next_at = slot + self.global_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _post(self, message: _Message) -> Tuple[bool, Optional[float], Optional[str]]:
+        """
+        إرسال رسالة واحدة
+
+        Returns:
+            (ok, retry_after, error) - retry_after عند 429 أو خطأ مؤقت
+        """
+        payload = {'chat_id': message.chat_id, 'text': message.text}
+        if message.parse_mode:
+            payload['parse_mode'] = message.parse_mode
+        try:
+            response = await async_http_transport.post(
+                f"{self.api_url}/bot{self.token}/sendMessage",
+                headers={'Content-Type': 'application/json'},
+                data=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                timeout=self.request_timeout
+            )
+        except requests.exceptions.RequestException as e:
+            return False, 1.0, str(e)
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code == 200 and body.get('ok'):
+            return True, None, None
+
+        description = body.get('description', response.text[:200])
+        if response.status_code == 429:
+            retry_after = float((body.get('parameters') or {}).get('retry_after', 1))
+            # 429 يخص البوت كله - إيقاف جميع المرسلين مدة retry_after
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, self._loop.time() + retry_after)
+            logger.warning(f"⏳ تلجرام 429 - إيقاف الإرسال {retry_after} ثانية")
+            return False, retry_after, description
+        if response.status_code >= 500:
+            return False, 1.0, description
+        if response.status_code == 400 and message.parse_mode and "can't parse entities" in description:
+            # تنسيق غير صالح - إعادة الإرسال كنص عادي بدلاً من فقدان الرسالة
+            message.parse_mode = None
+            return False, 0.0, description
+        return False, None, description
+
+    async def _sender(self, index: int):
+        while True:
+            chat_id = await self._ready.get()
+            queue = self._pending.get(chat_id)
+            if not queue:
+                self._scheduled.discard(chat_id)
+                continue
+
+            message = queue.popleft()
+            if not queue:
+                self._pending.pop(chat_id, None)
+            try:
+                await self._wait_global_slot()
+                ok, retry_after, error = await self._post(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ok, retry_after, error = False, None, str(e)
+
+            now = self._loop.time()
+            self._chat_next_at[chat_id] = now + self._chat_interval(chat_id)
+
+            if ok:
+                self.sent += 1
+                latency_tracer.record('telegram.queue_wait', (time.perf_counter() - message.enqueued_at) * 1000)
+                with self._lock:
+                    self._depth -= 1
+            elif retry_after is not None and message.attempts < self.max_retries:
+                message.attempts += 1
+                self.retried += 1
+                self._chat_next_at[chat_id] = now + retry_after
+                self._pending.setdefault(chat_id, deque()).appendleft(message)
+            else:
+                self.failed += 1
+                logger.error(f"❌ فشل إرسال رسالة تلجرام للمحادثة {chat_id}: {error}")
+                with self._lock:
+                    self._depth -= 1
+
+            self._scheduled.discard(chat_id)
+            if chat_id in self._pending:
+                self._schedule(chat_id)
+
+    # ==================== الإحصائيات ====================
+
+    def get_stats(self) -> Dict:
+        """عمق الطابور والعدادات وزمن الانتظار"""
+        return {
+            'running': self._loop is not None,
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'chats_pending': len(self._pending),
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'rate_limited': self.rate_limited,
+            'retried': self.retried,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'queue_wait': latency_tracer.get_stats().get('telegram.queue_wait', {}),
+        }
+
+
+# مثيل عام
+telegram_dispatcher = TelegramDispatcher()
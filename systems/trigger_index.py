@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Trigger Index - فهرس مستويات التفعيل (أهداف الربح، وقف الخسارة، Trailing، التصفية)
+مستويات كل رمز في قائمتين مرتبتين (صاعدة وهابطة)، ومع كل سعر جديد يُعاد فقط ما تجاوزه السعر
+منذ السعر السابق عبر bisect بدلاً من فحص كل صفقة مدارة في كل تحديث
+"""
+
+import logging
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from config import TRIGGER_INDEX_SETTINGS
+except ImportError:
+    TRIGGER_INDEX_SETTINGS = {
+        'enabled': True,
+    }
+
+UP = 'up'        # يتفعل عندما يصل السعر إلى المستوى أو أعلى (TP شراء، SL بيع، ...)
+DOWN = 'down'    # يتفعل عندما يصل السعر إلى المستوى أو أقل (SL شراء، TP بيع، ...)
+
+_INF = float('inf')
+
+# (owner, kind, tag)
+EntryId = Tuple[Hashable, str, Hashable]
+
+
+class _SymbolLevels:
+    """مستويات رمز واحد في سوق واحد"""
+
+    __slots__ = ('up', 'down', 'last_price', 'pending')
+
+    def __init__(self):
+        self.up: List[Tuple[float, int, EntryId]] = []
+        self.down: List[Tuple[float, int, EntryId]] = []
+        self.last_price: Optional[float] = None
+        # مستويات أُضيفت والسعر عندها أو متجاوز لها - تُعاد مع السعر التالي إن بقي متجاوزاً لها
+        self.pending: set = set()
+
+    def __len__(self) -> int:
+        return len(self.up) + len(self.down)
+
+
+class TriggerIndex:
+    """
+    فهرس مستويات التفعيل
+
+    - set_levels() يستبدل مستويات صاحبها (الصفقة) ويحرك فقط ما تغير سعره (Trailing، التعادل)
+    - on_price() يعيد المستويات التي عبرها السعر بين السعر السابق والسعر الجديد في O(log n + k)
+    - المستوى المتجاوز عند إضافته (هدف أُضيف تحت السعر الحالي) يُعاد مع السعر التالي كما كان
+      الفحص الكامل يفعل
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._symbols: Dict[Tuple[str, str], _SymbolLevels] = {}
+        # entry_id -> (مفتاح الرمز، الاتجاه، العنصر في القائمة المرتبة)
+        self._entries: Dict[EntryId, Tuple[Tuple[str, str], str, Tuple[float, int, EntryId]]] = {}
+        self._owners: Dict[Hashable, set] = {}
+        self._sequence = 0
+
+        self.ticks = 0
+        self.crossings = 0
+        self.moves = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, owner) -> bool:
+        return owner in self._owners
+
+    # ==================== الإضافة والحذف ====================
+
+    def _insert(self, key: Tuple[str, str], entry_id: EntryId, price: float, direction: str):
+        levels = self._symbols.get(key)
+        if levels is None:
+            levels = self._symbols[key] = _SymbolLevels()
+        self._sequence += 1
+        item = (price, self._sequence, entry_id)
+        insort(levels.up if direction == UP else levels.down, item)
+        self._entries[entry_id] = (key, direction, item)
+        self._owners.setdefault(entry_id[0], set()).add(entry_id)
+
+        # المستوى عند السعر السابق أو خلفه لن يقع في مدى العبور التالي، فيُفحص مع السعر التالي مباشرة
+        last = levels.last_price
+        if last is not None and ((price <= last) if direction == UP else (price >= last)):
+            levels.pending.add(entry_id)
+
+    def _delete(self, entry_id: EntryId):
+        key, direction, item = self._entries.pop(entry_id)
+        levels = self._symbols[key]
+        items = levels.up if direction == UP else levels.down
+        position = bisect_left(items, item)
+        del items[position]
+        levels.pending.discard(entry_id)
+
+        owned = self._owners.get(entry_id[0])
+        if owned is not None:
+            owned.discard(entry_id)
+            if not owned:
+                del self._owners[entry_id[0]]
+        if not levels:
+            del self._symbols[key]
+
+    def set_levels(self, owner: Hashable, symbol: str, market_type: str,
+                   levels: Iterable[Tuple[str, Hashable, float, str]]):
+        """
+        تعيين مستويات صاحبها
+
+        Args:
+            owner: معرف الصفقة
+            levels: [(kind, tag, price, direction)] - kind مثل 'tp' أو 'sl' أو 'trail' أو 'liquidation'
+        """
+        key = (symbol, market_type)
+        with self._lock:
+            wanted = {(owner, kind, tag): (price, direction) for kind, tag, price, direction in levels}
+            for entry_id in list(self._owners.get(owner, ())):
+                current_key, direction, item = self._entries[entry_id]
+                target = wanted.get(entry_id)
+                if target is not None and current_key == key and target == (item[0], direction):
+                    del wanted[entry_id]
+                    continue
+                self._delete(entry_id)
+                if target is not None:
+                    self.moves += 1
+
+            for entry_id, (price, direction) in wanted.items():
+                self._insert(key, entry_id, price, direction)
+
+    def remove(self, owner: Hashable) -> int:
+        """حذف جميع مستويات صاحبها"""
+        with self._lock:
+            entries = list(self._owners.get(owner, ()))
+            for entry_id in entries:
+                self._delete(entry_id)
+            return len(entries)
+
+    # ==================== الأسعار ====================
+
+    def on_price(self, symbol: str, market_type: str, price: float) -> List[EntryId]:
+        """
+        تسجيل سعر جديد للرمز
+
+        Returns:
+            [(owner, kind, tag)] للمستويات التي عبرها السعر منذ السعر السابق
+            (وفي أول سعر للرمز: كل المستويات المتجاوزة عند هذا السعر)
+        """
+        with self._lock:
+            levels = self._symbols.get((symbol, market_type))
+            if levels is None:
+                return []
+            self.ticks += 1
+            last = levels.last_price
+            levels.last_price = price
+            up, down = levels.up, levels.down
+
+            if last is None:
+                crossed = [item[2] for item in up[:bisect_right(up, (price, _INF))]]
+                crossed += [item[2] for item in down[bisect_left(down, (price, -_INF)):]]
+            elif price > last:
+                crossed = [item[2] for item in up[bisect_right(up, (last, _INF)):bisect_right(up, (price, _INF))]]
+            elif price < last:
+                crossed = [item[2] for item in down[bisect_left(down, (price, -_INF)):bisect_left(down, (last, -_INF))]]
+            else:
+                crossed = []
+
+            if levels.pending:
+                seen = set(crossed)
+                for entry_id in levels.pending:
+                    if entry_id in seen:
+                        continue
+                    _, direction, item = self._entries[entry_id]
+                    if (price >= item[0]) if direction == UP else (price <= item[0]):
+                        crossed.append(entry_id)
+                levels.pending.clear()
+
+            self.crossings += len(crossed)
+            return crossed
+
+    def watches(self, symbol: str, market_type: str) -> bool:
+        """هل للرمز مستويات في الفهرس (فحص سريع لكل تحديث سعر)"""
+        return (symbol, market_type) in self._symbols
+
+    def symbols(self) -> List[Tuple[str, str]]:
+        """(symbol, market_type) للرموز التي لها مستويات"""
+        with self._lock:
+            return list(self._symbols)
+
+    def levels_of(self, owner: Hashable) -> Dict[Tuple[str, Hashable], float]:
+        """مستويات صاحبها {(kind, tag): price}"""
+        with self._lock:
+            return {(entry_id[1], entry_id[2]): self._entries[entry_id][2][0]
+                    for entry_id in self._owners.get(owner, ())}
+
+    def get_stats(self) -> Dict:
+        """حجم الفهرس وعدد التفعيلات"""
+        with self._lock:
+            return {
+                'levels': len(self._entries),
+                'owners': len(self._owners),
+                'symbols': len(self._symbols),
+                'ticks': self.ticks,
+                'crossings': self.crossings,
+                'moves': self.moves,
+            }
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Managed Position Close Tests - اختبارات الإغلاق التلقائي للصفقات المدارة
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeAsyncAccount:
+    """حساب حقيقي وهمي: صفقة شراء مفتوحة بحجم 2 وتسجيل الأوامر المرسلة"""
+
+    def __init__(self):
+        self.orders = []
+
+    async def get_positions(self, category='linear', symbol=None):
+        return [{'symbol': symbol, 'side': 'Buy', 'size': '2'}]
+
+    async def place_order(self, **kwargs):
+        self.orders.append(kwargs)
+        return {'order_id': f"order-{len(self.orders)}"}
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    pytest.importorskip('telegram')
+    # قاعدة بيانات المستخدمين تُنشأ في مجلد العمل عند الاستيراد
+    monkeypatch.chdir(tmp_path)
+    import bybit_trading_bot
+    monkeypatch.setattr(bybit_trading_bot.telegram_dispatcher, 'send', lambda *args, **kwargs: True)
+    return bybit_trading_bot
+
+
+def test_real_managed_position_tp_places_reduce_only_order(bot, monkeypatch):
+    from api.bybit_api import real_account_manager
+
+    account = FakeAsyncAccount()
+    monkeypatch.setattr(real_account_manager, 'get_async_account',
+                        lambda user_id: account if user_id == 42 else None)
+
+    manager = bot.trade_tools_manager
+    pm = manager.create_managed_position('REAL-TP-1', 'BTCUSDT', 'buy', 100.0, 2.0, 'futures', 10,
+                                         owner_id=42, is_real=True)
+    assert pm.add_take_profit(101.0, 50)
+
+    try:
+        results = manager.update_all_positions(prices={'BTCUSDT': 102.0})
+        assert 'REAL-TP-1' in results
+        assert asyncio.run(bot.execute_managed_position_close('REAL-TP-1', results['REAL-TP-1'], 102.0))
+    finally:
+        manager.remove_managed_position('REAL-TP-1')
+
+    assert account.orders == [{
+        'category': 'linear',
+        'symbol': 'BTCUSDT',
+        'side': 'Sell',
+        'order_type': 'Market',
+        'qty': 1.0,
+        'reduce_only': True,
+    }]
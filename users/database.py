@@ -204,6 +204,7 @@ class DatabaseManager:
                     ("bitget_api_key", "TEXT"),
                     ("bitget_api_secret", "TEXT"),
                     ("auto_apply_enabled", "BOOLEAN DEFAULT 0"),
+                    ("enhanced_analysis_blocking", "BOOLEAN"),
                     ("auto_apply_settings", "TEXT DEFAULT '{\"tp_percentages\": [], \"tp_close_percentages\": [], \"sl_percentage\": 0, \"trailing_enabled\": false, \"trailing_distance\": 2.0, \"breakeven_on_tp1\": true}'")
                 ]
                 
@@ -658,7 +659,7 @@ class DatabaseManager:
                 logger.debug(f"🔍 update_user_data: معالجة {len(data)} حقل للمستخدم {user_id}")
                 
                 for key, value in data.items():
-                    if key in ['daily_loss', 'weekly_loss', 'total_loss', 'last_reset_date', 'last_reset_week', 'last_loss_update', 'is_active', 'risk_management', 'exchange', 'bybit_api_key', 'bybit_api_secret', 'bitget_api_key', 'bitget_api_secret', 'balance', 'partial_percents', 'tps_percents', 'notifications', 'preferred_symbols', 'auto_apply_enabled', 'auto_apply_settings']:
+                    if key in ['daily_loss', 'weekly_loss', 'total_loss', 'last_reset_date', 'last_reset_week', 'last_loss_update', 'is_active', 'risk_management', 'exchange', 'bybit_api_key', 'bybit_api_secret', 'bitget_api_key', 'bitget_api_secret', 'balance', 'partial_percents', 'tps_percents', 'notifications', 'preferred_symbols', 'auto_apply_enabled', 'auto_apply_settings', 'enhanced_analysis_blocking']:
                         if key == 'risk_management':
                             # تحويل risk_management إلى JSON string
                             set_clauses.append(f"{key} = ?")
@@ -10,6 +10,8 @@ import time
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from .database import db_manager
+from api.ticker_snapshot import ticker_snapshot
+from systems.account_snapshot import account_snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -37,10 +39,15 @@ class UserManager:
         self.TradingAccount = trading_account_class
         self.BybitAPI = bybit_api_class
         
+        # لقطات الحسابات التجريبية (استعادة الحسابات وصفقاتها عند إعادة التشغيل)
+        self.snapshots = account_snapshots if account_snapshots.enabled else None
+        
         # تهيئة النظام المحسن
         if ENHANCED_SYSTEM_AVAILABLE:
             try:
-                self.enhanced_system = SimpleEnhancedSystem()
+                # نسخة واحدة مشتركة بدلاً من نسخة لكل مدير
+                from systems.enrichment_worker import enrichment_worker
+                self.enhanced_system = enrichment_worker.system
                 logger.info("Enhanced system initialized in UserManager")
             except Exception as e:
                 logger.warning(f"Failed to initialize enhanced system: {e}")
@@ -62,6 +69,12 @@ class UserManager:
             users_data = db_manager.get_all_active_users()
             logger.warning(f"🔍 جلب {len(users_data)} مستخدم من قاعدة البيانات")
             
+            # حالة الحسابات المحفوظة (قراءة متتالية للقطة وسجل التغييرات)
+            saved_states = {}
+            if self.snapshots is not None:
+                self.snapshots.bind(self)
+                saved_states = self.snapshots.load()
+            
             for user_data in users_data:
                 user_id = user_data['user_id']
                 
@@ -76,7 +89,7 @@ class UserManager:
                     self.users[user_id] = user_data
                     
                     # إنشاء حسابات تجريبية للمستخدم الجديد فقط
-                    self._create_user_accounts(user_id, user_data)
+                    self._create_user_accounts(user_id, user_data, saved_states.get(user_id))
                     
                     # إنشاء API للمستخدم إذا كان لديه مفاتيح
                     if user_data.get('api_key') and user_data.get('api_secret'):
@@ -87,8 +100,8 @@ class UserManager:
         except Exception as e:
             logger.error(f"خطأ في تحميل المستخدمين: {e}")
     
-    def _create_user_accounts(self, user_id: int, user_data: Dict):
-        """إنشاء حسابات تجريبية للمستخدم"""
+    def _create_user_accounts(self, user_id: int, user_data: Dict, saved_state: Dict = None):
+        """إنشاء حسابات تجريبية للمستخدم (واستعادتها من لقطة الحسابات إن وُجدت)"""
         try:
             # 🔧 إصلاح: تهيئة user_positions للمستخدم أولاً (قبل أي شيء)
             if user_id not in self.user_positions:
@@ -121,11 +134,27 @@ class UserManager:
                 'futures': futures_account
             }
             
+            if saved_state:
+                self._restore_user_state(user_id, saved_state)
+            if self.snapshots is not None:
+                self.snapshots.watch(user_id, self.user_accounts[user_id])
+            
             logger.info(f"✅ تم إنشاء حسابات جديدة للمستخدم {user_id}")
             
         except Exception as e:
             logger.error(f"خطأ في إنشاء حسابات المستخدم {user_id}: {e}")
     
+    def _restore_user_state(self, user_id: int, saved_state: Dict):
+        """استعادة الأرصدة والمحافظ والصفقات من لقطة الحسابات"""
+        try:
+            for market_type, account in self.user_accounts[user_id].items():
+                account_state = saved_state['accounts'].get(market_type)
+                if account_state:
+                    account.restore_state(account_state)
+            self.user_positions[user_id].update(saved_state.get('positions', {}))
+        except Exception as e:
+            logger.error(f"❌ خطأ في استعادة حسابات المستخدم {user_id} من اللقطة: {e}")
+    
     def _create_user_api(self, user_id: int, api_key: str, api_secret: str):
         """إنشاء API للمستخدم"""
         try:
@@ -212,6 +241,11 @@ class UserManager:
             logger.info(f"🗑️ تم إزالة المستخدم {user_id} من الذاكرة")
         
         if user_id in self.user_accounts:
+            # إخراج صفقات الحسابات من دفتر الصفقات المشترك
+            for account in self.user_accounts[user_id].values():
+                book = getattr(account, 'position_book', None)
+                if book is not None:
+                    book.remove_account(account)
             del self.user_accounts[user_id]
         
         if user_id in self.user_positions:
@@ -506,13 +540,21 @@ class UserManager:
             logger.error(f"خطأ في إغلاق صفقة المستخدم {user_id}: {e}")
             return False, {"error": str(e)}
     
-    def update_user_positions_prices(self, user_id: int, prices: Dict[str, float]):
-        """تحديث أسعار صفقات المستخدم"""
+    def update_user_positions_prices(self, user_id: int, prices: Dict[str, float] = None):
+        """
+        تحديث أسعار صفقات المستخدم
+        
+        إذا لم تُمرر الأسعار تُقرأ من لقطة الأسعار المشتركة حسب نوع سوق كل صفقة
+        """
         try:
             user_positions = self.user_positions.get(user_id, {})
             if not user_positions:
                 return
             
+            if prices is None:
+                self._update_user_positions_from_snapshot(user_id, user_positions)
+                return
+            
             # تحديث الأسعار
             for position_id, position_data in user_positions.items():
                 symbol = position_data['symbol']
@@ -543,6 +585,73 @@ class UserManager:
         except Exception as e:
             logger.error(f"خطأ في تحديث أسعار صفقات المستخدم {user_id}: {e}")
     
+    @staticmethod
+    def _apply_prices(user_positions: Dict[str, Dict], prices: Dict[str, float], market_type: str):
+        """تحديث السعر الحالي ونسبة الربح في قائمة صفقات المستخدم لسوق واحد"""
+        for position_data in user_positions.values():
+            if position_data.get('account_type', 'spot') != market_type:
+                continue
+            current_price = prices.get(position_data['symbol'])
+            if not current_price:
+                continue
+            
+            position_data['current_price'] = current_price
+            entry_price = position_data['entry_price']
+            if position_data['side'].lower() == "buy":
+                position_data['pnl_percent'] = ((current_price - entry_price) / entry_price) * 100
+            else:
+                position_data['pnl_percent'] = ((entry_price - current_price) / entry_price) * 100
+    
+    def _update_user_positions_from_snapshot(self, user_id: int, user_positions: Dict[str, Dict]):
+        """تحديث صفقات المستخدم من الجدول المشترك مع فصل أسعار السبوت عن الفيوتشر"""
+        for market_type in ('spot', 'futures'):
+            symbols = {p['symbol'] for p in user_positions.values()
+                       if p.get('account_type', 'spot') == market_type}
+            if not symbols:
+                continue
+            
+            prices = ticker_snapshot.get_prices(symbols, market_type)
+            self._apply_prices(user_positions, prices, market_type)
+            
+            account = self.get_user_account(user_id, market_type)
+            if account and prices:
+                account.update_positions_pnl(prices)
+    
+    def update_all_users_positions_prices(self):
+        """
+        تحديث أسعار صفقات جميع المستخدمين
+        
+        لقطة أسعار واحدة لكل فئة، ثم إعادة تقييم صفقات جميع الحسابات التجريبية في دفتر الصفقات
+        بتمريرة واحدة لكل فئة بدلاً من حلقة على كل حساب
+        """
+        from systems.position_book import position_book
+        
+        for market_type in ('spot', 'futures'):
+            symbols = set(position_book.symbols(market_type)) if position_book.enabled else set()
+            for user_positions in list(self.user_positions.values()):
+                symbols.update(p['symbol'] for p in list(user_positions.values())
+                               if p.get('account_type', 'spot') == market_type)
+            if not symbols:
+                continue
+            
+            prices = ticker_snapshot.get_prices(symbols, market_type)
+            if not prices:
+                continue
+            
+            for user_positions in list(self.user_positions.values()):
+                self._apply_prices(user_positions, prices, market_type)
+            
+            if position_book.enabled:
+                crossings = position_book.revalue(prices, market_type)
+                for position, _ in crossings:
+                    logger.warning(f"⚠️ صفقة {position.symbol} ({position.position_id}) تجاوزت سعر التصفية")
+            
+            # الحسابات خارج الدفتر (عند تعطيله) تُحدث كما كانت
+            for user_id, accounts in list(self.user_accounts.items()):
+                account = accounts.get(market_type)
+                if account is not None and getattr(account, 'position_book', None) is None and account.positions:
+                    account.update_positions_pnl(prices)
+    
     def get_user_account_info(self, user_id: int, market_type: str = 'spot') -> Dict:
         """الحصول على معلومات حساب المستخدم"""
         try:
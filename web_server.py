@@ -20,6 +20,10 @@ import requests
 
 # استيراد إعدادات البوت
 from config import *
+from api.latency_tracer import latency_tracer
+from signals.signal_queue import signal_ingestion_queue
+from signals.signal_journal import signal_journal
+from systems.telegram_dispatcher import telegram_dispatcher
 
 class WebServer:
     def __init__(self, trading_bot):
@@ -115,6 +119,11 @@ class WebServer:
                     print("⚠️ [WEB SERVER - WEBHOOK القديم] لا توجد بيانات")
                     return jsonify({"status": "error", "message": "No data received"}), 400
                 
+                # تسجيل الإشارة في السجل الدائم (الإشارة المكررة لا تُنفذ مرة أخرى)
+                entry_id, is_new = signal_journal.append(self.trading_bot.user_id, data, route='legacy')
+                if not is_new:
+                    return jsonify({"status": "success", "message": "Duplicate signal ignored", "duplicate": True}), 200
+                
                 # استيراد محول الإشارات
                 from signals.signal_converter import convert_simple_signal, validate_simple_signal
                 
@@ -143,14 +152,20 @@ class WebServer:
                 # إرسال تحديث مباشر للعملاء
                 self.socketio.emit('new_signal', data)
                 
-                # معالجة الإشارة في البوت
-                def process_signal_async():
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(self.trading_bot.process_signal(data))
-                    loop.close()
+                # معالجة الإشارة في البوت عبر طابور الإشارات
+                async def process_signal():
+                    signal_journal.mark_processing(entry_id)
+                    try:
+                        await self.trading_bot.process_signal(data)
+                        signal_journal.mark_done(entry_id)
+                    except Exception as e:
+                        signal_journal.mark_failed(entry_id, str(e))
+                        raise
                 
-                threading.Thread(target=process_signal_async, daemon=True).start()
+                lane = signal_ingestion_queue.lane_key(self.trading_bot.user_id, data.get('symbol'))
+                if not signal_ingestion_queue.submit(process_signal, name='webhook', lane=lane):
+                    signal_journal.mark_rejected(entry_id, 'queue full')
+                    return self.queue_full_response()
                 
                 # إرسال إشعار تلجرام
                 self.send_telegram_notification("📡 تم استقبال إشارة جديدة", data)
@@ -164,10 +179,34 @@ class WebServer:
                 traceback.print_exc()
                 return jsonify({"status": "error", "message": str(e)}), 400
         
+        @self.app.route('/api/queue')
+        def queue_metrics():
+            """عمق طابور الإشارات وزمن الانتظار فيه"""
+            return jsonify(signal_ingestion_queue.get_stats())
+        
+        @self.app.route('/api/telegram')
+        def telegram_metrics():
+            """طابور رسائل تلجرام الصادرة"""
+            return jsonify(telegram_dispatcher.get_stats())
+        
+        @self.app.route('/api/journal')
+        def journal_metrics():
+            """حالة سجل الإشارات الدائم"""
+            return jsonify(signal_journal.get_stats())
+        
+        @self.app.route('/api/latency')
+        def latency_metrics():
+            """زمن مراحل معالجة الإشارات (p50/p95/p99 لكل مرحلة)"""
+            return jsonify({
+                'stages': latency_tracer.get_stats(),
+                'recent_traces': latency_tracer.get_recent_traces(request.args.get('traces', default=10, type=int))
+            })
+        
         @self.app.route('/personal/<int:user_id>/webhook', methods=['POST'])
         def personal_webhook(user_id):
             """استقبال إشارات TradingView الشخصية لكل مستخدم"""
             try:
+                latency_tracer.start_trace('webhook', route='personal', user_id=user_id)
                 data = request.get_json()
                 
                 print(f"🔔 [WEB SERVER - WEBHOOK شخصي] المستخدم: {user_id}")
@@ -210,6 +249,17 @@ class WebServer:
                     return jsonify({"status": "error", "message": f"User {user_id} is not active"}), 403
                 
                 print(f"✅ [WEB SERVER - WEBHOOK شخصي] المستخدم {user_id} موجود ونشط")
+                
+                # تسجيل الإشارة في السجل الدائم (الإشارة المكررة لا تُنفذ مرة أخرى)
+                entry_id, is_new = signal_journal.append(user_id, data, route='personal')
+                if not is_new:
+                    latency_tracer.detach()
+                    return jsonify({
+                        "status": "success",
+                        "message": "Duplicate signal ignored",
+                        "user_id": user_id,
+                        "duplicate": True
+                    }), 200
                 print(f"📋 [WEB SERVER - WEBHOOK شخصي] إعدادات المستخدم: market_type={user_data.get('market_type')}, account_type={user_data.get('account_type')}")
                 
                 # استيراد محول الإشارات
@@ -234,124 +284,118 @@ class WebServer:
                     print(f"✅ [WEB SERVER - WEBHOOK شخصي] تم تحويل الإشارة: {converted_data}")
                     data = converted_data
                 
-                # حفظ إعدادات البوت الحالية مؤقتًا واستخدام نفس دالة المعالجة
-                original_settings = self.trading_bot.user_settings.copy()
-                original_user_id = self.trading_bot.user_id
+                # معرف أمر ثابت من السجل - إعادة الإشارة لا تكرر الأمر على المنصة
+                if entry_id:
+                    data['order_link_id'] = signal_journal.order_link_id(entry_id)
                 
-                try:
-                    # تطبيق إعدادات المستخدم المحدد مؤقتًا
-                    self.trading_bot.user_id = user_id
-                    self.trading_bot.user_settings['market_type'] = user_data.get('market_type', 'spot')
-                    self.trading_bot.user_settings['account_type'] = user_data.get('account_type', 'demo')
-                    self.trading_bot.user_settings['trade_amount'] = user_data.get('trade_amount', 100.0)
-                    self.trading_bot.user_settings['leverage'] = user_data.get('leverage', 10)
-                    
-                    print(f"✅ [WEB SERVER - WEBHOOK شخصي] تم تطبيق إعدادات المستخدم {user_id}")
-                    
-                    # تسجيل الإشارة في الرسم البياني
-                    self.add_signal_to_chart(data)
-                    
-                    # إرسال تحديث مباشر للعملاء
-                    self.socketio.emit('new_signal', {
-                        'user_id': user_id,
-                        'data': data
-                    })
-                    
-                    # معالجة الإشارة - استخدام signal_executor للحسابات الحقيقية
-                    def process_signal_async():
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                        try:
-                            # التحقق من نوع الحساب
-                            if user_data.get('account_type') == 'real':
-                                # تنفيذ على الحساب الحقيقي
-                                from signals.signal_executor import signal_executor
-                                result = loop.run_until_complete(
-                                    signal_executor.execute_signal(user_id, data, user_data)
+                # إعدادات المستخدم تصل للمعالجة عبر user_data - لا تُعدّل إعدادات trading_bot المشترك
+                # (الإشارات تُنفذ لاحقاً في الطابور بالتوازي مع إشارات المستخدمين الآخرين)
+                
+                # تسجيل الإشارة في الرسم البياني
+                self.add_signal_to_chart(data)
+                
+                # إرسال تحديث مباشر للعملاء
+                self.socketio.emit('new_signal', {
+                    'user_id': user_id,
+                    'data': data
+                })
+                
+                # معالجة الإشارة - استخدام signal_executor للحسابات الحقيقية
+                async def process_signal():
+                    latency_tracer.mark('webhook.dispatch')
+                    signal_journal.mark_processing(entry_id)
+                    try:
+                        # التحقق من نوع الحساب
+                        if user_data.get('account_type') == 'real':
+                            # تنفيذ على الحساب الحقيقي
+                            from signals.signal_executor import signal_executor
+                            result = await signal_executor.execute_signal(user_id, data, user_data)
+                            print(f"✅ [SIGNAL EXECUTOR] نتيجة التنفيذ: {result}")
+                            signal_journal.mark_done(entry_id, result)
+                            
+                            # إرسال إشعار بالنتيجة
+                            if result.get('success'):
+                                self.send_telegram_notification(
+                                    f"✅ تم تنفيذ الإشارة على الحساب الحقيقي\n\n"
+                                    f"المنصة: {user_data.get('exchange', 'N/A').upper()}\n"
+                                    f"{result.get('message', '')}",
+                                    data
+                                )
+                            else:
+                                self.send_telegram_notification(
+                                    f"❌ فشل تنفيذ الإشارة\n\n"
+                                    f"{result.get('message', 'خطأ غير معروف')}",
+                                    data
+                                )
+                        else:
+                            # 🔧 إصلاح: معالجة الحساب التجريبي مع تنفيذ الصفقة بشكل صحيح
+                            print(f"🎯 [DEMO] معالجة إشارة للحساب التجريبي للمستخدم {user_id}")
+                            
+                            # استخدام user_manager لتنفيذ الصفقة
+                            action = data.get('action', '').lower()
+                            symbol = data.get('symbol', '')
+                            price = float(data.get('price', 0))
+                            trade_amount = user_data.get('trade_amount', 100.0)
+                            market_type = user_data.get('market_type', 'spot')
+                            
+                            print(f"📊 [DEMO] تفاصيل الصفقة: {action} {symbol} @ {price}, amount={trade_amount}, market={market_type}")
+                            
+                            # تنفيذ الصفقة على الحساب التجريبي
+                            if action in ['buy', 'long', 'sell', 'short']:
+                                success, result = user_manager.execute_user_trade(
+                                    user_id=user_id,
+                                    symbol=symbol,
+                                    action=action,
+                                    price=price,
+                                    amount=trade_amount,
+                                    market_type=market_type
                                 )
-                                print(f"✅ [SIGNAL EXECUTOR] نتيجة التنفيذ: {result}")
                                 
-                                # إرسال إشعار بالنتيجة
-                                if result.get('success'):
+                                if success:
+                                    print(f"✅ [DEMO] تم تنفيذ الصفقة بنجاح: {result}")
                                     self.send_telegram_notification(
-                                        f"✅ تم تنفيذ الإشارة على الحساب الحقيقي\n\n"
-                                        f"المنصة: {user_data.get('exchange', 'N/A').upper()}\n"
-                                        f"{result.get('message', '')}",
+                                        f"✅ تم تنفيذ الإشارة على الحساب التجريبي\n\n"
+                                        f"الرمز: {symbol}\n"
+                                        f"الإجراء: {action.upper()}\n"
+                                        f"السعر: ${price:.2f}\n"
+                                        f"المبلغ: ${trade_amount:.2f}\n"
+                                        f"Position ID: {result}",
                                         data
                                     )
                                 else:
+                                    print(f"❌ [DEMO] فشل تنفيذ الصفقة: {result}")
                                     self.send_telegram_notification(
-                                        f"❌ فشل تنفيذ الإشارة\n\n"
-                                        f"{result.get('message', 'خطأ غير معروف')}",
+                                        f"❌ فشل تنفيذ الإشارة على الحساب التجريبي\n\n"
+                                        f"السبب: {result}",
                                         data
                                     )
+                            elif action in ['close', 'partial_close']:
+                                # إغلاق الصفقات (سنضيف هذا لاحقاً)
+                                print(f"⚠️ [DEMO] إغلاق الصفقات غير مدعوم حالياً في الحساب التجريبي الشخصي")
                             else:
-                                # 🔧 إصلاح: معالجة الحساب التجريبي مع تنفيذ الصفقة بشكل صحيح
-                                print(f"🎯 [DEMO] معالجة إشارة للحساب التجريبي للمستخدم {user_id}")
-                                
-                                # استخدام user_manager لتنفيذ الصفقة
-                                action = data.get('action', '').lower()
-                                symbol = data.get('symbol', '')
-                                price = float(data.get('price', 0))
-                                trade_amount = user_data.get('trade_amount', 100.0)
-                                market_type = user_data.get('market_type', 'spot')
-                                
-                                print(f"📊 [DEMO] تفاصيل الصفقة: {action} {symbol} @ {price}, amount={trade_amount}, market={market_type}")
-                                
-                                # تنفيذ الصفقة على الحساب التجريبي
-                                if action in ['buy', 'long', 'sell', 'short']:
-                                    success, result = user_manager.execute_user_trade(
-                                        user_id=user_id,
-                                        symbol=symbol,
-                                        action=action,
-                                        price=price,
-                                        amount=trade_amount,
-                                        market_type=market_type
-                                    )
-                                    
-                                    if success:
-                                        print(f"✅ [DEMO] تم تنفيذ الصفقة بنجاح: {result}")
-                                        self.send_telegram_notification(
-                                            f"✅ تم تنفيذ الإشارة على الحساب التجريبي\n\n"
-                                            f"الرمز: {symbol}\n"
-                                            f"الإجراء: {action.upper()}\n"
-                                            f"السعر: ${price:.2f}\n"
-                                            f"المبلغ: ${trade_amount:.2f}\n"
-                                            f"Position ID: {result}",
-                                            data
-                                        )
-                                    else:
-                                        print(f"❌ [DEMO] فشل تنفيذ الصفقة: {result}")
-                                        self.send_telegram_notification(
-                                            f"❌ فشل تنفيذ الإشارة على الحساب التجريبي\n\n"
-                                            f"السبب: {result}",
-                                            data
-                                        )
-                                elif action in ['close', 'partial_close']:
-                                    # إغلاق الصفقات (سنضيف هذا لاحقاً)
-                                    print(f"⚠️ [DEMO] إغلاق الصفقات غير مدعوم حالياً في الحساب التجريبي الشخصي")
-                                else:
-                                    print(f"❌ [DEMO] إجراء غير معروف: {action}")
-                        finally:
-                            # استعادة الإعدادات الأصلية
-                            self.trading_bot.user_settings.update(original_settings)
-                            self.trading_bot.user_id = original_user_id
-                            loop.close()
-                    
-                    threading.Thread(target=process_signal_async, daemon=True).start()
-                    
-                    print(f"✅ [WEB SERVER - WEBHOOK شخصي] تمت معالجة إشارة المستخدم {user_id} بنجاح")
-                    return jsonify({
-                        "status": "success", 
-                        "message": f"Signal processed for user {user_id}",
-                        "user_id": user_id
-                    }), 200
-                    
-                except Exception as e:
-                    # استعادة الإعدادات في حالة الخطأ
-                    self.trading_bot.user_settings.update(original_settings)
-                    self.trading_bot.user_id = original_user_id
-                    raise
+                                print(f"❌ [DEMO] إجراء غير معروف: {action}")
+                            signal_journal.mark_done(entry_id, 'demo')
+                    except Exception as e:
+                        signal_journal.mark_failed(entry_id, str(e))
+                        raise
+                    finally:
+                        latency_tracer.finish_trace()
+                
+                # الطابور يحفظ سياق الطلب فينتقل تتبع الإشارة إلى العامل
+                lane = signal_ingestion_queue.lane_key(user_id, data.get('symbol'))
+                if not signal_ingestion_queue.submit(process_signal, name=f'webhook:{user_id}', lane=lane):
+                    latency_tracer.detach()
+                    signal_journal.mark_rejected(entry_id, 'queue full')
+                    return self.queue_full_response()
+                latency_tracer.mark('webhook.ack')
+                latency_tracer.detach()
+                
+                print(f"✅ [WEB SERVER - WEBHOOK شخصي] تمت معالجة إشارة المستخدم {user_id} بنجاح")
+                return jsonify({
+                    "status": "success", 
+                    "message": f"Signal processed for user {user_id}",
+                    "user_id": user_id
+                }), 200
                 
             except Exception as e:
                 print(f"❌ [WEB SERVER - WEBHOOK شخصي] خطأ للمستخدم {user_id}: {e}")
@@ -359,6 +403,16 @@ class WebServer:
                 traceback.print_exc()
                 return jsonify({"status": "error", "message": str(e)}), 500
     
+    @staticmethod
+    def queue_full_response():
+        """رد 429 مع Retry-After عند امتلاء طابور الإشارات"""
+        retry_after = signal_ingestion_queue.retry_after()
+        return jsonify({
+            "status": "error",
+            "message": "Signal queue is full, retry later",
+            "retry_after": retry_after
+        }), 429, {'Retry-After': str(retry_after)}
+    
     # تم حذف دالة _process_user_signal القديمة - الآن نستخدم trading_bot.process_signal مباشرة
     
     def setup_socketio_events(self):
@@ -558,25 +612,8 @@ class WebServer:
             else:
                 message += str(data)
             
-            # إرسال الرسالة (سيتم تنفيذها من خلال البوت)
-            import asyncio
-            from telegram.ext import Application
-            
-            async def send_message():
-                try:
-                    application = Application.builder().token(TELEGRAM_TOKEN).build()
-                    await application.bot.send_message(chat_id=ADMIN_USER_ID, text=message)
-                except Exception as e:
-                    print(f"خطأ في إرسال الرسالة: {e}")
-            
-            # تشغيل في thread منفصل
-            def run_async():
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(send_message())
-                loop.close()
-            
-            threading.Thread(target=run_async, daemon=True).start()
+            # إرسال الرسالة عبر موزع الرسائل (لا يحجز طلب الـ webhook)
+            telegram_dispatcher.send(ADMIN_USER_ID, message)
             
         except Exception as e:
             print(f"❌ خطأ في إرسال إشعار تلجرام: {e}")